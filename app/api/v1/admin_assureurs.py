@@ -5,6 +5,7 @@ from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile,
 from sqlalchemy import func, or_
 from sqlalchemy.orm import Session, selectinload
 
+from app.services.logo_cache import logo_cache
 from app.services.minio_service import MinioService
 
 from app.api.v1.auth import get_current_user
@@ -643,6 +644,8 @@ async def upload_assureur_logo(
         )
     assureur.logo_url = logo_key
     db.commit()
+    # Même clé MinIO qu'avant l'upload : le logo en cache (PDF, e-carte) est périmé
+    logo_cache.invalidate(assureur_id)
     db.refresh(assureur)
     return {"logo_url": logo_key, "message": "Logo enregistré."}
 
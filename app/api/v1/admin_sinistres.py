@@ -14,6 +14,7 @@ from app.schemas.sinistre import SinistreResponse, SinistreWorkflowStepResponse
 from app.schemas.alerte import AlerteResponse
 from pydantic import BaseModel
 from app.services.sinistre_workflow_service import update_workflow_step
+from app.services.hospital_index import find_nearest_active_hospital
 from app.api.v1.sos import notify_hospital_reception, get_latest_questionnaire
 
 
@@ -31,7 +32,8 @@ def require_admin_or_sos_operator(current_user: User = Depends(get_current_user)
 
 
 class AssignHospitalRequest(BaseModel):
-    hospital_id: int
+    # Sans hospital_id : hôpital actif le plus proche de la position de l'alerte
+    hospital_id: Optional[int] = None
 
 
 class CloseSinistreRequest(BaseModel):
@@ -93,7 +95,7 @@ async def get_sinistre(
 
 
 @router.put("/sinistres/{sinistre_id}/assign-hospital", response_model=SinistreResponse)
-async def assign_hospital(
+def assign_hospital(
     sinistre_id: int,
     request: AssignHospitalRequest,
     db: Session = Depends(get_db),
@@ -108,19 +110,33 @@ async def assign_hospital(
             detail="Sinistre non trouvé"
         )
     
-    # Vérifier que l'hôpital existe
-    hospital = db.query(Hospital).filter(Hospital.id == request.hospital_id).first()
-    if not hospital:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Hôpital non trouvé"
-        )
+    alerte = db.query(Alerte).filter(Alerte.id == sinistre.alerte_id).first()
+    
+    if request.hospital_id is None:
+        if not alerte:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Aucune alerte localisée : hospital_id requis"
+            )
+        hospital = find_nearest_active_hospital(db, alerte.latitude, alerte.longitude)
+        if not hospital:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Aucun hôpital actif disponible"
+            )
+    else:
+        # Vérifier que l'hôpital existe
+        hospital = db.query(Hospital).filter(Hospital.id == request.hospital_id).first()
+        if not hospital:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Hôpital non trouvé"
+            )
     
-    sinistre.hospital_id = request.hospital_id
+    sinistre.hospital_id = hospital.id
     db.commit()
     db.refresh(sinistre)
     
-    alerte = db.query(Alerte).filter(Alerte.id == sinistre.alerte_id).first()
     souscription = None
     assure = None
     if sinistre.souscription_id:
@@ -130,7 +146,7 @@ async def assign_hospital(
     
     medical_questionnaire = get_latest_questionnaire(db, sinistre.souscription_id)
     if alerte:
-        await notify_hospital_reception(
+        notify_hospital_reception(
             db=db,
             sinistre=sinistre,
             alerte=alerte,
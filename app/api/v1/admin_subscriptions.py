@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import List, Literal, Optional
 from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session, selectinload
@@ -14,6 +14,7 @@ from app.schemas.souscription import SouscriptionResponse
 from app.schemas.questionnaire import QuestionnaireResponse
 from app.schemas.paiement import PaiementResponse
 from app.services.attestation_service import AttestationService
+from app.services.attestation_batch_service import AttestationBatchService
 from pydantic import BaseModel
 from typing import List
 
@@ -42,6 +43,16 @@ class ValidationRequest(BaseModel):
     notes: Optional[str] = None
 
 
+class RegenerationAttestationsRequest(BaseModel):
+    """Schéma pour la régénération en masse des attestations (filtres combinés)"""
+    type_attestation: Literal["provisoire", "definitive"] = "definitive"
+    souscription_ids: Optional[List[int]] = None
+    produit_id: Optional[int] = None
+    assureur_id: Optional[int] = None
+    projet_voyage_id: Optional[int] = None
+    statut: Optional[StatutSouscription] = None
+
+
 @router.get("/pending", response_model=List[SouscriptionResponse])
 async def get_pending_subscriptions(
     skip: int = 0,
@@ -471,3 +482,40 @@ async def generate_attestation(
     )
     
     return {"url": attestation.url_signee, "attestation_id": attestation.id}
+
+
+@router.post("/attestations/regenerate", status_code=status.HTTP_202_ACCEPTED)
+async def regenerate_attestations(
+    payload: RegenerationAttestationsRequest,
+    current_user: User = Depends(require_role([Role.ADMIN, Role.PRODUCTION_AGENT]))
+):
+    """Planifier la régénération en masse des attestations (worker `documents`, hors API)"""
+    filtres = payload.model_dump(mode="json", exclude={"type_attestation"}, exclude_none=True)
+    if not filtres:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Au moins un filtre est requis (souscription_ids, produit_id, assureur_id, projet_voyage_id, statut)"
+        )
+    
+    statut = AttestationBatchService.enqueue_regeneration(payload.type_attestation, filtres, demandeur_id=current_user.id)
+    if not statut.get("mise_en_file"):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Impossible de planifier la régénération des attestations"
+        )
+    return statut
+
+
+@router.get("/attestations/regenerate/{job_id}")
+async def get_regeneration_status(
+    job_id: str,
+    current_user: User = Depends(require_role([Role.ADMIN, Role.PRODUCTION_AGENT]))
+):
+    """Avancement d'une régénération en masse des attestations"""
+    statut = AttestationBatchService.get_job_status(job_id)
+    if not statut:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Régénération introuvable"
+        )
+    return statut
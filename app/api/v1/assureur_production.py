@@ -1,7 +1,7 @@
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session, selectinload, joinedload
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.core.enums import Role, StatutSouscription
 from app.api.v1.auth import get_current_user
 from app.models.user import User
@@ -57,7 +57,7 @@ async def get_subscriptions_for_assureur(
     skip: int = 0,
     limit: int = 100,
     statut: Optional[str] = Query(None, description="Filtrer par statut"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(require_agent_production_assureur)
 ):
     """
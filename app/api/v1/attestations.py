@@ -47,6 +47,7 @@ def _serialize_document_for_review(doc: ProjetVoyageDocument) -> DocumentReviewI
             doc.bucket_name,
             doc.object_name,
             expires=timedelta(minutes=30),
+            known_object=True,
         )
     except Exception:
         pass
@@ -373,72 +374,9 @@ async def get_subscription_attestations(
     else:
         logger.info(f"📄 Types d'attestations trouvées: {[att.type_attestation for att in attestations]}")
     
-    # Générer les URLs à la volée à partir de la clé stockée (NE JAMAIS utiliser les URLs stockées en base)
-    from app.services.minio_service import MinioService
-    now = datetime.utcnow()
-    expires = timedelta(hours=24)  # 24h d'expiration (au lieu de 2h)
-    
-    for attestation in attestations:
-        # Générer une URL fraîche pour le PDF si ce n'est pas un stockage inline
-        uses_inline_storage = attestation.bucket_minio == INLINE_BUCKET_NAME or \
-            attestation.chemin_fichier_minio == INLINE_OBJECT_KEY
-        
-        if not uses_inline_storage and attestation.chemin_fichier_minio:
-            try:
-                # Générer une nouvelle URL signée à partir de la clé (NE PAS stocker en base)
-                fresh_url = MinioService.get_pdf_url(
-                    attestation.chemin_fichier_minio,
-                    attestation.bucket_minio,
-                    expires
-                )
-                # Mettre à jour uniquement pour la réponse (pas de commit en base)
-                attestation.url_signee = fresh_url
-                attestation.date_expiration_url = now + expires
-            except Exception as e:
-                import logging
-                logger = logging.getLogger(__name__)
-                # Vérifier si c'est une erreur d'URL expirée
-                if MinioService.is_expired_url_error(e):
-                    logger.warning(
-                        f"URL expirée pour l'attestation {attestation.id}. "
-                        f"Tentative de régénération..."
-                    )
-                    try:
-                        # Réessayer avec régénération automatique
-                        fresh_url = MinioService.get_pdf_url(
-                            attestation.chemin_fichier_minio,
-                            attestation.bucket_minio,
-                            expires
-                        )
-                        # Mettre à jour uniquement pour la réponse (pas de commit en base)
-                        attestation.url_signee = fresh_url
-                        attestation.date_expiration_url = now + expires
-                        logger.info(f"URL régénérée avec succès pour l'attestation {attestation.id}")
-                    except Exception as retry_error:
-                        logger.error(
-                            f"Échec de la régénération de l'URL pour l'attestation {attestation.id}: {retry_error}. "
-                            f"Vérifiez la synchronisation de l'heure du serveur."
-                        )
-                else:
-                    logger.error(f"Erreur lors de la génération de l'URL pour l'attestation {attestation.id}: {e}")
-        
-        # Pour les attestations définitives, générer aussi l'URL de la carte numérique
-        if attestation.type_attestation == "definitive" and attestation.carte_numerique_path and attestation.carte_numerique_bucket:
-            is_inline_card = attestation.carte_numerique_bucket == INLINE_BUCKET_NAME or \
-                attestation.carte_numerique_path == INLINE_OBJECT_KEY
-            if not is_inline_card:
-                try:
-                    fresh_card_url = MinioService.generate_signed_url(
-                        attestation.carte_numerique_bucket,
-                        attestation.carte_numerique_path,
-                        expires
-                    )
-                    attestation.carte_numerique_url = fresh_card_url
-                    attestation.carte_numerique_expires_at = now + expires
-                except Exception as e:
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.error(f"Erreur lors de la génération de l'URL de la carte pour l'attestation {attestation.id}: {e}")
+    # Générer les URLs à la volée à partir de la clé stockée (NE JAMAIS utiliser les URLs stockées en base),
+    # en une passe et sans commit (URLs signées mises en cache jusqu'à l'approche de leur expiration)
+    AttestationService.sign_attestation_urls(attestations, expires=timedelta(hours=24))
     
     logger.info(f"✅ Retour de {len(attestations)} attestation(s) pour souscription {subscription_id}")
     if len(attestations) > 0:
@@ -460,72 +398,9 @@ async def get_user_attestations(
         .all()
     )
     
-    # Générer les URLs à la volée à partir de la clé stockée (NE JAMAIS utiliser les URLs stockées en base)
-    from app.services.minio_service import MinioService
-    now = datetime.utcnow()
-    expires = timedelta(hours=24)  # 24h d'expiration (au lieu de 2h)
-    
-    for attestation in attestations:
-        # Générer une URL fraîche pour le PDF si ce n'est pas un stockage inline
-        uses_inline_storage = attestation.bucket_minio == INLINE_BUCKET_NAME or \
-            attestation.chemin_fichier_minio == INLINE_OBJECT_KEY
-        
-        if not uses_inline_storage and attestation.chemin_fichier_minio:
-            try:
-                # Générer une nouvelle URL signée à partir de la clé (NE PAS stocker en base)
-                fresh_url = MinioService.get_pdf_url(
-                    attestation.chemin_fichier_minio,
-                    attestation.bucket_minio,
-                    expires
-                )
-                # Mettre à jour uniquement pour la réponse (pas de commit en base)
-                attestation.url_signee = fresh_url
-                attestation.date_expiration_url = now + expires
-            except Exception as e:
-                import logging
-                logger = logging.getLogger(__name__)
-                # Vérifier si c'est une erreur d'URL expirée
-                if MinioService.is_expired_url_error(e):
-                    logger.warning(
-                        f"URL expirée pour l'attestation {attestation.id}. "
-                        f"Tentative de régénération..."
-                    )
-                    try:
-                        # Réessayer avec régénération automatique
-                        fresh_url = MinioService.get_pdf_url(
-                            attestation.chemin_fichier_minio,
-                            attestation.bucket_minio,
-                            expires
-                        )
-                        # Mettre à jour uniquement pour la réponse (pas de commit en base)
-                        attestation.url_signee = fresh_url
-                        attestation.date_expiration_url = now + expires
-                        logger.info(f"URL régénérée avec succès pour l'attestation {attestation.id}")
-                    except Exception as retry_error:
-                        logger.error(
-                            f"Échec de la régénération de l'URL pour l'attestation {attestation.id}: {retry_error}. "
-                            f"Vérifiez la synchronisation de l'heure du serveur."
-                        )
-                else:
-                    logger.error(f"Erreur lors de la génération de l'URL pour l'attestation {attestation.id}: {e}")
-        
-        # Pour les attestations définitives, générer aussi l'URL de la carte numérique
-        if attestation.type_attestation == "definitive" and attestation.carte_numerique_path and attestation.carte_numerique_bucket:
-            is_inline_card = attestation.carte_numerique_bucket == INLINE_BUCKET_NAME or \
-                attestation.carte_numerique_path == INLINE_OBJECT_KEY
-            if not is_inline_card:
-                try:
-                    fresh_card_url = MinioService.generate_signed_url(
-                        attestation.carte_numerique_bucket,
-                        attestation.carte_numerique_path,
-                        expires
-                    )
-                    attestation.carte_numerique_url = fresh_card_url
-                    attestation.carte_numerique_expires_at = now + expires
-                except Exception as e:
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.error(f"Erreur lors de la génération de l'URL de la carte pour l'attestation {attestation.id}: {e}")
+    # Générer les URLs à la volée à partir de la clé stockée (NE JAMAIS utiliser les URLs stockées en base),
+    # en une passe et sans commit (URLs signées mises en cache jusqu'à l'approche de leur expiration)
+    AttestationService.sign_attestation_urls(attestations, expires=timedelta(hours=24))
     
     return attestations
 
@@ -864,88 +739,18 @@ async def get_attestation_with_url(
             detail="Accès non autorisé à cette attestation"
         )
     
-    # Générer les URLs à la volée à partir de la clé stockée (NE JAMAIS utiliser les URLs stockées en base)
-    from app.services.minio_service import MinioService
-    now = datetime.utcnow()
-    expires = timedelta(hours=24)  # 24h d'expiration (au lieu de 2h)
-    
-    # Vérifier l'heure du serveur pour diagnostiquer les problèmes
-    import logging
-    logger = logging.getLogger(__name__)
-    logger.debug(f"🕐 Heure serveur UTC: {now.isoformat()}")
-    
-    uses_inline_storage = attestation.bucket_minio == INLINE_BUCKET_NAME or \
-        attestation.chemin_fichier_minio == INLINE_OBJECT_KEY
-
-    # Générer une URL fraîche pour le PDF si ce n'est pas un stockage inline
-    if not uses_inline_storage and attestation.chemin_fichier_minio:
-        try:
-            url_signee = MinioService.get_pdf_url(
-                attestation.chemin_fichier_minio,
-                attestation.bucket_minio,
-                expires
-            )
-        except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            # Vérifier si c'est une erreur d'URL expirée
-            if MinioService.is_expired_url_error(e):
-                logger.warning(
-                    f"URL expirée pour l'attestation {attestation.id}. "
-                    f"Tentative de régénération..."
-                )
-                try:
-                    # Réessayer avec régénération automatique
-                    url_signee = MinioService.get_pdf_url(
-                        attestation.chemin_fichier_minio,
-                        attestation.bucket_minio,
-                        expires
-                    )
-                    logger.info(f"URL régénérée avec succès pour l'attestation {attestation.id}")
-                except Exception as retry_error:
-                    logger.error(
-                        f"Échec de la régénération de l'URL pour l'attestation {attestation.id}: {retry_error}. "
-                        f"Vérifiez la synchronisation de l'heure du serveur."
-                    )
-                    url_signee = attestation.url_signee or None
-            else:
-                logger.error(f"Erreur lors de la génération de l'URL pour l'attestation {attestation.id}: {e}")
-                url_signee = attestation.url_signee or None
-    else:
-        url_signee = attestation.url_signee
-    
-    # Pour les attestations définitives, générer aussi l'URL de la carte numérique
-    carte_numerique_url = None
-    carte_numerique_expires_at = None
-    if attestation.type_attestation == "definitive" and attestation.carte_numerique_path and attestation.carte_numerique_bucket:
-        is_inline_card = attestation.carte_numerique_bucket == INLINE_BUCKET_NAME or \
-            attestation.carte_numerique_path == INLINE_OBJECT_KEY
-        if not is_inline_card:
-            try:
-                carte_numerique_url = MinioService.generate_signed_url(
-                    attestation.carte_numerique_bucket,
-                    attestation.carte_numerique_path,
-                    expires
-                )
-                carte_numerique_expires_at = now + expires
-            except Exception as e:
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.error(f"Erreur lors de la génération de l'URL de la carte pour l'attestation {attestation.id}: {e}")
-                carte_numerique_url = attestation.carte_numerique_url
-                carte_numerique_expires_at = attestation.carte_numerique_expires_at
-    else:
-        carte_numerique_url = attestation.carte_numerique_url
-        carte_numerique_expires_at = attestation.carte_numerique_expires_at
+    # Générer les URLs à partir de la clé stockée (NE JAMAIS utiliser les URLs stockées en base),
+    # via le cache des URLs signées ; en cas d'échec, les URLs stockées sont conservées
+    AttestationService.sign_attestation_urls([attestation], expires=timedelta(hours=24))
     
     return AttestationWithURLResponse(
         id=attestation.id,
         type_attestation=attestation.type_attestation,
         numero_attestation=attestation.numero_attestation,
-        url_signee=url_signee or "",
-        date_expiration_url=now + expires if url_signee else None,
-        carte_numerique_url=carte_numerique_url,
-        carte_numerique_expires_at=carte_numerique_expires_at,
+        url_signee=attestation.url_signee or "",
+        date_expiration_url=attestation.date_expiration_url if attestation.url_signee else None,
+        carte_numerique_url=attestation.carte_numerique_url,
+        carte_numerique_expires_at=attestation.carte_numerique_expires_at,
         created_at=attestation.created_at
     )
 
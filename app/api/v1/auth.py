@@ -2,7 +2,7 @@ from datetime import timedelta
 import random
 import string
 import logging
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from app.core.database import get_db
@@ -19,6 +19,7 @@ from app.core.enums import Role
 from app.models.user import User
 from app.models.hospital import Hospital
 from app.services.user_service import UserService
+from app.services.principal_cache import get_user_by_username
 from pydantic import BaseModel, EmailStr, field_validator
 
 router = APIRouter()
@@ -147,6 +148,7 @@ class GetMaskedEmailRequest(BaseModel):
 
 
 def get_current_user(
+    request: Request,
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
 ) -> User:
@@ -157,7 +159,11 @@ def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    payload = decode_token(token)
+    # Jeton déjà décodé par le middleware d'instrumentation
+    if getattr(request.state, "token", None) == token:
+        payload = request.state.token_payload
+    else:
+        payload = decode_token(token)
     if payload is None or payload.get("type") != "access":
         raise credentials_exception
     
@@ -165,7 +171,7 @@ def get_current_user(
     if username is None:
         raise credentials_exception
     
-    user = db.query(User).filter(User.username == username).first()
+    user = get_user_by_username(db, username)
     if user is None:
         raise credentials_exception
     
@@ -189,7 +195,7 @@ def require_admin_user(current_user: User = Depends(get_current_user)) -> User:
 
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+def register(user_data: UserCreate, db: Session = Depends(get_db)):
     """
     Enregistrer un nouvel utilisateur.
     
@@ -259,7 +265,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=Token)
-async def login(
+def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
@@ -389,7 +395,7 @@ async def login(
 
 
 @router.post("/refresh", response_model=Token)
-async def refresh_token(
+def refresh_token(
     token_data: RefreshTokenRequest,
     db: Session = Depends(get_db)
 ):
@@ -461,7 +467,7 @@ async def refresh_token(
 
 
 @router.post("/logout")
-async def logout(
+def logout(
     current_user: User = Depends(get_current_user)
 ):
     """Logout and invalidate refresh token"""
@@ -478,7 +484,7 @@ async def logout(
 
 
 @router.get("/me", response_model=UserResponse)
-async def get_current_user_info(
+def get_current_user_info(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
@@ -518,7 +524,7 @@ async def get_current_user_info(
 
 
 @router.post("/forgot-password")
-async def forgot_password(
+def forgot_password(
     request: ForgotPasswordRequest,
     db: Session = Depends(get_db)
 ):
@@ -621,7 +627,7 @@ async def forgot_password(
 
 
 @router.post("/verify-reset-code")
-async def verify_reset_code(
+def verify_reset_code(
     request: VerifyResetCodeRequest,
     db: Session = Depends(get_db)
 ):
@@ -742,7 +748,7 @@ async def verify_reset_code(
 
 
 @router.post("/reset-password")
-async def reset_password(
+def reset_password(
     request: ResetPasswordRequest,
     db: Session = Depends(get_db)
 ):
@@ -821,7 +827,7 @@ async def reset_password(
 
 
 @router.post("/verify-email")
-async def verify_email(
+def verify_email(
     request: VerifyEmailRequest,
     db: Session = Depends(get_db)
 ):
@@ -888,7 +894,7 @@ async def verify_email(
 
 
 @router.post("/resend-verification-code")
-async def resend_verification_code(
+def resend_verification_code(
     request: ResendVerificationCodeRequest,
     db: Session = Depends(get_db)
 ):
@@ -933,7 +939,7 @@ async def resend_verification_code(
 
 
 @router.post("/get-masked-email")
-async def get_masked_email(
+def get_masked_email(
     request: GetMaskedEmailRequest,
     db: Session = Depends(get_db)
 ):
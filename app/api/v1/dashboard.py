@@ -4,9 +4,9 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_, or_
 from decimal import Decimal
-from app.core.database import get_db
+from app.core.database import get_read_db, get_pool_stats
 from app.core.enums import Role, StatutSouscription, StatutPaiement
-from app.api.v1.auth import get_current_user
+from app.api.v1.auth import get_current_user, require_admin_user
 from app.models.user import User
 from app.models.souscription import Souscription
 from app.models.paiement import Paiement
@@ -44,7 +44,7 @@ class DashboardStatsResponse(BaseModel):
 
 @router.get("/stats", response_model=DashboardStatsResponse)
 async def get_dashboard_stats(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(require_admin_or_backoffice)
 ):
     """Obtenir les statistiques du tableau de bord back-office"""
@@ -128,7 +128,7 @@ class StatisticsResponse(BaseModel):
 @router.get("/statistics", response_model=StatisticsResponse)
 async def get_detailed_statistics(
     period: str = "month",  # "day", "week", "month", "year"
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(require_admin_or_backoffice)
 ):
     """Obtenir les statistiques détaillées"""
@@ -247,3 +247,14 @@ async def get_detailed_statistics(
         sinistres_by_product=sinistres_by_product
     )
 
+
+
+@router.get("/database-pool")
+async def get_database_pool_stats(
+    current_user: User = Depends(require_admin_user)
+):
+    """
+    Métriques des pools de connexions (monitoring) : connexions prises, débordement,
+    attente au checkout et délais dépassés, pour la base principale et la réplique.
+    """
+    return get_pool_stats()
@@ -81,71 +81,31 @@ async def get_user_documents(
     souscriptions = query.all()
     
     # Récupérer les attestations
+    attestations = []
     for souscription in souscriptions:
-        attestations = db.query(Attestation).filter(
+        attestations.extend(db.query(Attestation).filter(
             Attestation.souscription_id == souscription.id,
             Attestation.est_valide == True
-        ).order_by(Attestation.created_at.desc()).all()
+        ).order_by(Attestation.created_at.desc()).all())
+    
+    # Générer des URLs fraîches à partir des clés stockées, en une passe (cache des URLs signées) ;
+    # stockage inline ou échec de signature : URL stockée
+    AttestationService.sign_attestation_urls(attestations, expires=timedelta(hours=24))
+    
+    for attestation in attestations:
+        doc_type = 'attestation_provisoire' if attestation.type_attestation == 'provisoire' else 'attestation_definitive'
+        titre = f"Attestation {'Provisoire' if attestation.type_attestation == 'provisoire' else 'Définitive'}"
         
-        for attestation in attestations:
-            # Générer une URL fraîche à la volée à partir de la clé stockée
-            from app.services.minio_service import MinioService
-            from app.services.attestation_service import INLINE_BUCKET_NAME, INLINE_OBJECT_KEY
-            
-            url_signee = None
-            uses_inline_storage = attestation.bucket_minio == INLINE_BUCKET_NAME or \
-                attestation.chemin_fichier_minio == INLINE_OBJECT_KEY
-            
-            if not uses_inline_storage and attestation.chemin_fichier_minio:
-                try:
-                    # TOUJOURS régénérer l'URL (ignorer celle stockée en base)
-                    url_signee = MinioService.get_pdf_url(
-                        attestation.chemin_fichier_minio,
-                        attestation.bucket_minio,
-                        timedelta(hours=24)  # 24h d'expiration (au lieu de 2h)
-                    )
-                except Exception as e:
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    # Vérifier si c'est une erreur d'URL expirée
-                    if MinioService.is_expired_url_error(e):
-                        logger.warning(
-                            f"URL expirée pour l'attestation {attestation.id}. "
-                            f"Tentative de régénération..."
-                        )
-                        try:
-                            # Réessayer avec régénération automatique
-                            url_signee = MinioService.get_pdf_url(
-                                attestation.chemin_fichier_minio,
-                                attestation.bucket_minio,
-                                timedelta(hours=2)
-                            )
-                            logger.info(f"URL régénérée avec succès pour l'attestation {attestation.id}")
-                        except Exception as retry_error:
-                            logger.error(
-                                f"Échec de la régénération de l'URL pour l'attestation {attestation.id}: {retry_error}"
-                            )
-                            url_signee = attestation.url_signee
-                    else:
-                        logger.error(f"Erreur lors de la génération de l'URL pour l'attestation {attestation.id}: {e}")
-                        url_signee = attestation.url_signee
-                else:
-                    # Pour le stockage inline, utiliser l'URL stockée (data URI)
-                    url_signee = attestation.url_signee
-            
-            doc_type = 'attestation_provisoire' if attestation.type_attestation == 'provisoire' else 'attestation_definitive'
-            titre = f"Attestation {'Provisoire' if attestation.type_attestation == 'provisoire' else 'Définitive'}"
-            
-            documents.append(DocumentResponse(
-                id=attestation.id,
-                type=doc_type,
-                titre=titre,
-                numero=attestation.numero_attestation,
-                date_creation=attestation.created_at,
-                url_download=url_signee,
-                souscription_id=attestation.souscription_id,
-                paiement_id=attestation.paiement_id
-            ))
+        documents.append(DocumentResponse(
+            id=attestation.id,
+            type=doc_type,
+            titre=titre,
+            numero=attestation.numero_attestation,
+            date_creation=attestation.created_at,
+            url_download=attestation.url_signee,
+            souscription_id=attestation.souscription_id,
+            paiement_id=attestation.paiement_id
+        ))
     
     # Récupérer les paiements (pour les reçus)
     for souscription in souscriptions:
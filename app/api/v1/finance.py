@@ -3,7 +3,7 @@ from decimal import Decimal
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, desc
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.core.enums import Role
 from app.api.v1.auth import get_current_user
 from app.models.user import User
@@ -262,7 +262,7 @@ async def get_movements(
     movement_type: Optional[str] = Query(None, description="Filter by movement type"),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """Obtenir la liste des mouvements financiers avec filtres"""
@@ -6,18 +6,21 @@ Mobility Health
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 from typing import List, Optional
 from pydantic import BaseModel
+import asyncio
 import tempfile
 import os
 import shutil
 from sqlalchemy.orm import Session
 
-from app.api.v1.auth import get_current_user
-from app.core.database import get_db
+from app.api.v1.auth import get_current_user, require_admin_user
+from app.core.database import get_db, get_read_db
 from app.models.user import User
 from app.models.assureur import Assureur
 
 # Import du module IA
-from app.ia_module import analyser_document, formater_pour_agent_production, router_assureur, storage_analyses
+from app.ia_module import formater_pour_agent_production, router_assureur, storage_analyses
+from app.ia_module.ocr_engine import ocr_engine, OCREngineSature
+from app.ia_module.queue_manager import queue_manager
 
 router = APIRouter(prefix="/ia", tags=["IA - Analyse Documents"])
 
@@ -47,6 +50,95 @@ class AnalyseResponse(BaseModel):
     data: Optional[dict] = None
 
 
+# ═══════════════════════════════════════════════════════════════
+# HELPERS
+# ═══════════════════════════════════════════════════════════════
+
+async def _analyser_fichiers(fichiers_temp: List[dict]) -> List[dict]:
+    """
+    Analyse les fichiers dans le pool OCR (hors boucle d'événements), en parallèle.
+
+    Les places du pool sont réservées pour tous les fichiers avant de soumettre le premier :
+    si le moteur est saturé, une HTTPException 503 est levée sans qu'aucune analyse n'ait
+    démarré. Un fichier qui dépasse OCR_JOB_TIMEOUT est rendu en erreur ; son analyse
+    n'est pas interrompue (voir _supprimer_fichiers_temp).
+    """
+    try:
+        futures = ocr_engine.soumettre_lot([fichier_info["path"] for fichier_info in fichiers_temp])
+    except OCREngineSature as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    for fichier_info, future in zip(fichiers_temp, futures):
+        fichier_info["future"] = future
+
+    resultats = await asyncio.gather(
+        *(ocr_engine.attendre_async(future, fichier_info["path"]) for fichier_info, future in zip(fichiers_temp, futures)),
+        return_exceptions=True
+    )
+
+    resultats_analyse = []
+    for fichier_info, resultat in zip(fichiers_temp, resultats):
+        if isinstance(resultat, Exception):
+            resultats_analyse.append({
+                "status": "error",
+                "nom_fichier": fichier_info["original_name"],
+                "erreur": str(resultat)
+            })
+            continue
+        # Emballer le résultat dans le format attendu par le formateur
+        resultats_analyse.append({
+            "status": resultat.get("status", "ok"),
+            "nom_fichier": fichier_info["original_name"],
+            "analyse": resultat  # Le formateur attend les données sous "analyse"
+        })
+    return resultats_analyse
+
+
+def _supprimer_fichier(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def _supprimer_fichiers_temp(fichiers_temp: List[dict]):
+    """
+    Supprime les fichiers temporaires ; celui d'une analyse encore en cours (timeout)
+    n'est supprimé qu'à la fin de l'analyse, pour ne pas disparaître sous le processus OCR.
+    """
+    for fichier_info in fichiers_temp:
+        future = fichier_info.get("future")
+        if future is not None and not future.done():
+            future.add_done_callback(lambda _future, path=fichier_info["path"]: _supprimer_fichier(path))
+        else:
+            _supprimer_fichier(fichier_info["path"])
+
+
+def _get_souscription_autorisee(db: Session, subscription_id: int, current_user: User, allowed_roles: set):
+    """
+    Charge la souscription et vérifie que l'utilisateur a un rôle autorisé
+    ou en est le titulaire (404 / 403 sinon).
+    """
+    from app.models.souscription import Souscription
+
+    souscription = db.query(Souscription).filter(
+        Souscription.id == subscription_id
+    ).first()
+
+    if not souscription:
+        raise HTTPException(
+            status_code=404,
+            detail="Souscription non trouvée"
+        )
+
+    if current_user.role not in allowed_roles and souscription.user_id != current_user.id:
+        raise HTTPException(
+            status_code=403,
+            detail="Accès non autorisé"
+        )
+
+    return souscription
+
+
 # ═══════════════════════════════════════════════════════════════
 # ENDPOINTS
 # ═══════════════════════════════════════════════════════════════
@@ -67,6 +159,9 @@ async def analyser_documents(
     - Effectue l'OCR et l'extraction d'informations
     - Sauvegarde les résultats dans la base de données
     - Retourne un résumé complet pour la décision
+    - 503 si le moteur OCR n'a pas de place pour tous les fichiers (aucune analyse démarrée)
+    - Un fichier qui dépasse le délai d'analyse est rendu en erreur ; son analyse
+      n'est pas interrompue et occupe le pool jusqu'à la fin
     
     **Rôles autorisés**: Agent de Production, Admin
     """
@@ -103,22 +198,8 @@ async def analyser_documents(
                 "original_name": fichier.filename
             })
         
-        # Analyser chaque fichier
-        for fichier_info in fichiers_temp:
-            try:
-                resultat = analyser_document(fichier_info["path"])
-                # Emballer le résultat dans le format attendu par le formateur
-                resultats_analyse.append({
-                    "status": resultat.get("status", "ok"),
-                    "nom_fichier": fichier_info["original_name"],
-                    "analyse": resultat  # Le formateur attend les données sous "analyse"
-                })
-            except Exception as e:
-                resultats_analyse.append({
-                    "status": "error",
-                    "nom_fichier": fichier_info["original_name"],
-                    "erreur": str(e)
-                })
+        # Analyser les fichiers dans le pool OCR
+        resultats_analyse = await _analyser_fichiers(fichiers_temp)
         
         # Formater pour l'Agent de Production
         resultat_final = formater_pour_agent_production(
@@ -180,6 +261,8 @@ async def analyser_documents(
             data=resultat_final
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -188,11 +271,7 @@ async def analyser_documents(
     
     finally:
         # Nettoyer les fichiers temporaires
-        for fichier_info in fichiers_temp:
-            try:
-                os.unlink(fichier_info["path"])
-            except:
-                pass
+        _supprimer_fichiers_temp(fichiers_temp)
 
 
 @router.post("/analyser-avec-statut-medical", response_model=AnalyseResponse)
@@ -214,6 +293,9 @@ async def analyser_avec_statut_medical(
     - fichiers: Documents à analyser
     - demande_id: ID de la demande de souscription
     - statut_medical_json: JSON du statut médical (optionnel)
+    
+    Comme /analyser-documents : 503 avant toute analyse si le moteur OCR est saturé ;
+    un délai dépassé ne stoppe pas l'analyse en cours.
     """
     import json
     
@@ -242,20 +324,7 @@ async def analyser_avec_statut_medical(
                 "original_name": fichier.filename
             })
         
-        for fichier_info in fichiers_temp:
-            try:
-                resultat = analyser_document(fichier_info["path"])
-                resultats_analyse.append({
-                    "status": resultat.get("status", "ok"),
-                    "nom_fichier": fichier_info["original_name"],
-                    "analyse": resultat
-                })
-            except Exception as e:
-                resultats_analyse.append({
-                    "status": "error",
-                    "nom_fichier": fichier_info["original_name"],
-                    "erreur": str(e)
-                })
+        resultats_analyse = await _analyser_fichiers(fichiers_temp)
         
         resultat_final = formater_pour_agent_production(
             resultats_analyse=resultats_analyse,
@@ -313,6 +382,8 @@ async def analyser_avec_statut_medical(
             data=resultat_final
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -320,17 +391,13 @@ async def analyser_avec_statut_medical(
         )
     
     finally:
-        for fichier_info in fichiers_temp:
-            try:
-                os.unlink(fichier_info["path"])
-            except:
-                pass
+        _supprimer_fichiers_temp(fichiers_temp)
 
 
 @router.get("/souscriptions/{subscription_id}/analyse")
 async def get_subscription_ia_analysis(
     subscription_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -338,34 +405,17 @@ async def get_subscription_ia_analysis(
     
     **Rôles autorisés**: Agent de Production, Admin, Médecin MH, Agent Technique
     """
-    from app.models.souscription import Souscription
     from app.models.ia_analysis import IAAnalysis
     from app.core.enums import Role
     
-    # Vérifier que la souscription existe
-    souscription = db.query(Souscription).filter(
-        Souscription.id == subscription_id
-    ).first()
-    
-    if not souscription:
-        raise HTTPException(
-            status_code=404,
-            detail="Souscription non trouvée"
-        )
-    
-    # Vérifier les permissions
+    # Vérifier que la souscription existe et les permissions
     allowed_roles = {
         Role.PRODUCTION_AGENT,
         Role.ADMIN,
         Role.MEDICAL_REVIEWER,
         Role.TECHNICAL_REVIEWER
     }
-    
-    if current_user.role not in allowed_roles and souscription.user_id != current_user.id:
-        raise HTTPException(
-            status_code=403,
-            detail="Accès non autorisé"
-        )
+    _get_souscription_autorisee(db, subscription_id, current_user, allowed_roles)
     
     # Récupérer l'analyse IA
     analyse = db.query(IAAnalysis).filter(
@@ -438,6 +488,119 @@ async def get_subscription_ia_analysis(
     }
 
 
+@router.get("/souscriptions/{subscription_id}/analyse/statut")
+async def get_subscription_ia_analysis_status(
+    subscription_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    ⏳ Avancement de l'analyse IA d'une souscription (file Celery `ia_analysis`)
+    
+    Statuts: non_demarre, en_attente, en_cours, termine, aucun_document, echec
+    
+    **Rôles autorisés**: Agent de Production, Admin, Médecin MH, Agent Technique, titulaire
+    """
+    from app.models.ia_analysis import IAAnalysis
+    from app.services.ia_auto_service import IAAutoService
+    from app.core.enums import Role
+    
+    allowed_roles = {
+        Role.PRODUCTION_AGENT,
+        Role.ADMIN,
+        Role.MEDICAL_REVIEWER,
+        Role.TECHNICAL_REVIEWER
+    }
+    _get_souscription_autorisee(db, subscription_id, current_user, allowed_roles)
+    
+    statut = IAAutoService.get_analysis_status(subscription_id)
+    if statut is None:
+        # Statut expiré ou analyse antérieure : se rabattre sur la base
+        analyse = db.query(IAAnalysis).filter(
+            IAAnalysis.souscription_id == subscription_id
+        ).order_by(IAAnalysis.date_analyse.desc()).first()
+        if analyse:
+            statut = {
+                "souscription_id": subscription_id,
+                "statut": "termine",
+                "etape": "termine",
+                "progression": 100,
+                "demande_id": analyse.demande_id,
+                "mis_a_jour_le": analyse.date_analyse.isoformat() if analyse.date_analyse else None
+            }
+        else:
+            statut = {
+                "souscription_id": subscription_id,
+                "statut": "non_demarre",
+                "etape": None,
+                "progression": 0
+            }
+    
+    return {
+        "success": True,
+        "message": "Statut de l'analyse IA",
+        "data": statut
+    }
+
+
+@router.post("/souscriptions/{subscription_id}/analyse/relancer")
+async def relancer_subscription_ia_analysis(
+    subscription_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    🔁 Relance l'analyse IA d'une souscription (ré-analyse même si un rapport existe)
+    
+    Sans effet si une analyse est déjà en attente ou en cours.
+    
+    **Rôles autorisés**: Agent de Production, Admin
+    """
+    from app.services.ia_auto_service import IAAutoService, IA_PRIORITY_RELANCE
+    from app.core.enums import Role
+    
+    if current_user.role not in {Role.PRODUCTION_AGENT, Role.ADMIN}:
+        raise HTTPException(
+            status_code=403,
+            detail="Accès non autorisé"
+        )
+    _get_souscription_autorisee(db, subscription_id, current_user, {Role.PRODUCTION_AGENT, Role.ADMIN})
+    
+    statut = IAAutoService.enqueue_ia_analysis(
+        subscription_id,
+        source=f"relance:{current_user.id}",
+        priority=IA_PRIORITY_RELANCE,
+        force=True
+    )
+    return {
+        "success": statut.get("mise_en_file", False),
+        "message": "Analyse IA planifiée" if statut.get("mise_en_file") else "Analyse IA déjà en cours ou non planifiable",
+        "data": statut
+    }
+
+
+@router.get("/queue/stats")
+async def get_queue_stats(
+    current_user: User = Depends(require_admin_user)
+):
+    """
+    📊 Métriques de la file d'analyse IA et du moteur OCR (monitoring)
+    
+    Compteurs par statut, profondeur de file et histogrammes de latence
+    (attente, traitement) ; buckets cumulés au format Prometheus.
+    
+    **Rôles autorisés**: Admin
+    """
+    return {
+        "success": True,
+        "message": "Statistiques de la file d'analyse IA",
+        "data": {
+            "queue": queue_manager.get_stats(),
+            "ocr": ocr_engine.get_stats()
+        }
+    }
+
+
 @router.get("/health")
 async def health_check():
     """Vérification que le module IA est opérationnel"""
@@ -446,7 +609,8 @@ async def health_check():
         return {
             "status": "ok",
             "module": "ia_module",
-            "message": "Module IA opérationnel"
+            "message": "Module IA opérationnel",
+            "ocr": ocr_engine.get_stats()
         }
     except Exception as e:
         return {
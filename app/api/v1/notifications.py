@@ -87,7 +87,7 @@ class NotificationResponse(BaseModel):
         from_attributes = True
 
 
-async def _get_notifications_handler(
+def _get_notifications_handler(
     skip: int = 0,
     limit: int = 100,
     type_notification: Optional[str] = None,
@@ -139,7 +139,7 @@ async def _get_notifications_handler(
 
 # Route avec trailing slash (pour compatibilité)
 @router.get("/", response_model=List[NotificationResponse])
-async def get_notifications_with_slash(
+def get_notifications_with_slash(
     skip: int = 0,
     limit: int = 100,
     type_notification: Optional[str] = None,
@@ -148,14 +148,14 @@ async def get_notifications_with_slash(
     current_user: User = Depends(get_current_user)
 ):
     """Get user notifications (with trailing slash)"""
-    return await _get_notifications_handler(skip, limit, type_notification, is_read, db, current_user)
+    return _get_notifications_handler(skip, limit, type_notification, is_read, db, current_user)
 
 
 # Note: La route sans trailing slash est ajoutée dans __init__.py via add_api_route
 
 
 @router.get("/{notification_id}", response_model=NotificationResponse)
-async def get_notification(
+def get_notification(
     notification_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -188,7 +188,7 @@ async def get_notification(
 
 
 @router.patch("/{notification_id}/read", response_model=NotificationResponse)
-async def mark_notification_as_read(
+def mark_notification_as_read(
     notification_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -787,34 +787,10 @@ async def checkout_payment(
         user=current_user
     )
 
-    # Déclencher l'analyse IA automatiquement en arrière-plan
+    # Déclencher l'analyse IA automatiquement (file Celery dédiée, idempotente par souscription)
     try:
         from app.services.ia_auto_service import IAAutoService
-        from app.core.database import SessionLocal
-        # Lancer en arrière-plan (non bloquant)
-        import threading
-        subscription_id = souscription.id  # Capturer l'ID avant le thread
-        
-        def run_ia_analysis():
-            try:
-                # Créer une nouvelle session pour le thread
-                db_thread = SessionLocal()
-                try:
-                    # Recharger la souscription dans la nouvelle session
-                    souscription_thread = db_thread.query(Souscription).filter(
-                        Souscription.id == subscription_id
-                    ).first()
-                    if souscription_thread:
-                        IAAutoService.trigger_ia_analysis(db=db_thread, souscription=souscription_thread, background=True)
-                finally:
-                    db_thread.close()
-            except Exception as e:
-                logger.error(f"Erreur lors de l'analyse IA en arrière-plan: {e}", exc_info=True)
-        
-        thread = threading.Thread(target=run_ia_analysis)
-        thread.daemon = True
-        thread.start()
-        logger.info(f"🔍 Analyse IA lancée en arrière-plan pour souscription {souscription.id}")
+        IAAutoService.enqueue_ia_analysis(souscription.id, source="checkout")
     except Exception as e:
         logger.warning(f"Impossible de lancer l'analyse IA automatique: {e}", exc_info=True)
 
@@ -996,31 +972,10 @@ async def confirm_payment(
         db.refresh(souscription)
         db.refresh(attestation)
         
-        # Déclencher l'analyse IA automatiquement en arrière-plan
+        # Déclencher l'analyse IA automatiquement (file Celery dédiée, idempotente par souscription)
         try:
             from app.services.ia_auto_service import IAAutoService
-            from app.core.database import SessionLocal
-            import threading
-            subscription_id = souscription.id
-            
-            def run_ia_analysis():
-                try:
-                    db_thread = SessionLocal()
-                    try:
-                        souscription_thread = db_thread.query(Souscription).filter(
-                            Souscription.id == subscription_id
-                        ).first()
-                        if souscription_thread:
-                            IAAutoService.trigger_ia_analysis(db=db_thread, souscription=souscription_thread, background=True)
-                    finally:
-                        db_thread.close()
-                except Exception as e:
-                    logger.error(f"Erreur lors de l'analyse IA en arrière-plan: {e}", exc_info=True)
-            
-            thread = threading.Thread(target=run_ia_analysis)
-            thread.daemon = True
-            thread.start()
-            logger.info(f"🔍 Analyse IA lancée en arrière-plan pour souscription {souscription.id}")
+            IAAutoService.enqueue_ia_analysis(souscription.id, source="confirmation_paiement")
         except Exception as e:
             logger.warning(f"Impossible de lancer l'analyse IA automatique: {e}", exc_info=True)
         
@@ -1,10 +1,10 @@
 from typing import List, Optional
 from datetime import datetime
 from decimal import Decimal
-from fastapi import APIRouter, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session, joinedload, selectinload
 from sqlalchemy import func
-from app.core.database import get_db, SessionLocal
+from app.core.database import get_db
 from app.core.enums import Role, StatutWorkflowSinistre
 from app.api.v1.auth import get_current_user
 from app.models.user import User
@@ -15,6 +15,7 @@ from app.models.souscription import Souscription
 from app.models.questionnaire import Questionnaire
 from app.models.notification import Notification
 from app.models.prestation import Prestation
+from app.models.hospital_stay import HospitalStay
 from app.schemas.alerte import AlerteCreate, AlerteResponse
 from app.schemas.sinistre import (
     SinistreResponse,
@@ -26,55 +27,22 @@ from app.schemas.sinistre import (
 )
 from app.schemas.questionnaire import QuestionnaireResponse
 from app.schemas.hospital_stay import HospitalStayResponse
-from app.services.sinistre_workflow_service import ensure_workflow_steps, update_workflow_step
+from app.schemas.hospital import HospitalNearbyResponse
+from app.services.sinistre_workflow_service import (
+    ensure_workflow_steps,
+    project_workflow_steps,
+    update_workflow_step,
+)
+from app.services.hospital_index import find_nearest_active_hospital
+from app.services.hospital_ranking_service import rank_nearby_hospitals, MAX_RESULTATS
 from pydantic import BaseModel
 import uuid
-import json
-import asyncio
-from typing import Dict, Set
 
 router = APIRouter()
 
-# Gestionnaire de connexions WebSocket
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[int, Set[WebSocket]] = {}  # user_id -> set of websockets
-    
-    async def connect(self, websocket: WebSocket, user_id: int):
-        await websocket.accept()
-        if user_id not in self.active_connections:
-            self.active_connections[user_id] = set()
-        self.active_connections[user_id].add(websocket)
-    
-    def disconnect(self, websocket: WebSocket, user_id: int):
-        if user_id in self.active_connections:
-            self.active_connections[user_id].discard(websocket)
-            if not self.active_connections[user_id]:
-                del self.active_connections[user_id]
-    
-    async def send_personal_message(self, message: dict, user_id: int):
-        if user_id in self.active_connections:
-            disconnected = set()
-            for connection in self.active_connections[user_id]:
-                try:
-                    await connection.send_json(message)
-                except:
-                    disconnected.add(connection)
-            # Nettoyer les connexions déconnectées
-            for conn in disconnected:
-                self.active_connections[user_id].discard(conn)
-    
-    async def broadcast_to_role(self, message: dict, role: Role):
-        """Diffuser un message à tous les utilisateurs d'un rôle"""
-        db = SessionLocal()
-        try:
-            users = db.query(User).filter(User.role == role, User.is_active == True).all()
-            for user in users:
-                await self.send_personal_message(message, user.id)
-        finally:
-            db.close()
-
-manager = ConnectionManager()
+# Gestionnaire de connexions WebSocket (diffusion inter-workers via Redis pub/sub),
+# réexporté pour app.api.websocket et hospital_sinistres
+from app.core.websocket_manager import ConnectionManager, manager  # noqa: E402,F401
 
 
 def enrich_alerte_with_related_data(
@@ -160,22 +128,8 @@ def calculate_distance(lat1: Decimal, lon1: Decimal, lat2: Decimal, lon2: Decima
 
 
 def find_nearest_hospital(latitude: Decimal, longitude: Decimal, db: Session) -> Optional[Hospital]:
-    """Trouver l'hôpital le plus proche"""
-    hospitals = db.query(Hospital).filter(Hospital.est_actif == True).all()
-    
-    if not hospitals:
-        return None
-    
-    nearest = None
-    min_distance = float('inf')
-    
-    for hospital in hospitals:
-        distance = calculate_distance(latitude, longitude, hospital.latitude, hospital.longitude)
-        if distance < min_distance:
-            min_distance = distance
-            nearest = hospital
-    
-    return nearest
+    """Trouver l'hôpital actif le plus proche (index spatial en mémoire, sans parcourir la table)"""
+    return find_nearest_active_hospital(db, latitude, longitude)
 
 
 def user_has_hospital_access(user: User, sinistre: Optional[Sinistre], db: Session) -> bool:
@@ -279,7 +233,7 @@ def _questionnaire_excerpt(questionnaire: Optional[Questionnaire]) -> Optional[s
         return None
 
 
-async def notify_hospital_reception(
+def notify_hospital_reception(
     db: Session,
     sinistre: Sinistre,
     alerte: Alerte,
@@ -376,7 +330,7 @@ async def notify_hospital_reception(
             "hospital": hospital_payload,
             "medical_questionnaire": questionnaire_payload,
         }
-        await manager.send_personal_message(payload, user.id)
+        manager.send_personal_message_from_thread(payload, user.id)
         
         try:
             from app.workers.tasks import send_notification_multi_channel
@@ -407,7 +361,7 @@ def generate_numero_sinistre() -> str:
 
 
 @router.post("/trigger", response_model=AlerteResponse, status_code=status.HTTP_201_CREATED)
-async def trigger_sos(
+def trigger_sos(
     alerte_data: AlerteCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -515,7 +469,7 @@ async def trigger_sos(
         db.flush()  # Pour obtenir l'ID de la notification
         
         # Envoyer via WebSocket
-        await manager.send_personal_message({
+        manager.send_personal_message_from_thread({
             "type": "new_alert",
             "alerte_id": alerte.id,
             "sinistre_id": sinistre.id,
@@ -572,7 +526,7 @@ async def trigger_sos(
         db.flush()
         
         # Envoyer via WebSocket
-        await manager.send_personal_message({
+        manager.send_personal_message_from_thread({
             "type": "new_alert",
             "alerte_id": alerte.id,
             "sinistre_id": sinistre.id,
@@ -598,7 +552,7 @@ async def trigger_sos(
             pass
     
     medical_questionnaire = get_latest_questionnaire(db, souscription.id)
-    await notify_hospital_reception(
+    notify_hospital_reception(
         db=db,
         sinistre=sinistre,
         alerte=alerte,
@@ -617,13 +571,45 @@ async def trigger_sos(
     return alerte
 
 
+@router.get("/hospitals/nearby", response_model=List[HospitalNearbyResponse])
+def get_nearby_hospitals(
+    latitude: float = Query(..., ge=-90, le=90),
+    longitude: float = Query(..., ge=-180, le=180),
+    limit: int = Query(5, ge=1, le=MAX_RESULTATS),
+    examens: List[str] = Query(default=[], description="Examens requis (catalogue de l'hôpital)"),
+    actes: List[str] = Query(default=[], description="Actes requis, par code ou par nom"),
+    personnel_actif: bool = Query(True, description="Uniquement les hôpitaux avec du personnel actif"),
+    rayon_km: Optional[float] = Query(None, gt=0),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Hôpitaux alternatifs les plus proches d'une position, par temps de trajet estimé (opérateurs SOS)"""
+    allowed_roles = {Role.ADMIN, Role.SOS_OPERATOR, Role.MEDECIN_REFERENT_MH, Role.DOCTOR, Role.AGENT_SINISTRE_MH}
+    if current_user.role not in allowed_roles:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Accès non autorisé"
+        )
+    
+    return rank_nearby_hospitals(
+        db,
+        latitude,
+        longitude,
+        limit=limit,
+        examens=examens,
+        actes=actes,
+        personnel_actif=personnel_actif,
+        rayon_km=rayon_km,
+    )
+
+
 # Statuts considérés comme "clôturés" : à exclure de la liste "alertes en temps réel"
 ALERTE_STATUTS_CLOTURES = {"resolue", "annulee"}
 
 
 @router.get("", response_model=List[AlerteResponse])
 @router.get("/", response_model=List[AlerteResponse])
-async def get_alertes(
+def get_alertes(
     skip: int = 0,
     limit: int = 100,
     statut: Optional[str] = None,
@@ -675,12 +661,14 @@ async def get_alertes(
         db.query(Sinistre)
         .options(
             selectinload(Sinistre.workflow_steps),
-            selectinload(Sinistre.hospital_stay),
+            selectinload(Sinistre.hospital_stay).selectinload(HospitalStay.invoice),
         )
         .filter(Sinistre.alerte_id.in_(alerte_ids))
         .all()
     )
     sinistre_map = {sinistre.alerte_id: sinistre for sinistre in sinistres}
+    # Projection en lecture seule : les étapes sont matérialisées au commit des écritures
+    workflow_map = project_workflow_steps(sinistres, {alerte.id: alerte for alerte in alertes})
 
     hospital_ids = [sinistre.hospital_id for sinistre in sinistres if sinistre.hospital_id]
     hospital_map = {}
@@ -710,24 +698,13 @@ async def get_alertes(
             "numero_souscription",
             souscription_map.get(alerte.souscription_id) if alerte.souscription_id else None,
         )
-        steps = []
-        if sinistre:
-            steps_orm, _ = ensure_workflow_steps(db, sinistre, alerte)
-            for s in sorted(steps_orm, key=lambda x: x.ordre):
-                steps.append({
-                    "step_key": s.step_key,
-                    "titre": s.titre,
-                    "ordre": s.ordre,
-                    "statut": s.statut,
-                    "completed_at": getattr(s, "completed_at", None),
-                })
-        setattr(alerte, "workflow_steps", steps)
+        setattr(alerte, "workflow_steps", workflow_map.get(sinistre.id, []) if sinistre else [])
 
     return alertes
 
 
 @router.get("/{alerte_id}", response_model=AlerteResponse)
-async def get_alerte(
+def get_alerte(
     alerte_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -780,7 +757,7 @@ async def get_alerte(
 
 
 @router.get("/{alerte_id}/sinistre", response_model=SinistreDetailResponse)
-async def get_sinistre_by_alerte(
+def get_sinistre_by_alerte(
     alerte_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -930,7 +907,7 @@ async def get_sinistre_by_alerte(
     response_model=SinistreWorkflowStepResponse,
     status_code=status.HTTP_200_OK,
 )
-async def verify_alert_veracity(
+def verify_alert_veracity(
     sinistre_id: int,
     verification: SinistreVerificationRequest,
     db: Session = Depends(get_db),
@@ -60,7 +60,7 @@ class SouscriptionStartRequest(BaseModel):
 
 
 @router.post("/start", response_model=SouscriptionResponse, status_code=status.HTTP_201_CREATED)
-async def start_subscription(
+def start_subscription(
     subscription_data: SouscriptionStartRequest,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -207,7 +207,7 @@ async def start_subscription(
     return souscription
 
 
-async def _get_subscriptions_impl(
+def _get_subscriptions_impl(
     skip: int = 0,
     limit: int = 100,
     db: Session = None,
@@ -245,29 +245,29 @@ async def _get_subscriptions_impl(
 
 
 @router.get("/", response_model=List[SouscriptionResponse])
-async def get_subscriptions(
+def get_subscriptions(
     skip: int = 0,
     limit: int = 100,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Obtenir la liste des souscriptions de l'utilisateur (avec slash)"""
-    return await _get_subscriptions_impl(skip=skip, limit=limit, db=db, current_user=current_user)
+    return _get_subscriptions_impl(skip=skip, limit=limit, db=db, current_user=current_user)
 
 
 @router.get("", response_model=List[SouscriptionResponse], include_in_schema=False)
-async def get_subscriptions_no_slash(
+def get_subscriptions_no_slash(
     skip: int = 0,
     limit: int = 100,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Obtenir la liste des souscriptions de l'utilisateur (sans slash - pour compatibilité mobile)"""
-    return await _get_subscriptions_impl(skip=skip, limit=limit, db=db, current_user=current_user)
+    return _get_subscriptions_impl(skip=skip, limit=limit, db=db, current_user=current_user)
 
 
 @router.get("/pending-resiliations", response_model=List[SouscriptionResponse])
-async def get_pending_resiliations(
+def get_pending_resiliations(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_production_agent)
 ):
@@ -288,7 +288,7 @@ async def get_pending_resiliations(
 
 
 @router.get("/{subscription_id}/user-photo")
-async def get_subscription_user_photo(
+def get_subscription_user_photo(
     subscription_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -376,7 +376,7 @@ async def get_subscription_user_photo(
 
 
 @router.get("/{subscription_id}", response_model=SouscriptionResponse)
-async def get_subscription(
+def get_subscription(
     subscription_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -405,7 +405,7 @@ async def get_subscription(
 
 
 @router.get("/{subscription_id}/ecard", response_model=ECardResponse)
-async def get_subscription_ecard(
+def get_subscription_ecard(
     subscription_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
@@ -496,7 +496,7 @@ async def get_subscription_ecard(
 
 
 @router.get("/{subscription_id}/ecard/download")
-async def download_subscription_ecard(
+def download_subscription_ecard(
     subscription_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
@@ -648,7 +648,7 @@ class ResiliationDecisionRequest(BaseModel):
 
 
 @router.post("/{subscription_id}/request-resiliation", response_model=SouscriptionResponse)
-async def request_resiliation(
+def request_resiliation(
     subscription_id: int,
     request: ResiliationRequest,
     db: Session = Depends(get_db),
@@ -696,7 +696,7 @@ async def request_resiliation(
 
 
 @router.post("/{subscription_id}/process-resiliation", response_model=SouscriptionResponse)
-async def process_resiliation(
+def process_resiliation(
     subscription_id: int,
     decision: ResiliationDecisionRequest,
     db: Session = Depends(get_db),
@@ -808,7 +808,7 @@ async def process_resiliation(
 
 
 @router.delete("/{subscription_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_subscription(
+def delete_subscription(
     subscription_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
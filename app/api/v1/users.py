@@ -1,5 +1,5 @@
 from typing import List, Union
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from sqlalchemy import or_
@@ -13,6 +13,7 @@ from app.services.user_service import UserService
 from app.models.attestation import Attestation
 from app.models.souscription import Souscription
 from app.schemas.attestation import AttestationResponse
+from app.services.attestation_service import AttestationService
 from pydantic import BaseModel, EmailStr, field_serializer
 
 router = APIRouter()
@@ -229,6 +230,8 @@ async def get_my_attestations(
         .order_by(Attestation.created_at.desc())
         .all()
     )
+    # URLs fraîches signées en une passe à partir des clés stockées (pas de commit)
+    AttestationService.sign_attestation_urls(attestations, expires=timedelta(hours=24))
     return attestations
 
 @router.get("/search/{username}", response_model=UserResponse)
@@ -387,6 +387,7 @@ def _serialize_document(document: ProjetVoyageDocument) -> ProjetVoyageDocumentR
             document.bucket_name,
             document.object_name,
             expires=timedelta(minutes=30),
+            known_object=True,
         )
     except Exception as error:
         logger.warning("Impossible de générer l'URL signée pour le document %s: %s", document.id, error)
@@ -1,19 +1,46 @@
+import json
+from typing import Optional
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
+from starlette.concurrency import run_in_threadpool
 from app.api.v1.sos import manager
 from app.core.security import decode_token
 from app.core.database import SessionLocal
 from app.models.user import User
 from app.core.enums import Role
+from app.services.principal_cache import principal_cache
 
 router = APIRouter()
 
 
+def _charger_principal(username: str):
+    """
+    Colonnes de l'utilisateur du jeton, lues hors de la boucle asyncio. La connexion à la
+    base est rendue aussitôt : elle n'est pas retenue pendant toute la vie du WebSocket.
+    """
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == username).first()
+        return principal_cache.put(user) if user else None
+    finally:
+        db.close()
+
+
 @router.websocket("/ws/sos")
-async def websocket_sos(websocket: WebSocket, token: str = Query(None)):
+async def websocket_sos(
+    websocket: WebSocket,
+    token: str = Query(None),
+    batch: bool = Query(False),
+    last_event_id: Optional[str] = Query(None),
+):
     """
     WebSocket pour les agents sinistre.
     Permet la communication en temps réel des alertes SOS.
     Authentification via query parameter token.
+    `batch=true` : les messages accumulés pendant une rafale arrivent groupés dans une
+    trame {"type": "batch", "messages": [...]}.
+    Le serveur envoie un {"type": "heartbeat"} en l'absence de trafic.
+    Chaque notification porte un `event_id` : à la reconnexion, `last_event_id` fait
+    rejouer les notifications manquées (ou envoie {"type": "resync_required"}).
     """
     # Authentification via token dans les query params
     if not token:
@@ -27,41 +54,42 @@ async def websocket_sos(websocket: WebSocket, token: str = Query(None)):
         return
     
     username = payload.get("sub")
-    db = SessionLocal()
+    principal = principal_cache.get(username) if username else None
+    if principal is None and username:
+        principal = await run_in_threadpool(_charger_principal, username)
+
+    if not principal or not principal["is_active"]:
+        await websocket.close(code=1008, reason="Utilisateur invalide")
+        return
+    
+    # Vérifier que l'utilisateur est un agent sinistre, médecin ou admin
+    user_id, role = principal["id"], principal["role"]
+    if role not in [Role.SOS_OPERATOR, Role.DOCTOR, Role.ADMIN]:
+        await websocket.close(code=1008, reason="Accès non autorisé")
+        return
+    
+    await manager.connect(websocket, user_id, role, batch=batch, last_event_id=last_event_id)
     try:
-        user = db.query(User).filter(User.username == username).first()
-        if not user or not user.is_active:
-            await websocket.close(code=1008, reason="Utilisateur invalide")
-            return
-        
-        # Vérifier que l'utilisateur est un agent sinistre, médecin ou admin
-        if user.role not in [Role.SOS_OPERATOR, Role.DOCTOR, Role.ADMIN]:
-            await websocket.close(code=1008, reason="Accès non autorisé")
-            return
-        
-        await manager.connect(websocket, user.id)
-        
-        # Envoyer un message de bienvenue
-        await websocket.send_json({
+        # Envoyer un message de bienvenue (les envois passent par la file de la socket)
+        manager.send_to_socket(websocket, {
             "type": "connected",
             "message": "Connexion WebSocket établie",
-            "user_id": user.id,
-            "role": user.role.value
-        })
+            "user_id": user_id,
+            "role": role.value
+        }, prioritaire=True)
         
         # Écouter les messages
-        try:
-            while True:
-                data = await websocket.receive_text()
-                # Traiter les messages entrants si nécessaire
-                try:
-                    import json
-                    message = json.loads(data)
-                    if message.get("type") == "ping":
-                        await websocket.send_json({"type": "pong"})
-                except:
-                    pass
-        except WebSocketDisconnect:
-            manager.disconnect(websocket, user.id)
+        while True:
+            data = await websocket.receive_text()
+            manager.touch(websocket)
+            # Traiter les messages entrants si nécessaire
+            try:
+                message = json.loads(data)
+                if message.get("type") == "ping":
+                    manager.send_to_socket(websocket, {"type": "pong"})
+            except:
+                pass
+    except WebSocketDisconnect:
+        pass
     finally:
-        db.close()
+        manager.disconnect(websocket, user_id)
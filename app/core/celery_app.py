@@ -89,6 +89,12 @@ celery_app.conf.task_routes = {
     "app.workers.tasks.schedule_questionnaire_reminder": {"queue": "reminders"},
     "app.workers.tasks.process_questionnaire_reminders": {"queue": "reminders"},
     
+    # Analyse IA (workers dédiés : OCR coûteux, hors notifications)
+    "app.workers.tasks.analyse_souscription_ia": {"queue": "ia_analysis"},
+    
+    # Régénération en masse des attestations (rendu PDF / cartes, pool de processus)
+    "app.workers.tasks.regenerate_attestations": {"queue": "documents"},
+    
     # Tâches périodiques
     "app.workers.tasks.process_pending_notifications": {"queue": "default"},
     "app.workers.tasks.retry_failed_tasks": {"queue": "default"},
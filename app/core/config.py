@@ -9,6 +9,13 @@ class Settings(BaseSettings):
     # Pour la production : PostgreSQL (décommenter et configurer DATABASE_URL)
     DATABASE_URL: str = "sqlite:///./mobility_health.db"  # SQLite pour développement
     # DATABASE_URL: str  # PostgreSQL pour production - décommenter quand nécessaire
+    # Pool de connexions (par worker)
+    DATABASE_POOL_SIZE: int = 10
+    DATABASE_MAX_OVERFLOW: int = 20
+    DATABASE_POOL_TIMEOUT: int = 30  # secondes d'attente max d'une connexion libre
+    DATABASE_POOL_RECYCLE: int = -1  # durée de vie max d'une connexion (-1 = illimitée)
+    # Réplique en lecture pour les tableaux de bord et listes (vide = base principale)
+    DATABASE_READ_URL: str = ""
     
     # Redis
     REDIS_URL: str = "redis://localhost:6379/0"
@@ -24,6 +31,13 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
+    # Durée de mise en cache de l'utilisateur authentifié (0 = désactivé)
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 30
+    
+    # Journal d'audit des requêtes : tampon mémoire borné, écrit en base par lots
+    AUDIT_BUFFER_MAX_RECORDS: int = 10000
+    AUDIT_BATCH_SIZE: int = 500
+    AUDIT_FLUSH_INTERVAL_MS: int = 1000
     
     # Application
     DEBUG: bool = False
@@ -80,11 +94,15 @@ class Settings(BaseSettings):
     FCM_PROJECT_ID: str = ""
     
     # Attestations / Vérification
-<<<<<<< HEAD
     ATTESTATION_VERIFICATION_BASE_URL: str = "https://srv1324425.hstgr.cloud/api/v1"
-=======
-    ATTESTATION_VERIFICATION_BASE_URL: str = "https://mobility-health.ittechmed.com/api/v1"
->>>>>>> 7bf45370c0f1ce1cc4906e70652fe5d774263241
+    # Logos assureurs (PDF, e-carte) : délai avant revalidation ETag / Last-Modified
+    LOGO_CACHE_REVALIDATE_SECONDS: int = 300
+    # URLs signées MinIO réutilisées jusqu'à cette marge avant leur expiration
+    SIGNED_URL_SAFETY_MARGIN_SECONDS: int = 900
+    # Régénération en masse des attestations (tâche Celery, queue `documents`)
+    ATTESTATION_BATCH_WORKERS: int = 0  # Processus de rendu (0 = nombre de cœurs - 1)
+    ATTESTATION_BATCH_UPLOAD_CONCURRENCY: int = 8  # Uploads MinIO simultanés
+    ATTESTATION_BATCH_SIZE: int = 50  # Souscriptions par lot (un commit par lot)
     
     # Celery
     CELERY_BROKER_URL: str = ""  # Si différent de REDIS_URL
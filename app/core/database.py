@@ -1,16 +1,93 @@
+import threading
+import time
+
+from fastapi import Depends
 from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
 from app.core.config import settings
 
-engine = create_engine(
-    settings.DATABASE_URL,
-    pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20
-)
+
+class PoolMetrics:
+    """Attente au checkout, débordement et délais dépassés d'un pool de connexions"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.overflow_max = 0
+
+    def record_checkout(self, attente: float, overflow: int):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += attente
+            self.wait_seconds_max = max(self.wait_seconds_max, attente)
+            self.overflow_max = max(self.overflow_max, overflow)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def get_stats(self, pool: QueuePool) -> dict:
+        with self._lock:
+            return {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+                "overflow_max": self.overflow_max,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_avg": self.wait_seconds_total / self.checkouts if self.checkouts else 0.0,
+                "wait_seconds_max": self.wait_seconds_max,
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool qui mesure le temps passé à attendre une connexion libre"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        debut = time.perf_counter()
+        try:
+            connexion = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_checkout(time.perf_counter() - debut, self.overflow())
+        return connexion
+
+
+def _create_engine(url: str):
+    return create_engine(
+        url,
+        poolclass=InstrumentedQueuePool,
+        pool_pre_ping=True,
+        pool_size=settings.DATABASE_POOL_SIZE,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+        pool_timeout=settings.DATABASE_POOL_TIMEOUT,
+        pool_recycle=settings.DATABASE_POOL_RECYCLE,
+    )
+
+
+engine = _create_engine(settings.DATABASE_URL)
+
+# Réplique en lecture optionnelle : sans DATABASE_READ_URL, tout passe par la base principale
+read_engine = _create_engine(settings.DATABASE_READ_URL) if settings.DATABASE_READ_URL else None
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine) if read_engine else None
 
 Base = declarative_base()
 
@@ -24,19 +101,25 @@ def get_db():
         db.close()
 
 
+def get_read_db(db: Session = Depends(get_db)):
+    """
+    Session pour les endpoints en lecture seule (tableaux de bord, listes, rapports).
+    Servie par la réplique si DATABASE_READ_URL est défini, sinon par la session de get_db.
+    La réplique peut avoir un léger retard : à réserver aux lectures qui le tolèrent.
+    """
+    if ReadSessionLocal is None:
+        yield db
+        return
+    read_db = ReadSessionLocal()
+    try:
+        yield read_db
+    finally:
+        read_db.close()
 
 
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+def get_pool_stats() -> dict:
+    """Métriques des pools de connexions (principal et réplique)"""
+    stats = {"primary": engine.pool.metrics.get_stats(engine.pool)}
+    if read_engine is not None:
+        stats["replica"] = read_engine.pool.metrics.get_stats(read_engine.pool)
+    return stats
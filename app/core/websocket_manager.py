@@ -0,0 +1,537 @@
+"""
+Gestionnaire des connexions WebSocket temps réel (SOS), partagé entre les workers uvicorn.
+
+Chaque worker ne détient que ses propres sockets : les messages transitent par Redis pub/sub.
+- ws:user:<id>   : messages personnels, souscrit par les workers où l'utilisateur est connecté
+- ws:role:<rôle> : diffusions par rôle, souscrit par tous les workers
+Le même bus porte des canaux de service enregistrés par d'autres modules (ecouter_canal),
+par exemple l'invalidation du cache des utilisateurs authentifiés.
+Sans Redis (tests, développement mono-processus), la livraison reste locale au worker.
+
+Le rôle de chaque utilisateur est enregistré à la connexion : une diffusion par rôle est
+une simple lecture de dictionnaire, sans requête en base.
+
+Chaque socket a sa propre file d'envoi bornée, vidée par une tâche dédiée :
+- un client lent ne retarde ni l'émetteur ni les autres sockets ;
+- pendant une rafale, un nouvel état d'une même alerte/sinistre remplace celui encore en
+  attente (coalescence) ; si la file est pleine, les plus anciens messages sont abandonnés
+  et le client est prévenu (`messages_dropped`) pour recharger via l'API REST ;
+- les clients qui l'ont demandé (`batch=true`) reçoivent les messages en attente groupés
+  dans une seule trame `batch` ;
+- un `heartbeat` est envoyé en l'absence de trafic. Une socket dont l'envoi échoue ou
+  dépasse le délai est évincée, de même qu'un client qui a déjà parlé puis se tait plus
+  de HEARTBEAT_TIMEOUT_SECONDS (connexion à moitié ouverte).
+
+Chaque message personnel ou par rôle est aussi inscrit dans un journal borné (Redis Stream
+`ws:events`, ou tampon circulaire en mémoire sans Redis) et porte son `event_id`. Un client
+qui se reconnecte avec `last_event_id` reçoit uniquement les messages manqués ; si le
+journal ne couvre plus l'intervalle, il reçoit `resync_required` et recharge via l'API.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+import anyio.from_thread
+from fastapi import WebSocket
+
+from app.core.config import settings
+from app.core.enums import Role
+
+logger = logging.getLogger(__name__)
+
+CANAL_UTILISATEUR = "ws:user:{}"
+CANAL_ROLE = "ws:role:{}"
+MOTIF_CANAUX_ROLES = "ws:role:*"
+SEND_TIMEOUT_SECONDS = 5.0
+OUTBOX_MAX_MESSAGES = 256
+BATCH_MAX_MESSAGES = 50
+HEARTBEAT_INTERVAL_SECONDS = 25.0
+HEARTBEAT_TIMEOUT_SECONDS = 75.0
+CLE_JOURNAL = "ws:events"
+REPLAY_MAX_EVENTS = 1000
+
+# Messages décrivant l'état courant d'une alerte/d'un sinistre : seul le plus récent
+# encore en attente d'envoi est utile
+TYPES_COALESCABLES = frozenset({"new_alert", "hospital_assignment"})
+
+_compteur_messages = itertools.count()
+
+
+def cle_coalescence(message: dict) -> Hashable:
+    """Clé de remplacement dans la file d'envoi (unique si le message n'est pas coalescable)"""
+    type_message = message.get("type")
+    if type_message in TYPES_COALESCABLES or (type_message or "").endswith("_update"):
+        return (type_message, message.get("alerte_id"), message.get("sinistre_id"))
+    return next(_compteur_messages)
+
+
+class _Connexion:
+    """Une socket, sa file d'envoi bornée et la tâche qui la vide"""
+
+    def __init__(
+        self,
+        manager: "ConnectionManager",
+        websocket: WebSocket,
+        user_id: int,
+        batch: bool,
+        rattrapage: bool = False,
+    ):
+        self.manager = manager
+        self.websocket = websocket
+        self.user_id = user_id
+        self.batch = batch
+        self.file: "OrderedDict[Hashable, dict]" = OrderedDict()
+        self.abandonnes = 0
+        self.coalesces = 0
+        self.client_actif = False
+        self.derniere_activite = time.monotonic()
+        self._signal = asyncio.Event()
+        self.tache: Optional[asyncio.Task] = None
+        # event_id des messages mis en file avant la fin du rattrapage (dédoublonnage)
+        self.event_ids_recus: Optional[Set[str]] = set() if rattrapage else None
+
+    def enqueue(self, message: dict) -> Hashable:
+        if self.event_ids_recus is not None and "event_id" in message:
+            self.event_ids_recus.add(message["event_id"])
+        cle = cle_coalescence(message)
+        if cle in self.file:
+            self.coalesces += 1
+        self.file[cle] = message
+        while len(self.file) > self.manager.outbox_size:
+            self.file.popitem(last=False)
+            self.abandonnes += 1
+        self._signal.set()
+        return cle
+
+    def touch(self):
+        self.client_actif = True
+        self.derniere_activite = time.monotonic()
+
+    def _trames(self) -> List[dict]:
+        """Extrait de la file les trames à envoyer maintenant"""
+        limite = self.manager.batch_size if self.batch else 1
+        messages = []
+        while self.file and len(messages) < limite:
+            messages.append(self.file.popitem(last=False)[1])
+        abandonnes, self.abandonnes = self.abandonnes, 0
+        if self.batch and len(messages) > 1:
+            trame = {"type": "batch", "messages": messages}
+            if abandonnes:
+                trame["dropped"] = abandonnes
+            return [trame]
+        if abandonnes:
+            messages.insert(0, {"type": "messages_dropped", "count": abandonnes})
+        return messages
+
+    async def run(self):
+        while True:
+            if not self.file:
+                self._signal.clear()
+                try:
+                    await asyncio.wait_for(self._signal.wait(), timeout=self.manager.heartbeat_interval)
+                except asyncio.TimeoutError:
+                    if (
+                        self.client_actif
+                        and time.monotonic() - self.derniere_activite > self.manager.heartbeat_timeout
+                    ):
+                        logger.info(f"WebSocket de l'utilisateur {self.user_id} muet, connexion évincée")
+                        break
+                    self.file[next(_compteur_messages)] = {
+                        "type": "heartbeat",
+                        "timestamp": datetime.utcnow().isoformat(),
+                    }
+            for trame in self._trames():
+                if not await self.manager._envoyer(self.websocket, trame):
+                    await self.manager._evincer(self)
+                    return
+        await self.manager._evincer(self)
+
+
+def _id_flux(event_id: str) -> Tuple[int, int]:
+    """Identifiant d'entrée de stream Redis "<ms>-<seq>" en tuple comparable"""
+    ms, _, seq = event_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+class _JournalLocal:
+    """Tampon circulaire des derniers messages (worker unique, sans Redis)"""
+
+    def __init__(self, taille: int = REPLAY_MAX_EVENTS):
+        self._evenements: deque = deque(maxlen=taille)
+        self._sequence = itertools.count(1)
+        self._dernier = (0, 0)
+
+    async def ajouter(self, canal: str, message: dict) -> Optional[str]:
+        event_id = f"0-{next(self._sequence)}"
+        self._dernier = _id_flux(event_id)
+        self._evenements.append((self._dernier, canal, {**message, "event_id": event_id}))
+        return event_id
+
+    async def depuis(self, last_event_id: str, canaux: Set[str]) -> Optional[List[dict]]:
+        depart = _id_flux(last_event_id)
+        if depart > self._dernier or (self._evenements and self._evenements[0][0] > (0, depart[1] + 1)):
+            # Identifiant inconnu (redémarrage) ou événements suivants déjà sortis du tampon
+            return None
+        return [message for cle, canal, message in self._evenements if cle > depart and canal in canaux]
+
+
+class _JournalRedis:
+    """Redis Stream borné partagé par tous les workers"""
+
+    def __init__(self, redis_client, taille: int = REPLAY_MAX_EVENTS):
+        self._redis = redis_client
+        self._taille = taille
+
+    async def ajouter(self, canal: str, message: dict) -> Optional[str]:
+        return await self._redis.xadd(
+            CLE_JOURNAL,
+            {"canal": canal, "message": json.dumps(message, default=str)},
+            maxlen=self._taille,
+            approximate=True,
+        )
+
+    async def depuis(self, last_event_id: str, canaux: Set[str]) -> Optional[List[dict]]:
+        depart = _id_flux(last_event_id)
+        premiere = await self._redis.xrange(CLE_JOURNAL, count=1)
+        if premiere and _id_flux(premiere[0][0]) > depart:
+            return None
+        entrees = await self._redis.xrange(
+            CLE_JOURNAL, min=f"({depart[0]}-{depart[1]}", count=self._taille
+        )
+        messages = []
+        for event_id, champs in entrees:
+            if champs["canal"] in canaux:
+                messages.append({**json.loads(champs["message"]), "event_id": event_id})
+        return messages
+
+
+class ConnectionManager:
+    """Sockets WebSocket locales + bus Redis pub/sub pour la diffusion inter-workers"""
+
+    def __init__(
+        self,
+        send_timeout: float = SEND_TIMEOUT_SECONDS,
+        outbox_size: int = OUTBOX_MAX_MESSAGES,
+        batch_size: int = BATCH_MAX_MESSAGES,
+        heartbeat_interval: float = HEARTBEAT_INTERVAL_SECONDS,
+        heartbeat_timeout: float = HEARTBEAT_TIMEOUT_SECONDS,
+    ):
+        self.active_connections: Dict[int, Set[WebSocket]] = {}  # user_id -> set of websockets
+        self._connexions: Dict[WebSocket, _Connexion] = {}
+        self.users_by_role: Dict[Role, Set[int]] = {}  # rôle -> user_ids connectés à ce worker
+        self._user_roles: Dict[int, Role] = {}
+        self.send_timeout = send_timeout
+        self.outbox_size = outbox_size
+        self.batch_size = batch_size
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self._redis = None
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._journal = _JournalLocal()
+        self._canaux_service: Dict[str, Callable[[dict], None]] = {}
+
+    def ecouter_canal(self, canal: str, callback: Callable[[dict], None]):
+        """
+        Enregistre un canal de service du bus : `callback` reçoit chaque message (dict JSON)
+        publié sur `canal` par n'importe quel processus. À appeler avant start().
+        """
+        self._canaux_service[canal] = callback
+
+    @property
+    def distributed(self) -> bool:
+        """True quand les messages passent par le bus Redis"""
+        return self._listener is not None
+
+    async def start(self, redis_client=None):
+        """
+        Connecte le bus Redis et démarre l'écoute (démarrage de l'application).
+        En cas d'échec, le gestionnaire reste en livraison locale.
+        """
+        if self._listener is not None:
+            return
+        try:
+            if redis_client is None:
+                import redis.asyncio as aioredis
+                redis_client = aioredis.from_url(
+                    settings.REDIS_URL,
+                    decode_responses=True,
+                    socket_connect_timeout=5,
+                )
+            await redis_client.ping()
+            pubsub = redis_client.pubsub()
+            await pubsub.psubscribe(MOTIF_CANAUX_ROLES)
+            for canal in self._canaux_service:
+                await pubsub.subscribe(canal)
+            for user_id in list(self.active_connections):
+                await pubsub.subscribe(CANAL_UTILISATEUR.format(user_id))
+        except Exception as e:
+            logger.warning(f"⚠️ Bus WebSocket Redis indisponible, diffusion limitée à ce worker: {e}")
+            if redis_client is not None:
+                try:
+                    await redis_client.aclose()
+                except Exception:
+                    pass
+            return
+
+        self._redis = redis_client
+        self._pubsub = pubsub
+        self._journal = _JournalRedis(redis_client)
+        self._listener = asyncio.create_task(self._ecouter())
+        logger.info("✅ Bus WebSocket Redis démarré")
+
+    async def stop(self):
+        """Arrête l'écoute du bus (arrêt de l'application)"""
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.cancel()
+            try:
+                await listener
+            except asyncio.CancelledError:
+                pass
+        pubsub, self._pubsub = self._pubsub, None
+        client, self._redis = self._redis, None
+        self._journal = _JournalLocal()
+        for ressource in (pubsub, client):
+            if ressource is not None:
+                try:
+                    await ressource.aclose()
+                except Exception as e:
+                    logger.debug(f"Fermeture du bus WebSocket: {e}")
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        user_id: int,
+        role: Optional[Role] = None,
+        batch: bool = False,
+        last_event_id: Optional[str] = None,
+    ):
+        """
+        Enregistre une socket. Le rôle, déjà résolu lors de l'authentification du WebSocket,
+        rend l'utilisateur joignable par broadcast_to_role ; `batch` active les trames groupées.
+        Avec `last_event_id` (reconnexion), les messages manqués sont rejoués en tête de file.
+        """
+        await websocket.accept()
+        premiere_connexion = user_id not in self.active_connections
+        self.active_connections.setdefault(user_id, set()).add(websocket)
+        connexion = _Connexion(self, websocket, user_id, batch, rattrapage=bool(last_event_id))
+        self._connexions[websocket] = connexion
+        if role is not None:
+            self._enregistrer_role(user_id, Role(role))
+        if premiere_connexion and self._pubsub is not None:
+            try:
+                await self._pubsub.subscribe(CANAL_UTILISATEUR.format(user_id))
+            except Exception as e:
+                logger.warning(f"⚠️ Abonnement au canal de l'utilisateur {user_id} impossible: {e}")
+        if last_event_id:
+            await self._rejouer(connexion, role, last_event_id)
+        # L'envoi ne démarre qu'après le rattrapage, pour respecter l'ordre des messages
+        if self._connexions.get(websocket) is connexion:
+            connexion.tache = asyncio.create_task(connexion.run())
+
+    def disconnect(self, websocket: WebSocket, user_id: int):
+        connexion = self._connexions.pop(websocket, None)
+        if connexion is not None and connexion.tache is not None and connexion.tache is not _tache_courante():
+            connexion.tache.cancel()
+        if user_id in self.active_connections:
+            self.active_connections[user_id].discard(websocket)
+            if not self.active_connections[user_id]:
+                del self.active_connections[user_id]
+                self._retirer_role(user_id)
+                if self._pubsub is not None:
+                    try:
+                        asyncio.get_running_loop().create_task(self._desabonner(user_id))
+                    except RuntimeError:
+                        pass
+
+    def _enregistrer_role(self, user_id: int, role: Role):
+        if self._user_roles.get(user_id) != role:
+            self._retirer_role(user_id)
+            self._user_roles[user_id] = role
+            self.users_by_role.setdefault(role, set()).add(user_id)
+
+    def _retirer_role(self, user_id: int):
+        role = self._user_roles.pop(user_id, None)
+        if role is not None:
+            self.users_by_role[role].discard(user_id)
+            if not self.users_by_role[role]:
+                del self.users_by_role[role]
+
+    async def _desabonner(self, user_id: int):
+        # L'utilisateur a pu se reconnecter entre-temps sur ce worker
+        if user_id in self.active_connections or self._pubsub is None:
+            return
+        try:
+            await self._pubsub.unsubscribe(CANAL_UTILISATEUR.format(user_id))
+        except Exception as e:
+            logger.debug(f"Désabonnement du canal de l'utilisateur {user_id}: {e}")
+
+    def send_to_socket(self, websocket: WebSocket, message: dict, prioritaire: bool = False):
+        """
+        Message destiné à une seule socket locale (réponse à un ping, bienvenue...).
+        `prioritaire` le place en tête de la file.
+        """
+        connexion = self._connexions.get(websocket)
+        if connexion is not None:
+            cle = connexion.enqueue(message)
+            if prioritaire and cle in connexion.file:
+                connexion.file.move_to_end(cle, last=False)
+
+    async def _rejouer(self, connexion: _Connexion, role: Optional[Role], last_event_id: str):
+        """
+        Rejoue les messages publiés depuis last_event_id, devant ceux reçus en direct
+        pendant le rattrapage (sans doublon)
+        """
+        user_id = connexion.user_id
+        canaux = {CANAL_UTILISATEUR.format(user_id)}
+        if role is not None:
+            canaux.add(CANAL_ROLE.format(Role(role).value))
+        try:
+            manques = await self._journal.depuis(last_event_id, canaux)
+        except Exception as e:
+            logger.warning(f"⚠️ Rattrapage WebSocket impossible pour l'utilisateur {user_id}: {e}")
+            manques = None
+        deja_recus, connexion.event_ids_recus = connexion.event_ids_recus or set(), None
+
+        if manques is None or len(manques) > self.outbox_size:
+            rattrapage = [{"type": "resync_required", "last_event_id": last_event_id}]
+        else:
+            rattrapage = [message for message in manques if message["event_id"] not in deja_recus]
+        # Insérés en tête, dans l'ordre, devant les messages reçus en direct entre-temps
+        for message in reversed(rattrapage):
+            cle = next(_compteur_messages)
+            connexion.file[cle] = message
+            connexion.file.move_to_end(cle, last=False)
+        if rattrapage:
+            connexion._signal.set()
+
+    def touch(self, websocket: WebSocket):
+        """Signale une trame reçue du client (preuve que la connexion est vivante)"""
+        connexion = self._connexions.get(websocket)
+        if connexion is not None:
+            connexion.touch()
+
+    def get_stats(self) -> dict:
+        connexions = list(self._connexions.values())
+        return {
+            "users": len(self.active_connections),
+            "sockets": len(connexions),
+            "queued_messages": sum(len(c.file) for c in connexions),
+            "coalesced_messages": sum(c.coalesces for c in connexions),
+            "distributed": self.distributed,
+        }
+
+    async def send_personal_message(self, message: dict, user_id: int):
+        """Envoie un message à toutes les sockets d'un utilisateur, quel que soit leur worker"""
+        canal = CANAL_UTILISATEUR.format(user_id)
+        message = await self._journaliser(canal, message)
+        if not await self._publier(canal, message):
+            await self._livrer_utilisateur(user_id, message)
+
+    def send_personal_message_from_thread(self, message: dict, user_id: int):
+        """
+        send_personal_message pour les handlers synchrones (`def`), exécutés dans le
+        threadpool : l'envoi est confié à la boucle asyncio de l'application.
+        """
+        try:
+            anyio.from_thread.run(self.send_personal_message, message, user_id)
+        except Exception as e:
+            logger.warning(f"⚠️ Notification WebSocket non envoyée à l'utilisateur {user_id}: {e}")
+
+    async def broadcast_to_role(self, message: dict, role: Role):
+        """Diffuser un message à tous les utilisateurs connectés d'un rôle, quel que soit leur worker"""
+        canal = CANAL_ROLE.format(Role(role).value)
+        message = await self._journaliser(canal, message)
+        if not await self._publier(canal, message):
+            await self._livrer_role(Role(role), message)
+
+    async def _journaliser(self, canal: str, message: dict) -> dict:
+        """Inscrit le message dans le journal de rattrapage et lui attribue son event_id"""
+        try:
+            event_id = await self._journal.ajouter(canal, message)
+        except Exception as e:
+            logger.warning(f"⚠️ Journal WebSocket indisponible, message sans event_id: {e}")
+            return message
+        return {**message, "event_id": event_id}
+
+    async def _publier(self, canal: str, message: dict) -> bool:
+        if self._redis is None or self._listener is None:
+            return False
+        try:
+            await self._redis.publish(canal, json.dumps(message, default=str))
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ Publication sur {canal} impossible, livraison locale: {e}")
+            return False
+
+    async def _ecouter(self):
+        """Boucle de réception du bus : livre chaque message aux sockets locales"""
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Lecture du bus WebSocket impossible: {e}")
+                await asyncio.sleep(1)
+                continue
+            if message is None:
+                continue
+            try:
+                await self._dispatcher(message["channel"], json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Message du bus WebSocket ignoré ({message.get('channel')}): {e}")
+
+    async def _dispatcher(self, canal: str, message: dict):
+        callback = self._canaux_service.get(canal)
+        if callback is not None:
+            callback(message)
+            return
+        prefixe, _, cible = canal.rpartition(":")
+        if prefixe == "ws:user":
+            await self._livrer_utilisateur(int(cible), message)
+        elif prefixe == "ws:role":
+            await self._livrer_role(Role(cible), message)
+
+    async def _envoyer(self, websocket: WebSocket, message: dict) -> bool:
+        try:
+            await asyncio.wait_for(websocket.send_json(message), timeout=self.send_timeout)
+            return True
+        except Exception:
+            return False
+
+    async def _evincer(self, connexion: _Connexion):
+        """Retire une socket morte ou trop lente et la ferme"""
+        if self._connexions.get(connexion.websocket) is not connexion:
+            return
+        self.disconnect(connexion.websocket, connexion.user_id)
+        try:
+            await asyncio.wait_for(connexion.websocket.close(code=1011), timeout=self.send_timeout)
+        except Exception:
+            pass
+
+    async def _livrer_utilisateur(self, user_id: int, message: dict):
+        for websocket in list(self.active_connections.get(user_id, ())):
+            self.send_to_socket(websocket, message)
+
+    async def _livrer_role(self, role: Role, message: dict):
+        for user_id in list(self.users_by_role.get(role, ())):
+            await self._livrer_utilisateur(user_id, message)
+
+
+def _tache_courante() -> Optional[asyncio.Task]:
+    try:
+        return asyncio.current_task()
+    except RuntimeError:
+        return None
+
+
+manager = ConnectionManager()
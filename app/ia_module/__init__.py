@@ -68,6 +68,12 @@ from .router_assureur import RouterAssureur, router_assureur
 # Stockage des analyses (optionnel - pour mise en cache)
 from .storage_analyses import StorageAnalyses, storage_analyses
 
+# Moteur OCR (pool de processus, hors boucle d'événements)
+from .ocr_engine import OCREngine, OCREngineSature, OCRTimeout, ocr_engine
+
+# File d'analyse asynchrone bornée (statuts persistés, métriques)
+from .queue_manager import QueueManager, QueueSaturee, queue_manager
+
 # Configuration (détection automatique local/production)
 from .config import config, get_tesseract_cmd, get_poppler_path, is_production
 
@@ -161,6 +167,17 @@ __all__ = [
     # Classes optionnelles
     "RouterAssureur",
     "router_assureur",
-    "StorageAnalyses", 
+    "StorageAnalyses",
     "storage_analyses",
+
+    # Moteur OCR
+    "OCREngine",
+    "OCREngineSature",
+    "OCRTimeout",
+    "ocr_engine",
+
+    # File d'analyse
+    "QueueManager",
+    "QueueSaturee",
+    "queue_manager",
 ]
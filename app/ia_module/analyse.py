@@ -2,8 +2,9 @@
 import os
 import re
 import pickle
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
 from PIL import Image, ImageFilter, ImageEnhance
 import pytesseract
 import filetype
@@ -21,10 +22,151 @@ except ImportError:
     pytesseract.pytesseract.tesseract_cmd = config.TESSERACT_CMD
     POPPLER_PATH = config.POPPLER_PATH
 
+from .cache_manager import CacheManager
+
+# --- Cache OCR adressé par le contenu (partagé via Redis entre API, Celery et pool OCR) ---
+ocr_cache = CacheManager(
+    ttl_hours=config.OCR_CACHE_TTL_HOURS,
+    max_size=config.OCR_CACHE_MAX_SIZE,
+    namespace="ia:ocr",
+)
+
 # --- OCR PDF / Image avec calcul de confiance amélioré ---
+def _pretraiter_image(img):
+    """
+    Amélioration de l'image pour meilleure OCR (niveaux de gris, contraste, débruitage)
+    """
+    img = img.convert("L")  # Grayscale
+    enhancer = ImageEnhance.Contrast(img)
+    img = enhancer.enhance(2.0)
+    return img.filter(ImageFilter.MedianFilter(size=3))
+
+
+def reconstruire_texte_ocr(data):
+    """
+    Reconstruit le texte d'une page à partir des boîtes de mots de image_to_data
+    (sortie DICT/TSV) et renvoie (texte, confiances des mots).
+
+    Les mots sont regroupés par ligne (block_num, par_num, line_num) dans l'ordre
+    de lecture de Tesseract ; les lignes sont séparées par "\\n" et les paragraphes
+    par une ligne vide, comme dans la sortie de image_to_string.
+    """
+    paragraphes = []
+    lignes = {}
+    confiances = []
+    mots = data.get("text", [])
+
+    for i, mot in enumerate(mots):
+        mot = (mot or "").strip()
+        if not mot:
+            continue
+        try:
+            conf = float(data["conf"][i])
+        except (KeyError, TypeError, ValueError):
+            conf = -1
+        if conf >= 0:
+            confiances.append(conf)
+
+        cle_par = (data["block_num"][i], data["par_num"][i])
+        if cle_par not in lignes:
+            lignes[cle_par] = {}
+            paragraphes.append(cle_par)
+        lignes[cle_par].setdefault(data["line_num"][i], []).append(mot)
+
+    texte = "\n\n".join(
+        "\n".join(" ".join(mots_ligne) for mots_ligne in lignes[cle_par].values())
+        for cle_par in paragraphes
+    )
+    return texte, confiances
+
+
+def _ocr_image(img):
+    """
+    OCR d'une image prétraitée en une seule passe Tesseract :
+    le texte et les confiances sont dérivés de la même sortie image_to_data.
+    """
+    data = pytesseract.image_to_data(img, lang="fra+eng", output_type=pytesseract.Output.DICT)
+    return reconstruire_texte_ocr(data)
+
+
+def _confiance_moyenne(confs):
+    """Confiance moyenne d'une page ramenée entre 0 et 1 (0 si aucun mot)"""
+    return float(np.mean(confs)) / 100.0 if confs else 0.0
+
+
+def _rasteriser_page(filepath, numero_page, dpi):
+    """Rasterise une seule page du PDF (les autres pages ne sont pas chargées en mémoire)"""
+    return convert_from_path(
+        filepath,
+        poppler_path=POPPLER_PATH,
+        dpi=dpi,
+        first_page=numero_page,
+        last_page=numero_page,
+        grayscale=True,
+    )[0]
+
+
+def _ocr_page_pdf(filepath, numero_page):
+    """
+    OCR d'une page de PDF avec DPI adaptatif : la page est d'abord rasterisée à
+    OCR_DPI_INITIAL, puis re-rasterisée à OCR_DPI_MAX uniquement si sa confiance
+    moyenne reste sous OCR_SEUIL_CONFIANCE_PAGE.
+    """
+    texte, confs = _ocr_image(_pretraiter_image(_rasteriser_page(filepath, numero_page, config.OCR_DPI_INITIAL)))
+    confiance = _confiance_moyenne(confs)
+
+    if config.OCR_DPI_MAX > config.OCR_DPI_INITIAL and confiance < config.OCR_SEUIL_CONFIANCE_PAGE:
+        texte_hd, confs_hd = _ocr_image(_pretraiter_image(_rasteriser_page(filepath, numero_page, config.OCR_DPI_MAX)))
+        # On garde la passe la plus fiable (la haute résolution n'aide pas toujours)
+        if _confiance_moyenne(confs_hd) >= confiance:
+            return texte_hd, confs_hd
+
+    return texte, confs
+
+
+def _cle_cache_ocr(filepath):
+    """
+    Clé du cache OCR : hash du contenu + paramètres de rasterisation
+    (un changement de DPI ne doit pas servir d'anciens résultats)
+    """
+    return f"{CacheManager.hash_fichier(filepath)}:{config.OCR_DPI_INITIAL}-{config.OCR_DPI_MAX}"
+
+
 def extraire_texte_ocr(filepath):
     """
-    Extrait le texte depuis PDF ou image avec calcul de confiance OCR réel
+    Extrait le texte depuis PDF ou image avec calcul de confiance OCR réel.
+
+    Le résultat est mis en cache par contenu : un fichier identique (même octets)
+    n'est OCRisé qu'une fois, quel que soit son chemin temporaire.
+    """
+    cle = None
+    if config.OCR_CACHE_ENABLED:
+        try:
+            cle = _cle_cache_ocr(filepath)
+            en_cache = ocr_cache.get(cle)
+            if en_cache is not None:
+                return en_cache["texte"], en_cache["mime"], en_cache["confiance"]
+        except Exception as e:
+            # Une défaillance du cache ne doit jamais faire échouer l'OCR
+            print(f"Cache OCR ignoré : {e}")
+
+    texte, mime, confiance, succes = _extraire_texte_ocr_pages(filepath)
+    # Les échecs (Tesseract absent, PDF illisible...) ne sont pas mis en cache
+    if succes and cle is not None:
+        try:
+            ocr_cache.set(cle, {"texte": texte, "mime": mime, "confiance": confiance})
+        except Exception as e:
+            print(f"Mise en cache OCR ignorée : {e}")
+    return texte, mime, confiance
+
+
+def _extraire_texte_ocr_pages(filepath):
+    """
+    OCR effectif d'un PDF ou d'une image : (texte, mime, confiance, succès).
+
+    Les PDF sont traités page par page (rasterisation individuelle) et les pages
+    sont OCRisées en parallèle sur OCR_PAGE_WORKERS threads ; l'ordre des pages
+    est conservé dans le texte final.
     """
     texte_total = ""
     confiances = []
@@ -33,141 +175,176 @@ def extraire_texte_ocr(filepath):
     
     try:
         if "pdf" in mime.lower():
-            pages = convert_from_path(filepath, poppler_path=POPPLER_PATH, dpi=300)
-            for idx, img in enumerate(pages):
-                # Amélioration de l'image pour meilleure OCR
-                img = img.convert("L")  # Grayscale
-                enhancer = ImageEnhance.Contrast(img)
-                img = enhancer.enhance(2.0)
-                img = img.filter(ImageFilter.MedianFilter(size=3))
-                
-                # Extraction avec données de confiance
-                data = pytesseract.image_to_data(img, lang="fra+eng", output_type=pytesseract.Output.DICT)
-                
-                # Calcul de la confiance moyenne
-                confs = [int(conf) for conf in data['conf'] if conf != '-1']
-                if confs:
-                    confiances.extend(confs)
-                
-                # Extraction du texte
-                texte_page = pytesseract.image_to_string(img, lang="fra+eng")
-                texte_total += texte_page + "\n"
+            nb_pages = int(pdfinfo_from_path(filepath, poppler_path=POPPLER_PATH).get("Pages", 0))
+            numeros = range(1, nb_pages + 1)
+            nb_workers = max(1, min(config.OCR_PAGE_WORKERS, nb_pages))
+            with ThreadPoolExecutor(max_workers=nb_workers, thread_name_prefix="ocr-page") as executor:
+                resultats_pages = list(executor.map(lambda numero: _ocr_page_pdf(filepath, numero), numeros))
         else:
             # Traitement image
-            img = Image.open(filepath)
-            img = img.convert("L")
-            enhancer = ImageEnhance.Contrast(img)
-            img = enhancer.enhance(2.0)
-            img = img.filter(ImageFilter.MedianFilter(size=3))
-            
-            # Extraction avec confiance
-            data = pytesseract.image_to_data(img, lang="fra+eng", output_type=pytesseract.Output.DICT)
-            confs = [int(conf) for conf in data['conf'] if conf != '-1']
-            if confs:
-                confiances.extend(confs)
-            
-            texte_total = pytesseract.image_to_string(img, lang="fra+eng")
+            resultats_pages = [_ocr_image(_pretraiter_image(Image.open(filepath)))]
+
+        for texte_page, confs in resultats_pages:
+            confiances.extend(confs)
+            texte_total += texte_page + "\n"
     
     except Exception as e:
         print(f"Erreur OCR : {e}")
         confiance = 0.3
-        return texte_total.strip(), mime, confiance
+        return texte_total.strip(), mime, confiance, False
     
     # Calcul de la confiance moyenne (0-100 -> 0-1)
-    confiance = np.mean(confiances) / 100.0 if confiances else 0.5
+    confiance = float(np.mean(confiances)) / 100.0 if confiances else 0.5
     confiance = max(0.0, min(1.0, confiance))  # Normaliser entre 0 et 1
     
     # Nettoyage du texte
     texte_total = re.sub(r"\s+", " ", texte_total)
-    return texte_total.strip(), mime, confiance
+    return texte_total.strip(), mime, confiance, True
 
-# --- Extraction complète des informations personnelles ---
-def extraire_infos_personnelles(texte):
+# --- Moteur d'extraction : motifs compilés une seule fois au chargement du module ---
+# Chaque motif est associé à un indice : un fragment littéral (en minuscules) sans lequel
+# il ne peut pas correspondre. Les indices sont cherchés dans le texte normalisé avant de
+# lancer le moteur regex, ce qui évite de balayer un passeport ou un relevé bancaire avec
+# tous les motifs du questionnaire.
+def _motif(expression, indice=None, flags=re.IGNORECASE):
+    """Compile un motif d'extraction avec son indice de préfiltrage (ou None)"""
+    return indice, re.compile(expression, flags)
+
+
+def _normaliser_indices(texte):
     """
-    Extrait toutes les informations personnelles du formulaire
+    Texte dans lequel sont cherchés les indices (calculé une fois par texte).
+    casefold() couvre les équivalences de re.IGNORECASE sauf le I pointé et le i sans
+    point, ramenés à "i" : un indice présent dans le texte n'est jamais manqué.
+    """
+    return texte.casefold().replace("\u0307", "").replace("\u0131", "i")
+
+
+def _chercher(motif, texte, texte_indices, pos=0):
+    """Équivalent de re.search, court-circuité quand l'indice du motif est absent"""
+    indice, regex = motif
+    if indice is not None and indice not in texte_indices:
+        return None
+    return regex.search(texte, pos)
+
+
+def _fin_ancre(ancre, texte):
+    """Position de fin de la première occurrence de l'ancre, ou None"""
+    match = ancre.search(texte)
+    return match.end() if match else None
+
+
+def _chercher_apres(fin_ancre, motif, texte, texte_indices):
     """
-    champs_perso = {
+    Équivalent de re.search(ancre + r".*?" + motif, re.DOTALL) : le motif est cherché
+    après la première ancre du texte, sans rebalayer le texte depuis chaque ancre
+    """
+    if fin_ancre is None:
+        return None
+    return _chercher(motif, texte, texte_indices, fin_ancre)
+
+
+def _groupe(match, defaut=""):
+    return match.group(1).strip() if match else defaut
+
+
+_FLAGS_PERSO = re.IGNORECASE | re.MULTILINE | re.DOTALL
+
+# Motifs par champ, par ordre de priorité : le premier motif trouvé l'emporte
+_CHAMPS_PERSO = {
+    champ: [_motif(expression, indice, _FLAGS_PERSO) for expression, indice in motifs]
+    for champ, motifs in {
         "nom": [
-            r"Nom\s*:\s*([A-Z][A-Z\-']+)",
-            r"Nom\s*[:•]\s*([A-Z][a-zA-Z\-']+)"
+            (r"Nom\s*:\s*([A-Z][A-Z\-']+)", "nom"),
+            (r"Nom\s*[:•]\s*([A-Z][a-zA-Z\-']+)", "nom")
         ],
         "prenom": [
-            r"Pr[eé]nom\s*:\s*([A-Za-z][a-zA-Z\-']+)",
-            r"Pr[eé]nom\s*[:•]\s*([A-Za-z][a-zA-Z\-']+)"
+            (r"Pr[eé]nom\s*:\s*([A-Za-z][a-zA-Z\-']+)", "nom"),
+            (r"Pr[eé]nom\s*[:•]\s*([A-Za-z][a-zA-Z\-']+)", "nom")
         ],
         "date_naissance": [
-            r"Date\s+de\s+naissance\s*:\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})",
-            r"Date\s+naissance\s*:\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})",
-            r"N[eé]\s+le\s*:\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})"
+            (r"Date\s+de\s+naissance\s*:\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})", "naissance"),
+            (r"Date\s+naissance\s*:\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})", "naissance"),
+            (r"N[eé]\s+le\s*:\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})", None)
         ],
         "sexe": [
-            r"Sexe\s*:\s*(M|F|Homme|Femme|Masculin|F[eé]minin)",
-            r"Sexe\s*[:•]\s*(M|F|Homme|Femme|Masculin|F[eé]minin)"
+            (r"Sexe\s*:\s*(M|F|Homme|Femme|Masculin|F[eé]minin)", "sexe"),
+            (r"Sexe\s*[:•]\s*(M|F|Homme|Femme|Masculin|F[eé]minin)", "sexe")
         ],
         "telephone": [
-            r"T[eé]l[eé]phone\s*:\s*([+\d\s\-\(\)]{8,20})",
-            r"T[eé]l\s*:\s*([+\d\s\-\(\)]{8,20})"
+            (r"T[eé]l[eé]phone\s*:\s*([+\d\s\-\(\)]{8,20})", "phone"),
+            (r"T[eé]l\s*:\s*([+\d\s\-\(\)]{8,20})", None)
         ],
         "whatsapp": [
-            r"Whatsapp\s*:\s*([+\d\s\-\(\)]{8,20})",
-            r"Whatsapp\s*[:•]\s*([+\d\s\-\(\)]{8,20})"
+            (r"Whatsapp\s*:\s*([+\d\s\-\(\)]{8,20})", "whatsapp"),
+            (r"Whatsapp\s*[:•]\s*([+\d\s\-\(\)]{8,20})", "whatsapp")
         ],
         "email": [
-            r"[Ee]-?[Mm]ail\s*:\s*([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})",
-            r"Courriel\s*:\s*([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})"
+            (r"[Ee]-?[Mm]ail\s*:\s*([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})", "@"),
+            (r"Courriel\s*:\s*([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})", "@")
         ],
         "adresse": [
-            r"Adresse\s*:\s*([^:]{5,60}?)(?:\s+Ville|\s+Pays|\s+T[eé]l)",
-            r"Adresse\s*[:•]\s*(.{5,60}?)(?=\s+Ville|\s+Pays|\s+T[eé]l)"
+            (r"Adresse\s*:\s*([^:]{5,60}?)(?:\s+Ville|\s+Pays|\s+T[eé]l)", "adresse"),
+            (r"Adresse\s*[:•]\s*(.{5,60}?)(?=\s+Ville|\s+Pays|\s+T[eé]l)", "adresse")
         ],
         "ville": [
-            r"Ville\s*:\s*([A-Za-z][a-zA-Z\s\-']+?)(?:\s+Pays|\s+T[eé]l|\s+[0-9])",
-            r"Ville\s*[:•]\s*([A-Za-z][a-zA-Z\s\-']+)"
+            (r"Ville\s*:\s*([A-Za-z][a-zA-Z\s\-']+?)(?:\s+Pays|\s+T[eé]l|\s+[0-9])", "ville"),
+            (r"Ville\s*[:•]\s*([A-Za-z][a-zA-Z\s\-']+)", "ville")
         ],
         "pays": [
-            r"Pays\s*:\s*([A-Za-z][a-zA-Zéèêëàâäùûüôöîïç\-]+)",
-            r"Nationalit[eé]\s*:\s*([A-Za-z][a-zA-Zéèêëàâäùûüôöîïç\-]+)"
+            (r"Pays\s*:\s*([A-Za-z][a-zA-Zéèêëàâäùûüôöîïç\-]+)", "pays"),
+            (r"Nationalit[eé]\s*:\s*([A-Za-z][a-zA-Zéèêëàâäùûüôöîïç\-]+)", "nationalit")
         ],
         "marie": [
-            r"Marié\(e\)\s*[:•]\s*(Oui|Non|OUI|NON)(?:\s|$|\n|Nbre|Fréquence)",
-            r"Marié\(e\)\s+(Oui|Non|OUI|NON)(?:\s|$|\n|Nbre|Fréquence)"
+            (r"Marié\(e\)\s*[:•]\s*(Oui|Non|OUI|NON)(?:\s|$|\n|Nbre|Fréquence)", "marié(e)"),
+            (r"Marié\(e\)\s+(Oui|Non|OUI|NON)(?:\s|$|\n|Nbre|Fréquence)", "marié(e)")
         ],
         "nb_enfants": [
-            r"Nbre\s+d['']enfants\s+sous\s+votre\s+responsabilité\s*[:•]\s*(\d+)",
-            r"enfants\s+sous\s+votre\s+responsabilité\s*[:•]\s*(\d+)",
-            r"Nbre\s+d['']enfants\s*[:•]\s*(\d+)"
+            (r"Nbre\s+d['']enfants\s+sous\s+votre\s+responsabilité\s*[:•]\s*(\d+)", "enfants"),
+            (r"enfants\s+sous\s+votre\s+responsabilité\s*[:•]\s*(\d+)", "enfants"),
+            (r"Nbre\s+d['']enfants\s*[:•]\s*(\d+)", "enfants")
         ],
         "frequence_voyage_mois": [
-            r"Fréquence\s+de\s+voyage.*?Par\s+mois\s*[:•]\s*(\d+)",
-            r"Par\s+mois\s*[:•]\s*(\d+)"
+            (r"Fréquence\s+de\s+voyage.*?Par\s+mois\s*[:•]\s*(\d+)", "mois"),
+            (r"Par\s+mois\s*[:•]\s*(\d+)", "mois")
         ],
         "frequence_voyage_an": [
-            r"Par\s+an\s*[:•]\s*(\d+)",
-            r"Fréquence\s+de\s+voyage.*?Par\s+an\s*[:•]\s*(\d+)"
+            (r"Par\s+an\s*[:•]\s*(\d+)", "par"),
+            (r"Fréquence\s+de\s+voyage.*?Par\s+an\s*[:•]\s*(\d+)", "par")
         ],
         "destination_habituelle": [
-            r"Destination\s+habituelle\s*[:•]\s*(Afrique|Europe|Amérique|Asie|Autre)(?:\s|$|\n|Durée)",
-            r"Destination\s+habituelle.*?(Afrique|Europe|Amérique|Asie|Autre)(?:\s|$|\n|Durée)"
+            (r"Destination\s+habituelle\s*[:•]\s*(Afrique|Europe|Amérique|Asie|Autre)(?:\s|$|\n|Durée)", "destination"),
+            (r"Destination\s+habituelle.*?(Afrique|Europe|Amérique|Asie|Autre)(?:\s|$|\n|Durée)", "destination")
         ],
         "duree_sejours": [
-            r"Durée\s+moyenne\s+de\s+vos\s+séjours\s*[:•]\s*(Moins\s+de\s+1\s+mois|2\s+mois|3\s+mois|Plus\s+de\s+3\s+mois)",
-            r"(Moins\s+de\s+1\s+mois|2\s+mois|3\s+mois|Plus\s+de\s+3\s+mois)"
+            (r"Durée\s+moyenne\s+de\s+vos\s+séjours\s*[:•]\s*(Moins\s+de\s+1\s+mois|2\s+mois|3\s+mois|Plus\s+de\s+3\s+mois)", "mois"),
+            (r"(Moins\s+de\s+1\s+mois|2\s+mois|3\s+mois|Plus\s+de\s+3\s+mois)", "mois")
         ],
         "raison_sejours": [
-            r"Raison\s+principale\s+de\s+vos\s+séjours\s*[:•]\s*(Professionnelle|Tourisme|Vacance|Familiale|Religieux|Autres)(?:\s|$|\n)",
-            r"(Professionnelle|Tourisme|Vacance|Familiale|Religieux|Autres)"
+            (r"Raison\s+principale\s+de\s+vos\s+séjours\s*[:•]\s*(Professionnelle|Tourisme|Vacance|Familiale|Religieux|Autres)(?:\s|$|\n)", "raison"),
+            (r"(Professionnelle|Tourisme|Vacance|Familiale|Religieux|Autres)", None)
         ]
-    }
-    
+    }.items()
+}
+
+# Nettoyage des caractères indésirables en fin de valeur
+_RE_FIN_VALEUR = re.compile(r'[^\w\s@.\-+()/:]+$')
+
+# --- Extraction complète des informations personnelles ---
+def extraire_infos_personnelles(texte):
+    """
+    Extrait toutes les informations personnelles du formulaire
+    """
+    texte_indices = _normaliser_indices(texte)
     infos = {}
-    for champ, patterns in champs_perso.items():
+    for champ, motifs in _CHAMPS_PERSO.items():
         infos[champ] = ""
-        for pattern in patterns:
-            match = re.search(pattern, texte, re.IGNORECASE | re.MULTILINE | re.DOTALL)
+        for motif in motifs:
+            match = _chercher(motif, texte, texte_indices)
             if match:
                 valeur = match.group(1).strip() if match.lastindex else match.group(0).strip()
                 # Nettoyer la valeur : enlever les caractères indésirables en fin
-                valeur = re.sub(r'[^\w\s@.\-+()/:]+$', '', valeur).strip()
+                valeur = _RE_FIN_VALEUR.sub('', valeur).strip()
                 # Limiter la longueur pour éviter les captures trop longues
                 if len(valeur) <= 200:  # Limite raisonnable
                     infos[champ] = valeur
@@ -175,6 +352,51 @@ def extraire_infos_personnelles(texte):
     
     return infos
 
+# Historique médical : (libellé tel que lu par l'OCR, nom de la maladie)
+_MALADIES = [
+    ("Hypertension art[éèe]rielle", "Hypertension artérielle"),
+    ("Diab[éèe]te", "Diabète"),
+    ("Maladies cardiaques", "Maladies cardiaques"),
+    ("Maladies respiratoires", "Maladies respiratoires"),
+    ("Maladies neurologiques", "Maladies neurologiques"),
+    ("Maladies chroniques", "Maladies chroniques"),
+    ("Aucune", "Aucune de ces maladies")
+]
+
+# Une seule passe pour toutes les maladies. Seule une réponse "Oui" compte : une réponse
+# "Non" ou absente donne False. L'OCR peut lire "Oui" comme "Qui" ou "0ui".
+_RE_MALADIES_OUI = re.compile(
+    r"(?:" + "|".join(
+        f"(?P<maladie_{rang}>{libelle})" for rang, (libelle, _) in enumerate(_MALADIES)
+    ) + r")\s*:\s*(?:Oui|OUI|oui|Qui|QUI|qui|0ui)",
+    re.IGNORECASE
+)
+
+# Ancres des questions de précision ("Si oui, ..."), suivies en texte libre
+_RE_SI_OUI = re.compile(r"Si\s+oui", re.IGNORECASE)
+_RE_MALADIES_CARDIAQUES = re.compile(r"Maladies\s+cardiaques", re.IGNORECASE)
+
+_MOTIF_PRECISEZ = _motif(r"Précisez\s*[:•]\s*([^\n\r]+)", "précisez")
+_MOTIF_TRAITEMENT_REGULIER = _motif(r"traitement\s+médical\s+régulier\??\s*(Oui|Non|OUI|NON)", "régulier")
+_MOTIF_TYPE_TRAITEMENT = _motif(r"type\s+de\s+traitement\s*[:•]\s*([^\n\r]+)", "traitement")
+_MOTIF_HOSPITALISATION = _motif(r"hospitalisé\s+au\s+cours\s+des\s+12\s+derniers\s+mois\??\s*(Oui|Non|OUI|NON)", "hospitalisé")
+_MOTIF_RAISON_HOSPITALISATION = _motif(r"précisez\s+pour\s+quelle\s+raison\s*[:•]\s*([^\n\r]+)", "raison")
+_MOTIF_MALADE = _motif(r"malade\s+au\s+moment\s+de\s+la\s+souscription\??\s*(Oui|Non|OUI|NON)", "souscription")
+_MOTIF_SOUFFRANCE = _motif(r"précisez\s+de\s+quoi\s+souffrez-vous\??\s*[:•]\s*([^\n\r]+)", "souffrez-vous")
+_MOTIF_SYMPTOMES = _motif(r"symptômes\s+persistants\??\s*(Oui|Non|OUI|NON)", "persistants")
+_MOTIF_MEDECIN = _motif(r"médecin\s+traitant\s*[:•]\s*(Oui|Non|OUI|NON)", "traitant")
+_MOTIF_NOM_MEDECIN = _motif(r"son\s+nom\s*[:•]\s*([^\n\r]+)", "nom")
+_MOTIF_SPECIALITE = _motif(r"Spécialité\s*[:•]\s*([^\n\r]+)", "spécialité")
+_MOTIF_TEL_MEDECIN = _motif(r"Téléphone\s*[:•]\s*([^\n\r]+)", "téléphone")
+_MOTIF_FUMEUR = _motif(r"Fumez-vous\??\s*(Oui|Non|OUI|NON)", "fumez-vous")
+_MOTIF_CIGARETTES = _motif(r"combien\s+de\s+cigarettes\s+par\s+jour\??\s*[:•]\s*(\d+)", "cigarettes")
+_MOTIF_ALCOOL = _motif(r"Consommez-vous\s+de\s+l['']alcool\??\s*(Oui|Non|OUI|NON)", "alcool")
+_MOTIF_FREQ_ALCOOL = _motif(r"à\s+quelle\s+fréquence\??\s*[:•]\s*([^\n\r]+)", "fréquence")
+_MOTIF_ACTIVITE = _motif(r"activité\s+physique\s+régulièrement\??\s*(Oui|Non|OUI|NON)", "physique")
+_MOTIF_ACTIVITE_DETAILS = _motif(r"laquelle\s+et\s+à\s+quelle\s+fréquence\??\s*[:•]\s*([^\n\r]+)", "laquelle")
+_MOTIF_ALLERGIE = _motif(r"allergique\s+à\s+certains\s+médicaments.*?\??\s*(Oui|Non|OUI|NON)", "allergique")
+_MOTIF_MENTAL = _motif(r"trouble\s+mental\s+ou\s+émotionnel\??\s*(Oui|Non|OUI|NON)", "mental")
+
 # --- Extraction complète des informations de santé ---
 def extraire_infos_sante(texte):
     """
@@ -188,97 +410,70 @@ def extraire_infos_sante(texte):
         "sante_mentale": {},
         "voyage": {}
     }
+    texte_indices = _normaliser_indices(texte)
+    fin_si_oui = _fin_ancre(_RE_SI_OUI, texte)
+    # "Si oui, précisez : ..." est commun aux symptômes, aux allergies et à la santé mentale
+    match_precisez = _chercher_apres(fin_si_oui, _MOTIF_PRECISEZ, texte, texte_indices)
     
     # === SECTION 1: HISTORIQUE MÉDICAL ===
-    maladies = [
-        "Hypertension art[éèe]rielle",
-        "Diab[éèe]te",
-        "Maladies cardiaques",
-        "Maladies respiratoires",
-        "Maladies neurologiques",
-        "Maladies chroniques",
-        "Aucune"
-    ]
-    
-    maladie_noms = [
-        "Hypertension artérielle",
-        "Diabète",
-        "Maladies cardiaques",
-        "Maladies respiratoires",
-        "Maladies neurologiques",
-        "Maladies chroniques",
-        "Aucune de ces maladies"
-    ]
-    
-    for maladie_pattern, maladie_nom in zip(maladies, maladie_noms):
-        # Chercher le pattern "Maladie : Oui" ou "Maladie : Non"
-        # Note: L'OCR peut lire "Oui" comme "Qui" ou "0ui"
-        pattern_oui = rf"{maladie_pattern}\s*:\s*(Oui|OUI|oui|Qui|QUI|qui|0ui)"
-        pattern_non = rf"{maladie_pattern}\s*:\s*(Non|NON|non|N0n)"
-        
-        if re.search(pattern_oui, texte, re.IGNORECASE):
-            data["historique_medical"][maladie_nom] = True
-        elif re.search(pattern_non, texte, re.IGNORECASE):
-            data["historique_medical"][maladie_nom] = False
-        else:
-            data["historique_medical"][maladie_nom] = False
+    maladies_oui = {match.lastgroup for match in _RE_MALADIES_OUI.finditer(texte)}
+    for rang, (_, maladie_nom) in enumerate(_MALADIES):
+        data["historique_medical"][maladie_nom] = f"maladie_{rang}" in maladies_oui
     
     # Maladies cardiaques - précision
-    match_card = re.search(r"Maladies\s+cardiaques.*?Précisez\s*[:•]\s*([^\n\r]+)", texte, re.IGNORECASE | re.DOTALL)
-    data["historique_medical"]["maladies_cardiaques_details"] = match_card.group(1).strip() if match_card else ""
+    match_card = _chercher_apres(_fin_ancre(_RE_MALADIES_CARDIAQUES, texte), _MOTIF_PRECISEZ, texte, texte_indices)
+    data["historique_medical"]["maladies_cardiaques_details"] = _groupe(match_card)
     
     # Traitement médical régulier
-    match_traitement = re.search(r"traitement\s+médical\s+régulier\??\s*(Oui|Non|OUI|NON)", texte, re.IGNORECASE)
-    data["historique_medical"]["traitement_regulier"] = match_traitement.group(1).strip() if match_traitement else "Non"
+    match_traitement = _chercher(_MOTIF_TRAITEMENT_REGULIER, texte, texte_indices)
+    data["historique_medical"]["traitement_regulier"] = _groupe(match_traitement, "Non")
     
     # Type de traitement
-    match_type_traitement = re.search(r"Si\s+oui.*?type\s+de\s+traitement\s*[:•]\s*([^\n\r]+)", texte, re.IGNORECASE | re.DOTALL)
-    data["historique_medical"]["type_traitement"] = match_type_traitement.group(1).strip() if match_type_traitement else ""
+    match_type_traitement = _chercher_apres(fin_si_oui, _MOTIF_TYPE_TRAITEMENT, texte, texte_indices)
+    data["historique_medical"]["type_traitement"] = _groupe(match_type_traitement)
     
     # Hospitalisation récente
-    match_hosp = re.search(r"hospitalisé\s+au\s+cours\s+des\s+12\s+derniers\s+mois\??\s*(Oui|Non|OUI|NON)", texte, re.IGNORECASE)
-    data["historique_medical"]["hospitalisation_recente"] = match_hosp.group(1).strip() if match_hosp else "Non"
+    match_hosp = _chercher(_MOTIF_HOSPITALISATION, texte, texte_indices)
+    data["historique_medical"]["hospitalisation_recente"] = _groupe(match_hosp, "Non")
     
     # Raison hospitalisation
-    match_raison_hosp = re.search(r"Si\s+oui.*?précisez\s+pour\s+quelle\s+raison\s*[:•]\s*([^\n\r]+)", texte, re.IGNORECASE | re.DOTALL)
-    data["historique_medical"]["raison_hospitalisation"] = match_raison_hosp.group(1).strip() if match_raison_hosp else ""
+    match_raison_hosp = _chercher_apres(fin_si_oui, _MOTIF_RAISON_HOSPITALISATION, texte, texte_indices)
+    data["historique_medical"]["raison_hospitalisation"] = _groupe(match_raison_hosp)
     
     # === SECTION 2: SANTÉ ACTUELLE ===
-    match_malade = re.search(r"malade\s+au\s+moment\s+de\s+la\s+souscription\??\s*(Oui|Non|OUI|NON)", texte, re.IGNORECASE)
-    data["sante_actuelle"]["malade_actuellement"] = match_malade.group(1).strip() if match_malade else "Non"
-    
-    match_souffrance = re.search(r"Si\s+oui.*?précisez\s+de\s+quoi\s+souffrez-vous\??\s*[:•]\s*([^\n\r]+)", texte, re.IGNORECASE | re.DOTALL)
-    data["sante_actuelle"]["maladie_actuelle"] = match_souffrance.group(1).strip() if match_souffrance else ""
+    match_malade = _chercher(_MOTIF_MALADE, texte, texte_indices)
+    data["sante_actuelle"]["malade_actuellement"] = _groupe(match_malade, "Non")
     
-    match_symptomes = re.search(r"symptômes\s+persistants\??\s*(Oui|Non|OUI|NON)", texte, re.IGNORECASE)
-    data["sante_actuelle"]["symptomes_persistants"] = match_symptomes.group(1).strip() if match_symptomes else "Non"
+    match_souffrance = _chercher_apres(fin_si_oui, _MOTIF_SOUFFRANCE, texte, texte_indices)
+    data["sante_actuelle"]["maladie_actuelle"] = _groupe(match_souffrance)
     
-    match_symptomes_details = re.search(r"Si\s+oui.*?précisez\s*[:•]\s*([^\n\r]+)", texte, re.IGNORECASE | re.DOTALL)
-    data["sante_actuelle"]["symptomes_details"] = match_symptomes_details.group(1).strip() if match_symptomes_details else ""
+    match_symptomes = _chercher(_MOTIF_SYMPTOMES, texte, texte_indices)
+    data["sante_actuelle"]["symptomes_persistants"] = _groupe(match_symptomes, "Non")
+    data["sante_actuelle"]["symptomes_details"] = _groupe(match_precisez)
     
-    match_medecin = re.search(r"médecin\s+traitant\s*[:•]\s*(Oui|Non|OUI|NON)", texte, re.IGNORECASE)
-    data["sante_actuelle"]["medecin_traitant"] = match_medecin.group(1).strip() if match_medecin else "Non"
+    match_medecin = _chercher(_MOTIF_MEDECIN, texte, texte_indices)
+    data["sante_actuelle"]["medecin_traitant"] = _groupe(match_medecin, "Non")
     
-    match_nom_medecin = re.search(r"son\s+nom\s*[:•]\s*([^\n\r]+)", texte, re.IGNORECASE)
-    data["sante_actuelle"]["nom_medecin"] = match_nom_medecin.group(1).strip() if match_nom_medecin else ""
+    match_nom_medecin = _chercher(_MOTIF_NOM_MEDECIN, texte, texte_indices)
+    data["sante_actuelle"]["nom_medecin"] = _groupe(match_nom_medecin)
     
-    match_specialite = re.search(r"Spécialité\s*[:•]\s*([^\n\r]+)", texte, re.IGNORECASE)
-    data["sante_actuelle"]["specialite_medecin"] = match_specialite.group(1).strip() if match_specialite else ""
+    match_specialite = _chercher(_MOTIF_SPECIALITE, texte, texte_indices)
+    data["sante_actuelle"]["specialite_medecin"] = _groupe(match_specialite)
     
-    match_tel_medecin = re.search(r"Téléphone\s*[:•]\s*([^\n\r]+)", texte, re.IGNORECASE)
-    data["sante_actuelle"]["telephone_medecin"] = match_tel_medecin.group(1).strip() if match_tel_medecin else ""
+    match_tel_medecin = _chercher(_MOTIF_TEL_MEDECIN, texte, texte_indices)
+    data["sante_actuelle"]["telephone_medecin"] = _groupe(match_tel_medecin)
     
     # === SECTION 3: MODE DE VIE ===
-    match_fumeur = re.search(r"Fumez-vous\??\s*(Oui|Non|OUI|NON)", texte, re.IGNORECASE)
-    data["mode_vie"]["fumeur"] = match_fumeur.group(1).strip() if match_fumeur else "Non"
+    match_fumeur = _chercher(_MOTIF_FUMEUR, texte, texte_indices)
+    data["mode_vie"]["fumeur"] = _groupe(match_fumeur, "Non")
     
-    match_cigarettes = re.search(r"Si\s+oui.*?combien\s+de\s+cigarettes\s+par\s+jour\??\s*[:•]\s*(\d+)", texte, re.IGNORECASE | re.DOTALL)
-    data["mode_vie"]["nb_cigarettes"] = match_cigarettes.group(1).strip() if match_cigarettes else "0"
+    match_cigarettes = _chercher_apres(fin_si_oui, _MOTIF_CIGARETTES, texte, texte_indices)
+    data["mode_vie"]["nb_cigarettes"] = _groupe(match_cigarettes, "0")
     
-    match_alcool = re.search(r"Consommez-vous\s+de\s+l['']alcool\??\s*(Oui|Non|OUI|NON)", texte, re.IGNORECASE)
-    data["mode_vie"]["alcool"] = match_alcool.group(1).strip() if match_alcool else "Non"
+    match_alcool = _chercher(_MOTIF_ALCOOL, texte, texte_indices)
+    data["mode_vie"]["alcool"] = _groupe(match_alcool, "Non")
     
-    match_freq_alcool = re.search(r"Si\s+oui.*?à\s+quelle\s+fréquence\??\s*[:•]\s*([^\n\r]+)", texte, re.IGNORECASE | re.DOTALL)
+    match_freq_alcool = _chercher_apres(fin_si_oui, _MOTIF_FREQ_ALCOOL, texte, texte_indices)
     if match_freq_alcool:
         freq_text = match_freq_alcool.group(1).lower()
         if "quotidien" in freq_text:
@@ -290,25 +485,21 @@ def extraire_infos_sante(texte):
     else:
         data["mode_vie"]["frequence_alcool"] = ""
     
-    match_activite = re.search(r"activité\s+physique\s+régulièrement\??\s*(Oui|Non|OUI|NON)", texte, re.IGNORECASE)
-    data["mode_vie"]["activite_physique"] = match_activite.group(1).strip() if match_activite else "Non"
+    match_activite = _chercher(_MOTIF_ACTIVITE, texte, texte_indices)
+    data["mode_vie"]["activite_physique"] = _groupe(match_activite, "Non")
     
-    match_activite_details = re.search(r"Si\s+oui.*?laquelle\s+et\s+à\s+quelle\s+fréquence\??\s*[:•]\s*([^\n\r]+)", texte, re.IGNORECASE | re.DOTALL)
-    data["mode_vie"]["activite_details"] = match_activite_details.group(1).strip() if match_activite_details else ""
+    match_activite_details = _chercher_apres(fin_si_oui, _MOTIF_ACTIVITE_DETAILS, texte, texte_indices)
+    data["mode_vie"]["activite_details"] = _groupe(match_activite_details)
     
     # === SECTION 4: ALLERGIES ===
-    match_allergie = re.search(r"allergique\s+à\s+certains\s+médicaments.*?\??\s*(Oui|Non|OUI|NON)", texte, re.IGNORECASE)
-    data["allergies"]["presence"] = match_allergie.group(1).strip() if match_allergie else "Non"
-    
-    match_allergie_details = re.search(r"Si\s+oui.*?précisez\s*[:•]\s*([^\n\r]+)", texte, re.IGNORECASE | re.DOTALL)
-    data["allergies"]["details"] = match_allergie_details.group(1).strip() if match_allergie_details else ""
+    match_allergie = _chercher(_MOTIF_ALLERGIE, texte, texte_indices)
+    data["allergies"]["presence"] = _groupe(match_allergie, "Non")
+    data["allergies"]["details"] = _groupe(match_precisez)
     
     # === SECTION 5: SANTÉ MENTALE ===
-    match_mental = re.search(r"trouble\s+mental\s+ou\s+émotionnel\??\s*(Oui|Non|OUI|NON)", texte, re.IGNORECASE)
-    data["sante_mentale"]["trouble_mental"] = match_mental.group(1).strip() if match_mental else "Non"
-    
-    match_mental_details = re.search(r"Si\s+oui.*?précisez\s*[:•]\s*([^\n\r]+)", texte, re.IGNORECASE | re.DOTALL)
-    data["sante_mentale"]["details"] = match_mental_details.group(1).strip() if match_mental_details else ""
+    match_mental = _chercher(_MOTIF_MENTAL, texte, texte_indices)
+    data["sante_mentale"]["trouble_mental"] = _groupe(match_mental, "Non")
+    data["sante_mentale"]["details"] = _groupe(match_precisez)
     
     return data
 
@@ -806,6 +997,14 @@ def generer_avis_et_commentaire(score_risque, probabilite_acceptation, niveau_ri
     
     return avis, commentaire
 
+# Mots-clés par type de document, dans l'ordre de priorité de la détection
+_MOTS_CLES_TYPE_DOCUMENT = [
+    ("Passeport", ["passeport", "passport", "pass no", "passport no"]),
+    ("CNI / Carte d'identité", ["carte nationale", "cni", "carte d'identité", "national identity"]),
+    ("Permis de conduire", ["permis de conduire", "driving license", "permis"]),
+    ("Attestation / Certificat", ["attestation", "certificat"])
+]
+
 # --- Détection du type de document ---
 def detecter_type_document(texte, filepath):
     """
@@ -817,21 +1016,55 @@ def detecter_type_document(texte, filepath):
     type_doc = "Document inconnu"
     
     # Détection par mots-clés
-    if any(mot in texte_lower for mot in ["passeport", "passport", "pass no", "passport no"]):
-        type_doc = "Passeport"
-    elif any(mot in texte_lower for mot in ["carte nationale", "cni", "carte d'identité", "national identity"]):
-        type_doc = "CNI / Carte d'identité"
-    elif any(mot in texte_lower for mot in ["permis de conduire", "driving license", "permis"]):
-        type_doc = "Permis de conduire"
-    elif any(mot in texte_lower for mot in ["attestation", "certificat"]):
-        type_doc = "Attestation / Certificat"
-    elif "passport" in nom_fichier:
+    for type_mots_cles, mots in _MOTS_CLES_TYPE_DOCUMENT:
+        if any(mot in texte_lower for mot in mots):
+            return type_mots_cles
+    
+    if "passport" in nom_fichier:
         type_doc = "Passeport"
     elif "cni" in nom_fichier or "identite" in nom_fichier:
         type_doc = "CNI / Carte d'identité"
     
     return type_doc
 
+# Libellés des dates de document, par ordre de priorité pour chaque type de date
+_LIBELLES_DATES_DOCUMENT = {
+    "delivrance": [
+        r"Date\s+de\s+délivrance\s*[:•]\s*",
+        r"Date\s+délivrance\s*[:•]\s*",
+        r"Délivré\s+le\s*[:•]?\s*",
+        r"Date\s+d['']émission\s*[:•]\s*",
+        r"Date\s+émission\s*[:•]\s*",
+        r"Émis\s+le\s*[:•]?\s*",
+        r"Issued\s+on\s*[:•]?\s*",
+        r"Issue\s+date\s*[:•]\s*"
+    ],
+    "expiration": [
+        r"Date\s+d['']expiration\s*[:•]\s*",
+        r"Date\s+expiration\s*[:•]\s*",
+        r"Expire\s+le\s*[:•]?\s*",
+        r"Expires\s+on\s*[:•]?\s*",
+        r"Expiry\s+date\s*[:•]\s*",
+        r"Valid\s+until\s*[:•]?\s*",
+        r"Valable\s+jusqu['']au\s*[:•]?\s*"
+    ]
+}
+
+# Une seule passe sur le texte : on cherche les dates (motif à préfixe numérique, que le
+# moteur regex saute rapidement), puis le libellé qui se termine juste avant chacune.
+# Les libellés ne sont jamais suffixes l'un de l'autre : au plus un libellé par date.
+_RE_DATE_DOCUMENT = re.compile(r"\d\d?[/-]\d\d?[/-]\d{2,4}")
+_RE_LIBELLE_DATE = re.compile(
+    "(?:" + "|".join(
+        f"(?P<{type_date}_{rang}>{libelle})"
+        for type_date, libelles in _LIBELLES_DATES_DOCUMENT.items()
+        for rang, libelle in enumerate(libelles)
+    ) + r")\Z",
+    re.IGNORECASE
+)
+# Longueur maximale d'un libellé avant la date (le texte OCR a ses espaces normalisés)
+_FENETRE_LIBELLE_DATE = 120
+
 # --- Extraction des dates de document (délivrance et expiration) ---
 def extraire_dates_document(texte):
     """
@@ -843,43 +1076,23 @@ def extraire_dates_document(texte):
         "date_emission": None
     }
     
-    # Patterns pour date de délivrance/émission
-    patterns_delivrance = [
-        r"Date\s+de\s+délivrance\s*[:•]\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})",
-        r"Date\s+délivrance\s*[:•]\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})",
-        r"Délivré\s+le\s*[:•]?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})",
-        r"Date\s+d['']émission\s*[:•]\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})",
-        r"Date\s+émission\s*[:•]\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})",
-        r"Émis\s+le\s*[:•]?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})",
-        r"Issued\s+on\s*[:•]?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})",
-        r"Issue\s+date\s*[:•]\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})"
-    ]
-    
-    # Patterns pour date d'expiration
-    patterns_expiration = [
-        r"Date\s+d['']expiration\s*[:•]\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})",
-        r"Date\s+expiration\s*[:•]\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})",
-        r"Expire\s+le\s*[:•]?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})",
-        r"Expires\s+on\s*[:•]?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})",
-        r"Expiry\s+date\s*[:•]\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})",
-        r"Valid\s+until\s*[:•]?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})",
-        r"Valable\s+jusqu['']au\s*[:•]?\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})"
-    ]
-    
-    # Chercher date de délivrance
-    for pattern in patterns_delivrance:
-        match = re.search(pattern, texte, re.IGNORECASE)
-        if match:
-            dates["date_delivrance"] = match.group(1).strip()
-            dates["date_emission"] = match.group(1).strip()  # Même chose
-            break
-    
-    # Chercher date d'expiration
-    for pattern in patterns_expiration:
-        match = re.search(pattern, texte, re.IGNORECASE)
-        if match:
-            dates["date_expiration"] = match.group(1).strip()
-            break
+    # Pour chaque type de date, le libellé de plus haute priorité l'emporte
+    meilleures = {}
+    for match_date in _RE_DATE_DOCUMENT.finditer(texte):
+        debut = match_date.start()
+        match = _RE_LIBELLE_DATE.search(texte, max(0, debut - _FENETRE_LIBELLE_DATE), debut)
+        if not match:
+            continue
+        type_date, rang = match.lastgroup.rsplit("_", 1)
+        rang = int(rang)
+        if type_date not in meilleures or rang < meilleures[type_date][0]:
+            meilleures[type_date] = (rang, match_date.group(0))
+    
+    if "delivrance" in meilleures:
+        dates["date_delivrance"] = meilleures["delivrance"][1]
+        dates["date_emission"] = meilleures["delivrance"][1]  # Même chose
+    if "expiration" in meilleures:
+        dates["date_expiration"] = meilleures["expiration"][1]
     
     return dates
 
@@ -1,151 +1,245 @@
 """
 Gestionnaire de cache pour stocker les résultats d'analyse
 Évite de réanalyser les mêmes fichiers
+
+Les entrées sont adressées par le contenu (SHA-256 des octets du fichier) et non
+par le chemin : un même passeport envoyé au checkout puis à /ia/analyser-documents
+(dans deux fichiers temporaires différents) partage la même entrée.
+
+Deux niveaux :
+- LRU en mémoire du processus, expiration gérée par un tas (heap) trié par échéance
+- Redis (optionnel), partagé entre les workers uvicorn, Celery et le pool OCR
+
+Le niveau mémoire est protégé par un verrou : l'instance du module (ocr_cache) est
+partagée par les threads du moteur OCR et des analyses parallèles.
 """
+import hashlib
+import heapq
+import json
 import logging
+import threading
+import time
 from typing import Optional, Dict, Any
-from datetime import datetime, timedelta
 from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
 
+# Taille des blocs lus pour le calcul du hash (1 Mo)
+_TAILLE_BLOC_HASH = 1024 * 1024
+
+
+def get_redis_client():
+    """Client Redis de l'application, ou None (module IA utilisé hors backend, Redis absent)"""
+    try:
+        from app.core.redis_client import get_redis
+        return get_redis()
+    except Exception as e:
+        logger.debug(f"Redis indisponible pour le cache IA: {e}")
+        return None
+
+
 class CacheManager:
     """
-    Gestionnaire de cache en mémoire avec TTL (Time To Live)
-    Utilise LRU (Least Recently Used) pour limiter la taille
+    Gestionnaire de cache à deux niveaux avec TTL (Time To Live)
+    Utilise LRU (Least Recently Used) pour limiter la taille du niveau mémoire
     """
-    
-    def __init__(self, ttl_hours: int = 24, max_size: int = 1000):
+
+    def __init__(
+        self,
+        ttl_hours: float = 24,
+        max_size: int = 1000,
+        namespace: str = "ia:cache",
+        use_redis: bool = True,
+        redis_client=None
+    ):
         """
         Initialise le gestionnaire de cache
-        
+
         Args:
             ttl_hours: Durée de vie des entrées en heures (défaut: 24h)
-            max_size: Taille maximale du cache (défaut: 1000)
+            max_size: Taille maximale du cache mémoire (défaut: 1000)
+            namespace: Préfixe des clés Redis
+            use_redis: Active le niveau Redis partagé
+            redis_client: Client Redis explicite (défaut: client de l'application)
         """
         self.ttl_hours = ttl_hours
+        self.ttl_seconds = max(1, int(ttl_hours * 3600))
         self.max_size = max_size
-        self.cache: OrderedDict[str, Dict] = OrderedDict()
+        self.namespace = namespace
+        self.use_redis = use_redis
+        self._redis = redis_client
+        # clé -> (échéance monotonic, valeur)
+        self.cache: OrderedDict[str, tuple] = OrderedDict()
+        # Tas (échéance, clé) : seules les entrées arrivées à échéance sont examinées
+        self._echeances: list = []
+        # Protège le LRU, le tas et les compteurs (appels concurrents depuis plusieurs threads)
+        self._lock = threading.Lock()
         self.hits = 0
+        self.hits_redis = 0
         self.misses = 0
-        
-        logger.info(f"✅ CacheManager initialisé (TTL: {ttl_hours}h, Max: {max_size})")
-    
-    def _is_expired(self, entry: Dict) -> bool:
-        """Vérifie si une entrée du cache a expiré"""
-        if "expires_at" not in entry:
-            return True
-        
-        expires_at = entry["expires_at"]
-        if isinstance(expires_at, str):
-            expires_at = datetime.fromisoformat(expires_at)
-        
-        return datetime.now() > expires_at
-    
-    def _cleanup_expired(self):
-        """Nettoie les entrées expirées"""
-        to_remove = []
-        for key, entry in self.cache.items():
-            if self._is_expired(entry):
-                to_remove.append(key)
-        
-        for key in to_remove:
-            del self.cache[key]
-            self.misses += 1  # Compter comme un miss car on ne peut pas l'utiliser
-        
-        if to_remove:
-            logger.debug(f"🧹 {len(to_remove)} entrées expirées nettoyées")
-    
+        self.expirations = 0
+        self.erreurs_redis = 0
+
+        logger.info(f"✅ CacheManager initialisé (TTL: {ttl_hours}h, Max: {max_size}, Redis: {use_redis})")
+
+    @staticmethod
+    def hash_fichier(filepath: str) -> str:
+        """
+        Calcule la clé de contenu d'un fichier (SHA-256 hexadécimal de ses octets)
+        """
+        sha = hashlib.sha256()
+        with open(filepath, "rb") as f:
+            for bloc in iter(lambda: f.read(_TAILLE_BLOC_HASH), b""):
+                sha.update(bloc)
+        return sha.hexdigest()
+
+    def _redis_client(self):
+        """Client Redis résolu paresseusement (évite la connexion à l'import)"""
+        if not self.use_redis:
+            return None
+        if self._redis is None:
+            self._redis = get_redis_client()
+            if self._redis is None:
+                # Pas de Redis : on reste en mémoire seule
+                self.use_redis = False
+        return self._redis
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _cleanup_expired(self, now: Optional[float] = None):
+        """Nettoie les entrées expirées (uniquement celles arrivées à échéance) - appelé sous self._lock"""
+        now = time.monotonic() if now is None else now
+        removed = 0
+        while self._echeances and self._echeances[0][0] <= now:
+            expires_at, key = heapq.heappop(self._echeances)
+            entry = self.cache.get(key)
+            # Échéance périmée si la clé a été réécrite depuis
+            if entry is not None and entry[0] == expires_at:
+                del self.cache[key]
+                removed += 1
+
+        if removed:
+            self.expirations += removed
+            logger.debug(f"🧹 {removed} entrées expirées nettoyées")
+
+        # Compacter le tas si les échéances périmées s'accumulent
+        if len(self._echeances) > 2 * len(self.cache) + 64:
+            self._echeances = [(entry[0], key) for key, entry in self.cache.items()]
+            heapq.heapify(self._echeances)
+
     def _evict_lru(self):
         """Supprime l'entrée la moins récemment utilisée si le cache est plein"""
-        if len(self.cache) >= self.max_size:
+        while len(self.cache) >= self.max_size:
             # Supprimer la première entrée (la moins récemment utilisée)
-            oldest_key = next(iter(self.cache))
-            del self.cache[oldest_key]
+            oldest_key, _ = self.cache.popitem(last=False)
             logger.debug(f"🗑️ Entrée LRU supprimée: {oldest_key[:20]}...")
-    
+
+    def _set_local(self, key: str, value: Any, ttl_seconds: float):
+        self.cache.pop(key, None)
+        self._evict_lru()
+        expires_at = time.monotonic() + ttl_seconds
+        self.cache[key] = (expires_at, value)
+        heapq.heappush(self._echeances, (expires_at, key))
+
     def get(self, key: str) -> Optional[Any]:
         """
-        Récupère une valeur du cache
-        
+        Récupère une valeur du cache (mémoire puis Redis)
+
         Args:
-            key: Clé de l'entrée (généralement le chemin du fichier)
-        
+            key: Clé de l'entrée (généralement le hash du contenu du fichier)
+
         Returns:
             La valeur mise en cache ou None si absente/expirée
         """
-        # Nettoyer les entrées expirées
-        self._cleanup_expired()
-        
-        if key not in self.cache:
-            self.misses += 1
-            return None
-        
-        entry = self.cache[key]
-        
-        # Vérifier si expirée
-        if self._is_expired(entry):
-            del self.cache[key]
+        with self._lock:
+            self._cleanup_expired()
+
+            entry = self.cache.get(key)
+            if entry is not None:
+                # Déplacer à la fin (LRU - most recently used)
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        # Aller-retour Redis hors verrou : ne bloque pas les autres threads
+        client = self._redis_client()
+        if client is not None:
+            try:
+                redis_key = self._redis_key(key)
+                brut = client.get(redis_key)
+                if brut is not None:
+                    value = json.loads(brut)
+                    # Remonter l'entrée en mémoire pour la durée de vie restante
+                    ttl_restant = client.ttl(redis_key)
+                    with self._lock:
+                        self._set_local(key, value, ttl_restant if ttl_restant and ttl_restant > 0 else self.ttl_seconds)
+                        self.hits_redis += 1
+                    return value
+            except Exception as e:
+                with self._lock:
+                    self.erreurs_redis += 1
+                logger.warning(f"⚠️ Lecture du cache Redis impossible ({key[:12]}...): {e}")
+
+        with self._lock:
             self.misses += 1
-            return None
-        
-        # Déplacer à la fin (LRU - most recently used)
-        self.cache.move_to_end(key)
-        self.hits += 1
-        
-        return entry["value"]
-    
+        return None
+
     def set(self, key: str, value: Any):
         """
-        Stocke une valeur dans le cache
-        
+        Stocke une valeur dans le cache (mémoire et Redis)
+
         Args:
             key: Clé de l'entrée
-            value: Valeur à stocker
+            value: Valeur à stocker (sérialisable en JSON pour le niveau Redis)
         """
-        # Nettoyer les entrées expirées
-        self._cleanup_expired()
-        
-        # Évincer si nécessaire
-        self._evict_lru()
-        
-        # Calculer la date d'expiration
-        expires_at = datetime.now() + timedelta(hours=self.ttl_hours)
-        
-        # Stocker l'entrée
-        self.cache[key] = {
-            "value": value,
-            "expires_at": expires_at.isoformat(),
-            "created_at": datetime.now().isoformat()
-        }
-        
-        # Déplacer à la fin (LRU - most recently used)
-        self.cache.move_to_end(key)
-    
+        with self._lock:
+            self._cleanup_expired()
+            self._set_local(key, value, self.ttl_seconds)
+
+        client = self._redis_client()
+        if client is not None:
+            try:
+                client.setex(self._redis_key(key), self.ttl_seconds, json.dumps(value, default=str))
+            except Exception as e:
+                with self._lock:
+                    self.erreurs_redis += 1
+                logger.warning(f"⚠️ Écriture du cache Redis impossible ({key[:12]}...): {e}")
+
     def clear(self):
-        """Vide complètement le cache"""
-        self.cache.clear()
-        self.hits = 0
-        self.misses = 0
+        """Vide complètement le cache mémoire (le niveau Redis expire de lui-même)"""
+        with self._lock:
+            self.cache.clear()
+            self._echeances = []
+            self.hits = 0
+            self.hits_redis = 0
+            self.misses = 0
+            self.expirations = 0
         logger.info("🗑️ Cache vidé")
-    
+
     def get_stats(self) -> Dict:
         """
         Retourne les statistiques du cache
-        
+
         Returns:
             Dictionnaire avec les statistiques
         """
-        self._cleanup_expired()
-        
-        total_requests = self.hits + self.misses
-        hit_rate = (self.hits / total_requests * 100) if total_requests > 0 else 0
-        
-        return {
-            "size": len(self.cache),
-            "max_size": self.max_size,
-            "hits": self.hits,
-            "misses": self.misses,
-            "hit_rate": round(hit_rate, 2),
-            "ttl_hours": self.ttl_hours
-        }
+        with self._lock:
+            self._cleanup_expired()
+
+            total_hits = self.hits + self.hits_redis
+            total_requests = total_hits + self.misses
+            hit_rate = (total_hits / total_requests * 100) if total_requests > 0 else 0
+
+            return {
+                "size": len(self.cache),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "hits_redis": self.hits_redis,
+                "misses": self.misses,
+                "expirations": self.expirations,
+                "erreurs_redis": self.erreurs_redis,
+                "hit_rate": round(hit_rate, 2),
+                "ttl_hours": self.ttl_hours,
+                "redis": self.use_redis and self._redis is not None
+            }
@@ -102,7 +102,45 @@ class Config:
         # ═══════════════════════════════════════════════════════════
         
         self.LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO" if self.IS_PRODUCTION else "DEBUG")
-        
+
+        # ═══════════════════════════════════════════════════════════
+        # CONFIGURATION MOTEUR OCR (pool de processus)
+        # ═══════════════════════════════════════════════════════════
+
+        # Par défaut : un processus par cœur en laissant un cœur au serveur API
+        cpu_count = os.cpu_count() or 2
+        self.OCR_MAX_WORKERS = int(os.getenv("OCR_MAX_WORKERS", str(max(1, cpu_count - 1))))
+        # Nombre maximum de documents en attente + en cours avant refus (back-pressure)
+        self.OCR_MAX_PENDING = int(os.getenv("OCR_MAX_PENDING", str(self.OCR_MAX_WORKERS * 4)))
+        # Durée maximale d'analyse d'un document (secondes)
+        self.OCR_JOB_TIMEOUT = float(os.getenv("OCR_JOB_TIMEOUT", "120"))
+        # Méthode de démarrage des processus ('spawn' évite de dupliquer l'état du serveur)
+        self.OCR_MP_CONTEXT = os.getenv("OCR_MP_CONTEXT", "spawn")
+        # Pages d'un même PDF OCRisées en parallèle (threads : Tesseract tourne en sous-processus).
+        # Chaque worker du moteur ouvre ses propres threads de pages : le défaut partage les cœurs
+        # entre documents et pages (1 thread par document quand le pool occupe déjà tous les cœurs)
+        pages_par_worker = max(1, cpu_count // max(1, self.OCR_MAX_WORKERS))
+        self.OCR_PAGE_WORKERS = int(os.getenv("OCR_PAGE_WORKERS", str(min(4, pages_par_worker))))
+        # Rasterisation adaptative : DPI de départ, puis DPI max pour les pages peu lisibles
+        self.OCR_DPI_INITIAL = int(os.getenv("OCR_DPI_INITIAL", "200"))
+        self.OCR_DPI_MAX = int(os.getenv("OCR_DPI_MAX", "300"))
+        # Confiance moyenne (0-1) sous laquelle une page est re-rasterisée à OCR_DPI_MAX
+        self.OCR_SEUIL_CONFIANCE_PAGE = float(os.getenv("OCR_SEUIL_CONFIANCE_PAGE", "0.70"))
+        # Cache des résultats OCR adressé par le contenu (SHA-256), mémoire + Redis
+        self.OCR_CACHE_ENABLED = os.getenv("OCR_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+        self.OCR_CACHE_TTL_HOURS = float(os.getenv("OCR_CACHE_TTL_HOURS", "24"))
+        self.OCR_CACHE_MAX_SIZE = int(os.getenv("OCR_CACHE_MAX_SIZE", "256"))
+
+        # ═══════════════════════════════════════════════════════════
+        # CONFIGURATION FILE D'ANALYSE (QueueManager)
+        # ═══════════════════════════════════════════════════════════
+
+        self.QUEUE_MAX_WORKERS = int(os.getenv("IA_QUEUE_MAX_WORKERS", "3"))
+        # Demandes en attente au-delà desquelles les ajouts sont refusés
+        self.QUEUE_MAX_EN_ATTENTE = int(os.getenv("IA_QUEUE_MAX_EN_ATTENTE", "100"))
+        # Durée de conservation des demandes terminées (secondes)
+        self.QUEUE_TTL_TERMINEES = float(os.getenv("IA_QUEUE_TTL_TERMINEES", "3600"))
+
         if self.IS_PRODUCTION:
             self.LOG_DIR = os.getenv("LOG_DIR", "/var/log/ia_module")
         else:
@@ -126,7 +164,19 @@ class Config:
             "api_port": self.API_PORT,
             "ia_service_url": self.IA_SERVICE_URL,
             "temp_dir": self.TEMP_DIR,
-            "log_level": self.LOG_LEVEL
+            "log_level": self.LOG_LEVEL,
+            "ocr_max_workers": self.OCR_MAX_WORKERS,
+            "ocr_max_pending": self.OCR_MAX_PENDING,
+            "ocr_job_timeout": self.OCR_JOB_TIMEOUT,
+            "ocr_page_workers": self.OCR_PAGE_WORKERS,
+            "ocr_dpi_initial": self.OCR_DPI_INITIAL,
+            "ocr_dpi_max": self.OCR_DPI_MAX,
+            "ocr_seuil_confiance_page": self.OCR_SEUIL_CONFIANCE_PAGE,
+            "ocr_cache_enabled": self.OCR_CACHE_ENABLED,
+            "ocr_cache_ttl_hours": self.OCR_CACHE_TTL_HOURS,
+            "queue_max_workers": self.QUEUE_MAX_WORKERS,
+            "queue_max_en_attente": self.QUEUE_MAX_EN_ATTENTE,
+            "queue_ttl_terminees": self.QUEUE_TTL_TERMINEES
         }
     
     def print_config(self):
@@ -0,0 +1,338 @@
+"""
+Moteur d'exécution OCR - pool de processus dédié
+Sort l'analyse des documents (pdf2image + Tesseract) de la boucle d'événements
+pour que les requêtes SOS, login et paiement continuent d'être servies.
+
+UTILISATION:
+    from app.ia_module.ocr_engine import ocr_engine
+
+    # Depuis un endpoint async
+    resultat = await ocr_engine.analyser_async("document.pdf")
+
+    # Depuis du code synchrone (thread d'arrière-plan, tâche Celery)
+    resultat = ocr_engine.analyser("document.pdf")
+
+Dans un worker Celery (processus « daemon » qui ne peut pas créer d'enfants),
+le moteur utilise un pool de threads : le worker est déjà un processus dédié.
+"""
+import asyncio
+import logging
+import math
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .analyse import analyser_document
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+
+def _analyser_chronometre(filepath: str, infos_client_reference: Optional[Dict] = None) -> Dict[str, Any]:
+    """Exécuté dans le worker : analyse le document et ajoute la durée d'analyse (ms)"""
+    debut = time.perf_counter()
+    resultat = analyser_document(filepath, infos_client_reference)
+    resultat["duree_ms"] = round((time.perf_counter() - debut) * 1000)
+    return resultat
+
+
+class OCREngineSature(RuntimeError):
+    """Levée quand trop de documents sont déjà en attente d'analyse (back-pressure)"""
+
+
+class OCRTimeout(TimeoutError):
+    """Levée quand l'analyse d'un document dépasse le délai autorisé"""
+
+
+class OCREngine:
+    """
+    Pool de processus borné pour l'analyse OCR des documents
+
+    - Nombre de processus configurable (par défaut: nombre de cœurs - 1)
+    - Back-pressure: au-delà de `max_pending` documents (en attente + en cours),
+      les nouvelles soumissions sont refusées ou mises en attente
+    - Timeout par document avec annulation des analyses non démarrées
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        job_timeout: Optional[float] = None,
+        mp_context: Optional[str] = None
+    ):
+        """
+        Initialise le moteur (le pool est créé à la première soumission)
+
+        Args:
+            max_workers: Nombre de processus OCR (défaut: config.OCR_MAX_WORKERS)
+            max_pending: Nombre maximum de documents en attente + en cours
+            job_timeout: Durée maximale d'analyse d'un document en secondes
+            mp_context: Méthode de démarrage des processus ('spawn', 'fork', ...)
+        """
+        self.max_workers = max_workers or config.OCR_MAX_WORKERS
+        self.max_pending = max(max_pending or config.OCR_MAX_PENDING, self.max_workers)
+        self.job_timeout = job_timeout or config.OCR_JOB_TIMEOUT
+        self.mp_context = mp_context or config.OCR_MP_CONTEXT
+
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+        self._en_cours = 0
+        self._terminees = 0
+        self._erreurs = 0
+        self._timeouts = 0
+        self._refusees = 0
+
+    def _get_executor(self) -> Executor:
+        """Crée le pool de processus à la demande (pool de threads dans un processus daemon)"""
+        with self._lock:
+            if self._executor is None:
+                if multiprocessing.current_process().daemon:
+                    # Worker Celery prefork : les processus daemon ne peuvent pas avoir d'enfants
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix="ocr"
+                    )
+                    logger.info(f"✅ Moteur OCR démarré en threads ({self.max_workers} threads, {self.max_pending} documents max)")
+                else:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context(self.mp_context)
+                    )
+                    logger.info(f"✅ Moteur OCR démarré ({self.max_workers} processus, {self.max_pending} documents max)")
+            return self._executor
+
+    def _reset_executor(self):
+        """Abandonne un pool cassé (processus tué) pour en recréer un à la prochaine soumission"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+            logger.warning("⚠️ Pool OCR réinitialisé après la perte d'un processus")
+
+    def _liberer(self, future: Future):
+        """Callback de fin d'analyse : libère la place et met à jour les compteurs"""
+        self._slots.release()
+        erreur = None if future.cancelled() else future.exception()
+        with self._lock:
+            self._en_cours -= 1
+            if erreur is not None:
+                self._erreurs += 1
+            elif not future.cancelled():
+                self._terminees += 1
+        if isinstance(erreur, BrokenProcessPool):
+            self._reset_executor()
+
+    def soumettre(
+        self,
+        filepath: str,
+        infos_client_reference: Optional[Dict] = None,
+        bloquant: bool = False,
+        attente: Optional[float] = None
+    ) -> Future:
+        """
+        Soumet un document au pool OCR
+
+        Args:
+            filepath: Chemin du fichier à analyser
+            infos_client_reference: Informations de référence pour la cohérence entre documents
+            bloquant: Si True, attend qu'une place se libère au lieu de refuser immédiatement
+            attente: Durée maximale d'attente d'une place en mode bloquant (secondes)
+
+        Returns:
+            Future concurrent dont le résultat est celui de `analyser_document`,
+            complété de `duree_ms` (durée d'analyse dans le worker)
+
+        Raises:
+            OCREngineSature: si la file est pleine
+        """
+        if not self._slots.acquire(blocking=bloquant, timeout=attente if bloquant else None):
+            raise self._sature()
+        return self._lancer(filepath, infos_client_reference)
+
+    def soumettre_lot(self, filepaths: List[str], infos_client_reference: Optional[Dict] = None) -> List[Future]:
+        """
+        Soumet plusieurs documents d'une requête : tous sont acceptés, ou aucun.
+
+        Les places sont réservées avant toute soumission ; s'il en manque une,
+        OCREngineSature est levée sans qu'aucune analyse n'ait démarré.
+        """
+        reservees = 0
+        while reservees < len(filepaths) and self._slots.acquire(blocking=False):
+            reservees += 1
+        if reservees < len(filepaths):
+            for _ in range(reservees):
+                self._slots.release()
+            raise self._sature()
+
+        futures = []
+        try:
+            for filepath in filepaths:
+                futures.append(self._lancer(filepath, infos_client_reference))
+        except Exception:
+            # _lancer a rendu la place du document en échec ; rendre celles des suivants
+            for _ in range(len(filepaths) - len(futures) - 1):
+                self._slots.release()
+            for future in futures:
+                future.cancel()
+            raise
+        return futures
+
+    def _sature(self) -> OCREngineSature:
+        with self._lock:
+            self._refusees += 1
+        return OCREngineSature(
+            f"Moteur OCR saturé ({self.max_pending} documents en attente ou en cours)"
+        )
+
+    def _lancer(self, filepath: str, infos_client_reference: Optional[Dict]) -> Future:
+        """Soumet un document dont la place est déjà réservée (rendue si la soumission échoue)"""
+        try:
+            future = self._get_executor().submit(_analyser_chronometre, filepath, infos_client_reference)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._reset_executor()
+            raise
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._en_cours += 1
+        future.add_done_callback(self._liberer)
+        return future
+
+    def _timeout(self, future: Future, filepath: str, timeout: float) -> OCRTimeout:
+        """Annule une analyse trop longue (si elle n'a pas démarré) et construit l'erreur"""
+        future.cancel()
+        with self._lock:
+            self._timeouts += 1
+        logger.warning(f"⏱️ Analyse OCR trop longue pour {filepath} (> {timeout}s)")
+        return OCRTimeout(f"Analyse du document interrompue après {timeout:.0f}s")
+
+    def analyser(
+        self,
+        filepath: str,
+        infos_client_reference: Optional[Dict] = None,
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Analyse un document de manière synchrone (pour threads et tâches Celery)
+
+        Attend une place dans la file si elle est pleine, puis attend le résultat
+        au plus `timeout` secondes.
+        """
+        timeout = timeout or self.job_timeout
+        future = self.soumettre(filepath, infos_client_reference, bloquant=True, attente=timeout)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise self._timeout(future, filepath, timeout)
+
+    async def analyser_async(
+        self,
+        filepath: str,
+        infos_client_reference: Optional[Dict] = None,
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Analyse un document sans bloquer la boucle d'événements
+
+        Refuse immédiatement le document si la file est pleine (OCREngineSature)
+        pour que l'appelant puisse répondre 503 plutôt que d'accumuler des requêtes.
+        """
+        future = self.soumettre(filepath, infos_client_reference)
+        return await self.attendre_async(future, filepath, timeout)
+
+    async def attendre_async(self, future: Future, filepath: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Attend le résultat d'une analyse soumise, au plus `timeout` secondes.
+
+        Au-delà, OCRTimeout est levée ; une analyse déjà démarrée n'est pas interrompue
+        (le processus garde sa place jusqu'à la fin et le fichier doit rester en place).
+        """
+        timeout = timeout or self.job_timeout
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise self._timeout(future, filepath, timeout)
+
+    def analyser_lot(
+        self,
+        filepaths: List[str],
+        timeout: Optional[float] = None
+    ) -> Iterator[Tuple[int, Optional[Dict[str, Any]], Optional[Exception], float]]:
+        """
+        Analyse plusieurs documents en parallèle (dans la limite du pool) et rend
+        les résultats au fil de l'eau, dans l'ordre de fin d'analyse
+
+        Yields:
+            (index du document, résultat ou None, exception ou None, durée totale en ms
+            depuis la soumission, attente dans la file comprise)
+        """
+        timeout = timeout or self.job_timeout
+        futures: Dict[Future, int] = {}
+        debuts: Dict[int, float] = {}
+
+        for index, filepath in enumerate(filepaths):
+            debuts[index] = time.perf_counter()
+            try:
+                futures[self.soumettre(filepath, bloquant=True, attente=timeout)] = index
+            except Exception as e:
+                yield index, None, e, 0.0
+
+        # Les documents d'un même lot se partagent les processus : délai global par vagues
+        vagues = math.ceil(len(futures) / self.max_workers) if futures else 0
+        restants = set(futures)
+        try:
+            for future in as_completed(futures, timeout=timeout * vagues):
+                restants.discard(future)
+                index = futures[future]
+                duree_totale_ms = round((time.perf_counter() - debuts[index]) * 1000)
+                try:
+                    yield index, future.result(), None, duree_totale_ms
+                except Exception as e:
+                    yield index, None, e, duree_totale_ms
+        except FutureTimeoutError:
+            for future in restants:
+                index = futures[future]
+                erreur = self._timeout(future, filepaths[index], timeout * vagues)
+                yield index, None, erreur, round((time.perf_counter() - debuts[index]) * 1000)
+
+    def get_stats(self) -> Dict:
+        """
+        Retourne les statistiques du moteur OCR
+
+        Returns:
+            Dictionnaire avec les statistiques
+        """
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "job_timeout": self.job_timeout,
+                "en_cours": self._en_cours,
+                "terminees": self._terminees,
+                "erreurs": self._erreurs,
+                "timeouts": self._timeouts,
+                "refusees": self._refusees,
+                "demarre": self._executor is not None
+            }
+
+    def stop(self, wait: bool = False):
+        """Arrête le pool de processus et annule les analyses non démarrées"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+            logger.info("🛑 Moteur OCR arrêté")
+
+
+# Instance globale partagée par les endpoints IA et le service d'analyse automatique
+ocr_engine = OCREngine()
@@ -1,17 +1,38 @@
 """
 Gestionnaire de queue pour traiter les demandes d'analyse de manière asynchrone
 Permet de gérer plusieurs demandes simultanément sans bloquer le serveur
+
+- File bornée : au-delà de `max_en_attente` demandes en attente, les ajouts sont refusés
+- Les demandes terminées sont évincées après `ttl_terminees` secondes (tas d'échéances)
+- Compteurs par statut tenus à jour à chaque transition (O(1))
+- Statuts finaux persistés dans Redis (partagés entre workers, conservés au redémarrage) ;
+  une demande en attente ou en cours vit dans la file mémoire et ne survit pas au processus
+- Histogrammes de profondeur de file et de latences (attente, traitement)
 """
 import asyncio
+import heapq
+import json
 import logging
+import time
 from enum import Enum
-from typing import Dict, Optional, Callable, Any
+from typing import Dict, List, Optional, Callable, Any
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor
 import threading
 
+from .cache_manager import get_redis_client
+from .config import config
+
 logger = logging.getLogger(__name__)
 
+# Bornes des histogrammes (secondes pour les latences, nombre de demandes pour la file)
+BUCKETS_LATENCE = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BUCKETS_PROFONDEUR = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+
+# Horloge des latences et des TTL (distincte de celle de la boucle asyncio)
+_horloge = time.monotonic
+
+
 class StatutDemande(Enum):
     """Statuts possibles d'une demande"""
     EN_ATTENTE = "en_attente"
@@ -19,40 +40,175 @@ class StatutDemande(Enum):
     TERMINE = "termine"
     ERREUR = "erreur"
 
+
+STATUTS_FINAUX = {StatutDemande.TERMINE.value, StatutDemande.ERREUR.value}
+
+
+class QueueSaturee(RuntimeError):
+    """Levée quand la file d'attente est pleine (back-pressure)"""
+
+
+class Histogramme:
+    """Histogramme cumulatif à bornes fixes (format compatible Prometheus)"""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = tuple(buckets)
+        self.compteurs = [0] * (len(self.buckets) + 1)  # dernier = +Inf
+        self.total = 0
+        self.somme = 0.0
+
+    def observer(self, valeur: float):
+        """Enregistre une observation"""
+        for i, borne in enumerate(self.buckets):
+            if valeur <= borne:
+                self.compteurs[i] += 1
+                break
+        else:
+            self.compteurs[-1] += 1
+        self.total += 1
+        self.somme += valeur
+
+    def to_dict(self) -> Dict:
+        """Buckets cumulés, nombre d'observations, somme et moyenne"""
+        cumul = 0
+        buckets = {}
+        for borne, compteur in zip(list(self.buckets) + ["+Inf"], self.compteurs):
+            cumul += compteur
+            buckets[str(borne)] = cumul
+        return {
+            "buckets": buckets,
+            "count": self.total,
+            "sum": round(self.somme, 3),
+            "moyenne": round(self.somme / self.total, 3) if self.total else 0
+        }
+
+
 class QueueManager:
     """
     Gestionnaire de queue pour traiter les demandes d'analyse
-    
+
     Utilise un pool de workers pour traiter plusieurs demandes en parallèle
     """
-    
-    def __init__(self, max_workers: int = 3):
+
+    def __init__(
+        self,
+        max_workers: int = 3,
+        max_en_attente: Optional[int] = None,
+        ttl_terminees: Optional[float] = None,
+        namespace: str = "ia:queue",
+        use_redis: bool = True,
+        redis_client=None
+    ):
         """
         Initialise le gestionnaire de queue
-        
+
         Args:
             max_workers: Nombre maximum de workers pour traiter les demandes
+            max_en_attente: Nombre maximum de demandes en attente avant refus
+            ttl_terminees: Durée de conservation des demandes terminées (secondes)
+            namespace: Préfixe des clés Redis
+            use_redis: Active la persistance des statuts dans Redis
+            redis_client: Client Redis explicite (défaut: client de l'application)
         """
         self.max_workers = max_workers
+        self.max_en_attente = max_en_attente or config.QUEUE_MAX_EN_ATTENTE
+        self.ttl_terminees = ttl_terminees or config.QUEUE_TTL_TERMINEES
+        self.namespace = namespace
+        self.use_redis = use_redis
+        self._redis = redis_client
+
         self.demandes: Dict[str, Dict] = {}  # {demande_id: {status, created_at, result, error}}
-        self.queue: asyncio.Queue = None
+        self.queue: Optional[asyncio.Queue] = None
         self.workers: list = []
-        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ia-queue")
         self.lock = threading.Lock()
-        self._loop = None
         self._running = False
-        
-        logger.info(f"✅ QueueManager initialisé avec {max_workers} workers")
-    
-    def _get_loop(self):
-        """Récupère ou crée la boucle d'événements"""
+
+        # Compteurs par statut (mis à jour à chaque transition)
+        self._compteurs: Dict[str, int] = {statut.value: 0 for statut in StatutDemande}
+        self._refusees = 0
+        self._evincees = 0
+        # Tas (échéance, demande_id) des demandes terminées à évincer
+        self._echeances: List[tuple] = []
+        # Instants (monotonic) de mise en file / début de traitement
+        self._horodatages: Dict[str, float] = {}
+
+        self.histo_profondeur = Histogramme(BUCKETS_PROFONDEUR)
+        self.histo_attente = Histogramme(BUCKETS_LATENCE)
+        self.histo_traitement = Histogramme(BUCKETS_LATENCE)
+
+        logger.info(f"✅ QueueManager initialisé avec {max_workers} workers (file max: {self.max_en_attente})")
+
+    # ------------------------------------------------------------------
+    # Persistance Redis
+    # ------------------------------------------------------------------
+
+    def _redis_client(self):
+        """Client Redis résolu paresseusement (mémoire seule si indisponible)"""
+        if not self.use_redis:
+            return None
+        if self._redis is None:
+            self._redis = get_redis_client()
+            if self._redis is None:
+                self.use_redis = False
+        return self._redis
+
+    def _redis_key(self, demande_id: str) -> str:
+        return f"{self.namespace}:demande:{demande_id}"
+
+    def _persister(self, demande_id: str, demande: Dict):
+        """
+        Enregistre le statut final d'une demande dans Redis
+
+        Seuls les statuts finaux sont persistés : une demande en attente ou en cours
+        ne peut pas reprendre après un redémarrage et resterait bloquée dans Redis.
+        """
+        if demande["status"] not in STATUTS_FINAUX:
+            return
+        client = self._redis_client()
+        if client is None:
+            return
         try:
-            return asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            return loop
-    
+            client.setex(
+                self._redis_key(demande_id), max(1, int(self.ttl_terminees)),
+                json.dumps(demande, default=str)
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Statut de la demande {demande_id} non persisté dans Redis: {e}")
+
+    # ------------------------------------------------------------------
+    # Transitions et éviction
+    # ------------------------------------------------------------------
+
+    def _changer_statut(self, demande_id: str, statut: StatutDemande, **champs) -> Optional[Dict]:
+        """Applique une transition de statut et met à jour les compteurs (lock requis)"""
+        demande = self.demandes.get(demande_id)
+        if demande is None:
+            return None
+        self._compteurs[demande["status"]] -= 1
+        self._compteurs[statut.value] += 1
+        demande["status"] = statut.value
+        demande.update(champs)
+        if statut.value in STATUTS_FINAUX:
+            heapq.heappush(self._echeances, (_horloge() + self.ttl_terminees, demande_id))
+            self._horodatages.pop(demande_id, None)
+        return dict(demande)
+
+    def _evincer_terminees(self):
+        """Évince les demandes terminées dont le TTL est échu (lock requis)"""
+        maintenant = _horloge()
+        while self._echeances and self._echeances[0][0] <= maintenant:
+            _, demande_id = heapq.heappop(self._echeances)
+            demande = self.demandes.get(demande_id)
+            if demande is not None and demande["status"] in STATUTS_FINAUX:
+                del self.demandes[demande_id]
+                self._compteurs[demande["status"]] -= 1
+                self._evincees += 1
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+
     async def _worker(self):
         """Worker qui traite les demandes de la queue"""
         while self._running:
@@ -60,147 +216,213 @@ class QueueManager:
                 # Récupérer une demande de la queue (timeout de 1 seconde)
                 item = await asyncio.wait_for(self.queue.get(), timeout=1.0)
                 demande_id, fonction, *args = item
-                
+                debut = _horloge()
+
                 # Mettre à jour le statut
                 with self.lock:
-                    if demande_id in self.demandes:
-                        self.demandes[demande_id]["status"] = StatutDemande.EN_TRAITEMENT.value
-                
+                    mis_en_file = self._horodatages.get(demande_id, debut)
+                    self._horodatages[demande_id] = debut
+                    demande = self._changer_statut(
+                        demande_id, StatutDemande.EN_TRAITEMENT,
+                        started_at=datetime.now().isoformat()
+                    )
+                    self.histo_attente.observer(debut - mis_en_file)
+
                 logger.info(f"🔄 Worker traite la demande {demande_id}")
-                
+
                 try:
                     # Exécuter la fonction de traitement
                     if asyncio.iscoroutinefunction(fonction):
                         result = await fonction(*args)
                     else:
                         # Si c'est une fonction synchrone, l'exécuter dans le thread pool
-                        loop = self._get_loop()
+                        loop = asyncio.get_running_loop()
                         result = await loop.run_in_executor(self.executor, fonction, *args)
-                    
+
                     # Mettre à jour avec le résultat
                     with self.lock:
-                        if demande_id in self.demandes:
-                            self.demandes[demande_id]["status"] = StatutDemande.TERMINE.value
-                            self.demandes[demande_id]["result"] = result
-                            self.demandes[demande_id]["completed_at"] = datetime.now().isoformat()
-                    
+                        demande = self._changer_statut(
+                            demande_id, StatutDemande.TERMINE,
+                            result=result,
+                            completed_at=datetime.now().isoformat()
+                        )
+
                     logger.info(f"✅ Demande {demande_id} traitée avec succès")
-                    
+
                 except Exception as e:
                     # Mettre à jour avec l'erreur
                     error_msg = str(e)
                     logger.error(f"❌ Erreur lors du traitement de {demande_id}: {error_msg}")
-                    
+
                     with self.lock:
-                        if demande_id in self.demandes:
-                            self.demandes[demande_id]["status"] = StatutDemande.ERREUR.value
-                            self.demandes[demande_id]["error"] = error_msg
-                
+                        demande = self._changer_statut(
+                            demande_id, StatutDemande.ERREUR,
+                            error=error_msg,
+                            completed_at=datetime.now().isoformat()
+                        )
+
                 finally:
+                    with self.lock:
+                        self.histo_traitement.observer(_horloge() - debut)
                     self.queue.task_done()
-                    
+
+                if demande:
+                    self._persister(demande_id, demande)
+
             except asyncio.TimeoutError:
                 # Timeout normal, continuer la boucle
                 continue
             except Exception as e:
                 logger.error(f"❌ Erreur dans le worker: {e}")
                 await asyncio.sleep(1)  # Attendre avant de réessayer
-    
+
     async def _start_workers(self):
         """Démarre les workers"""
         if self._running:
             return
-        
+
         self._running = True
-        self.queue = asyncio.Queue()
-        
+        self.queue = asyncio.Queue(maxsize=self.max_en_attente)
+
         # Créer les workers
         for i in range(self.max_workers):
             worker = asyncio.create_task(self._worker())
             self.workers.append(worker)
             logger.info(f"✅ Worker {i+1}/{self.max_workers} démarré")
-    
+
+    # ------------------------------------------------------------------
+    # API publique
+    # ------------------------------------------------------------------
+
     async def ajouter_demande(
         self,
         demande_id: str,
         fonction: Callable,
         *args
-    ):
+    ) -> bool:
         """
-        Ajoute une demande à la queue pour traitement asynchrone
-        
+        Ajoute une demande à la queue pour traitement asynchrone.
+
+        Idempotent : une demande de même ID encore en attente ou en traitement
+        n'est pas remplacée (son statut passerait sinon à la nouvelle et fausserait les compteurs).
+
         Args:
             demande_id: ID unique de la demande
             fonction: Fonction à exécuter (peut être async ou sync)
             *args: Arguments à passer à la fonction
+
+        Returns:
+            True si la demande a été ajoutée, False si la précédente n'est pas terminée
+
+        Raises:
+            QueueSaturee: si `max_en_attente` demandes sont déjà en attente
         """
         # Démarrer les workers si ce n'est pas déjà fait
         if not self._running:
             await self._start_workers()
-        
-        # Enregistrer la demande
+
+        demande = {
+            "status": StatutDemande.EN_ATTENTE.value,
+            "created_at": datetime.now().isoformat(),
+            "result": None,
+            "error": None
+        }
+
         with self.lock:
-            self.demandes[demande_id] = {
-                "status": StatutDemande.EN_ATTENTE.value,
-                "created_at": datetime.now().isoformat(),
-                "result": None,
-                "error": None
-            }
-        
-        # Ajouter à la queue
-        await self.queue.put((demande_id, fonction, *args))
-        
+            self._evincer_terminees()
+            precedente = self.demandes.get(demande_id)
+            if precedente is not None and precedente["status"] in (
+                StatutDemande.EN_ATTENTE.value, StatutDemande.EN_TRAITEMENT.value
+            ):
+                logger.info(f"⏭️ Demande {demande_id} déjà {precedente['status']}, ajout ignoré")
+                return False
+
+            if self.queue.full():
+                self._refusees += 1
+                raise QueueSaturee(f"File d'analyse saturée ({self.max_en_attente} demandes en attente)")
+
+            # Remplacer une demande précédente terminée de même ID (compteurs cohérents)
+            if precedente is not None:
+                del self.demandes[demande_id]
+                self._compteurs[precedente["status"]] -= 1
+
+            # Enregistrer la demande et l'ajouter à la queue
+            self.demandes[demande_id] = demande
+            self._compteurs[StatutDemande.EN_ATTENTE.value] += 1
+            self._horodatages[demande_id] = _horloge()
+            self.histo_profondeur.observer(self.queue.qsize())
+            self.queue.put_nowait((demande_id, fonction, *args))
+
         logger.info(f"📥 Demande {demande_id} ajoutée à la queue")
-    
+        return True
+
     def get_status(self, demande_id: str) -> Optional[Dict]:
         """
-        Récupère le statut d'une demande
-        
+        Récupère le statut d'une demande (mémoire locale puis Redis)
+
         Args:
             demande_id: ID de la demande
-        
+
         Returns:
             Dictionnaire avec le statut ou None si la demande n'existe pas
         """
         with self.lock:
-            return self.demandes.get(demande_id)
-    
+            self._evincer_terminees()
+            demande = self.demandes.get(demande_id)
+            if demande is not None:
+                return dict(demande)
+
+        # Demande traitée par un autre worker ou avant un redémarrage
+        client = self._redis_client()
+        if client is not None:
+            try:
+                brut = client.get(self._redis_key(demande_id))
+                return json.loads(brut) if brut else None
+            except Exception as e:
+                logger.warning(f"⚠️ Lecture du statut de la demande {demande_id} impossible: {e}")
+        return None
+
     def get_stats(self) -> Dict:
         """
         Retourne les statistiques de la queue
-        
+
         Returns:
             Dictionnaire avec les statistiques
         """
         with self.lock:
-            total = len(self.demandes)
-            en_attente = sum(1 for d in self.demandes.values() 
-                          if d["status"] == StatutDemande.EN_ATTENTE.value)
-            en_traitement = sum(1 for d in self.demandes.values() 
-                              if d["status"] == StatutDemande.EN_TRAITEMENT.value)
-            terminees = sum(1 for d in self.demandes.values() 
-                          if d["status"] == StatutDemande.TERMINE.value)
-            erreurs = sum(1 for d in self.demandes.values() 
-                         if d["status"] == StatutDemande.ERREUR.value)
-            
+            self._evincer_terminees()
             return {
-                "total": total,
-                "en_attente": en_attente,
-                "en_traitement": en_traitement,
-                "terminees": terminees,
-                "erreurs": erreurs,
-                "workers": self.max_workers
+                "total": len(self.demandes),
+                "en_attente": self._compteurs[StatutDemande.EN_ATTENTE.value],
+                "en_traitement": self._compteurs[StatutDemande.EN_TRAITEMENT.value],
+                "terminees": self._compteurs[StatutDemande.TERMINE.value],
+                "erreurs": self._compteurs[StatutDemande.ERREUR.value],
+                "refusees": self._refusees,
+                "evincees": self._evincees,
+                "workers": self.max_workers,
+                "max_en_attente": self.max_en_attente,
+                "profondeur": self.queue.qsize() if self.queue is not None else 0,
+                "histogrammes": {
+                    "profondeur_file": self.histo_profondeur.to_dict(),
+                    "attente_secondes": self.histo_attente.to_dict(),
+                    "traitement_secondes": self.histo_traitement.to_dict()
+                }
             }
-    
+
     async def stop(self):
         """Arrête les workers et nettoie les ressources"""
         self._running = False
-        
+
         # Attendre que tous les workers se terminent
         if self.workers:
             await asyncio.gather(*self.workers, return_exceptions=True)
-        
+            self.workers = []
+
         # Arrêter l'executor
         self.executor.shutdown(wait=True)
-        
+
         logger.info("🛑 QueueManager arrêté")
+
+
+# Instance globale (file d'analyse du module IA)
+queue_manager = QueueManager(max_workers=config.QUEUE_MAX_WORKERS)
@@ -14,8 +14,7 @@ from starlette.responses import Response
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from app.core.config import settings
 from app.core.database import engine, Base
-from app.middleware.logging import LoggingMiddleware
-from app.middleware.audit import AuditMiddleware
+from app.middleware.instrumentation import InstrumentationMiddleware
 from app.api.v1 import api_router
 from app.api.websocket import router as websocket_router
 
@@ -79,6 +78,26 @@ async def startup_event():
     except Exception as e:
         logger.error(f"Erreur inattendue lors de la vérification de la base de données: {e}")
 
+    # Bus Redis des notifications WebSocket (SOS) partagé entre workers
+    from app.core.websocket_manager import manager as websocket_manager
+    await websocket_manager.start()
+
+    # Écriture par lots du journal d'audit
+    from app.middleware.audit import audit_writer
+    audit_writer.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Arrêter la file d'analyse IA, le pool de processus OCR et le bus WebSocket, vider le journal d'audit"""
+    from app.core.websocket_manager import manager as websocket_manager
+    from app.middleware.audit import audit_writer
+    from app.ia_module.ocr_engine import ocr_engine
+    from app.ia_module.queue_manager import queue_manager
+    await websocket_manager.stop()
+    await queue_manager.stop()
+    ocr_engine.stop()
+    await audit_writer.stop()
+
 # CORS middleware
 # Filtrer "*" de la liste car il n'est pas compatible avec allow_credentials=True
 cors_origins = [origin for origin in settings.CORS_ORIGINS if origin != "*"]
@@ -237,8 +256,7 @@ class ForceHTTPSMiddleware(BaseHTTPMiddleware):
 
 # Custom middlewares
 app.add_middleware(ForceHTTPSMiddleware)
-app.add_middleware(LoggingMiddleware)
-app.add_middleware(AuditMiddleware)
+app.add_middleware(InstrumentationMiddleware)
 
 # Exception handlers globaux pour capturer toutes les erreurs
 @app.exception_handler(Exception)
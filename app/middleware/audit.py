@@ -1,79 +1,136 @@
-import json
+"""
+Journal d'audit des requêtes API.
+
+Le middleware d'instrumentation (app.middleware.instrumentation) ne fait aucun accès à la
+base : chaque requête est déposée dans un tampon mémoire borné. Une tâche de fond vide le tampon par lots (tous les AUDIT_BATCH_SIZE
+enregistrements ou toutes les AUDIT_FLUSH_INTERVAL_MS millisecondes) avec un INSERT
+multi-lignes dans `audit_logs`, exécuté hors de la boucle asyncio.
+Tampon plein (base lente ou indisponible) : les nouveaux enregistrements sont abandonnés
+et comptés, la mémoire du worker reste bornée.
+"""
+import asyncio
+import logging
 from datetime import datetime
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from sqlalchemy.orm import Session
-from app.core.database import SessionLocal
-from app.models.audit import AuditLog
-from app.core.security import decode_token
-
-# Create a simple in-memory store for audit logs
-# In production, you might want to use a separate database or service
-audit_logs = []
-
-
-class AuditMiddleware(BaseHTTPMiddleware):
-    """Middleware for auditing API requests"""
-    
-    async def dispatch(self, request: Request, call_next):
-        # Get user info from token if available
-        user_id = None
-        user_role = None
-        
-        auth_header = request.headers.get("Authorization")
-        if auth_header and auth_header.startswith("Bearer "):
-            token = auth_header.split(" ")[1]
-            payload = decode_token(token)
-            if payload:
-                user_id = payload.get("sub")
-                user_role = payload.get("role")
-        
-        # Prepare audit data
-        audit_data = {
-            "timestamp": datetime.utcnow().isoformat(),
-            "method": request.method,
-            "path": str(request.url.path),
-            "query_params": str(request.query_params),
-            "user_id": user_id,
-            "user_role": user_role,
-            "client_ip": request.client.host if request.client else None,
-            "user_agent": request.headers.get("user-agent"),
-        }
-        
-        # Process request
-        response = await call_next(request)
-        
-        # Add response info
-        audit_data["status_code"] = response.status_code
-        
-        # Store audit log (in production, save to database)
-        audit_logs.append(audit_data)
-        
-        # In production, you would save to database:
-        # db = SessionLocal()
-        # try:
-        #     audit_log = AuditLog(**audit_data)
-        #     db.add(audit_log)
-        #     db.commit()
-        # finally:
-        #     db.close()
-        
-        return response
-
-
-
-
-
-
-
-
-
-
-
-
-
+from typing import Dict, List, Optional
 
+from sqlalchemy import insert, select
+from starlette.concurrency import run_in_threadpool
 
+from app.core.config import settings
+from app.core.database import engine
+from app.models.audit import AuditLog
+from app.models.user import User
+from app.services.principal_cache import principal_cache
+
+logger = logging.getLogger(__name__)
+
+
+class AuditWriter:
+    """Tampon borné d'enregistrements d'audit, écrit par lots en tâche de fond"""
+
+    def __init__(
+        self,
+        bind=engine,
+        max_records: int = settings.AUDIT_BUFFER_MAX_RECORDS,
+        batch_size: int = settings.AUDIT_BATCH_SIZE,
+        flush_interval_ms: int = settings.AUDIT_FLUSH_INTERVAL_MS,
+    ):
+        self.bind = bind
+        self.max_records = max_records
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self._tampon: List[Dict] = []
+        self._lot_pret: Optional[asyncio.Event] = None
+        self._tache: Optional[asyncio.Task] = None
+        self.ecrits = 0
+        self.abandonnes = 0
+        self.echecs = 0
+
+    def enregistrer(self, enregistrement: Dict) -> bool:
+        """Dépose un enregistrement dans le tampon (sans attente) ; False s'il est abandonné"""
+        if len(self._tampon) >= self.max_records:
+            self.abandonnes += 1
+            return False
+        self._tampon.append(enregistrement)
+        if len(self._tampon) >= self.batch_size and self._lot_pret is not None:
+            self._lot_pret.set()
+        return True
+
+    def start(self):
+        """Démarre la tâche d'écriture (démarrage de l'application)"""
+        if self._tache is None:
+            self._lot_pret = asyncio.Event()
+            self._tache = asyncio.create_task(self._boucle())
+
+    async def stop(self):
+        """Arrête la tâche et écrit les enregistrements restants (arrêt de l'application)"""
+        tache, self._tache = self._tache, None
+        if tache is not None:
+            tache.cancel()
+            try:
+                await tache
+            except asyncio.CancelledError:
+                pass
+        self._lot_pret = None
+        await self.flush()
+
+    async def flush(self):
+        """Écrit tout le tampon, par lots de batch_size"""
+        while self._tampon:
+            lot = self._tampon[:self.batch_size]
+            del self._tampon[:self.batch_size]
+            try:
+                await run_in_threadpool(self._inserer, lot)
+                self.ecrits += len(lot)
+            except Exception as e:
+                self.echecs += len(lot)
+                logger.warning(f"⚠️ Écriture de {len(lot)} enregistrement(s) d'audit impossible: {e}")
+
+    async def _boucle(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._lot_pret.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._lot_pret.clear()
+            await self.flush()
+
+    def _inserer(self, lot: List[Dict]):
+        """Un INSERT multi-lignes par lot ; les usernames du jeton sont résolus en une requête"""
+        maintenant = datetime.utcnow()
+        with self.bind.begin() as connexion:
+            user_ids = self._resoudre_utilisateurs(connexion, {e["username"] for e in lot if e["username"]})
+            lignes = []
+            for enregistrement in lot:
+                ligne = {cle: valeur for cle, valeur in enregistrement.items() if cle != "username"}
+                ligne["user_id"] = user_ids.get(enregistrement["username"])
+                ligne["created_at"] = ligne["updated_at"] = maintenant
+                lignes.append(ligne)
+            connexion.execute(insert(AuditLog.__table__), lignes)
+
+    @staticmethod
+    def _resoudre_utilisateurs(connexion, usernames) -> Dict[str, int]:
+        user_ids = {}
+        for username in usernames:
+            colonnes = principal_cache.get(username)
+            if colonnes is not None:
+                user_ids[username] = colonnes["id"]
+        inconnus = usernames - user_ids.keys()
+        if inconnus:
+            lignes = connexion.execute(
+                select(User.__table__.c.username, User.__table__.c.id).where(User.__table__.c.username.in_(inconnus))
+            )
+            user_ids.update(dict(lignes.all()))
+        return user_ids
+
+    def get_stats(self) -> Dict:
+        return {
+            "buffered": len(self._tampon),
+            "written": self.ecrits,
+            "dropped": self.abandonnes,
+            "failed": self.echecs,
+        }
 
 
+audit_writer = AuditWriter()
 
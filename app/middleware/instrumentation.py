@@ -0,0 +1,81 @@
+"""
+Middleware ASGI d'instrumentation : journal des requêtes, en-tête X-Process-Time et audit.
+
+Un seul middleware ASGI pur (sans BaseHTTPMiddleware) : pas de tâche ni de file
+intermédiaire par requête, et les réponses en streaming passent telles quelles.
+Le jeton Bearer est décodé une fois ici ; get_current_user réutilise le résultat
+(`request.state.token_payload`) au lieu de le décoder de nouveau.
+"""
+import logging
+import time
+from datetime import datetime
+
+from app.core.security import decode_token
+from app.middleware import audit
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentationMiddleware:
+    """Mesure chaque requête HTTP, la journalise et la dépose dans le journal d'audit"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        debut = time.perf_counter()
+        horodatage = datetime.utcnow()
+        entetes = dict(scope["headers"])
+        payload = self._decoder_jeton(scope, entetes)
+        status_code = 500
+
+        async def send_instrumente(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                duree = time.perf_counter() - debut
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-process-time", repr(duree).encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_instrumente)
+        finally:
+            duree_ms = (time.perf_counter() - debut) * 1000
+            client = scope.get("client")
+            client_ip = client[0] if client else None
+            logger.info(
+                "request method=%s path=%s status=%s duration_ms=%.1f client=%s",
+                scope["method"], scope["path"], status_code, duree_ms, client_ip,
+            )
+            user_agent = entetes.get(b"user-agent")
+            audit.audit_writer.enregistrer({
+                "timestamp": horodatage,
+                "method": scope["method"],
+                "path": scope["path"],
+                "query_params": scope.get("query_string", b"").decode("latin-1"),
+                "username": payload.get("sub") if payload else None,
+                "user_role": payload.get("role") if payload else None,
+                "client_ip": client_ip,
+                "user_agent": user_agent.decode("latin-1") if user_agent else None,
+                "status_code": status_code,
+                "duration_ms": int(duree_ms),
+            })
+
+    @staticmethod
+    def _decoder_jeton(scope, entetes):
+        """Décode le jeton Bearer et le partage avec les dépendances via l'état de la requête"""
+        autorisation = entetes.get(b"authorization", b"").decode("latin-1")
+        if not autorisation.startswith("Bearer "):
+            return None
+        token = autorisation[len("Bearer "):]
+        payload = decode_token(token)
+        etat = scope.setdefault("state", {})
+        etat["token"] = token
+        etat["token_payload"] = payload
+        return payload
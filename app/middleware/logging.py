@@ -1,64 +0,0 @@
-import time
-import logging
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response
-
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-
-# Create handler
-handler = logging.StreamHandler()
-formatter = logging.Formatter(
-    '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-handler.setFormatter(formatter)
-logger.addHandler(handler)
-
-
-class LoggingMiddleware(BaseHTTPMiddleware):
-    """Middleware for logging HTTP requests"""
-    
-    async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
-        
-        # Log request
-        logger.info(
-            f"Request: {request.method} {request.url.path} - "
-            f"Client: {request.client.host if request.client else 'unknown'}"
-        )
-        
-        # Process request
-        response = await call_next(request)
-        
-        # Calculate process time
-        process_time = time.time() - start_time
-        
-        # Log response
-        logger.info(
-            f"Response: {response.status_code} - "
-            f"Process time: {process_time:.4f}s"
-        )
-        
-        # Add process time to response headers
-        response.headers["X-Process-Time"] = str(process_time)
-        
-        return response
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
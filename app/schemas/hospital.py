@@ -96,6 +96,24 @@ class HospitalMapMarker(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class HospitalNearbyResponse(BaseModel):
+    """Hôpital candidat pour un dispatch SOS, classé par temps de trajet estimé"""
+    id: int
+    nom: str
+    adresse: Optional[str] = None
+    ville: Optional[str] = None
+    telephone: Optional[str] = None
+    latitude: float
+    longitude: float
+    distance_km: float
+    distance_route_km: float
+    duree_trajet_minutes: float
+    capacite_lits: Optional[int] = None
+    specialites: Optional[str] = None
+    medecins_actifs: int = 0
+    personnel_actif: int = 0
+
+
 class HospitalReceptionistCreate(BaseModel):
     email: EmailStr
     username: str
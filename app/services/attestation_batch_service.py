@@ -0,0 +1,530 @@
+"""
+Régénération en masse des attestations et e-cartes (voyages de groupe, changement de logo,
+nouvelles conditions générales).
+
+La génération unitaire (AttestationService) tourne dans les requêtes API. Ce service est
+exécuté par la tâche Celery `regenerate_attestations` (queue `documents`), hors des workers API :
+1. sélection des souscriptions par filtre (ids, produit, assureur, projet de voyage, statut) ;
+2. par lot de ATTESTATION_BATCH_SIZE : chargement des souscriptions, produits, assureurs,
+   projets, paiements, attestations, abonnés et questionnaires en une requête par table,
+   puis copie en instantanés sérialisables (colonnes seulement) ; le logo de chaque
+   assureur est chargé une fois (logo_cache) et joint aux travaux ;
+3. rendu QR + PDF + carte dans un pool de ATTESTATION_BATCH_WORKERS processus
+   (pool de threads dans un processus daemon, comme le moteur OCR) ;
+4. upload MinIO avec au plus ATTESTATION_BATCH_UPLOAD_CONCURRENCY envois simultanés
+   (stockage inline si MinIO échoue, comme la génération unitaire) ;
+5. un commit par lot ; les anciens fichiers MinIO remplacés sont supprimés après le commit.
+
+Une attestation existante garde son numéro (QR code et URL de vérification inchangés) ;
+une souscription sans attestation du type demandé en reçoit une nouvelle, aux mêmes
+conditions que la génération unitaire (paiement valide, validation finale pour la définitive).
+L'avancement est publié dans Redis (repli en mémoire) et lu par
+GET /api/v1/admin/subscriptions/attestations/regenerate/{job_id}.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import traceback
+from base64 import b64encode
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session, selectinload
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.models.attestation import Attestation
+from app.models.paiement import Paiement
+from app.models.produit_assurance import ProduitAssurance
+from app.models.questionnaire import Questionnaire
+from app.models.souscription import Souscription
+from app.models.user import User
+from app.services.attestation_service import AttestationService, INLINE_BUCKET_NAME, INLINE_OBJECT_KEY
+from app.services.logo_cache import logo_cache
+from app.services.minio_service import MinioService
+
+logger = logging.getLogger(__name__)
+
+DOCUMENTS_QUEUE = "documents"
+TYPES_ATTESTATION = ("provisoire", "definitive")
+JOB_STATUS_TTL = 24 * 3600
+URL_EXPIRATION = timedelta(hours=24)
+# Erreurs détaillées conservées dans le statut (les suivantes sont seulement comptées)
+MAX_ERREURS_STATUT = 50
+
+# Repli en mémoire quand Redis est indisponible (développement, tests)
+_local_lock = threading.Lock()
+_local_statuts: Dict[str, Dict[str, Any]] = {}
+
+
+def _instantane(objet, **relations) -> Optional[SimpleNamespace]:
+    """Copie les colonnes d'un modèle (et les relations fournies) dans un objet sérialisable"""
+    if objet is None:
+        return None
+    valeurs = {attr.key: getattr(objet, attr.key) for attr in inspect(objet).mapper.column_attrs}
+    valeurs.update(relations)
+    return SimpleNamespace(**valeurs)
+
+
+def rendre_documents(travail: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Rendu d'une attestation (QR, PDF et, pour une définitive, carte) à partir d'instantanés.
+    Exécuté dans un processus du pool : pas de session base ; le logo de l'assureur est
+    fourni par le travail et déposé dans le cache des logos du processus (seul le logo
+    Mobility Health est téléchargé, une fois par processus, s'il manque sur le disque).
+    """
+    from app.services.card_service import CardService
+    from app.services.pdf_service import PDFService
+    from app.services.qrcode_service import QRCodeService
+
+    if travail.get("logo_assureur"):
+        logo_cache.seed(*travail["logo_assureur"])
+
+    numero = travail["numero_attestation"]
+    verification_url = AttestationService.build_verification_url(numero)
+    qr_buffer = QRCodeService.generate_qr_image(verification_url)
+    qr_bytes = qr_buffer.getvalue()
+    souscription = travail["souscription"]
+
+    if travail["type_attestation"] == "provisoire":
+        pdf_buffer = PDFService.generate_attestation_provisoire(
+            souscription,
+            travail["paiement"],
+            travail["user"],
+            numero,
+            qr_image_data=qr_buffer,
+            verification_url=verification_url,
+            traveler_info=travail["traveler_info"],
+        )
+        return {"pdf": pdf_buffer.read(), "carte": None}
+
+    pdf_buffer = PDFService.generate_attestation_definitive(
+        souscription,
+        travail["paiement"],
+        travail["user"],
+        numero,
+        qr_image_data=qr_buffer,
+        verification_url=verification_url,
+        traveler_info=travail["traveler_info"],
+        minors_info=travail["minors_info"],
+    )
+    carte = None
+    try:
+        carte = CardService.generate_insurance_card(
+            travail["user"],
+            souscription,
+            numero,
+            verification_url,
+            photo_bytes=travail["photo"],
+            qr_bytes=qr_bytes,
+            traveler_info=travail["traveler_info"],
+        ).getvalue()
+    except Exception as card_error:
+        # Comme la génération unitaire : l'attestation est produite même sans carte
+        logger.error(f"❌ Carte numérique non générée pour {numero}: {card_error}")
+    return {"pdf": pdf_buffer.read(), "carte": carte}
+
+
+def _televerser(souscription_id: int, type_attestation: str, numero: str, documents: Dict[str, Any]) -> Dict[str, Any]:
+    """Upload du PDF et de la carte ; stockage inline (data URI) si MinIO échoue"""
+    maintenant = datetime.utcnow()
+    champs: Dict[str, Any] = {}
+    pdf_bytes = documents["pdf"]
+    try:
+        chemin = MinioService.upload_pdf(pdf_bytes, souscription_id, type_attestation, numero)
+        champs.update(
+            chemin_fichier_minio=chemin,
+            bucket_minio=MinioService.BUCKET_ATTESTATIONS,
+            url_signee=MinioService.get_pdf_url(chemin, expires=URL_EXPIRATION),
+            date_expiration_url=maintenant + URL_EXPIRATION,
+        )
+    except Exception as storage_error:
+        logger.warning(f"⚠️ MinIO indisponible pour l'attestation {numero}, stockage inline: {storage_error}")
+        champs.update(
+            chemin_fichier_minio=INLINE_OBJECT_KEY,
+            bucket_minio=INLINE_BUCKET_NAME,
+            url_signee=f"data:application/pdf;base64,{b64encode(pdf_bytes).decode('ascii')}",
+            date_expiration_url=None,
+        )
+
+    carte_bytes = documents.get("carte")
+    if carte_bytes:
+        try:
+            chemin_carte = MinioService.upload_card_image(carte_bytes, souscription_id, numero)
+            champs.update(
+                carte_numerique_path=chemin_carte,
+                carte_numerique_bucket=MinioService.BUCKET_ATTESTATIONS,
+                carte_numerique_url=MinioService.generate_signed_url(
+                    MinioService.BUCKET_ATTESTATIONS, chemin_carte, expires=URL_EXPIRATION
+                ),
+                carte_numerique_expires_at=maintenant + URL_EXPIRATION,
+            )
+        except Exception as upload_error:
+            logger.warning(f"⚠️ Upload de la carte {numero} impossible, stockage inline: {upload_error}")
+            champs.update(
+                carte_numerique_path=INLINE_OBJECT_KEY,
+                carte_numerique_bucket=INLINE_BUCKET_NAME,
+                carte_numerique_url=f"data:image/png;base64,{b64encode(carte_bytes).decode('ascii')}",
+                carte_numerique_expires_at=None,
+            )
+    return champs
+
+
+def _fichiers_minio(attestation: Attestation) -> List[tuple]:
+    """(bucket, objet) MinIO d'une attestation, hors stockage inline"""
+    fichiers = []
+    for bucket, chemin in (
+        (attestation.bucket_minio, attestation.chemin_fichier_minio),
+        (attestation.carte_numerique_bucket, attestation.carte_numerique_path),
+    ):
+        if bucket and chemin and bucket != INLINE_BUCKET_NAME and chemin != INLINE_OBJECT_KEY:
+            fichiers.append((bucket, chemin))
+    return fichiers
+
+
+class AttestationBatchService:
+    """Régénération en masse des attestations, exécutée par un worker Celery"""
+
+    # ------------------------------------------------------------------
+    # Statut et mise en file
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _status_key(job_id: str) -> str:
+        return f"attestations:lot:statut:{job_id}"
+
+    @staticmethod
+    def set_job_status(job_id: str, statut: str, **details: Any) -> Dict[str, Any]:
+        """
+        Enregistre l'avancement d'une régénération
+
+        Statuts: en_attente, en_cours, termine, echec
+        Les champs non fournis (compteurs, filtres...) sont conservés.
+        """
+        precedent = AttestationBatchService.get_job_status(job_id) or {}
+        statut_complet = {
+            **precedent,
+            **details,
+            "job_id": job_id,
+            "statut": statut,
+            "mis_a_jour_le": datetime.utcnow().isoformat(),
+        }
+
+        redis_client = get_redis()
+        if redis_client is not None:
+            try:
+                redis_client.setex(
+                    AttestationBatchService._status_key(job_id),
+                    JOB_STATUS_TTL,
+                    json.dumps(statut_complet, default=str)
+                )
+                return statut_complet
+            except Exception as e:
+                logger.warning(f"Impossible d'enregistrer le statut de régénération dans Redis: {e}")
+
+        with _local_lock:
+            _local_statuts[job_id] = statut_complet
+        return statut_complet
+
+    @staticmethod
+    def get_job_status(job_id: str) -> Optional[Dict[str, Any]]:
+        """Retourne le dernier statut connu d'une régénération"""
+        redis_client = get_redis()
+        if redis_client is not None:
+            try:
+                brut = redis_client.get(AttestationBatchService._status_key(job_id))
+                return json.loads(brut) if brut else None
+            except Exception as e:
+                logger.warning(f"Impossible de lire le statut de régénération dans Redis: {e}")
+
+        with _local_lock:
+            statut = _local_statuts.get(job_id)
+            return dict(statut) if statut else None
+
+    @staticmethod
+    def enqueue_regeneration(type_attestation: str, filtres: Dict[str, Any], demandeur_id: Optional[int] = None) -> Dict[str, Any]:
+        """Planifie une régénération sur la queue `documents` et retourne son statut initial"""
+        import uuid
+        from app.workers.tasks import regenerate_attestations
+
+        job_id = uuid.uuid4().hex
+        AttestationBatchService.set_job_status(
+            job_id, "en_attente",
+            type_attestation=type_attestation, filtres=filtres, demandeur_id=demandeur_id,
+            total=None, traitees=0, reussies=0, ignorees=0, echecs=0, erreurs=[],
+        )
+        try:
+            regenerate_attestations.apply_async(
+                args=[job_id, type_attestation, filtres],
+                task_id=job_id,
+                queue=DOCUMENTS_QUEUE,
+            )
+        except Exception as e:
+            logger.error(f"❌ Impossible de planifier la régénération d'attestations {job_id}: {e}")
+            statut = AttestationBatchService.set_job_status(job_id, "echec", erreur="Mise en file impossible")
+            return {**statut, "mise_en_file": False}
+        logger.info(f"📄 Régénération d'attestations {type_attestation} planifiée (job {job_id})")
+        return {**AttestationBatchService.get_job_status(job_id), "mise_en_file": True}
+
+    # ------------------------------------------------------------------
+    # Sélection et préparation
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def select_souscription_ids(db: Session, filtres: Dict[str, Any]) -> List[int]:
+        """
+        Souscriptions visées par les filtres (combinés) :
+        souscription_ids, produit_id, assureur_id, projet_voyage_id, statut
+        """
+        query = db.query(Souscription.id)
+        if filtres.get("souscription_ids"):
+            query = query.filter(Souscription.id.in_(filtres["souscription_ids"]))
+        if filtres.get("produit_id") is not None:
+            query = query.filter(Souscription.produit_assurance_id == filtres["produit_id"])
+        if filtres.get("assureur_id") is not None:
+            query = query.join(ProduitAssurance, Souscription.produit_assurance_id == ProduitAssurance.id).filter(
+                ProduitAssurance.assureur_id == filtres["assureur_id"]
+            )
+        if filtres.get("projet_voyage_id") is not None:
+            query = query.filter(Souscription.projet_voyage_id == filtres["projet_voyage_id"])
+        if filtres.get("statut"):
+            query = query.filter(Souscription.statut == filtres["statut"])
+        return [ligne.id for ligne in query.order_by(Souscription.id)]
+
+    @staticmethod
+    def _preparer_lot(db: Session, ids: List[int], type_attestation: str):
+        """
+        Charge un lot de souscriptions et construit les travaux de rendu.
+        Retourne (travaux, existantes par souscription_id, ignorées).
+        """
+        souscriptions = (
+            db.query(Souscription)
+            .options(
+                selectinload(Souscription.produit_assurance).selectinload(ProduitAssurance.assureur_obj),
+                selectinload(Souscription.projet_voyage),
+            )
+            .filter(Souscription.id.in_(ids))
+            .order_by(Souscription.id)
+            .all()
+        )
+        paiements: Dict[int, Paiement] = {}
+        for paiement in (
+            db.query(Paiement)
+            .filter(Paiement.souscription_id.in_(ids), Paiement.statut == "valide")
+            .order_by(Paiement.created_at)
+        ):
+            paiements[paiement.souscription_id] = paiement  # le plus récent l'emporte
+        existantes = {
+            attestation.souscription_id: attestation
+            for attestation in db.query(Attestation).filter(
+                Attestation.souscription_id.in_(ids),
+                Attestation.type_attestation == type_attestation,
+            ).order_by(Attestation.created_at)
+        }
+        # Abonné servant de repli : payeur pour la provisoire, titulaire pour la définitive
+        user_ids = {
+            paiements[s.id].user_id if type_attestation == "provisoire" and s.id in paiements else s.user_id
+            for s in souscriptions
+        }
+        users = {user.id: user for user in db.query(User).filter(User.id.in_(user_ids))}
+        questionnaires: Dict[int, List[Questionnaire]] = {souscription.id: [] for souscription in souscriptions}
+        for questionnaire in db.query(Questionnaire).filter(Questionnaire.souscription_id.in_(ids)):
+            questionnaires[questionnaire.souscription_id].append(questionnaire)
+        # Logo de chaque assureur du lot, chargé une fois ici plutôt que dans chaque processus de rendu
+        logos: Dict[Any, Optional[tuple]] = {}
+        for souscription in souscriptions:
+            assureur = souscription.produit_assurance.assureur_obj if souscription.produit_assurance else None
+            if assureur is not None and assureur.logo_url and (assureur.id, assureur.logo_url) not in logos:
+                contenu = logo_cache.get_bytes(assureur.id, assureur.logo_url)
+                logos[(assureur.id, assureur.logo_url)] = (assureur.id, assureur.logo_url, contenu) if contenu else None
+
+        travaux, ignorees = [], []
+        for souscription in souscriptions:
+            paiement = paiements.get(souscription.id)
+            existante = existantes.get(souscription.id)
+            if paiement is None:
+                ignorees.append((souscription.id, "Aucun paiement valide"))
+                continue
+            if existante is None and type_attestation == "definitive" and souscription.validation_finale != "approved":
+                ignorees.append((souscription.id, "Souscription non validée"))
+                continue
+
+            produit = souscription.produit_assurance
+            projet = souscription.projet_voyage
+            assureur = produit.assureur_obj if produit else None
+            user_id = paiement.user_id if type_attestation == "provisoire" else souscription.user_id
+            travail = {
+                "souscription_id": souscription.id,
+                "type_attestation": type_attestation,
+                "numero_attestation": (
+                    existante.numero_attestation if existante is not None
+                    else AttestationService.generate_numero_attestation(souscription, type_attestation)
+                ),
+                "paiement_id": paiement.id,
+                "souscription": _instantane(
+                    souscription,
+                    produit_assurance=_instantane(produit, assureur_obj=_instantane(assureur)) if produit else None,
+                    projet_voyage=_instantane(projet),
+                ),
+                "paiement": _instantane(paiement),
+                "user": _instantane(users.get(user_id)),
+                "traveler_info": AttestationService._extract_traveler_info(
+                    db, souscription.id, souscription=souscription, questionnaires=questionnaires[souscription.id]
+                ),
+                "minors_info": None,
+                "photo": None,
+                "logo_assureur": logos.get((assureur.id, assureur.logo_url)) if assureur is not None else None,
+            }
+            if type_attestation == "definitive":
+                minors_info = AttestationService._extract_minors_from_notes(souscription.notes or "")
+                if not minors_info and projet is not None and projet.notes:
+                    minors_info = AttestationService._extract_minors_from_notes(projet.notes)
+                travail["minors_info"] = minors_info
+                travail["photo"] = AttestationService._extract_identity_photo_bytes(
+                    db, souscription.id, questionnaires=questionnaires[souscription.id]
+                )
+            travaux.append(travail)
+        return travaux, existantes, ignorees
+
+    # ------------------------------------------------------------------
+    # Exécution
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _creer_executor(max_workers: int) -> Executor:
+        """Pool de processus de rendu (pool de threads dans un processus daemon)"""
+        if multiprocessing.current_process().daemon:
+            # Worker Celery prefork : les processus daemon ne peuvent pas avoir d'enfants
+            logger.warning("⚠️ Worker daemon : rendu des attestations en threads (lancer le worker avec --pool=solo)")
+            return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="attestations")
+        return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    @staticmethod
+    def run(
+        db: Session,
+        job_id: str,
+        type_attestation: str,
+        filtres: Dict[str, Any],
+        executor: Optional[Executor] = None,
+    ) -> Dict[str, Any]:
+        """Exécute une régénération complète et retourne son statut final"""
+        if type_attestation not in TYPES_ATTESTATION:
+            return AttestationBatchService.set_job_status(
+                job_id, "echec", erreur=f"Type d'attestation inconnu: {type_attestation}"
+            )
+
+        ids = AttestationBatchService.select_souscription_ids(db, filtres)
+        compteurs = {"total": len(ids), "traitees": 0, "reussies": 0, "ignorees": 0, "echecs": 0}
+        erreurs: List[Dict[str, Any]] = []
+        AttestationBatchService.set_job_status(job_id, "en_cours", debut=datetime.utcnow().isoformat(), erreurs=list(erreurs), **compteurs)
+        logger.info(f"📄 Régénération {job_id}: {len(ids)} souscription(s), attestations {type_attestation}")
+
+        def noter_erreur(souscription_id: int, message: str):
+            compteurs["echecs"] += 1
+            if len(erreurs) < MAX_ERREURS_STATUT:
+                erreurs.append({"souscription_id": souscription_id, "erreur": message})
+
+        workers = settings.ATTESTATION_BATCH_WORKERS or max(1, (os.cpu_count() or 2) - 1)
+        pool_rendu = executor or AttestationBatchService._creer_executor(workers)
+        pool_upload = ThreadPoolExecutor(
+            max_workers=max(1, settings.ATTESTATION_BATCH_UPLOAD_CONCURRENCY), thread_name_prefix="attestations-upload"
+        )
+        taille_lot = max(1, settings.ATTESTATION_BATCH_SIZE)
+        try:
+            for debut in range(0, len(ids), taille_lot):
+                lot = ids[debut:debut + taille_lot]
+                travaux, existantes, ignorees = AttestationBatchService._preparer_lot(db, lot, type_attestation)
+                compteurs["ignorees"] += len(ignorees)
+
+                # Rendu en parallèle ; chaque document rendu part aussitôt à l'upload
+                rendus = {
+                    pool_rendu.submit(rendre_documents, travail): travail for travail in travaux
+                }
+                uploads = {}
+                for future in as_completed(rendus):
+                    travail = rendus[future]
+                    try:
+                        documents = future.result()
+                    except Exception as e:
+                        logger.error(f"❌ Rendu de l'attestation de la souscription {travail['souscription_id']} impossible: {e}")
+                        noter_erreur(travail["souscription_id"], f"Rendu: {e}")
+                        continue
+                    uploads[pool_upload.submit(
+                        _televerser, travail["souscription_id"], type_attestation, travail["numero_attestation"], documents
+                    )] = travail
+
+                anciens_fichiers, nouveaux_fichiers = [], []
+                enregistrees = []
+                for future in as_completed(uploads):
+                    travail = uploads[future]
+                    try:
+                        champs = future.result()
+                    except Exception as e:
+                        noter_erreur(travail["souscription_id"], f"Upload: {e}")
+                        continue
+                    existante = existantes.get(travail["souscription_id"])
+                    if existante is not None:
+                        avant = _fichiers_minio(existante)
+                        for cle, valeur in champs.items():
+                            setattr(existante, cle, valeur)
+                        existante.paiement_id = travail["paiement_id"]
+                        existante.est_valide = True
+                        apres = _fichiers_minio(existante)
+                        anciens_fichiers.extend(fichier for fichier in avant if fichier not in apres)
+                        nouveaux_fichiers.extend(fichier for fichier in apres if fichier not in avant)
+                    else:
+                        attestation = Attestation(
+                            souscription_id=travail["souscription_id"],
+                            paiement_id=travail["paiement_id"],
+                            type_attestation=type_attestation,
+                            numero_attestation=travail["numero_attestation"],
+                            est_valide=True,
+                            **champs,
+                        )
+                        db.add(attestation)
+                        nouveaux_fichiers.extend(_fichiers_minio(attestation))
+                    enregistrees.append(travail)
+
+                try:
+                    db.commit()
+                    compteurs["reussies"] += len(enregistrees)
+                    a_supprimer = anciens_fichiers
+                except Exception as e:
+                    db.rollback()
+                    logger.error(f"❌ Enregistrement du lot {debut // taille_lot + 1} de la régénération {job_id} impossible: {e}")
+                    for travail in enregistrees:
+                        noter_erreur(travail["souscription_id"], f"Enregistrement: {e}")
+                    a_supprimer = nouveaux_fichiers
+
+                # Fichiers remplacés (ou orphelins si le lot n'a pas pu être enregistré)
+                for bucket, objet in a_supprimer:
+                    try:
+                        MinioService.delete_pdf(bucket, objet)
+                    except Exception as e:
+                        logger.warning(f"⚠️ Fichier {bucket}/{objet} non supprimé: {e}")
+
+                compteurs["traitees"] += len(lot)
+                AttestationBatchService.set_job_status(job_id, "en_cours", erreurs=list(erreurs), **compteurs)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"❌ Régénération {job_id} interrompue: {e}\n{traceback.format_exc()}")
+            return AttestationBatchService.set_job_status(
+                job_id, "echec", erreur=str(e), fin=datetime.utcnow().isoformat(), erreurs=list(erreurs), **compteurs
+            )
+        finally:
+            pool_upload.shutdown(wait=True)
+            if executor is None:
+                pool_rendu.shutdown(wait=True)
+
+        logger.info(
+            f"✅ Régénération {job_id} terminée: {compteurs['reussies']} réussie(s), "
+            f"{compteurs['ignorees']} ignorée(s), {compteurs['echecs']} échec(s)"
+        )
+        return AttestationBatchService.set_job_status(
+            job_id, "termine", fin=datetime.utcnow().isoformat(), erreurs=list(erreurs), **compteurs
+        )
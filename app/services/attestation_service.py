@@ -380,24 +380,28 @@ class AttestationService:
         expires: timedelta = timedelta(hours=1),
         refresh_card: bool = False
     ) -> str:
-        """Rafraîchit l'URL signée d'une attestation"""
+        """
+        Rafraîchit l'URL signée d'une attestation.
+        L'URL vient du cache des URLs signées tant qu'elle n'approche pas de son expiration :
+        la ligne n'est modifiée (et commitée) que si l'URL a changé.
+        """
         now = datetime.utcnow()
-        if attestation.bucket_minio == INLINE_BUCKET_NAME or attestation.chemin_fichier_minio == INLINE_OBJECT_KEY:
+        if AttestationService._is_inline(attestation.bucket_minio, attestation.chemin_fichier_minio):
             # Rien à rafraîchir pour un stockage inline (data URI)
             url_signee = attestation.url_signee
         else:
-            url_signee = MinioService.get_pdf_url(
-                attestation.chemin_fichier_minio,
+            url_signee, expire_le = MinioService.generate_signed_url_with_expiry(
                 attestation.bucket_minio,
-                expires
+                attestation.chemin_fichier_minio,
+                expires,
+                known_object=True
             )
-            attestation.url_signee = url_signee
-            attestation.date_expiration_url = now + expires
+            if attestation.url_signee != url_signee:
+                attestation.url_signee = url_signee
+                attestation.date_expiration_url = expire_le
 
         if refresh_card and attestation.carte_numerique_path and attestation.carte_numerique_bucket:
-            is_inline_card = attestation.carte_numerique_bucket == INLINE_BUCKET_NAME or \
-                attestation.carte_numerique_path == INLINE_OBJECT_KEY
-            if not is_inline_card:
+            if not AttestationService._is_inline(attestation.carte_numerique_bucket, attestation.carte_numerique_path):
                 needs_refresh = (
                     not attestation.carte_numerique_url or
                     not attestation.carte_numerique_expires_at or
@@ -405,16 +409,49 @@ class AttestationService:
                 )
                 if needs_refresh:
                     bucket = attestation.carte_numerique_bucket or MinioService.BUCKET_ATTESTATIONS
-                    attestation.carte_numerique_url = MinioService.generate_signed_url(
+                    card_url, card_expires = MinioService.generate_signed_url_with_expiry(
                         bucket,
                         attestation.carte_numerique_path,
-                        expires
+                        expires,
+                        known_object=True
                     )
-                    attestation.carte_numerique_expires_at = now + expires
+                    if attestation.carte_numerique_url != card_url:
+                        attestation.carte_numerique_url = card_url
+                        attestation.carte_numerique_expires_at = card_expires
 
-        db.commit()
+        if db.is_modified(attestation):
+            db.commit()
         return url_signee
     
+    @staticmethod
+    def sign_attestation_urls(attestations: List[Attestation], expires: timedelta = timedelta(hours=24)) -> None:
+        """
+        Signe en une passe les URLs (PDF et carte) d'une liste d'attestations, pour la réponse
+        seulement (pas de commit). Les clés viennent de la base : pas de vérification d'existence.
+        En cas d'échec de signature, les URLs stockées sont conservées.
+        """
+        objets = []
+        for attestation in attestations:
+            if attestation.chemin_fichier_minio and \
+                    not AttestationService._is_inline(attestation.bucket_minio, attestation.chemin_fichier_minio):
+                objets.append((attestation.bucket_minio, attestation.chemin_fichier_minio))
+            if attestation.carte_numerique_path and attestation.carte_numerique_bucket and \
+                    not AttestationService._is_inline(attestation.carte_numerique_bucket, attestation.carte_numerique_path):
+                objets.append((attestation.carte_numerique_bucket, attestation.carte_numerique_path))
+        urls = MinioService.sign_urls(objets, expires)
+
+        for attestation in attestations:
+            signee = urls.get((attestation.bucket_minio, attestation.chemin_fichier_minio))
+            if signee:
+                attestation.url_signee, attestation.date_expiration_url = signee
+            carte = urls.get((attestation.carte_numerique_bucket, attestation.carte_numerique_path))
+            if carte:
+                attestation.carte_numerique_url, attestation.carte_numerique_expires_at = carte
+    
+    @staticmethod
+    def _is_inline(bucket: Optional[str], chemin: Optional[str]) -> bool:
+        return bucket == INLINE_BUCKET_NAME or chemin == INLINE_OBJECT_KEY
+    
     @staticmethod
     def check_all_validations_complete(db: Session, attestation_provisoire: Attestation) -> bool:
         """Vérifie si la validation production est complète pour générer l'attestation définitive.
@@ -434,9 +471,16 @@ class AttestationService:
         return required_types.issubset(validated_types)
 
     @staticmethod
-    def _extract_traveler_info(db: Session, souscription_id: int) -> Dict[str, Any]:
+    def _extract_traveler_info(
+        db: Session,
+        souscription_id: int,
+        souscription: Optional[Souscription] = None,
+        questionnaires: Optional[List[Questionnaire]] = None,
+    ) -> Dict[str, Any]:
         """
         Extrait les informations du voyageur depuis le questionnaire administratif.
+        `souscription` (avec son projet de voyage) et `questionnaires` (tous ceux de la
+        souscription) évitent les requêtes quand ils ont été chargés pour tout un lot.
         
         IMPORTANT: 
         - Si c'est une souscription pour un tiers, cette fonction retourne les informations
@@ -451,9 +495,11 @@ class AttestationService:
         from app.models.projet_voyage import ProjetVoyage
         
         # Récupérer la souscription pour vérifier si c'est pour un tiers
-        souscription = db.query(SouscriptionModel).filter(
-            SouscriptionModel.id == souscription_id
-        ).first()
+        souscription_fournie = souscription is not None
+        if not souscription_fournie:
+            souscription = db.query(SouscriptionModel).filter(
+                SouscriptionModel.id == souscription_id
+            ).first()
         
         if not souscription:
             logger.warning("Souscription %s non trouvée", souscription_id)
@@ -465,9 +511,12 @@ class AttestationService:
         
         # Chercher dans les notes du voyage
         if souscription.projet_voyage_id:
-            projet = db.query(ProjetVoyage).filter(
-                ProjetVoyage.id == souscription.projet_voyage_id
-            ).first()
+            if souscription_fournie:
+                projet = souscription.projet_voyage
+            else:
+                projet = db.query(ProjetVoyage).filter(
+                    ProjetVoyage.id == souscription.projet_voyage_id
+                ).first()
             
             if projet and projet.notes:
                 # Vérifier si c'est une souscription pour un tiers
@@ -492,7 +541,7 @@ class AttestationService:
         from app.models.questionnaire import Questionnaire as QuestionnaireModel
         
         # Vérifier d'abord combien de questionnaires existent pour cette souscription
-        all_questionnaires = (
+        all_questionnaires = questionnaires if questionnaires is not None else (
             db.query(QuestionnaireModel)
             .filter(QuestionnaireModel.souscription_id == souscription_id)
             .all()
@@ -503,15 +552,18 @@ class AttestationService:
             len(all_questionnaires)
         )
         
-        questionnaire = (
-            db.query(QuestionnaireModel)
-            .filter(
-                QuestionnaireModel.souscription_id == souscription_id,
-                QuestionnaireModel.type_questionnaire == "administratif",
+        if questionnaires is not None:
+            questionnaire = AttestationService._latest_questionnaire(questionnaires, "administratif")
+        else:
+            questionnaire = (
+                db.query(QuestionnaireModel)
+                .filter(
+                    QuestionnaireModel.souscription_id == souscription_id,
+                    QuestionnaireModel.type_questionnaire == "administratif",
+                )
+                .order_by(QuestionnaireModel.version.desc())
+                .first()
             )
-            .order_by(QuestionnaireModel.version.desc())
-            .first()
-        )
 
         if not questionnaire:
             logger.error(
@@ -665,6 +717,12 @@ class AttestationService:
         
         return traveler_info
     
+    @staticmethod
+    def _latest_questionnaire(questionnaires: List[Questionnaire], type_questionnaire: str) -> Optional[Questionnaire]:
+        """Dernière version d'un type de questionnaire parmi ceux déjà chargés"""
+        candidats = [q for q in questionnaires if q.type_questionnaire == type_questionnaire]
+        return max(candidats, key=lambda q: q.version or 0) if candidats else None
+
     @staticmethod
     def _extract_tier_info_from_notes(notes: str) -> Dict[str, Any]:
         """
@@ -916,18 +974,30 @@ class AttestationService:
             return None
 
     @staticmethod
-    def _extract_identity_photo_bytes(db: Session, souscription_id: int) -> Optional[bytes]:
-        """Récupère la photo pour la carte : priorité questionnaire médical (photo medicale), puis administratif (photo identité)."""
-        # 1) Priorité : photo médicale du questionnaire médical (souscription)
-        questionnaire_medical = (
-            db.query(Questionnaire)
-            .filter(
-                Questionnaire.souscription_id == souscription_id,
-                Questionnaire.type_questionnaire == "medical",
+    def _extract_identity_photo_bytes(
+        db: Session,
+        souscription_id: int,
+        questionnaires: Optional[List[Questionnaire]] = None,
+    ) -> Optional[bytes]:
+        """
+        Récupère la photo pour la carte : priorité questionnaire médical (photo medicale), puis administratif (photo identité).
+        `questionnaires` (tous ceux de la souscription, chargés pour un lot) évite les requêtes.
+        """
+        def dernier(type_questionnaire: str) -> Optional[Questionnaire]:
+            if questionnaires is not None:
+                return AttestationService._latest_questionnaire(questionnaires, type_questionnaire)
+            return (
+                db.query(Questionnaire)
+                .filter(
+                    Questionnaire.souscription_id == souscription_id,
+                    Questionnaire.type_questionnaire == type_questionnaire,
+                )
+                .order_by(Questionnaire.version.desc())
+                .first()
             )
-            .order_by(Questionnaire.version.desc())
-            .first()
-        )
+
+        # 1) Priorité : photo médicale du questionnaire médical (souscription)
+        questionnaire_medical = dernier("medical")
         if questionnaire_medical and questionnaire_medical.reponses:
             photo_payload = (
                 questionnaire_medical.reponses.get("photoMedicale") or
@@ -939,15 +1009,7 @@ class AttestationService:
                     return decoded
 
         # 2) Fallback : questionnaire administratif (photo identité)
-        questionnaire = (
-            db.query(Questionnaire)
-            .filter(
-                Questionnaire.souscription_id == souscription_id,
-                Questionnaire.type_questionnaire == "administratif",
-            )
-            .order_by(Questionnaire.version.desc())
-            .first()
-        )
+        questionnaire = dernier("administratif")
 
         if not questionnaire or not questionnaire.reponses:
             logger.warning(
@@ -1,14 +1,20 @@
 from __future__ import annotations
 
 from datetime import datetime
+from functools import lru_cache
 from io import BytesIO
 from typing import Optional, Dict, Any
 import os
 import math
 
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont, ImageOps
 
+from app.services.logo_cache import logo_cache
+
 RESAMPLE_METHOD = Image.Resampling.LANCZOS if hasattr(Image, "Resampling") else Image.LANCZOS
+# Compression zlib par défaut : ~4x plus rapide que optimize=True pour ~2 % d'octets en plus
+PNG_COMPRESS_LEVEL = 6
 
 # Chemin vers le logo (relatif au répertoire du projet)
 LOGO_PATH = os.path.join(
@@ -19,6 +25,89 @@ LOGO_PATH = os.path.join(
 )
 
 
+# --- Couche d'assets ---
+# Tout ce qui ne dépend pas de l'assuré (fond, polices, logos fixes) est préparé une fois
+# par processus ; chaque carte ne compose que le texte, la photo et le QR code.
+# Les images mises en cache ne sont jamais modifiées : les appelants travaillent sur une copie.
+
+
+@lru_cache(maxsize=8)
+def _fond_carte(palette: tuple, size: tuple) -> Image.Image:
+    """Fond de carte (dégradé + motifs) rendu une fois par palette et par taille"""
+    card = Image.new("RGB", size, palette[0])
+    CardService._draw_gradient(card, palette)
+    CardService._draw_wavy_pattern(card)
+    CardService._draw_halftone_pattern(card)
+    return card
+
+
+@lru_cache(maxsize=64)
+def _police(size: int, bold: bool):
+    candidates = []
+    base_paths = [
+        "/usr/share/fonts/truetype/dejavu",
+        "/usr/share/fonts",
+        "/System/Library/Fonts",
+        "C:/Windows/Fonts",
+    ]
+    font_names = ["DejaVuSans.ttf", "DejaVuSans-Bold.ttf"] if bold else ["DejaVuSans.ttf", "Arial.ttf"]
+    if bold:
+        font_names = ["DejaVuSans-Bold.ttf", "Arialbd.ttf", "Arial Bold.ttf"]
+
+    for base in base_paths:
+        for name in font_names:
+            candidates.append(os.path.join(base, name))
+
+    for path in candidates:
+        if os.path.exists(path):
+            try:
+                return ImageFont.truetype(path, size=size)
+            except Exception:
+                continue
+
+    return ImageFont.load_default()
+
+
+def _reduire(image: Image.Image, max_size: Optional[tuple]) -> Image.Image:
+    # Décodage immédiat : l'image mise en cache ne garde pas le fichier source ouvert
+    image.load()
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+    if max_size:
+        w, h = image.width, image.height
+        if w > max_size[0] or h > max_size[1]:
+            ratio = min(max_size[0] / w, max_size[1] / h)
+            image = image.resize((int(w * ratio), int(h * ratio)), RESAMPLE_METHOD)
+    return image
+
+
+@lru_cache(maxsize=16)
+def _image_asset(path: str, mtime: float, max_size: Optional[tuple] = None) -> Image.Image:
+    """Image RGBA d'un fichier d'assets, réduite à max_size ; clé incluant mtime (fichier remplacé = rechargé)"""
+    return _reduire(Image.open(path), max_size)
+
+
+def _logo_carte(contenu: bytes, max_size: Optional[tuple]) -> Optional[Image.Image]:
+    """Variante e-carte d'un logo d'assureur (mise en cache par logo_cache)"""
+    try:
+        return _reduire(Image.open(BytesIO(contenu)), max_size)
+    except Exception:
+        return None
+
+
+def _charger_asset(path: str, max_size: Optional[tuple] = None) -> Optional[Image.Image]:
+    if not os.path.exists(path):
+        return None
+    return _image_asset(path, os.path.getmtime(path), max_size)
+
+
+@lru_cache(maxsize=4)
+def _masque_coins(size: tuple, radius: int) -> Image.Image:
+    mask = Image.new("L", size, 0)
+    ImageDraw.Draw(mask).rounded_rectangle([(0, 0), size], radius=radius, fill=255)
+    return mask
+
+
 class CardService:
     """Générateur de carte numérique à partir d'une attestation."""
 
@@ -35,12 +124,6 @@ class CardService:
     SILVER = "#C0C0C0"  # Argent pour logo NSIA
     
     # Chemins vers les logos
-    NSIA_LOGO_PATH = os.path.join(
-        os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
-        "frontend-simple",
-        "assets",
-        "nsia-logo.png"
-    )
     MOBILITY_LOGO_PATH = os.path.join(
         os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
         "frontend-simple",
@@ -78,23 +161,13 @@ class CardService:
         LOGO_MAX_HEIGHT = 80
 
         # Logo de l'assureur (en haut à gauche) - charger depuis l'assureur de la souscription
-        assureur_logo = cls._load_assureur_logo(souscription)
+        assureur_logo = cls._load_assureur_logo(souscription, max_size=(LOGO_MAX_WIDTH, LOGO_MAX_HEIGHT))
         if assureur_logo:
-            w, h = assureur_logo.width, assureur_logo.height
-            if w > LOGO_MAX_WIDTH or h > LOGO_MAX_HEIGHT:
-                ratio = min(LOGO_MAX_WIDTH / w, LOGO_MAX_HEIGHT / h)
-                new_w, new_h = int(w * ratio), int(h * ratio)
-                assureur_logo = assureur_logo.resize((new_w, new_h), RESAMPLE_METHOD)
             card.paste(assureur_logo, (40, 40), assureur_logo if assureur_logo.mode == "RGBA" else None)
 
         # Logo MOBILITY HealthCare (en haut à droite) - même taille max que l'assureur
-        mobility_logo = cls._load_mobility_logo()
+        mobility_logo = cls._load_mobility_logo(max_size=(LOGO_MAX_WIDTH, LOGO_MAX_HEIGHT))
         if mobility_logo:
-            w, h = mobility_logo.width, mobility_logo.height
-            if w > LOGO_MAX_WIDTH or h > LOGO_MAX_HEIGHT:
-                ratio = min(LOGO_MAX_WIDTH / w, LOGO_MAX_HEIGHT / h)
-                new_w, new_h = int(w * ratio), int(h * ratio)
-                mobility_logo = mobility_logo.resize((new_w, new_h), RESAMPLE_METHOD)
             logo_x = cls.WIDTH - mobility_logo.width - 40
             card.paste(mobility_logo, (logo_x, 40), mobility_logo if mobility_logo.mode == "RGBA" else None)
 
@@ -167,18 +240,9 @@ class CardService:
         # QR code (à droite) - blanc sur fond transparent pour visibilité sur fond violet
         if qr_bytes:
             qr = Image.open(BytesIO(qr_bytes)).convert("RGB")
-            # Créer une version blanche du QR code
-            qr_white = Image.new("RGBA", qr.size, (0, 0, 0, 0))
-            qr_data = qr.load()
-            qr_white_data = qr_white.load()
-            for y in range(qr.height):
-                for x in range(qr.width):
-                    # Si le pixel est noir (module du QR), le rendre blanc
-                    r, g, b = qr_data[x, y]
-                    if r < 128 and g < 128 and b < 128:
-                        qr_white_data[x, y] = (255, 255, 255, 255)  # Blanc opaque
-                    else:
-                        qr_white_data[x, y] = (0, 0, 0, 0)  # Transparent
+            # Créer une version blanche du QR code : modules noirs -> blanc opaque, reste transparent
+            modules = (np.asarray(qr) < 128).all(axis=2)
+            qr_white = Image.fromarray(np.where(modules[..., None], np.uint8(255), np.uint8(0)).repeat(4, axis=2), "RGBA")
             
             qr_white = qr_white.resize((180, 180), RESAMPLE_METHOD)
             qr_x = cls.WIDTH - qr_white.width - 60
@@ -214,24 +278,15 @@ class CardService:
         card = cls._add_rounded_corners(card, radius=20)
         
         buffer = BytesIO()
-        card.save(buffer, format="PNG", optimize=True)
+        card.save(buffer, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
         buffer.seek(0)
         return buffer
 
     @staticmethod
     def _add_rounded_corners(image: Image.Image, radius: int = 20) -> Image.Image:
         """Ajoute des coins arrondis à l'image."""
-        # Créer un masque avec des coins arrondis
-        mask = Image.new("L", image.size, 0)
-        mask_draw = ImageDraw.Draw(mask)
-        width, height = image.size
-        
-        # Dessiner un rectangle arrondi blanc (masque)
-        mask_draw.rounded_rectangle(
-            [(0, 0), (width, height)],
-            radius=radius,
-            fill=255
-        )
+        # Masque des coins arrondis (mis en cache par taille)
+        mask = _masque_coins(image.size, radius)
         
         # Appliquer le masque si l'image a un canal alpha, sinon créer une version RGBA
         if image.mode != "RGBA":
@@ -249,8 +304,8 @@ class CardService:
         return final
 
     @staticmethod
-    def _load_assureur_logo(souscription) -> Optional[Image.Image]:
-        """Charge le logo de l'assureur depuis la souscription."""
+    def _load_assureur_logo(souscription, max_size: Optional[tuple] = None) -> Optional[Image.Image]:
+        """Logo de l'assureur de la souscription (RGBA, réduit à max_size), servi par le cache des logos."""
         import logging
         logger = logging.getLogger(__name__)
         
@@ -300,81 +355,32 @@ class CardService:
                 logger.warning("Aucun logo_url trouvé pour l'assureur")
                 return None
             
-            logger.info(f"Chargement du logo de l'assureur depuis: {logo_url}")
-            
-            # Si c'est une URL Minio (contient le bucket et le chemin)
-            if logo_url.startswith("http") or "/" in logo_url:
-                # Essayer de télécharger depuis Minio si c'est un chemin Minio
-                if not logo_url.startswith("http"):
-                    # C'est probablement un chemin Minio (bucket/object)
-                    from app.services.minio_service import MinioService
-                    # Essayer de trouver le bucket (peut être dans différents buckets)
-                    buckets_to_try = ["logos", "assureurs", "assets", MinioService.BUCKET_ATTESTATIONS]
-                    for bucket in buckets_to_try:
-                        try:
-                            logo_bytes = MinioService.get_file(bucket, logo_url)
-                            if logo_bytes:
-                                logo = Image.open(BytesIO(logo_bytes))
-                                if logo.mode != "RGBA":
-                                    logo = logo.convert("RGBA")
-                                logger.info(f"Logo chargé depuis Minio: {bucket}/{logo_url}")
-                                return logo
-                        except Exception as e:
-                            logger.debug(f"Impossible de charger depuis {bucket}/{logo_url}: {e}")
-                            continue
-                
-                # Si c'est une URL HTTP, essayer de télécharger
-                if logo_url.startswith("http"):
-                    try:
-                        import httpx
-                        with httpx.Client(timeout=5.0) as client:
-                            response = client.get(logo_url)
-                            if response.status_code == 200:
-                                logo = Image.open(BytesIO(response.content))
-                                if logo.mode != "RGBA":
-                                    logo = logo.convert("RGBA")
-                                logger.info(f"Logo chargé depuis URL: {logo_url}")
-                                return logo
-                    except Exception as e:
-                        logger.warning(f"Impossible de télécharger le logo depuis {logo_url}: {e}")
-            
-            # Si c'est un chemin local
-            if os.path.exists(logo_url):
-                logo = Image.open(logo_url)
-                if logo.mode != "RGBA":
-                    logo = logo.convert("RGBA")
-                logger.info(f"Logo chargé depuis fichier local: {logo_url}")
-                return logo
-            
-            logger.warning(f"Impossible de charger le logo depuis: {logo_url}")
-            return None
+            # Logo partagé avec les attestations PDF : téléchargé une fois, revalidé par ETag
+            return logo_cache.get_variant(
+                getattr(assureur, "id", None),
+                logo_url,
+                ("carte", max_size),
+                lambda contenu: _logo_carte(contenu, max_size),
+            )
             
         except Exception as e:
             logger.error(f"Erreur lors du chargement du logo de l'assureur: {e}")
             return None
 
     @staticmethod
-    def _load_mobility_logo() -> Optional[Image.Image]:
-        """Charge le logo Mobility Health depuis le fichier."""
+    def _load_mobility_logo(max_size: Optional[tuple] = None) -> Optional[Image.Image]:
+        """Logo Mobility Health (RGBA, réduit à max_size), chargé une fois puis servi depuis le cache."""
         try:
-            if os.path.exists(CardService.MOBILITY_LOGO_PATH):
-                logo = Image.open(CardService.MOBILITY_LOGO_PATH)
-                # Convertir en RGBA si nécessaire pour la transparence
-                if logo.mode != "RGBA":
-                    logo = logo.convert("RGBA")
-                return logo
+            return _charger_asset(CardService.MOBILITY_LOGO_PATH, max_size)
         except Exception as e:
             print(f"Erreur lors du chargement du logo Mobility: {e}")
         return None
 
     @classmethod
     def _create_card_background(cls) -> Image.Image:
-        """Crée le fond de la e-carte : dégradé violet + ondulations gauche + demi-teintes droite (prototype MHC)."""
-        card = Image.new("RGB", (cls.WIDTH, cls.HEIGHT), cls.PURPLE_DARK)
-        cls._draw_gradient(card)
-        cls._draw_wavy_pattern(card)
-        cls._draw_halftone_pattern(card)
-        return card
+        """Fond de la e-carte : dégradé violet + ondulations gauche + demi-teintes droite (prototype MHC).
+        Rendu une seule fois par palette ; chaque carte reçoit une copie."""
+        return _fond_carte((cls.PURPLE_DARK, cls.PURPLE_INDIGO), (cls.WIDTH, cls.HEIGHT)).copy()
 
     @staticmethod
     def _hex_to_rgb(hex_color: str) -> tuple:
@@ -382,18 +388,15 @@ class CardService:
         return tuple(int(h[i : i + 2], 16) for i in (0, 2, 4))
 
     @classmethod
-    def _draw_gradient(cls, card: Image.Image) -> None:
-        """Dégradé horizontal : violet foncé (gauche) vers indigo (droite)."""
-        r1, g1, b1 = cls._hex_to_rgb(cls.PURPLE_DARK)
-        r2, g2, b2 = cls._hex_to_rgb(cls.PURPLE_INDIGO)
+    def _draw_gradient(cls, card: Image.Image, palette: Optional[tuple] = None) -> None:
+        """Dégradé horizontal : violet foncé (gauche) vers indigo (droite), calculé colonne par colonne en NumPy."""
+        gauche, droite = palette or (cls.PURPLE_DARK, cls.PURPLE_INDIGO)
+        debut = np.array(cls._hex_to_rgb(gauche), dtype=np.float64)
+        fin = np.array(cls._hex_to_rgb(droite), dtype=np.float64)
         w, h = card.size
-        draw = ImageDraw.Draw(card)
-        for x in range(w):
-            t = x / max(w - 1, 1)
-            r = int(r1 + (r2 - r1) * t)
-            g = int(g1 + (g2 - g1) * t)
-            b = int(b1 + (b2 - b1) * t)
-            draw.line([(x, 0), (x, h)], fill=(r, g, b))
+        t = np.arange(w, dtype=np.float64)[:, None] / max(w - 1, 1)
+        ligne = (debut + (fin - debut) * t).astype(np.int64).astype(np.uint8)
+        card.paste(Image.fromarray(np.ascontiguousarray(np.broadcast_to(ligne, (h, w, 3))), "RGB"), (0, 0))
 
     @classmethod
     def _draw_wavy_pattern(cls, card: Image.Image) -> None:
@@ -444,10 +447,10 @@ class CardService:
     @staticmethod
     def _draw_africa_background(card: Image.Image) -> None:
         """Pose en arrière-plan une carte de l'Afrique (asset africa-map.png) en gardant la couleur violette."""
-        if not os.path.exists(CardService.AFRICA_MAP_PATH):
-            return
         try:
-            map_img = Image.open(CardService.AFRICA_MAP_PATH).convert("RGBA")
+            map_img = _charger_asset(CardService.AFRICA_MAP_PATH)
+            if map_img is None:
+                return
             map_img = map_img.resize((CardService.WIDTH, CardService.HEIGHT), RESAMPLE_METHOD)
             r, g, b = 0x34, 0x13, 0x5A
             overlay = Image.new("RGBA", card.size, (r, g, b, 0))
@@ -624,29 +627,8 @@ class CardService:
 
     @staticmethod
     def _font(size: int, bold: bool = False):
-        candidates = []
-        base_paths = [
-            "/usr/share/fonts/truetype/dejavu",
-            "/usr/share/fonts",
-            "/System/Library/Fonts",
-            "C:/Windows/Fonts",
-        ]
-        font_names = ["DejaVuSans.ttf", "DejaVuSans-Bold.ttf"] if bold else ["DejaVuSans.ttf", "Arial.ttf"]
-        if bold:
-            font_names = ["DejaVuSans-Bold.ttf", "Arialbd.ttf", "Arial Bold.ttf"]
-
-        for base in base_paths:
-            for name in font_names:
-                candidates.append(os.path.join(base, name))
-
-        for path in candidates:
-            if os.path.exists(path):
-                try:
-                    return ImageFont.truetype(path, size=size)
-                except Exception:
-                    continue
-
-        return ImageFont.load_default()
+        """Police TrueType de la taille demandée (recherche sur le disque une fois par taille)."""
+        return _police(size, bold)
 
     
     @staticmethod
@@ -0,0 +1,366 @@
+"""
+Index spatial des hôpitaux actifs pour la recherche du plus proche (SOS, affectation).
+
+Les coordonnées des hôpitaux actifs sont chargées une fois dans un BallTree (métrique
+haversine) au lieu de parcourir toute la table à chaque alerte. Les candidats renvoyés
+par l'arbre sont ensuite départagés avec une formule de Haversine vectorisée NumPy,
+identique à `calculate_distance` (mêmes distances, égalités départagées par id).
+Chaque hôpital indexé porte aussi un profil précalculé (examens et actes du catalogue,
+personnel actif rattaché) utilisé par le classement des hôpitaux proches.
+
+L'index est reconstruit paresseusement :
+- après tout commit qui modifie un hôpital, son catalogue d'examens/actes ou son
+  personnel (événements SQLAlchemy), y compris dans les autres workers via un numéro
+  de version partagé dans Redis ;
+- au plus tard après INDEX_MAX_AGE_SECONDS (filet de sécurité sans Redis).
+"""
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, FrozenSet, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from sklearn.neighbors import BallTree
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.core.enums import Role
+from app.models.hospital import Hospital
+from app.models.hospital_act_tarif import HospitalActTarif
+from app.models.hospital_exam_tarif import HospitalExamTarif
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+RAYON_TERRE_KM = 6371
+REDIS_VERSION_KEY = "hospitals:geo_index:version"
+INDEX_MAX_AGE_SECONDS = 300
+# Candidats supplémentaires demandés à l'arbre pour départager les égalités de distance
+_MARGE_CANDIDATS = 4
+# Rôles du personnel hospitalier (utilisateurs rattachés via hospital_id) pris en compte
+ROLES_MEDECINS = (Role.MEDECIN_HOPITAL, Role.DOCTOR)
+ROLES_PERSONNEL = ROLES_MEDECINS + (Role.AGENT_RECEPTION_HOPITAL, Role.HOSPITAL_ADMIN)
+
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Distances en km entre un point et des tableaux de points (degrés), formule de Haversine"""
+    lat_rad = np.radians(lat)
+    lats_rad = np.radians(lats)
+    delta_lat = np.radians(lats - lat)
+    delta_lon = np.radians(lons - lon)
+
+    a = np.sin(delta_lat / 2) ** 2 + np.cos(lat_rad) * np.cos(lats_rad) * np.sin(delta_lon / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return RAYON_TERRE_KM * c
+
+
+def normaliser_libelle(libelle: str) -> str:
+    """Forme de comparaison des noms d'examens et d'actes"""
+    return " ".join(libelle.split()).casefold()
+
+
+class HospitalProfile(NamedTuple):
+    """Profil précalculé d'un hôpital actif"""
+    id: int
+    nom: str
+    adresse: Optional[str]
+    ville: Optional[str]
+    telephone: Optional[str]
+    latitude: float
+    longitude: float
+    capacite_lits: Optional[int]
+    specialites: Optional[str]
+    examens: FrozenSet[str]
+    actes: FrozenSet[str]
+    medecins_actifs: int
+    personnel_actif: int
+
+
+class _Snapshot(NamedTuple):
+    """État immuable de l'index (remplacé d'un bloc à chaque reconstruction)"""
+    version: Tuple[int, Optional[str]]
+    built_at: float
+    ids: np.ndarray
+    lats: np.ndarray
+    lons: np.ndarray
+    tree: Optional[BallTree]
+    profils: Dict[int, HospitalProfile]
+
+
+class HospitalSpatialIndex:
+    """Index en mémoire des hôpitaux actifs : k plus proches voisins et recherche par rayon"""
+
+    def __init__(self, max_age_seconds: float = INDEX_MAX_AGE_SECONDS, redis_client=None):
+        self.max_age_seconds = max_age_seconds
+        self._redis = redis_client
+        self._lock = threading.Lock()
+        self._version_locale = 0
+        self._snapshot: Optional[_Snapshot] = None
+        self.rebuilds = 0
+
+    def _redis_client(self):
+        if self._redis is None:
+            try:
+                from app.core.redis_client import get_redis
+                self._redis = get_redis()
+            except Exception as e:
+                logger.debug(f"Redis indisponible pour l'index des hôpitaux: {e}")
+        return self._redis
+
+    def _version_courante(self) -> Tuple[int, Optional[str]]:
+        version_partagee = None
+        client = self._redis_client()
+        if client is not None:
+            try:
+                version_partagee = client.get(REDIS_VERSION_KEY)
+            except Exception as e:
+                logger.warning(f"⚠️ Lecture de la version de l'index des hôpitaux impossible: {e}")
+        return self._version_locale, version_partagee
+
+    def invalidate(self):
+        """Marque l'index comme périmé dans ce processus et dans les autres workers"""
+        with self._lock:
+            self._version_locale += 1
+        client = self._redis_client()
+        if client is not None:
+            try:
+                client.incr(REDIS_VERSION_KEY)
+            except Exception as e:
+                logger.warning(f"⚠️ Invalidation partagée de l'index des hôpitaux impossible: {e}")
+
+    def _rebuild(self, db: Session, version: Tuple[int, Optional[str]]) -> _Snapshot:
+        hospitals = (
+            db.query(
+                Hospital.id, Hospital.nom, Hospital.adresse, Hospital.ville, Hospital.telephone,
+                Hospital.latitude, Hospital.longitude, Hospital.capacite_lits, Hospital.specialites,
+            )
+            .filter(Hospital.est_actif == True)
+            .order_by(Hospital.id)
+            .all()
+        )
+        ids = np.array([row.id for row in hospitals], dtype=np.int64)
+        lats = np.array([float(row.latitude) for row in hospitals], dtype=np.float64)
+        lons = np.array([float(row.longitude) for row in hospitals], dtype=np.float64)
+        tree = BallTree(np.radians(np.column_stack([lats, lons])), metric="haversine") if len(hospitals) else None
+
+        # Catalogue et personnel : trois requêtes groupées pour tous les hôpitaux actifs
+        examens = defaultdict(set)
+        for hospital_id, nom in (
+            db.query(HospitalExamTarif.hospital_id, HospitalExamTarif.nom)
+            .join(Hospital, Hospital.id == HospitalExamTarif.hospital_id)
+            .filter(Hospital.est_actif == True)
+        ):
+            examens[hospital_id].add(normaliser_libelle(nom))
+        actes = defaultdict(set)
+        for hospital_id, code, nom in (
+            db.query(HospitalActTarif.hospital_id, HospitalActTarif.code, HospitalActTarif.nom)
+            .join(Hospital, Hospital.id == HospitalActTarif.hospital_id)
+            .filter(Hospital.est_actif == True)
+        ):
+            actes[hospital_id].add(normaliser_libelle(nom))
+            if code:
+                actes[hospital_id].add(normaliser_libelle(code))
+        medecins = Counter()
+        personnel = Counter()
+        for hospital_id, role in (
+            db.query(User.hospital_id, User.role)
+            .filter(User.hospital_id.isnot(None), User.is_active == True, User.role.in_(ROLES_PERSONNEL))
+        ):
+            personnel[hospital_id] += 1
+            if role in ROLES_MEDECINS:
+                medecins[hospital_id] += 1
+
+        profils = {
+            row.id: HospitalProfile(
+                id=row.id,
+                nom=row.nom,
+                adresse=row.adresse,
+                ville=row.ville,
+                telephone=row.telephone,
+                latitude=float(row.latitude),
+                longitude=float(row.longitude),
+                capacite_lits=row.capacite_lits,
+                specialites=row.specialites,
+                examens=frozenset(examens.get(row.id, ())),
+                actes=frozenset(actes.get(row.id, ())),
+                medecins_actifs=medecins[row.id],
+                personnel_actif=personnel[row.id],
+            )
+            for row in hospitals
+        }
+
+        self.rebuilds += 1
+        logger.info(f"🗺️ Index spatial des hôpitaux reconstruit ({len(hospitals)} hôpitaux actifs)")
+        return _Snapshot(version, time.monotonic(), ids, lats, lons, tree, profils)
+
+    def _get_snapshot(self, db: Session) -> _Snapshot:
+        # Version lue avant la requête : une invalidation concurrente force une nouvelle reconstruction
+        version = self._version_courante()
+        snapshot = self._snapshot
+        if (
+            snapshot is not None
+            and snapshot.version == version
+            and time.monotonic() - snapshot.built_at < self.max_age_seconds
+        ):
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != version or time.monotonic() - snapshot.built_at >= self.max_age_seconds:
+                snapshot = self._rebuild(db, version)
+                self._snapshot = snapshot
+        return snapshot
+
+    @staticmethod
+    def _trier(snapshot: _Snapshot, positions: np.ndarray, latitude: float, longitude: float):
+        """Distances exactes des candidats, triées par distance puis par id"""
+        distances = haversine_km(latitude, longitude, snapshot.lats[positions], snapshot.lons[positions])
+        ids = snapshot.ids[positions]
+        ordre = np.lexsort((ids, distances))
+        return ids[ordre], distances[ordre]
+
+    def nearest(self, db: Session, latitude, longitude, k: int = 1) -> List[Tuple[int, float]]:
+        """
+        Les k hôpitaux actifs les plus proches
+
+        Returns:
+            Liste de (hospital_id, distance_km), du plus proche au plus lointain
+        """
+        snapshot = self._get_snapshot(db)
+        if snapshot.tree is None or k <= 0:
+            return []
+
+        latitude, longitude = float(latitude), float(longitude)
+        ids, distances = self._k_plus_proches(snapshot, latitude, longitude, k)
+        return [(int(i), float(d)) for i, d in zip(ids[:k], distances[:k])]
+
+    def _k_plus_proches(self, snapshot: _Snapshot, latitude: float, longitude: float, k: int):
+        nb_candidats = min(k + _MARGE_CANDIDATS, len(snapshot.ids))
+        positions = snapshot.tree.query(
+            np.radians([[latitude, longitude]]), k=nb_candidats, return_distance=False
+        )[0]
+        return self._trier(snapshot, positions, latitude, longitude)
+
+    def iter_nearest_profiles(
+        self, db: Session, latitude, longitude, batch_size: int = 16
+    ) -> Iterator[Tuple[HospitalProfile, float]]:
+        """
+        Parcourt les hôpitaux actifs du plus proche au plus lointain, avec leur profil.
+        L'arbre est interrogé par lots de taille croissante : un filtre sélectif
+        n'impose pas de trier toute la table.
+        """
+        snapshot = self._get_snapshot(db)
+        if snapshot.tree is None:
+            return
+
+        latitude, longitude = float(latitude), float(longitude)
+        total = len(snapshot.ids)
+        deja_vus = 0
+        k = max(1, batch_size)
+        while deja_vus < total:
+            ids, distances = self._k_plus_proches(snapshot, latitude, longitude, k)
+            limite = min(k, total)
+            for hospital_id, distance in zip(ids[deja_vus:limite], distances[deja_vus:limite]):
+                yield snapshot.profils[int(hospital_id)], float(distance)
+            deja_vus = limite
+            k *= 2
+
+    def within_radius(self, db: Session, latitude, longitude, radius_km: float) -> List[Tuple[int, float]]:
+        """
+        Les hôpitaux actifs situés à moins de radius_km
+
+        Returns:
+            Liste de (hospital_id, distance_km), du plus proche au plus lointain
+        """
+        snapshot = self._get_snapshot(db)
+        if snapshot.tree is None or radius_km < 0:
+            return []
+
+        latitude, longitude = float(latitude), float(longitude)
+        # Léger débord sur le rayon de l'arbre : la distance exacte tranche ensuite
+        positions = snapshot.tree.query_radius(
+            np.radians([[latitude, longitude]]), r=radius_km * 1.000001 / RAYON_TERRE_KM
+        )[0]
+        ids, distances = self._trier(snapshot, positions, latitude, longitude)
+        garder = distances <= radius_km
+        return [(int(i), float(d)) for i, d in zip(ids[garder], distances[garder])]
+
+    def get_stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "hospitals": int(len(snapshot.ids)) if snapshot else 0,
+            "rebuilds": self.rebuilds,
+            "age_seconds": round(time.monotonic() - snapshot.built_at, 1) if snapshot else None,
+        }
+
+
+hospital_index = HospitalSpatialIndex()
+
+
+def find_nearest_active_hospital(db: Session, latitude, longitude) -> Optional[Hospital]:
+    """
+    Hôpital actif le plus proche, chargé depuis la session.
+    Si l'index désigne un hôpital disparu entre-temps (base recréée, suppression non
+    commitée ailleurs...), l'index est reconstruit une fois.
+    """
+    for tentative in range(2):
+        for hospital_id, _ in hospital_index.nearest(db, latitude, longitude, k=1 + _MARGE_CANDIDATS):
+            hospital = db.query(Hospital).filter(Hospital.id == hospital_id, Hospital.est_actif == True).first()
+            if hospital is not None:
+                return hospital
+        if tentative == 0:
+            hospital_index.invalidate()
+    return None
+
+
+# --- Invalidation sur les écritures d'hôpitaux ---
+# Les événements de mapper surviennent pendant le flush : l'invalidation est différée
+# au commit, sans quoi un autre worker pourrait reconstruire l'index avant que les
+# nouvelles lignes soient visibles.
+_CLE_SESSION = "hospital_index_dirty"
+
+
+def _marquer_session(target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info[_CLE_SESSION] = True
+
+
+def _surveiller(modele, attributs, concerne=lambda target: True):
+    """
+    Invalide l'index au commit quand une ligne du modèle est créée, supprimée, ou
+    qu'un des attributs indexés change
+    """
+    def _ecriture(mapper, connection, target):
+        if concerne(target):
+            _marquer_session(target)
+
+    def _modification(mapper, connection, target):
+        etat = inspect(target)
+        if any(etat.attrs[attribut].history.has_changes() for attribut in attributs):
+            _marquer_session(target)
+
+    event.listen(modele, "after_insert", _ecriture)
+    event.listen(modele, "after_delete", _ecriture)
+    event.listen(modele, "after_update", _modification)
+
+
+_surveiller(Hospital, (
+    "latitude", "longitude", "est_actif", "nom", "adresse", "ville", "telephone", "capacite_lits", "specialites",
+))
+_surveiller(HospitalExamTarif, ("hospital_id", "nom"))
+_surveiller(HospitalActTarif, ("hospital_id", "code", "nom"))
+# Personnel : seuls les utilisateurs rattachés à un hôpital comptent
+_surveiller(User, ("hospital_id", "role", "is_active"), concerne=lambda user: user.hospital_id is not None)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalider_apres_commit(session):
+    if session.info.pop(_CLE_SESSION, False):
+        hospital_index.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _oublier_apres_rollback(session):
+    session.info.pop(_CLE_SESSION, None)
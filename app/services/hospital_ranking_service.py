@@ -0,0 +1,84 @@
+"""
+Classement des hôpitaux proches d'une position pour le dispatch SOS.
+
+Les hôpitaux sont parcourus du plus proche au plus lointain dans l'index spatial
+(app.services.hospital_index) et filtrés sur leur profil précalculé : examens et actes
+du catalogue, personnel actif. Aucune requête sur la table des hôpitaux par appel.
+
+Le temps de trajet est une estimation : distance à vol d'oiseau multipliée par un
+facteur de détour routier, parcourue à une vitesse moyenne d'intervention.
+"""
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.services.hospital_index import hospital_index, normaliser_libelle
+
+# Rapport moyen distance routière / distance à vol d'oiseau
+FACTEUR_DETOUR_ROUTE = 1.3
+# Vitesse moyenne d'un trajet d'urgence en agglomération (km/h)
+VITESSE_MOYENNE_KMH = 40.0
+MAX_RESULTATS = 20
+
+
+def estimer_trajet(distance_km: float) -> Dict[str, float]:
+    """Distance routière et durée estimées pour une distance à vol d'oiseau"""
+    distance_route_km = distance_km * FACTEUR_DETOUR_ROUTE
+    return {
+        "distance_route_km": round(distance_route_km, 2),
+        "duree_trajet_minutes": round(distance_route_km / VITESSE_MOYENNE_KMH * 60, 1),
+    }
+
+
+def rank_nearby_hospitals(
+    db: Session,
+    latitude: float,
+    longitude: float,
+    limit: int = 5,
+    examens: Optional[Iterable[str]] = None,
+    actes: Optional[Iterable[str]] = None,
+    personnel_actif: bool = True,
+    rayon_km: Optional[float] = None,
+) -> List[dict]:
+    """
+    Hôpitaux actifs les plus proches satisfaisant les filtres, par temps de trajet estimé
+
+    Args:
+        examens: Noms d'examens que l'hôpital doit tous proposer (catalogue HospitalExamTarif)
+        actes: Codes ou noms d'actes que l'hôpital doit tous proposer (catalogue HospitalActTarif)
+        personnel_actif: Exige au moins un membre du personnel actif rattaché à l'hôpital
+        rayon_km: Distance à vol d'oiseau maximale
+    """
+    limit = max(1, min(limit, MAX_RESULTATS))
+    examens_requis = {normaliser_libelle(e) for e in examens or () if e and e.strip()}
+    actes_requis = {normaliser_libelle(a) for a in actes or () if a and a.strip()}
+
+    resultats = []
+    for profil, distance_km in hospital_index.iter_nearest_profiles(db, latitude, longitude):
+        # Parcours par distance croissante : au-delà du rayon, plus aucun candidat
+        if rayon_km is not None and distance_km > rayon_km:
+            break
+        if personnel_actif and profil.personnel_actif == 0:
+            continue
+        if not examens_requis <= profil.examens or not actes_requis <= profil.actes:
+            continue
+
+        resultats.append({
+            "id": profil.id,
+            "nom": profil.nom,
+            "adresse": profil.adresse,
+            "ville": profil.ville,
+            "telephone": profil.telephone,
+            "latitude": profil.latitude,
+            "longitude": profil.longitude,
+            "distance_km": round(distance_km, 2),
+            **estimer_trajet(distance_km),
+            "capacite_lits": profil.capacite_lits,
+            "specialites": profil.specialites,
+            "medecins_actifs": profil.medecins_actifs,
+            "personnel_actif": profil.personnel_actif,
+        })
+        if len(resultats) >= limit:
+            break
+
+    return resultats
@@ -7,6 +7,8 @@ import os
 import base64
 import re
 import json
+import threading
+import time
 from typing import List, Optional, Dict, Any
 from sqlalchemy.orm import Session
 from datetime import datetime
@@ -16,17 +18,181 @@ from app.models.questionnaire import Questionnaire
 from app.models.projet_voyage import ProjetVoyage
 from app.models.projet_voyage_document import ProjetVoyageDocument
 from app.services.minio_service import MinioService
-from app.ia_module import analyser_document, formater_pour_agent_production, router_assureur, storage_analyses
+from app.ia_module import formater_pour_agent_production, router_assureur, storage_analyses
+from app.ia_module.ocr_engine import ocr_engine
 from app.models.assureur import Assureur
 from app.services.notification_service import NotificationService
 from app.core.enums import Role
+from app.core.redis_client import get_redis
 
 logger = logging.getLogger(__name__)
 
+# File Celery dédiée au pipeline IA (workers séparés des notifications)
+IA_ANALYSIS_QUEUE = "ia_analysis"
+# Priorités Celery (broker Redis : 0 = la plus haute ; paliers kombu par défaut 0/3/6/9, 2 et 6 sont distincts)
+IA_PRIORITY_PAIEMENT = 2
+IA_PRIORITY_RELANCE = 6
+# Verrou d'idempotence : au plus une analyse en cours par souscription
+IA_LOCK_TTL = 35 * 60  # Au-delà du time limit Celery (30 min)
+IA_STATUS_TTL = 24 * 3600
+# Au-delà de cette durée (attente + analyse), un document est signalé comme lent
+IA_DOCUMENT_LENT_MS = 30_000
+
+# Repli en mémoire quand Redis est indisponible (développement, tests)
+_local_lock = threading.Lock()
+_local_verrous: Dict[int, str] = {}
+_local_statuts: Dict[int, Dict[str, Any]] = {}
+
 
 class IAAutoService:
     """Service pour déclencher automatiquement l'analyse IA"""
     
+    # ------------------------------------------------------------------
+    # Statut, idempotence et mise en file
+    # ------------------------------------------------------------------
+    
+    @staticmethod
+    def _status_key(souscription_id: int) -> str:
+        return f"ia:analyse:statut:{souscription_id}"
+    
+    @staticmethod
+    def _lock_key(souscription_id: int) -> str:
+        return f"ia:analyse:verrou:{souscription_id}"
+    
+    @staticmethod
+    def set_analysis_status(
+        souscription_id: int,
+        statut: str,
+        etape: Optional[str] = None,
+        progression: Optional[int] = None,
+        **details: Any
+    ) -> Dict[str, Any]:
+        """
+        Enregistre l'avancement de l'analyse IA d'une souscription
+        
+        Statuts: en_attente, en_cours, termine, aucun_document, echec
+        Les champs non fournis (task_id, demande_id...) sont conservés.
+        """
+        precedent = IAAutoService.get_analysis_status(souscription_id) or {}
+        statut_complet = {
+            **precedent,
+            **details,
+            "souscription_id": souscription_id,
+            "statut": statut,
+            "etape": etape if etape is not None else precedent.get("etape"),
+            "progression": progression if progression is not None else precedent.get("progression", 0),
+            "mis_a_jour_le": datetime.utcnow().isoformat(),
+        }
+        
+        redis_client = get_redis()
+        if redis_client is not None:
+            try:
+                redis_client.setex(
+                    IAAutoService._status_key(souscription_id),
+                    IA_STATUS_TTL,
+                    json.dumps(statut_complet, default=str)
+                )
+                return statut_complet
+            except Exception as e:
+                logger.warning(f"Impossible d'enregistrer le statut IA dans Redis: {e}")
+        
+        with _local_lock:
+            _local_statuts[souscription_id] = statut_complet
+        return statut_complet
+    
+    @staticmethod
+    def get_analysis_status(souscription_id: int) -> Optional[Dict[str, Any]]:
+        """Retourne le dernier statut connu de l'analyse IA d'une souscription"""
+        redis_client = get_redis()
+        if redis_client is not None:
+            try:
+                brut = redis_client.get(IAAutoService._status_key(souscription_id))
+                return json.loads(brut) if brut else None
+            except Exception as e:
+                logger.warning(f"Impossible de lire le statut IA dans Redis: {e}")
+        
+        with _local_lock:
+            statut = _local_statuts.get(souscription_id)
+            return dict(statut) if statut else None
+    
+    @staticmethod
+    def _acquire_analysis_lock(souscription_id: int, owner: str) -> bool:
+        """Prend le verrou d'analyse (SET NX) ; False si une analyse est déjà planifiée"""
+        redis_client = get_redis()
+        if redis_client is not None:
+            try:
+                return bool(redis_client.set(
+                    IAAutoService._lock_key(souscription_id), owner, nx=True, ex=IA_LOCK_TTL
+                ))
+            except Exception as e:
+                logger.warning(f"Verrou IA Redis indisponible, repli en mémoire: {e}")
+        
+        with _local_lock:
+            if souscription_id in _local_verrous:
+                return False
+            _local_verrous[souscription_id] = owner
+            return True
+    
+    @staticmethod
+    def release_analysis_lock(souscription_id: int):
+        """Libère le verrou d'analyse d'une souscription"""
+        redis_client = get_redis()
+        if redis_client is not None:
+            try:
+                redis_client.delete(IAAutoService._lock_key(souscription_id))
+            except Exception as e:
+                logger.warning(f"Impossible de libérer le verrou IA dans Redis: {e}")
+        with _local_lock:
+            _local_verrous.pop(souscription_id, None)
+    
+    @staticmethod
+    def enqueue_ia_analysis(
+        souscription_id: int,
+        source: str = "paiement",
+        priority: int = IA_PRIORITY_PAIEMENT,
+        force: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Planifie l'analyse IA d'une souscription dans la file Celery `ia_analysis`
+        
+        Idempotent : si une analyse est déjà en attente ou en cours pour cette
+        souscription, aucune nouvelle tâche n'est créée et le statut courant est renvoyé.
+        Une souscription déjà analysée n'est ré-analysée qu'avec force=True.
+        
+        Returns:
+            Statut de l'analyse, avec `mise_en_file` à False si rien n'a été planifié
+        """
+        from app.workers.tasks import analyse_souscription_ia
+        
+        owner = f"{source}:{datetime.utcnow().isoformat()}"
+        if not IAAutoService._acquire_analysis_lock(souscription_id, owner):
+            logger.info(f"⏭️ Analyse IA déjà planifiée pour souscription {souscription_id}")
+            statut = IAAutoService.get_analysis_status(souscription_id) or {"souscription_id": souscription_id}
+            return {**statut, "mise_en_file": False}
+        
+        IAAutoService.set_analysis_status(
+            souscription_id, "en_attente", etape="file_attente", progression=0,
+            source=source, task_id=None, demande_id=None, erreur=None
+        )
+        try:
+            task = analyse_souscription_ia.apply_async(
+                args=[souscription_id],
+                kwargs={"force": force},
+                queue=IA_ANALYSIS_QUEUE,
+                priority=priority
+            )
+        except Exception as e:
+            IAAutoService.release_analysis_lock(souscription_id)
+            logger.error(f"❌ Impossible de planifier l'analyse IA pour souscription {souscription_id}: {e}")
+            statut = IAAutoService.set_analysis_status(
+                souscription_id, "echec", etape="file_attente", erreur="Mise en file impossible"
+            )
+            return {**statut, "mise_en_file": False}
+        
+        statut = IAAutoService.set_analysis_status(souscription_id, "en_attente", task_id=task.id)
+        logger.info(f"🔍 Analyse IA planifiée pour souscription {souscription_id} (tâche {task.id})")
+        return {**statut, "mise_en_file": True}
+    
     @staticmethod
     def collect_subscription_documents(
         db: Session,
@@ -294,11 +460,64 @@ class IAAutoService:
             "questionnaires": questionnaires_utilises
         }
     
+    @staticmethod
+    def _analyser_documents(documents: List[Dict[str, Any]], parallele: bool = True):
+        """
+        Analyse les documents collectés dans le pool OCR
+        
+        Yields:
+            (index du document, résultat ou None, exception ou None, durée totale en ms)
+            dans l'ordre de fin d'analyse en mode parallèle, dans l'ordre des documents sinon
+        """
+        if parallele:
+            yield from ocr_engine.analyser_lot([doc_info['path'] for doc_info in documents])
+            return
+        
+        for index, doc_info in enumerate(documents):
+            debut = time.perf_counter()
+            try:
+                resultat = ocr_engine.analyser(doc_info['path'])
+                yield index, resultat, None, round((time.perf_counter() - debut) * 1000)
+            except Exception as e:
+                yield index, None, e, round((time.perf_counter() - debut) * 1000)
+    
+    @staticmethod
+    def _fusionner_questionnaires(entree: Dict[str, Any], infos_questionnaires: Dict[str, Any]):
+        """
+        Complète l'analyse OCR d'un document avec les données des questionnaires
+        (OCR en priorité, questionnaires en complément)
+        """
+        if not infos_questionnaires.get("infos_personnelles"):
+            return
+        if entree.get("status") != "ok" or "analyse" not in entree:
+            return
+        
+        analyse = entree["analyse"]
+        infos_perso_ocr = analyse.get("infos_personnelles", {})
+        infos_perso_quest = infos_questionnaires.get("infos_personnelles", {})
+        
+        # Fusionner : OCR en priorité, questionnaires en complément
+        for key, value in infos_perso_quest.items():
+            if not infos_perso_ocr.get(key) or infos_perso_ocr.get(key) == "":
+                infos_perso_ocr[key] = value
+        
+        analyse["infos_personnelles"] = infos_perso_ocr
+        
+        # Ajouter aussi les infos santé du questionnaire médical
+        if infos_questionnaires.get("infos_sante"):
+            analyse["infos_sante"] = infos_questionnaires.get("infos_sante")
+        
+        # Ajouter les infos voyage si disponibles
+        if infos_questionnaires.get("infos_voyage"):
+            analyse["infos_voyage"] = infos_questionnaires.get("infos_voyage")
+    
     @staticmethod
     def trigger_ia_analysis(
         db: Session,
         souscription: Souscription,
-        background: bool = True
+        background: bool = True,
+        parallele: bool = True,
+        raise_errors: bool = False
     ) -> Optional[Dict[str, Any]]:
         """
         Déclenche automatiquement l'analyse IA pour une souscription
@@ -307,6 +526,10 @@ class IAAutoService:
             db: Session SQLAlchemy
             souscription: La souscription à analyser
             background: Si True, l'analyse se fait en arrière-plan (non bloquant)
+            parallele: Si True, les documents sont analysés en parallèle dans le pool OCR
+                et fusionnés au fil de l'eau ; sinon un par un
+            raise_errors: Si True, l'erreur est relevée après le passage au statut "echec"
+                (tâche Celery : nouvelle tentative et enregistrement de l'échec)
         
         Returns:
             Résultat de l'analyse ou None si en arrière-plan
@@ -314,10 +537,12 @@ class IAAutoService:
         try:
             # Collecter les documents
             logger.info(f"🔍 Collecte des documents pour souscription {souscription.id}")
+            IAAutoService.set_analysis_status(souscription.id, "en_cours", etape="collecte_documents", progression=5)
             documents = IAAutoService.collect_subscription_documents(db, souscription)
             
             if not documents:
                 logger.warning(f"⚠️ Aucun document trouvé pour souscription {souscription.id}")
+                IAAutoService.set_analysis_status(souscription.id, "aucun_document", etape="collecte_documents", progression=100)
                 return None
             
             logger.info(f"📄 {len(documents)} document(s) collecté(s) pour l'analyse IA")
@@ -325,59 +550,62 @@ class IAAutoService:
             # Générer un demande_id
             demande_id = f"DEM-{souscription.numero_souscription}-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
             
-            # Analyser chaque document
-            resultats_analyse = []
-            fichiers_temp = []
+            # Fichiers temporaires à supprimer quoi qu'il arrive
+            fichiers_temp = [doc_info['path'] for doc_info in documents]
             
             try:
-                for doc_info in documents:
-                    try:
-                        resultat = analyser_document(doc_info['path'])
-                        resultats_analyse.append({
-                            "status": resultat.get("status", "ok"),
-                            "nom_fichier": doc_info['original_name'],
-                            "analyse": resultat
-                        })
-                        fichiers_temp.append(doc_info['path'])
-                    except Exception as e:
-                        logger.error(f"Erreur lors de l'analyse du document {doc_info['original_name']}: {e}")
-                        resultats_analyse.append({
-                            "status": "error",
-                            "nom_fichier": doc_info['original_name'],
-                            "erreur": str(e)
-                        })
-                        fichiers_temp.append(doc_info['path'])
-                
                 # Extraire les informations depuis les questionnaires (JSON, pas besoin d'OCR)
+                # avant l'OCR pour fusionner chaque document dès qu'il est analysé
                 infos_questionnaires = IAAutoService._extract_questionnaire_data(db, souscription)
                 logger.info(f"📋 Informations extraites depuis {len(infos_questionnaires.get('questionnaires', []))} questionnaire(s)")
                 
-                # Enrichir les résultats d'analyse avec les données des questionnaires
-                if infos_questionnaires.get("infos_personnelles"):
-                    # Fusionner les infos personnelles des questionnaires avec celles de l'OCR
-                    for resultat in resultats_analyse:
-                        if resultat.get("status") == "ok" and "analyse" in resultat:
-                            analyse = resultat["analyse"]
-                            # Priorité aux données OCR, compléter avec les questionnaires si manquant
-                            infos_perso_ocr = analyse.get("infos_personnelles", {})
-                            infos_perso_quest = infos_questionnaires.get("infos_personnelles", {})
-                            
-                            # Fusionner : OCR en priorité, questionnaires en complément
-                            for key, value in infos_perso_quest.items():
-                                if not infos_perso_ocr.get(key) or infos_perso_ocr.get(key) == "":
-                                    infos_perso_ocr[key] = value
-                            
-                            analyse["infos_personnelles"] = infos_perso_ocr
-                            
-                            # Ajouter aussi les infos santé du questionnaire médical
-                            if infos_questionnaires.get("infos_sante"):
-                                analyse["infos_sante"] = infos_questionnaires.get("infos_sante")
-                            
-                            # Ajouter les infos voyage si disponibles
-                            if infos_questionnaires.get("infos_voyage"):
-                                analyse["infos_voyage"] = infos_questionnaires.get("infos_voyage")
+                # Analyser les documents (en parallèle dans le pool OCR par défaut)
+                resultats_par_index: Dict[int, Dict[str, Any]] = {}
+                durees_ms: Dict[str, int] = {}
+                IAAutoService.set_analysis_status(
+                    souscription.id, "en_cours", etape="ocr", progression=10,
+                    demande_id=demande_id, documents_total=len(documents), documents_analyses=0
+                )
+                for index, resultat, erreur, duree_totale_ms in IAAutoService._analyser_documents(documents, parallele):
+                    doc_info = documents[index]
+                    if erreur is not None:
+                        logger.error(f"Erreur lors de l'analyse du document {doc_info['original_name']}: {erreur}")
+                        entree = {
+                            "status": "error",
+                            "nom_fichier": doc_info['original_name'],
+                            "erreur": str(erreur)
+                        }
+                    else:
+                        entree = {
+                            "status": resultat.get("status", "ok"),
+                            "nom_fichier": doc_info['original_name'],
+                            "analyse": resultat
+                        }
+                        IAAutoService._fusionner_questionnaires(entree, infos_questionnaires)
+                    
+                    entree["duree_ms"] = (resultat or {}).get("duree_ms")
+                    entree["duree_totale_ms"] = duree_totale_ms
+                    durees_ms[doc_info['original_name']] = duree_totale_ms
+                    if duree_totale_ms >= IA_DOCUMENT_LENT_MS:
+                        logger.warning(
+                            f"🐢 Document lent pour souscription {souscription.id}: {doc_info['original_name']} "
+                            f"({duree_totale_ms} ms dont analyse {entree['duree_ms']} ms)"
+                        )
+                    resultats_par_index[index] = entree
+                    
+                    IAAutoService.set_analysis_status(
+                        souscription.id, "en_cours", etape="ocr",
+                        progression=10 + int(60 * len(resultats_par_index) / len(documents)),
+                        documents_analyses=len(resultats_par_index), durees_ms=durees_ms
+                    )
+                
+                # Ordre d'origine des documents (le premier sert de référence au formateur)
+                resultats_analyse = [resultats_par_index[index] for index in sorted(resultats_par_index)]
                 
                 # Formater pour l'Agent de Production
+                IAAutoService.set_analysis_status(
+                    souscription.id, "en_cours", etape="formatage", progression=75, documents_analyses=len(documents)
+                )
                 resultat_final = formater_pour_agent_production(
                     resultats_analyse=resultats_analyse,
                     demande_id=demande_id
@@ -395,6 +623,7 @@ class IAAutoService:
                 resultat_final["resultats_analyse_bruts"] = resultats_analyse
                 
                 # Déterminer les assureurs concernés
+                IAAutoService.set_analysis_status(souscription.id, "en_cours", etape="routage", progression=85)
                 infos_perso = resultat_final.get("infos_personnelles", {})
                 infos_voyage = resultat_final.get("infos_voyage", {}) or infos_questionnaires.get("infos_voyage", {})
                 
@@ -425,6 +654,7 @@ class IAAutoService:
                 questionnaire_id = questionnaires[0].id if questionnaires else None
                 
                 # Sauvegarder l'analyse
+                IAAutoService.set_analysis_status(souscription.id, "en_cours", etape="sauvegarde", progression=90)
                 storage_analyses.sauvegarder_analyse(
                     demande_id=demande_id,
                     assureurs_concernes=assureurs_concernes,
@@ -437,8 +667,10 @@ class IAAutoService:
                 logger.info(f"✅ Analyse IA sauvegardée pour souscription {souscription.id} (demande_id: {demande_id})")
                 
                 # Notifier l'Agent de Production
+                IAAutoService.set_analysis_status(souscription.id, "en_cours", etape="notification", progression=95)
                 IAAutoService._notify_production_agents(db, souscription, demande_id)
                 
+                IAAutoService.set_analysis_status(souscription.id, "termine", etape="termine", progression=100)
                 return resultat_final
                 
             finally:
@@ -452,6 +684,9 @@ class IAAutoService:
         
         except Exception as e:
             logger.error(f"❌ Erreur lors de l'analyse IA automatique pour souscription {souscription.id}: {e}", exc_info=True)
+            IAAutoService.set_analysis_status(souscription.id, "echec", erreur=str(e))
+            if raise_errors:
+                raise
             return None
     
     @staticmethod
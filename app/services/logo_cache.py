@@ -0,0 +1,208 @@
+"""
+Cache des logos d'assureurs pour les attestations PDF et les e-cartes.
+
+Le logo était rechargé pour chaque document : téléchargement httpx pour une URL http,
+ou recherche dans jusqu'à quatre buckets MinIO. Il est désormais conservé par
+(assureur_id, logo_url), avec l'emplacement où il a été trouvé et son validateur :
+- URL http : ETag / Last-Modified, revalidés par un GET conditionnel (304 = inchangé) ;
+- objet MinIO : ETag, revalidé par un stat_object sur le bucket déjà identifié ;
+- fichier local : date de modification.
+La revalidation a lieu au plus toutes les LOGO_CACHE_REVALIDATE_SECONDS ; si la source
+ne répond pas, le logo déjà chargé continue d'être servi.
+
+Chaque service y dépose ses variantes prêtes à l'emploi (PNG réduit pour l'en-tête PDF,
+image RGBA redimensionnée pour la carte), calculées une fois par version du logo et
+jamais modifiées par les appelants.
+
+Invalidation : à l'upload d'un logo (admin_assureurs.upload_assureur_logo), qui réécrit
+la même clé MinIO ; dans les autres workers, à la revalidation suivante.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+MAX_ENTREES = 256
+
+
+class _Logo:
+    """Contenu d'un logo, son origine et ses variantes calculées"""
+
+    def __init__(self, contenu: Optional[bytes], source: Optional[Tuple] = None, validateur: Any = None):
+        self.contenu = contenu
+        self.source = source  # ("http", url) | ("minio", bucket, cle) | ("fichier", chemin) | ("fourni",) | None
+        self.validateur = validateur
+        self.verifie_le = time.monotonic()
+        self.variantes: Dict[Any, Any] = {}
+
+
+class LogoAssureurCache:
+    """Logos d'assureurs par (assureur_id, logo_url), revalidés par ETag / Last-Modified"""
+
+    def __init__(self, revalidate_seconds: float, max_entries: int = MAX_ENTREES):
+        self.revalidate_seconds = revalidate_seconds
+        self.max_entries = max_entries
+        self._entrees: "OrderedDict[Tuple[Optional[int], str], _Logo]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    def get_bytes(self, assureur_id: Optional[int], logo_url: Optional[str]) -> Optional[bytes]:
+        """Contenu brut du logo, ou None s'il est introuvable"""
+        logo = self._logo(assureur_id, logo_url)
+        return logo.contenu if logo else None
+
+    def get_variant(self, assureur_id: Optional[int], logo_url: Optional[str], cle, fabrique: Callable[[bytes], Any]):
+        """
+        Variante du logo (ex. image redimensionnée), calculée une fois par version du logo.
+        `fabrique` reçoit le contenu brut ; sa valeur est partagée et ne doit pas être modifiée.
+        """
+        logo = self._logo(assureur_id, logo_url)
+        if logo is None or logo.contenu is None:
+            return None
+        variante = logo.variantes.get(cle)
+        if variante is None:
+            variante = fabrique(logo.contenu)
+            if variante is not None:
+                logo.variantes[cle] = variante
+        return variante
+
+    def seed(self, assureur_id: Optional[int], logo_url: Optional[str], contenu: Optional[bytes]):
+        """
+        Dépose un logo chargé par un autre processus (rendu en masse dans un pool), sans
+        remplacer une entrée existante ; une entrée déposée n'est jamais revalidée.
+        """
+        if not logo_url or contenu is None:
+            return
+        cle = (assureur_id, logo_url)
+        with self._lock:
+            if cle in self._entrees:
+                return
+            self._entrees[cle] = _Logo(contenu, ("fourni",))
+            while len(self._entrees) > self.max_entries:
+                self._entrees.popitem(last=False)
+
+    def invalidate(self, assureur_id: Optional[int] = None):
+        with self._lock:
+            if assureur_id is None:
+                self._entrees.clear()
+            else:
+                for cle in [cle for cle in self._entrees if cle[0] == assureur_id]:
+                    del self._entrees[cle]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entrees),
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+            }
+
+    def _logo(self, assureur_id: Optional[int], logo_url: Optional[str]) -> Optional[_Logo]:
+        if not logo_url:
+            return None
+        cle = (assureur_id, logo_url)
+        with self._lock:
+            logo = self._entrees.get(cle)
+            if logo is None:
+                self.misses += 1
+            elif time.monotonic() - logo.verifie_le >= self.revalidate_seconds:
+                self.revalidations += 1
+            else:
+                self._entrees.move_to_end(cle)
+                self.hits += 1
+                return logo
+        # Chargement et revalidation hors verrou (accès réseau)
+        logo = _charger(logo_url) if logo is None else _revalider(logo, logo_url)
+        with self._lock:
+            self._entrees[cle] = logo
+            self._entrees.move_to_end(cle)
+            while len(self._entrees) > self.max_entries:
+                self._entrees.popitem(last=False)
+        return logo
+
+
+def _charger(logo_url: str) -> _Logo:
+    """Recherche complète : URL http, fichier local, puis buckets MinIO"""
+    if logo_url.startswith("http"):
+        return _charger_http(logo_url) or _Logo(None)
+    if os.path.exists(logo_url):
+        try:
+            with open(logo_url, "rb") as f:
+                return _Logo(f.read(), ("fichier", logo_url), os.path.getmtime(logo_url))
+        except OSError as e:
+            logger.warning(f"⚠️ Lecture du logo {logo_url} impossible: {e}")
+            return _Logo(None)
+    from app.services.minio_service import MinioService
+    for bucket in (MinioService.BUCKET_LOGOS, "assureurs", "assets", MinioService.BUCKET_ATTESTATIONS):
+        etag = MinioService.get_file_etag(bucket, logo_url)
+        if etag is None:
+            continue
+        contenu = MinioService.get_file(bucket, logo_url)
+        if contenu:
+            return _Logo(contenu, ("minio", bucket, logo_url), etag)
+    logger.warning(f"⚠️ Logo assureur introuvable: {logo_url}")
+    return _Logo(None)
+
+
+def _charger_http(url: str, precedent: Optional[_Logo] = None) -> Optional[_Logo]:
+    import httpx
+
+    entetes = {}
+    if precedent is not None and precedent.validateur:
+        etag, last_modified = precedent.validateur
+        if etag:
+            entetes["If-None-Match"] = etag
+        if last_modified:
+            entetes["If-Modified-Since"] = last_modified
+    try:
+        with httpx.Client(timeout=5.0) as client:
+            r = client.get(url, headers=entetes)
+    except Exception as e:
+        logger.warning(f"⚠️ Téléchargement du logo {url} impossible: {e}")
+        return None
+    if r.status_code == 304 and precedent is not None:
+        return precedent
+    if r.status_code == 200:
+        return _Logo(r.content, ("http", url), (r.headers.get("etag"), r.headers.get("last-modified")))
+    return None
+
+
+def _revalider(logo: _Logo, logo_url: str) -> _Logo:
+    """Vérifie que la version en cache est toujours la bonne ; en cas d'erreur, la conserve"""
+    source = logo.source
+    if source is None:
+        return _charger(logo_url)  # logo absent : nouvelle recherche
+    if source[0] == "fourni":
+        nouveau = logo  # déposé par le processus parent (seed)
+    elif source[0] == "http":
+        nouveau = _charger_http(logo_url, logo)
+    elif source[0] == "fichier":
+        try:
+            mtime = os.path.getmtime(source[1])
+        except OSError:
+            mtime = None
+        nouveau = logo if mtime == logo.validateur else _charger(logo_url)
+    else:
+        from app.services.minio_service import MinioService
+        _, bucket, objet = source
+        etag = MinioService.get_file_etag(bucket, objet)
+        if etag is None or etag != logo.validateur:
+            nouveau = _charger(logo_url)
+        else:
+            nouveau = logo
+    if nouveau is None or (nouveau.contenu is None and logo.contenu is not None):
+        nouveau = logo  # source indisponible : on garde la version connue
+    nouveau.verifie_le = time.monotonic()
+    return nouveau
+
+
+logo_cache = LogoAssureurCache(revalidate_seconds=settings.LOGO_CACHE_REVALIDATE_SECONDS)
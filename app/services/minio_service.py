@@ -1,9 +1,10 @@
-from datetime import timedelta
-from typing import Optional
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
 from minio import Minio
 from minio.error import S3Error
 from app.core.minio_client import minio_client, ensure_bucket_exists
 from app.core.config import settings
+from app.services.signed_url_cache import signed_url_cache
 import uuid
 import logging
 
@@ -40,6 +41,7 @@ class MinioService:
                 length=len(file_bytes),
                 content_type=content_type,
             )
+            signed_url_cache.record_object(MinioService.BUCKET_LOGOS, object_name)
             return object_name
         except S3Error as e:
             raise Exception(f"Erreur lors de l'upload du logo assureur sur MinIO: {str(e)}")
@@ -89,6 +91,7 @@ class MinioService:
                 length=len(pdf_buffer),
                 content_type="application/pdf"
             )
+            signed_url_cache.record_object(MinioService.BUCKET_ATTESTATIONS, file_name)
             return file_name
         except S3Error as e:
             raise Exception(f"Erreur lors de l'upload du PDF sur Minio: {str(e)}")
@@ -113,6 +116,7 @@ class MinioService:
                 length=len(image_buffer),
                 content_type=f"image/{extension}"
             )
+            signed_url_cache.record_object(MinioService.BUCKET_ATTESTATIONS, file_name)
             return file_name
         except S3Error as e:
             raise Exception(f"Erreur lors de l'upload de la carte numérique sur Minio: {str(e)}")
@@ -142,6 +146,24 @@ class MinioService:
             logger.error(f"Erreur inattendue lors de la vérification de l'existence du fichier: {e}")
             return False
     
+    @staticmethod
+    def get_file_etag(bucket_name: str, object_name: str) -> Optional[str]:
+        """
+        Récupère l'ETag d'un fichier dans Minio (sans télécharger son contenu)
+        
+        Returns:
+            ETag de l'objet, ou None s'il n'existe pas ou en cas d'erreur
+        """
+        try:
+            return minio_client.stat_object(bucket_name, object_name).etag
+        except S3Error as e:
+            if e.code not in ('NoSuchKey', 'NoSuchBucket'):
+                logger.warning(f"Erreur lors de la lecture de l'ETag de {object_name} dans {bucket_name}: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Erreur inattendue lors de la lecture de l'ETag: {e}")
+            return None
+    
     @staticmethod
     def extract_error_details(error: Exception) -> dict:
         """
@@ -238,7 +260,8 @@ class MinioService:
         bucket_name: str,
         object_name: str,
         expires: timedelta = timedelta(hours=24),  # 24h par défaut (au lieu de 1h)
-        retry_on_expired: bool = True
+        retry_on_expired: bool = True,
+        known_object: bool = False
     ) -> str:
         """
         Génère une URL signée pour accéder à un objet Minio
@@ -248,16 +271,74 @@ class MinioService:
             object_name: Nom de l'objet (chemin du fichier)
             expires: Durée de validité de l'URL (défaut: 24 heures, max 7 jours pour AWS/MinIO)
             retry_on_expired: Si True, régénère l'URL en cas d'erreur d'expiration (défaut: True)
+            known_object: Clé lue en base après l'upload : pas de vérification d'existence
             
         Returns:
-            URL signée
+            URL signée (réutilisée depuis le cache jusqu'à la marge de sécurité avant expiration)
             
         Raises:
             Exception: Si le fichier n'existe pas ou en cas d'erreur MinIO
         """
+        return MinioService.generate_signed_url_with_expiry(
+            bucket_name, object_name, expires, retry_on_expired, known_object
+        )[0]
+    
+    @staticmethod
+    def generate_signed_url_with_expiry(
+        bucket_name: str,
+        object_name: str,
+        expires: timedelta = timedelta(hours=24),
+        retry_on_expired: bool = True,
+        known_object: bool = False
+    ) -> Tuple[str, datetime]:
+        """URL signée et sa date d'expiration réelle (antérieure à maintenant + expires si elle vient du cache)"""
+        en_cache = signed_url_cache.get(bucket_name, object_name, expires)
+        if en_cache is not None:
+            return en_cache
+        
+        signee_le = datetime.utcnow()
+        url = MinioService._presign(
+            bucket_name,
+            object_name,
+            expires,
+            retry_on_expired,
+            check_exists=not known_object and not signed_url_cache.is_known(bucket_name, object_name)
+        )
+        signed_url_cache.put(bucket_name, object_name, expires, url, signee_le + expires)
+        return url, signee_le + expires
+    
+    @staticmethod
+    def sign_urls(
+        objets: Iterable[Tuple[str, str]],
+        expires: timedelta = timedelta(hours=24)
+    ) -> Dict[Tuple[str, str], Tuple[str, datetime]]:
+        """
+        Signe en une passe les URLs d'une liste de documents (clés lues en base, sans vérification
+        d'existence). Retourne {(bucket, objet): (url, expiration)} ; les objets dont la signature
+        échoue sont absents du résultat.
+        """
+        urls = {}
+        for bucket_name, object_name in dict.fromkeys(objets):
+            try:
+                urls[(bucket_name, object_name)] = MinioService.generate_signed_url_with_expiry(
+                    bucket_name, object_name, expires, known_object=True
+                )
+            except Exception as e:
+                logger.error(f"Erreur lors de la génération de l'URL signée pour {bucket_name}/{object_name}: {e}")
+        return urls
+    
+    @staticmethod
+    def _presign(
+        bucket_name: str,
+        object_name: str,
+        expires: timedelta,
+        retry_on_expired: bool = True,
+        check_exists: bool = True
+    ) -> str:
+        """Signe une URL (calcul local), après une vérification d'existence si check_exists"""
         try:
-            # Vérifier que le fichier existe avant de générer l'URL
-            if not MinioService.file_exists(bucket_name, object_name):
+            # Vérifier que le fichier existe avant de générer l'URL (objets inconnus seulement)
+            if check_exists and not MinioService.file_exists(bucket_name, object_name):
                 error_msg = f"Le fichier {object_name} n'existe pas dans le bucket {bucket_name}"
                 logger.error(error_msg)
                 raise Exception(error_msg)
@@ -269,7 +350,6 @@ class MinioService:
             )
             
             # Log pour diagnostiquer les problèmes d'heure
-            from datetime import datetime
             logger.debug(
                 f"URL signée générée pour {bucket_name}/{object_name} "
                 f"à {datetime.utcnow().isoformat()} avec expiration de {expires}"
@@ -367,7 +447,8 @@ class MinioService:
     def get_pdf_url(
         chemin_fichier: str,
         bucket_name: Optional[str] = None,
-        expires: timedelta = timedelta(hours=24)  # 24h par défaut (au lieu de 1h)
+        expires: timedelta = timedelta(hours=24),  # 24h par défaut (au lieu de 1h)
+        known_object: bool = False
     ) -> str:
         """
         Récupère une URL signée pour un PDF d'attestation
@@ -376,6 +457,7 @@ class MinioService:
             chemin_fichier: Chemin du fichier dans Minio
             bucket_name: Nom du bucket (défaut: BUCKET_ATTESTATIONS)
             expires: Durée de validité de l'URL
+            known_object: Clé lue en base après l'upload : pas de vérification d'existence
             
         Returns:
             URL signée
@@ -387,7 +469,7 @@ class MinioService:
             bucket_name = MinioService.BUCKET_ATTESTATIONS
         
         try:
-            return MinioService.generate_signed_url(bucket_name, chemin_fichier, expires)
+            return MinioService.generate_signed_url(bucket_name, chemin_fichier, expires, known_object=known_object)
         except Exception as e:
             logger.error(f"Erreur lors de la génération de l'URL pour le PDF {chemin_fichier} dans {bucket_name}: {e}")
             raise
@@ -406,6 +488,7 @@ class MinioService:
         """
         try:
             minio_client.remove_object(bucket_name, object_name)
+            signed_url_cache.invalidate(bucket_name, object_name)
             return True
         except S3Error as e:
             raise Exception(f"Erreur lors de la suppression du PDF: {str(e)}")
@@ -441,6 +524,7 @@ class MinioService:
                 length=len(file_data),
                 content_type=content_type
             )
+            signed_url_cache.record_object(bucket_name, object_name)
             return object_name
         except S3Error as e:
             raise Exception(f"Erreur lors de l'upload du fichier sur Minio: {str(e)}")
@@ -1,8 +1,10 @@
 import os
 from io import BytesIO
 from datetime import datetime as dt, date
+from functools import lru_cache
 from typing import Dict, Any, Optional, List
 
+from reportlab import rl_config
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from reportlab.lib.pagesizes import A4
@@ -26,6 +28,7 @@ from app.core.config import settings
 from app.models.paiement import Paiement
 from app.models.souscription import Souscription
 from app.models.user import User
+from app.services.logo_cache import logo_cache
 
 
 # Chemins logos (alignés sur card_service)
@@ -37,30 +40,190 @@ _LOGO_DIR = os.path.join(
 MOBILITY_LOGO_PATH = os.path.join(_LOGO_DIR, "mobility-logo.png")
 
 
+# --- Gabarits d'attestation ---
+# Les styles, le logo Mobility Health et les paragraphes des annexes (Conditions Générales,
+# articles fixes des Conditions Particulières et de la Police) sont préparés une fois par
+# processus ; chaque attestation ne compose que ses données propres.
+# Les flux PDF sont écrits en binaire compressé : l'encodage ASCII85 (activé par défaut dans
+# ReportLab, en Python pur) représentait près de la moitié du temps de génération.
+rl_config.useA85 = 0
+
+
+@lru_cache(maxsize=1)
+def _styles_attestation() -> Dict[str, ParagraphStyle]:
+    """Styles communs aux attestations provisoire et définitive (partagés, jamais modifiés)"""
+    styles = getSampleStyleSheet()
+    normal_style = ParagraphStyle(
+        'CustomNormal',
+        parent=styles['Normal'],
+        fontSize=11,
+        textColor=colors.HexColor('#333333'),
+        spaceAfter=8
+    )
+    return {
+        "base": styles['Normal'],
+        "title": ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=18,
+            textColor=colors.HexColor('#1a1a1a'),
+            spaceAfter=30,
+            alignment=TA_CENTER
+        ),
+        "heading": ParagraphStyle(
+            'CustomHeading',
+            parent=styles['Heading2'],
+            fontSize=14,
+            textColor=colors.HexColor('#2c3e50'),
+            spaceAfter=12,
+            spaceBefore=12
+        ),
+        "normal": normal_style,
+        "numero": ParagraphStyle(
+            'Numero',
+            parent=normal_style,
+            fontSize=12,
+            alignment=TA_CENTER,
+            textColor=colors.HexColor('#28a745')
+        ),
+        "validation": ParagraphStyle(
+            'Validation',
+            parent=normal_style,
+            fontSize=11,
+            textColor=colors.HexColor('#28a745'),
+            backColor=colors.HexColor('#d4edda'),
+            borderPadding=10,
+            borderWidth=1,
+            borderColor=colors.HexColor('#28a745')
+        ),
+        "date": ParagraphStyle(
+            'Date',
+            parent=normal_style,
+            fontSize=10,
+            alignment=TA_RIGHT
+        ),
+    }
+
+
+@lru_cache(maxsize=16)
+def _style_article(normal_style: ParagraphStyle) -> ParagraphStyle:
+    return ParagraphStyle(
+        'AppendixHeading',
+        parent=normal_style,
+        fontSize=12,
+        textColor=colors.HexColor('#111827'),
+        spaceBefore=10,
+        spaceAfter=4,
+        leading=14,
+        fontName='Helvetica-Bold'
+    )
+
+
+class _ParagrapheCompile(Paragraph):
+    """Paragraphe issu d'un gabarit : texte déjà analysé, coupures de lignes mémorisées par largeur"""
+
+    _gabarit = None  # absent sur les morceaux créés par split(), qui sont recalculés normalement
+
+    def breakLines(self, width):
+        if self._gabarit is None:
+            return super().breakLines(width)
+        cle = tuple(width) if isinstance(width, (list, tuple)) else width
+        resultat = self._gabarit.coupures.get(cle)
+        if resultat is None:
+            blPara = super().breakLines(width)
+            resultat = (blPara, self._width_max)
+            if len(self._gabarit.coupures) < 8:
+                self._gabarit.coupures[cle] = resultat
+        blPara, self._width_max = resultat
+        return blPara
+
+
+class _GabaritParagraphe:
+    """Texte d'annexe analysé une fois ; les lignes coupées sont partagées en lecture seule"""
+
+    def __init__(self, texte: str, style: ParagraphStyle):
+        modele = Paragraph(texte, style)
+        self.texte = texte
+        self.style = modele.style
+        self.frags = modele.frags
+        self.bulletText = modele.bulletText
+        self.coupures: Dict[Any, tuple] = {}
+
+    def paragraphe(self) -> Paragraph:
+        # Un Paragraph est modifié pendant la mise en page (wrap/split) : une instance par document
+        p = _ParagrapheCompile(self.texte, self.style, bulletText=self.bulletText, frags=self.frags)
+        p._gabarit = self
+        return p
+
+
+@lru_cache(maxsize=1024)
+def _gabarit_paragraphe(texte: str, style: ParagraphStyle) -> _GabaritParagraphe:
+    """
+    Clé = texte + style : un paragraphe dépendant de la souscription ou du produit
+    (garanties, dates) a sa propre entrée, une modification ne sert jamais un ancien rendu.
+    """
+    return _GabaritParagraphe(texte, style)
+
+
+@lru_cache(maxsize=4)
+def _lire_logo(path: str, mtime: float) -> bytes:
+    """Contenu d'un logo local ; clé incluant mtime (fichier remplacé = relu)"""
+    with open(path, "rb") as f:
+        return f.read()
+
+
+_logos_telecharges: Dict[str, bytes] = {}
+
+
 def _load_logo_bytes_mobility() -> Optional[BytesIO]:
-    """Charge le logo Mobility Health en bytes pour le PDF."""
+    """Charge le logo Mobility Health en bytes pour le PDF (lu ou téléchargé une fois par processus)."""
     path = getattr(settings, "MOBILITY_HEALTH_LOGO_PATH", None) or MOBILITY_LOGO_PATH
     if path and os.path.exists(path):
         try:
-            with open(path, "rb") as f:
-                return BytesIO(f.read())
+            return BytesIO(_lire_logo(path, os.path.getmtime(path)))
         except Exception:
             pass
     url = getattr(settings, "MOBILITY_HEALTH_LOGO_URL", None)
     if url:
+        if url in _logos_telecharges:
+            return BytesIO(_logos_telecharges[url])
         try:
             import httpx
             with httpx.Client(timeout=5.0) as client:
                 r = client.get(url)
                 if r.status_code == 200:
+                    # Seuls les succès sont conservés : un échec est retenté au document suivant
+                    _logos_telecharges[url] = r.content
                     return BytesIO(r.content)
         except Exception:
             pass
     return None
 
 
+# En-tête PDF : logo affiché dans 3,5 × 1,2 cm, soit ces dimensions à 300 dpi
+PDF_LOGO_MAX_PIXELS = (413, 142)
+
+
+def _logo_pdf(contenu: bytes) -> bytes:
+    """Variante en-tête PDF : logo réduit à la résolution d'impression (inchangé s'il est déjà petit)."""
+    from PIL import Image as PILImage
+
+    try:
+        image = PILImage.open(BytesIO(contenu))
+        if image.width <= PDF_LOGO_MAX_PIXELS[0] and image.height <= PDF_LOGO_MAX_PIXELS[1]:
+            return contenu
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        image.thumbnail(PDF_LOGO_MAX_PIXELS, PILImage.LANCZOS)
+        sortie = BytesIO()
+        image.save(sortie, format="PNG")
+        return sortie.getvalue()
+    except Exception:
+        return contenu
+
+
 def _load_logo_bytes_assureur(souscription: Souscription) -> Optional[BytesIO]:
-    """Charge le logo de l'assureur (produit lié à la souscription) en bytes pour le PDF."""
+    """Charge le logo de l'assureur (produit lié à la souscription) en bytes pour le PDF, via le cache des logos."""
     try:
         produit = getattr(souscription, "produit_assurance", None)
         if not produit:
@@ -71,24 +234,9 @@ def _load_logo_bytes_assureur(souscription: Souscription) -> Optional[BytesIO]:
         logo_url = getattr(assureur, "logo_url", None)
         if not logo_url:
             return None
-        if logo_url.startswith("http"):
-            import httpx
-            with httpx.Client(timeout=5.0) as client:
-                r = client.get(logo_url)
-                if r.status_code == 200:
-                    return BytesIO(r.content)
-            return None
-        if os.path.exists(logo_url):
-            with open(logo_url, "rb") as f:
-                return BytesIO(f.read())
-        from app.services.minio_service import MinioService
-        for bucket in ["logos", "assureurs", "assets", MinioService.BUCKET_ATTESTATIONS]:
-            try:
-                data = MinioService.get_file(bucket, logo_url)
-                if data:
-                    return BytesIO(data)
-            except Exception:
-                continue
+        contenu = logo_cache.get_variant(getattr(assureur, "id", None), logo_url, "pdf", _logo_pdf)
+        if contenu:
+            return BytesIO(contenu)
     except Exception:
         pass
     return None
@@ -166,8 +314,7 @@ def _build_logo_header_flowable(souscription: Souscription):
             mobility_io.seek(0)
             left_flowable = Image(mobility_io, width=logo_w, height=logo_h, kind="proportional")
         except Exception:
-            _styles = getSampleStyleSheet()
-            left_flowable = Paragraph("<i>Mobility Health</i>", _styles["Normal"])
+            left_flowable = Paragraph("<i>Mobility Health</i>", _styles_attestation()["base"])
     if assureur_io:
         try:
             assureur_io.seek(0)
@@ -175,8 +322,7 @@ def _build_logo_header_flowable(souscription: Souscription):
         except Exception:
             right_flowable = None
     if not left_flowable:
-        _styles = getSampleStyleSheet()
-        left_flowable = Paragraph("<i>Mobility Health</i>", _styles["Normal"])
+        left_flowable = Paragraph("<i>Mobility Health</i>", _styles_attestation()["base"])
     if not right_flowable:
         right_flowable = Spacer(1, logo_w)
     col_widths = [9 * cm, 9 * cm]
@@ -500,32 +646,10 @@ class PDFService:
         )
         
         # Styles
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=18,
-            textColor=colors.HexColor('#1a1a1a'),
-            spaceAfter=30,
-            alignment=TA_CENTER
-        )
-        
-        heading_style = ParagraphStyle(
-            'CustomHeading',
-            parent=styles['Heading2'],
-            fontSize=14,
-            textColor=colors.HexColor('#2c3e50'),
-            spaceAfter=12,
-            spaceBefore=12
-        )
-        
-        normal_style = ParagraphStyle(
-            'CustomNormal',
-            parent=styles['Normal'],
-            fontSize=11,
-            textColor=colors.HexColor('#333333'),
-            spaceAfter=8
-        )
+        styles = _styles_attestation()
+        title_style = styles["title"]
+        heading_style = styles["heading"]
+        normal_style = styles["normal"]
         
         # Logos : Mobility Health (gauche), Assureur (droite)
         story.append(_build_logo_header_flowable(souscription))
@@ -649,12 +773,7 @@ class PDFService:
             story.append(Spacer(1, 0.5*cm))
 
         # Date d'émission
-        date_style = ParagraphStyle(
-            'Date',
-            parent=normal_style,
-            fontSize=10,
-            alignment=TA_RIGHT
-        )
+        date_style = styles["date"]
         story.append(Paragraph(
             f"Émis le {dt.now().strftime('%d/%m/%Y à %H:%M')}",
             date_style
@@ -685,33 +804,11 @@ class PDFService:
         doc = SimpleDocTemplate(buffer, pagesize=A4)
         story = []
         
-        # Styles (similaires à l'attestation provisoire)
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=18,
-            textColor=colors.HexColor('#1a1a1a'),
-            spaceAfter=30,
-            alignment=TA_CENTER
-        )
-        
-        heading_style = ParagraphStyle(
-            'CustomHeading',
-            parent=styles['Heading2'],
-            fontSize=14,
-            textColor=colors.HexColor('#2c3e50'),
-            spaceAfter=12,
-            spaceBefore=12
-        )
-        
-        normal_style = ParagraphStyle(
-            'CustomNormal',
-            parent=styles['Normal'],
-            fontSize=11,
-            textColor=colors.HexColor('#333333'),
-            spaceAfter=8
-        )
+        # Styles (communs à l'attestation provisoire)
+        styles = _styles_attestation()
+        title_style = styles["title"]
+        heading_style = styles["heading"]
+        normal_style = styles["normal"]
         
         # Logos : Mobility Health (gauche), Assureur (droite)
         story.append(_build_logo_header_flowable(souscription))
@@ -722,13 +819,7 @@ class PDFService:
         story.append(Spacer(1, 0.3*cm))
         
         # Numéro d'attestation
-        numero_style = ParagraphStyle(
-            'Numero',
-            parent=normal_style,
-            fontSize=12,
-            alignment=TA_CENTER,
-            textColor=colors.HexColor('#28a745')
-        )
+        numero_style = styles["numero"]
         story.append(Paragraph(f"<b>N° {numero_attestation}</b>", numero_style))
         story.append(Spacer(1, 0.5*cm))
         
@@ -852,16 +943,7 @@ class PDFService:
             "✓ Équipe technique<br/>"
             "✓ Agent de production MH"
         )
-        validation_style = ParagraphStyle(
-            'Validation',
-            parent=normal_style,
-            fontSize=11,
-            textColor=colors.HexColor('#28a745'),
-            backColor=colors.HexColor('#d4edda'),
-            borderPadding=10,
-            borderWidth=1,
-            borderColor=colors.HexColor('#28a745')
-        )
+        validation_style = styles["validation"]
         story.append(Paragraph(validation_text, validation_style))
         story.append(Spacer(1, 0.5*cm))
         
@@ -881,12 +963,7 @@ class PDFService:
             story.append(Spacer(1, 0.5*cm))
 
         # Date d'émission
-        date_style = ParagraphStyle(
-            'Date',
-            parent=normal_style,
-            fontSize=10,
-            alignment=TA_RIGHT
-        )
+        date_style = styles["date"]
         story.append(Paragraph(
             f"Émis le {dt.now().strftime('%d/%m/%Y à %H:%M')}",
             date_style
@@ -1270,22 +1347,13 @@ class PDFService:
     @staticmethod
     def _append_structured_section(story, title, sections, heading_style, normal_style):
         story.append(PageBreak())
-        story.append(Paragraph(title, heading_style))
+        story.append(_gabarit_paragraphe(title, heading_style).paragraphe())
         story.append(Spacer(1, 0.3*cm))
-        article_style = ParagraphStyle(
-            'AppendixHeading',
-            parent=normal_style,
-            fontSize=12,
-            textColor=colors.HexColor('#111827'),
-            spaceBefore=10,
-            spaceAfter=4,
-            leading=14,
-            fontName='Helvetica-Bold'
-        )
+        article_style = _style_article(normal_style)
         for section in sections:
-            story.append(Paragraph(section["title"], article_style))
+            story.append(_gabarit_paragraphe(section["title"], article_style).paragraphe())
             for content in section.get("content", []):
-                story.append(Paragraph(content, normal_style))
+                story.append(_gabarit_paragraphe(content, normal_style).paragraphe())
             table_flowable = section.get("table_flowable")
             if table_flowable is not None:
                 story.append(table_flowable)
@@ -1297,7 +1365,7 @@ class PDFService:
 
     @staticmethod
     def _build_list_flowable(items, normal_style):
-        list_items = [ListItem(Paragraph(item, normal_style)) for item in items]
+        list_items = [ListItem(_gabarit_paragraphe(item, normal_style).paragraphe()) for item in items]
         return ListFlowable(
             list_items,
             bulletType='bullet',
@@ -0,0 +1,165 @@
+"""
+Cache des utilisateurs authentifiés (principal) pour get_current_user et le WebSocket SOS.
+
+Chaque requête authentifiée relisait l'utilisateur par son username. Les colonnes de
+l'utilisateur sont conservées quelques secondes par `sub` du jeton ; sur un succès, elles
+sont rattachées à la session de la requête par `Session.merge(load=False)` : l'objet est
+persistant (relations chargeables, modifications possibles) sans SELECT.
+
+Invalidation :
+- à la création, modification ou suppression d'un utilisateur (événements SQLAlchemy),
+  au flush puis de nouveau au commit ;
+- dans les autres processus (workers uvicorn, Celery) : les usernames modifiés sont publiés
+  au commit sur le canal Redis `principal:invalidate`, écouté par le bus WebSocket de
+  chaque worker API ;
+- sans Redis, au plus tard après PRINCIPAL_CACHE_TTL_SECONDS.
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.core.websocket_manager import manager as websocket_manager
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+MAX_ENTREES = 10000
+CANAL_INVALIDATION = "principal:invalidate"
+
+_COLONNES = tuple(attribut.key for attribut in inspect(User).column_attrs)
+
+
+class PrincipalCache:
+    """Colonnes des utilisateurs par username, avec TTL et éviction LRU"""
+
+    def __init__(self, ttl_seconds: float, max_entries: int = MAX_ENTREES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entrees: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username: str) -> Optional[Dict[str, Any]]:
+        if self.ttl_seconds <= 0:
+            return None
+        maintenant = time.monotonic()
+        with self._lock:
+            entree = self._entrees.get(username)
+            if entree is None or entree[0] <= maintenant:
+                if entree is not None:
+                    del self._entrees[username]
+                self.misses += 1
+                return None
+            self._entrees.move_to_end(username)
+            self.hits += 1
+            return entree[1]
+
+    def put(self, user: User) -> Dict[str, Any]:
+        """Mémorise l'utilisateur et renvoie ses colonnes"""
+        colonnes = {cle: getattr(user, cle) for cle in _COLONNES}
+        if self.ttl_seconds > 0:
+            with self._lock:
+                self._entrees[user.username] = (time.monotonic() + self.ttl_seconds, colonnes)
+                self._entrees.move_to_end(user.username)
+                while len(self._entrees) > self.max_entries:
+                    self._entrees.popitem(last=False)
+        return colonnes
+
+    def invalidate(self, username: Optional[str] = None):
+        with self._lock:
+            if username is None:
+                self._entrees.clear()
+            else:
+                self._entrees.pop(username, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entrees), "hits": self.hits, "misses": self.misses}
+
+
+principal_cache = PrincipalCache(ttl_seconds=settings.PRINCIPAL_CACHE_TTL_SECONDS)
+
+
+def attach_user(db: Session, colonnes: Dict[str, Any]) -> User:
+    """Rattache un utilisateur mis en cache à la session, sans requête"""
+    user = User(**colonnes)
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
+
+def get_user_by_username(db: Session, username: str) -> Optional[User]:
+    """Utilisateur du jeton, depuis le cache ou la base"""
+    colonnes = principal_cache.get(username)
+    if colonnes is not None:
+        return attach_user(db, colonnes)
+    user = db.query(User).filter(User.username == username).first()
+    if user is not None:
+        principal_cache.put(user)
+    return user
+
+
+# --- Invalidation sur les écritures d'utilisateurs ---
+# Invalidé dès le flush, puis au commit : une requête concurrente a pu recharger
+# l'ancienne ligne entre les deux.
+_CLE_SESSION = "principal_cache_usernames"
+
+
+def _usernames(target: User) -> Set[str]:
+    historique = inspect(target).attrs.username.history
+    return {nom for nom in (target.username, *historique.deleted) if nom}
+
+
+def _ecriture(mapper, connection, target):
+    usernames = _usernames(target)
+    for username in usernames:
+        principal_cache.invalidate(username)
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault(_CLE_SESSION, set()).update(usernames)
+
+
+event.listen(User, "after_insert", _ecriture)
+event.listen(User, "after_update", _ecriture)
+event.listen(User, "after_delete", _ecriture)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalider_apres_commit(session):
+    usernames = session.info.pop(_CLE_SESSION, ())
+    for username in usernames:
+        principal_cache.invalidate(username)
+    if usernames:
+        _publier_invalidation(usernames)
+
+
+def _publier_invalidation(usernames: Set[str]):
+    """Prévient les autres processus ; sans Redis, leur copie expire avec le TTL"""
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.publish(CANAL_INVALIDATION, json.dumps({"usernames": sorted(usernames)}))
+    except Exception as e:
+        logger.warning(f"⚠️ Publication de l'invalidation des utilisateurs impossible: {e}")
+
+
+def _invalidation_distante(message: Dict[str, Any]):
+    for username in message.get("usernames") or ():
+        principal_cache.invalidate(username)
+
+
+websocket_manager.ecouter_canal(CANAL_INVALIDATION, _invalidation_distante)
+
+
+@event.listens_for(Session, "after_rollback")
+def _oublier_apres_rollback(session):
+    session.info.pop(_CLE_SESSION, None)
@@ -0,0 +1,99 @@
+"""
+Cache des URLs signées MinIO (attestations, cartes, documents de projet).
+
+La signature d'une URL présignée est un calcul HMAC local, mais generate_signed_url
+faisait d'abord un stat_object (aller-retour réseau) pour vérifier l'existence de l'objet,
+et les listes (attestations, documents) re-signaient chaque URL à chaque requête.
+
+- Les URLs sont conservées par (bucket, objet, durée demandée) et réutilisées tant qu'il
+  leur reste plus que la marge de sécurité (SIGNED_URL_SAFETY_MARGIN_SECONDS, au plus la
+  moitié de leur durée de vie) ; l'expiration réelle est rendue avec l'URL.
+- Les objets connus ne sont pas vérifiés : clés enregistrées à l'upload par ce processus,
+  ou lues dans une ligne en base écrite après l'upload (known_object=True).
+
+Invalidation : à la suppression de l'objet (MinioService.delete_pdf) ; les URLs déjà
+distribuées restent valides jusqu'à leur expiration, comme avant.
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+MAX_ENTREES = 4096
+
+
+class SignedUrlCache:
+    """URLs signées par (bucket, objet, durée), réutilisées jusqu'à la marge de sécurité"""
+
+    def __init__(self, safety_margin_seconds: float, max_entries: int = MAX_ENTREES):
+        self.safety_margin_seconds = safety_margin_seconds
+        self.max_entries = max_entries
+        self._urls: "OrderedDict[Tuple[str, str, int], Tuple[str, datetime]]" = OrderedDict()
+        self._objets: "OrderedDict[Tuple[str, str], None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, bucket_name: str, object_name: str, expires: timedelta) -> Optional[Tuple[str, datetime]]:
+        """(url, expiration) encore utilisable, ou None s'il faut signer"""
+        duree = int(expires.total_seconds())
+        marge = min(self.safety_margin_seconds, duree / 2)
+        cle = (bucket_name, object_name, duree)
+        with self._lock:
+            entree = self._urls.get(cle)
+            if entree is not None and entree[1] - datetime.utcnow() > timedelta(seconds=marge):
+                self._urls.move_to_end(cle)
+                self.hits += 1
+                return entree
+            self.misses += 1
+            return None
+
+    def put(self, bucket_name: str, object_name: str, expires: timedelta, url: str, expire_le: datetime):
+        with self._lock:
+            cle = (bucket_name, object_name, int(expires.total_seconds()))
+            self._urls[cle] = (url, expire_le)
+            self._urls.move_to_end(cle)
+            while len(self._urls) > self.max_entries:
+                self._urls.popitem(last=False)
+            self._retenir(bucket_name, object_name)
+
+    def record_object(self, bucket_name: str, object_name: str):
+        """Enregistre une clé qui vient d'être uploadée (pas de vérification d'existence à la signature)"""
+        with self._lock:
+            self._retenir(bucket_name, object_name)
+
+    def is_known(self, bucket_name: str, object_name: str) -> bool:
+        with self._lock:
+            return (bucket_name, object_name) in self._objets
+
+    def invalidate(self, bucket_name: Optional[str] = None, object_name: Optional[str] = None):
+        with self._lock:
+            if bucket_name is None:
+                self._urls.clear()
+                self._objets.clear()
+                return
+            for cle in [cle for cle in self._urls if cle[0] == bucket_name and object_name in (None, cle[1])]:
+                del self._urls[cle]
+            for cle in [cle for cle in self._objets if cle[0] == bucket_name and object_name in (None, cle[1])]:
+                del self._objets[cle]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._urls),
+                "known_objects": len(self._objets),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _retenir(self, bucket_name: str, object_name: str):
+        cle = (bucket_name, object_name)
+        self._objets[cle] = None
+        self._objets.move_to_end(cle)
+        while len(self._objets) > self.max_entries:
+            self._objets.popitem(last=False)
+
+
+signed_url_cache = SignedUrlCache(safety_margin_seconds=settings.SIGNED_URL_SAFETY_MARGIN_SECONDS)
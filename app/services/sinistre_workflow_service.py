@@ -1,13 +1,19 @@
+import itertools
+import logging
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
-from sqlalchemy.orm import Session
+from sqlalchemy import event, or_
+from sqlalchemy.orm import Session, joinedload, selectinload
 
 from app.core.enums import StatutWorkflowSinistre
 from app.models.alerte import Alerte
+from app.models.hospital_stay import HospitalStay
 from app.models.sinistre import Sinistre
 from app.models.sinistre_process_step import SinistreProcessStep
-from app.models.invoice import InvoiceStatus
+from app.models.invoice import Invoice, InvoiceStatus
+
+logger = logging.getLogger(__name__)
 
 SINISTRE_WORKFLOW_TEMPLATE: List[Dict] = [
     {
@@ -130,10 +136,11 @@ def ensure_workflow_steps(
     existing_steps: Dict[str, SinistreProcessStep] = {step.step_key: step for step in sinistre.workflow_steps}
     ordered_steps: List[SinistreProcessStep] = []
     modified = False
+    now = datetime.utcnow()
 
     for template in SINISTRE_WORKFLOW_TEMPLATE:
         step = existing_steps.get(template["key"])
-        status, completed_at = _compute_status(template["key"], sinistre, alerte)
+        statut, completed_at = _resolve_step_state(template, step, sinistre, alerte, now)
 
         if step is None:
             step = SinistreProcessStep(
@@ -142,21 +149,18 @@ def ensure_workflow_steps(
                 titre=template["titre"],
                 description=template["description"],
                 ordre=template["ordre"],
-                statut=status.value,
-                completed_at=completed_at if status == StatutWorkflowSinistre.COMPLETED else None,
+                statut=statut,
+                completed_at=completed_at,
             )
             db.add(step)
+            # Garder la collection en mémoire à jour (appels successifs dans la même session)
+            sinistre.workflow_steps.append(step)
             modified = True
         else:
-            if template["auto_sync"]:
-                desired_status = status.value
-                if step.statut != desired_status:
-                    step.statut = desired_status
-                    if status == StatutWorkflowSinistre.COMPLETED and step.completed_at is None:
-                        step.completed_at = completed_at or datetime.utcnow()
-                    if status != StatutWorkflowSinistre.COMPLETED:
-                        step.completed_at = None
-                    modified = True
+            if step.statut != statut or step.completed_at != completed_at:
+                step.statut = statut
+                step.completed_at = completed_at
+                modified = True
             # Toujours synchroniser les métadonnées statiques
             if step.titre != template["titre"] or step.description != template["description"] or step.ordre != template["ordre"]:
                 step.titre = template["titre"]
@@ -170,6 +174,57 @@ def ensure_workflow_steps(
     return ordered_steps, modified
 
 
+def project_workflow_steps(
+    sinistres: Iterable[Sinistre],
+    alertes: Optional[Dict[int, Alerte]] = None,
+) -> Dict[int, List[Dict]]:
+    """
+    Projection en lecture seule du workflow d'une page de sinistres : même résultat que
+    ensure_workflow_steps, sans écriture ni requête.
+
+    Les relations workflow_steps, hospital_stay et hospital_stay.invoice doivent être
+    chargées au préalable (selectinload) ; `alertes` est indexé par alerte_id.
+    Retourne les étapes ordonnées de chaque sinistre, indexées par sinistre.id.
+    """
+    alertes = alertes or {}
+    now = datetime.utcnow()
+    projection: Dict[int, List[Dict]] = {}
+    for sinistre in sinistres:
+        alerte = alertes.get(sinistre.alerte_id)
+        stored = {step.step_key: step for step in sinistre.workflow_steps}
+        steps = []
+        for template in SINISTRE_WORKFLOW_TEMPLATE:
+            statut, completed_at = _resolve_step_state(template, stored.get(template["key"]), sinistre, alerte, now)
+            steps.append({
+                "step_key": template["key"],
+                "titre": template["titre"],
+                "ordre": template["ordre"],
+                "statut": statut,
+                "completed_at": completed_at,
+            })
+        projection[sinistre.id] = steps
+    return projection
+
+
+def _resolve_step_state(
+    template: Dict,
+    step: Optional[SinistreProcessStep],
+    sinistre: Sinistre,
+    alerte: Optional[Alerte],
+    now: datetime,
+) -> Tuple[str, Optional[datetime]]:
+    """Statut et date de complétion qu'une étape doit avoir (étape stockée ou à créer)"""
+    status, completed_at = _compute_status(template["key"], sinistre, alerte)
+    if step is None:
+        return status.value, completed_at if status == StatutWorkflowSinistre.COMPLETED else None
+    # Étapes manuelles, ou statut déjà à jour : l'état stocké fait foi
+    if not template["auto_sync"] or step.statut == status.value:
+        return step.statut, step.completed_at
+    if status == StatutWorkflowSinistre.COMPLETED:
+        return status.value, step.completed_at or completed_at or now
+    return status.value, None
+
+
 def update_workflow_step(
     db: Session,
     sinistre: Sinistre,
@@ -369,3 +424,60 @@ def _apply_business_rules(
     return changed
 
 
+# --- Synchronisation des étapes au commit ---
+# Les écritures sur un sinistre, son alerte, son séjour ou sa facture matérialisent les
+# étapes dans la même transaction ; les listes (project_workflow_steps) n'écrivent plus.
+_CLE_SESSION = "sinistre_workflow_sync"
+_MODELES_SUIVIS = (Sinistre, Alerte, HospitalStay, Invoice)
+
+
+def _sinistres_a_synchroniser(db: Session, cles: Set[Tuple[type, int]]) -> List[Sinistre]:
+    ids = {pk for modele, pk in cles if modele is Sinistre}
+    alerte_ids = {pk for modele, pk in cles if modele is Alerte}
+    stay_ids = {pk for modele, pk in cles if modele is HospitalStay}
+    invoice_ids = {pk for modele, pk in cles if modele is Invoice}
+    if invoice_ids:
+        stay_ids.update(
+            row.hospital_stay_id
+            for row in db.query(Invoice.hospital_stay_id).filter(
+                Invoice.id.in_(invoice_ids), Invoice.hospital_stay_id.isnot(None)
+            )
+        )
+    if stay_ids:
+        ids.update(row.sinistre_id for row in db.query(HospitalStay.sinistre_id).filter(HospitalStay.id.in_(stay_ids)))
+    if not ids and not alerte_ids:
+        return []
+    return (
+        db.query(Sinistre)
+        .options(
+            joinedload(Sinistre.alerte),
+            selectinload(Sinistre.workflow_steps),
+            selectinload(Sinistre.hospital_stay).selectinload(HospitalStay.invoice),
+        )
+        .filter(or_(Sinistre.id.in_(ids), Sinistre.alerte_id.in_(alerte_ids)))
+        .all()
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _noter_ecritures(session, flush_context):
+    for obj in itertools.chain(session.new, session.dirty):
+        if isinstance(obj, _MODELES_SUIVIS) and obj.id is not None:
+            session.info.setdefault(_CLE_SESSION, set()).add((type(obj), obj.id))
+
+
+@event.listens_for(Session, "before_commit")
+def _synchroniser_workflows(session):
+    if session.new or session.dirty:
+        session.flush()
+    cles = session.info.pop(_CLE_SESSION, None)
+    if not cles:
+        return
+    for sinistre in _sinistres_a_synchroniser(session, cles):
+        ensure_workflow_steps(session, sinistre, sinistre.alerte)
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _oublier_ecritures(session):
+    session.info.pop(_CLE_SESSION, None)
@@ -0,0 +1,247 @@
+"""
+Bulk attestation regeneration tests: batch commits, kept numbers, MinIO cleanup, picklable render jobs, admin endpoints
+"""
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import BytesIO
+
+import pytest
+
+from fastapi import status
+
+from app.core.config import settings
+from app.core.enums import StatutPaiement, StatutSouscription, TypePaiement
+from app.models.attestation import Attestation
+from app.models.paiement import Paiement
+from app.models.souscription import Souscription
+from app.services.attestation_batch_service import AttestationBatchService, rendre_documents
+from app.services.minio_service import MinioService
+
+
+def _souscription(db, user, product, numero, paiement=True, validation_finale="approved"):
+    souscription = Souscription(
+        user_id=user.id,
+        produit_assurance_id=product.id,
+        numero_souscription=numero,
+        prix_applique=product.cout,
+        date_debut=datetime.utcnow(),
+        date_fin=datetime.utcnow() + timedelta(days=30),
+        statut=StatutSouscription.ACTIVE,
+        validation_finale=validation_finale,
+    )
+    db.add(souscription)
+    db.flush()
+    if paiement:
+        db.add(Paiement(
+            souscription_id=souscription.id,
+            user_id=user.id,
+            montant=product.cout,
+            type_paiement=TypePaiement.CARTE_BANCAIRE,
+            statut=StatutPaiement.VALIDE,
+            date_paiement=datetime.utcnow(),
+            reference_transaction=f"TX-{numero}",
+        ))
+    db.commit()
+    return souscription
+
+
+def _minio(monkeypatch, echec_upload=False):
+    objets = {"uploads": [], "supprimes": []}
+
+    def upload_pdf(contenu, souscription_id, type_attestation, numero):
+        if echec_upload:
+            raise Exception("MinIO indisponible")
+        assert contenu.startswith(b"%PDF")
+        chemin = f"{souscription_id}/{type_attestation}/{numero}.pdf"
+        objets["uploads"].append(chemin)
+        return chemin
+
+    def upload_card_image(contenu, souscription_id, numero, extension="png"):
+        assert contenu.startswith(b"\x89PNG")
+        chemin = f"{souscription_id}/cards/{numero}.png"
+        objets["uploads"].append(chemin)
+        return chemin
+
+    monkeypatch.setattr(MinioService, "upload_pdf", staticmethod(upload_pdf))
+    monkeypatch.setattr(MinioService, "upload_card_image", staticmethod(upload_card_image))
+    monkeypatch.setattr(MinioService, "get_pdf_url", staticmethod(lambda chemin, bucket_name=None, expires=None: f"https://minio/{chemin}"))
+    monkeypatch.setattr(MinioService, "generate_signed_url", staticmethod(lambda bucket, chemin, expires=None: f"https://minio/{chemin}"))
+    monkeypatch.setattr(MinioService, "delete_pdf", staticmethod(lambda bucket, objet: objets["supprimes"].append(objet) or True))
+    return objets
+
+
+class TestAttestationBatchService:
+    def test_definitive_regeneration_commits_per_batch(self, db, test_user, test_product, monkeypatch):
+        product = test_product(db, code="BATCH-001", cout=Decimal("150.00"))
+        nouvelle = _souscription(db, test_user, product, "SUB-BATCH-001")
+        existante = _souscription(db, test_user, product, "SUB-BATCH-002")
+        sans_paiement = _souscription(db, test_user, product, "SUB-BATCH-003", paiement=False)
+        non_validee = _souscription(db, test_user, product, "SUB-BATCH-004", validation_finale="pending")
+        ancienne = Attestation(
+            souscription_id=existante.id,
+            type_attestation="definitive",
+            numero_attestation="ATT-DEF-SUB-BATCH-002-ANCIENNE",
+            chemin_fichier_minio="ancien.pdf",
+            bucket_minio="attestations",
+            carte_numerique_path="ancienne_carte.png",
+            carte_numerique_bucket="attestations",
+            est_valide=False,
+        )
+        db.add(ancienne)
+        db.commit()
+
+        objets = _minio(monkeypatch)
+        monkeypatch.setattr(settings, "ATTESTATION_BATCH_SIZE", 2)
+        commits = []
+        commit_reel = db.commit
+        monkeypatch.setattr(db, "commit", lambda: commits.append(1) or commit_reel())
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            statut = AttestationBatchService.run(
+                db, "job-def", "definitive", {"produit_id": product.id}, executor=executor
+            )
+
+        assert statut["statut"] == "termine"
+        assert {cle: statut[cle] for cle in ("total", "traitees", "reussies", "ignorees", "echecs")} == {
+            "total": 4, "traitees": 4, "reussies": 2, "ignorees": 2, "echecs": 0,
+        }
+        assert len(commits) == 2  # un commit par lot de 2
+        assert AttestationBatchService.get_job_status("job-def")["reussies"] == 2
+
+        db.expire_all()
+        regeneree = db.query(Attestation).filter(Attestation.souscription_id == existante.id).one()
+        assert regeneree.numero_attestation == "ATT-DEF-SUB-BATCH-002-ANCIENNE"  # QR code inchangé
+        assert regeneree.est_valide and regeneree.paiement_id is not None
+        assert regeneree.carte_numerique_url.startswith("https://minio/")
+        assert sorted(objets["supprimes"]) == ["ancien.pdf", "ancienne_carte.png"]
+
+        creee = db.query(Attestation).filter(Attestation.souscription_id == nouvelle.id).one()
+        assert creee.numero_attestation.startswith("ATT-DEF-SUB-BATCH-001-")
+        assert creee.chemin_fichier_minio in objets["uploads"]
+        assert db.query(Attestation).filter(
+            Attestation.souscription_id.in_([sans_paiement.id, non_validee.id])
+        ).count() == 0
+
+    def test_storage_failure_falls_back_to_inline(self, db, test_user, test_product, monkeypatch):
+        product = test_product(db, code="BATCH-002", cout=Decimal("90.00"))
+        souscription = _souscription(db, test_user, product, "SUB-BATCH-010", validation_finale=None)
+        _minio(monkeypatch, echec_upload=True)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            statut = AttestationBatchService.run(
+                db, "job-prov", "provisoire", {"souscription_ids": [souscription.id]}, executor=executor
+            )
+
+        assert statut["statut"] == "termine" and statut["reussies"] == 1
+        attestation = db.query(Attestation).filter(Attestation.souscription_id == souscription.id).one()
+        assert attestation.bucket_minio == "inline"
+        assert attestation.url_signee.startswith("data:application/pdf;base64,")
+        assert attestation.carte_numerique_path is None
+
+    def test_render_jobs_are_picklable_for_process_pool(self, db, test_user, test_product):
+        product = test_product(db, code="BATCH-003", cout=Decimal("75.00"))
+        souscription = _souscription(db, test_user, product, "SUB-BATCH-020")
+
+        travaux, existantes, ignorees = AttestationBatchService._preparer_lot(db, [souscription.id], "definitive")
+        assert len(travaux) == 1 and not existantes and not ignorees
+
+        travail = pickle.loads(pickle.dumps(travaux[0]))
+        assert travail["souscription"].produit_assurance.code == "BATCH-003"
+        documents = rendre_documents(travail)
+        assert documents["pdf"].startswith(b"%PDF")
+        assert documents["carte"].startswith(b"\x89PNG")
+
+    def test_batch_loads_do_not_grow_with_size_and_logo_travels_with_job(
+        self, db, test_user, test_product, monkeypatch
+    ):
+        from PIL import Image
+        from sqlalchemy import event
+
+        from app.models.assureur import Assureur
+        from app.services import attestation_batch_service, card_service, logo_cache, pdf_service
+
+        product = test_product(db, code="BATCH-004", cout=Decimal("75.00"))
+        assureur = Assureur(nom="Assureur Lot", pays="CI", logo_url="logos/lot.png")
+        db.add(assureur)
+        db.flush()
+        product.assureur_id = assureur.id
+        db.commit()
+        ids = [_souscription(db, test_user, product, f"SUB-BATCH-03{i}").id for i in range(3)]
+
+        png = BytesIO()
+        Image.new("RGBA", (40, 20), (0, 0, 255, 255)).save(png, "PNG")
+        chargements = []
+        monkeypatch.setattr(
+            logo_cache, "_charger",
+            lambda url: chargements.append(url) or logo_cache._Logo(png.getvalue(), ("minio", "logos", url), "etag"),
+        )
+        monkeypatch.setattr(attestation_batch_service, "logo_cache", logo_cache.LogoAssureurCache(revalidate_seconds=3600))
+
+        requetes = []
+
+        def _noter(conn, cursor, statement, parameters, context, executemany):
+            requetes.append(statement)
+
+        event.listen(db.get_bind(), "before_cursor_execute", _noter)
+        try:
+            AttestationBatchService._preparer_lot(db, ids[:1], "definitive")
+            requetes_une = len(requetes)
+            travaux, _, _ = AttestationBatchService._preparer_lot(db, ids, "definitive")
+        finally:
+            event.remove(db.get_bind(), "before_cursor_execute", _noter)
+        assert len(travaux) == 3
+        assert len(requetes) - requetes_une == requetes_une  # une requête par table, quelle que soit la taille du lot
+        assert chargements == ["logos/lot.png"]  # logo chargé une fois par le processus parent
+
+        # Processus de rendu : cache des logos vide, aucun accès MinIO
+        cache_processus = logo_cache.LogoAssureurCache(revalidate_seconds=3600)
+        for module in (attestation_batch_service, card_service, pdf_service):
+            monkeypatch.setattr(module, "logo_cache", cache_processus)
+        monkeypatch.setattr(logo_cache, "_charger", lambda url: pytest.fail("logo rechargé dans le processus de rendu"))
+        documents = rendre_documents(pickle.loads(pickle.dumps(travaux[0])))
+        assert documents["carte"].startswith(b"\x89PNG")
+        assert cache_processus.get_stats()["entries"] == 1
+
+
+class TestRegenerationEndpoints:
+    def test_admin_enqueues_and_reads_progress(self, client, admin_headers, monkeypatch):
+        from app.workers import tasks
+
+        envois = []
+        monkeypatch.setattr(
+            tasks.regenerate_attestations, "apply_async", lambda **kwargs: envois.append(kwargs)
+        )
+
+        response = client.post(
+            "/api/v1/admin/subscriptions/attestations/regenerate",
+            headers=admin_headers,
+            json={"type_attestation": "definitive", "assureur_id": 3, "statut": "active"},
+        )
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        job_id = response.json()["job_id"]
+        assert envois == [{
+            "args": [job_id, "definitive", {"assureur_id": 3, "statut": "active"}],
+            "task_id": job_id,
+            "queue": "documents",
+        }]
+
+        response = client.get(f"/api/v1/admin/subscriptions/attestations/regenerate/{job_id}", headers=admin_headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["statut"] == "en_attente"
+
+        response = client.post(
+            "/api/v1/admin/subscriptions/attestations/regenerate",
+            headers=admin_headers,
+            json={"type_attestation": "provisoire"},
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_regeneration_requires_production_role(self, client, auth_headers):
+        response = client.post(
+            "/api/v1/admin/subscriptions/attestations/regenerate",
+            headers=auth_headers,
+            json={"souscription_ids": [1]},
+        )
+        assert response.status_code == status.HTTP_403_FORBIDDEN
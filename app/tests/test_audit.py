@@ -0,0 +1,135 @@
+"""
+Audit log tests: bounded buffer, batched writes, middleware without per-request queries
+"""
+import asyncio
+
+from fastapi import status
+from sqlalchemy import event
+
+from app.middleware import audit
+from app.middleware.audit import AuditWriter
+from app.models.audit import AuditLog
+
+
+def _enregistrement(numero, username=None):
+    from datetime import datetime
+
+    return {
+        "timestamp": datetime.utcnow(),
+        "method": "GET",
+        "path": f"/api/v1/test/{numero}",
+        "query_params": "",
+        "username": username,
+        "user_role": None,
+        "client_ip": "127.0.0.1",
+        "user_agent": "pytest",
+        "status_code": 200,
+        "duration_ms": numero,
+    }
+
+
+class TestAuditWriter:
+    def test_flush_inserts_batches_and_resolves_users(self, db, test_user):
+        writer = AuditWriter(bind=db.get_bind(), max_records=100, batch_size=4)
+        for numero in range(10):
+            assert writer.enregistrer(_enregistrement(numero, test_user.username if numero % 2 else None))
+
+        requetes = []
+
+        def _noter(conn, cursor, statement, parameters, context, executemany):
+            requetes.append(statement.split(None, 1)[0].upper())
+
+        event.listen(db.get_bind(), "before_cursor_execute", _noter)
+        try:
+            asyncio.run(writer.flush())
+        finally:
+            event.remove(db.get_bind(), "before_cursor_execute", _noter)
+
+        assert requetes.count("INSERT") == 3  # lots de 4, 4 et 2
+        assert writer.get_stats() == {"buffered": 0, "written": 10, "dropped": 0, "failed": 0}
+        lignes = db.query(AuditLog).order_by(AuditLog.duration_ms).all()
+        assert [ligne.duration_ms for ligne in lignes] == list(range(10))
+        assert {ligne.user_id for ligne in lignes} == {None, test_user.id}
+
+    def test_full_buffer_drops_records(self, db):
+        writer = AuditWriter(bind=db.get_bind(), max_records=3, batch_size=10)
+        acceptes = [writer.enregistrer(_enregistrement(numero)) for numero in range(5)]
+        assert acceptes == [True, True, True, False, False]
+        assert writer.get_stats()["dropped"] == 2
+
+        asyncio.run(writer.flush())
+        assert db.query(AuditLog).count() == 3
+        assert writer.enregistrer(_enregistrement(5))
+
+
+class TestInstrumentationMiddleware:
+    def test_requests_are_buffered_without_database_queries(self, client, db, monkeypatch, test_user, auth_headers):
+        writer = AuditWriter(bind=db.get_bind())
+        monkeypatch.setattr(audit, "audit_writer", writer)
+
+        requetes = []
+
+        def _noter(conn, cursor, statement, parameters, context, executemany):
+            requetes.append(statement)
+
+        event.listen(db.get_bind(), "before_cursor_execute", _noter)
+        try:
+            response = client.get("/health", headers=auth_headers)
+        finally:
+            event.remove(db.get_bind(), "before_cursor_execute", _noter)
+        assert response.status_code == status.HTTP_200_OK
+        assert float(response.headers["X-Process-Time"]) >= 0
+        assert requetes == []
+
+        asyncio.run(writer.flush())
+        ligne = db.query(AuditLog).filter(AuditLog.path == "/health").one()
+        assert ligne.user_id == test_user.id
+        assert ligne.status_code == 200
+        assert ligne.duration_ms is not None
+
+    def test_token_is_decoded_once_per_request(self, client, monkeypatch, test_user, auth_headers):
+        from app.api.v1 import auth
+        from app.core.security import decode_token
+        from app.middleware import instrumentation
+
+        appels = []
+
+        def decode_compte(token):
+            appels.append(token)
+            return decode_token(token)
+
+        monkeypatch.setattr(instrumentation, "decode_token", decode_compte)
+        monkeypatch.setattr(auth, "decode_token", decode_compte)
+
+        response = client.get("/api/v1/auth/me", headers=auth_headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["username"] == test_user.username
+        assert len(appels) == 1
+
+        response = client.get("/api/v1/auth/me", headers={"Authorization": "Bearer invalide"})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_streaming_responses_pass_through(self, caplog):
+        import logging
+
+        from fastapi import FastAPI
+        from fastapi.responses import StreamingResponse
+        from fastapi.testclient import TestClient
+
+        from app.middleware.instrumentation import InstrumentationMiddleware
+
+        mini = FastAPI()
+        mini.add_middleware(InstrumentationMiddleware)
+
+        @mini.get("/flux")
+        def flux():
+            return StreamingResponse(iter([b"a", b"b", b"c"]), media_type="text/plain")
+
+        with caplog.at_level(logging.INFO, logger="app.middleware.instrumentation"):
+            response = TestClient(mini).get("/flux?x=1")
+        assert response.content == b"abc"
+        assert "X-Process-Time" in response.headers
+        assert any(
+            "method=GET path=/flux status=200" in enregistrement.getMessage()
+            for enregistrement in caplog.records
+        )
@@ -3,6 +3,9 @@ Comprehensive authentication flow tests
 """
 import pytest
 from fastapi import status
+from sqlalchemy import event
+
+from app.core.security import create_access_token
 
 
 @pytest.mark.auth
@@ -274,19 +277,62 @@ class TestAuthFlows:
         assert me_response.json()["username"] == "flowtest"
 
 
+@pytest.mark.auth
+class TestPrincipalCache:
+    """Cache de l'utilisateur authentifié dans get_current_user"""
 
+    def _requetes_users(self, db):
+        requetes = []
 
+        def _compter(conn, cursor, statement, parameters, context, executemany):
+            if "FROM users" in statement:
+                requetes.append(statement)
 
+        event.listen(db.get_bind(), "before_cursor_execute", _compter)
+        return requetes, lambda: event.remove(db.get_bind(), "before_cursor_execute", _compter)
 
+    def test_cached_principal_skips_user_query(self, client, db, test_user):
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': test_user.username})}"}
+        assert client.get("/api/v1/auth/me", headers=headers).status_code == status.HTTP_200_OK
 
+        db.expunge_all()
+        requetes, arreter = self._requetes_users(db)
+        try:
+            response = client.get("/api/v1/auth/me", headers=headers)
+        finally:
+            arreter()
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["username"] == test_user.username
+        assert requetes == []
 
+    def test_user_update_invalidates_cached_principal(self, client, db, test_user):
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': test_user.username})}"}
+        assert client.get("/api/v1/auth/me", headers=headers).status_code == status.HTTP_200_OK
 
+        test_user.is_active = False
+        db.commit()
+        response = client.get("/api/v1/auth/me", headers=headers)
+        assert response.status_code == status.HTTP_403_FORBIDDEN
 
+    def test_user_update_invalidates_other_processes_over_redis(self, client, db, test_user, monkeypatch):
+        import asyncio
+        import json
 
+        from app.core.websocket_manager import manager
+        from app.services import principal_cache as module
 
+        publies = []
 
+        class _Redis:
+            def publish(self, canal, data):
+                publies.append((canal, json.loads(data)))
 
+        monkeypatch.setattr(module, "get_redis", lambda: _Redis())
+        test_user.full_name = "Nom Modifié"
+        db.commit()
+        assert publies == [(module.CANAL_INVALIDATION, {"usernames": [test_user.username]})]
 
-
-
-
+        # Autre worker : sa copie est retirée à la réception du message du bus
+        module.principal_cache.put(test_user)
+        asyncio.run(manager._dispatcher(*publies[0]))
+        assert module.principal_cache.get(test_user.username) is None
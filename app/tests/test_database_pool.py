@@ -0,0 +1,76 @@
+"""
+Database layer tests: instrumented connection pool and read-replica routing
+"""
+import pytest
+from fastapi import status
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import sessionmaker
+
+from app.core import database
+from app.core.database import InstrumentedQueuePool, get_read_db
+
+
+class TestConnectionPool:
+    def test_pool_records_checkouts_overflow_and_timeouts(self, tmp_path):
+        moteur = create_engine(
+            f"sqlite:///{tmp_path / 'pool.db'}",
+            poolclass=InstrumentedQueuePool,
+            pool_size=1,
+            max_overflow=1,
+            pool_timeout=0.1,
+        )
+        try:
+            premiere = moteur.connect()
+            seconde = moteur.connect()  # débordement
+            with pytest.raises(PoolTimeoutError):
+                moteur.connect()
+            seconde.close()
+            premiere.close()
+
+            stats = moteur.pool.metrics.get_stats(moteur.pool)
+            assert stats["checkouts"] == 2
+            assert stats["timeouts"] == 1
+            assert stats["overflow_max"] == 1
+            assert stats["checked_out"] == 0
+            assert stats["wait_seconds_max"] < 0.1
+
+            moteur.dispose()
+            assert moteur.pool.metrics.get_stats(moteur.pool)["timeouts"] == 1
+        finally:
+            moteur.dispose()
+
+    def test_pool_stats_endpoint_requires_admin(self, client, admin_headers, auth_headers):
+        response = client.get("/api/v1/dashboard/database-pool", headers=auth_headers)
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+        response = client.get("/api/v1/dashboard/database-pool", headers=admin_headers)
+        assert response.status_code == status.HTTP_200_OK
+        stats = response.json()
+        assert set(stats) == {"primary"}
+        assert {"size", "checked_out", "overflow", "checkouts", "timeouts", "wait_seconds_max"} <= set(stats["primary"])
+
+
+class TestReadReplicaRouting:
+    def test_read_db_uses_primary_session_without_replica(self, db):
+        dependance = get_read_db(db)
+        assert next(dependance) is db
+        with pytest.raises(StopIteration):
+            next(dependance)
+
+    def test_read_db_uses_replica_when_configured(self, db, monkeypatch, tmp_path):
+        replique = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+        monkeypatch.setattr(database, "ReadSessionLocal", sessionmaker(bind=replique))
+        try:
+            dependance = get_read_db(db)
+            session = next(dependance)
+            assert session is not db
+            assert session.get_bind() is replique
+            with pytest.raises(StopIteration):
+                next(dependance)
+        finally:
+            replique.dispose()
+
+    def test_dashboard_stats_served_by_read_session(self, client, admin_headers):
+        response = client.get("/api/v1/dashboard/stats", headers=admin_headers)
+        assert response.status_code == status.HTTP_200_OK
@@ -0,0 +1,790 @@
+"""
+IA module tests
+OCR engine (process pool) and document analysis helpers
+"""
+import asyncio
+import json
+import shutil
+import time
+from pathlib import Path
+
+import pytest
+
+from app.ia_module.cache_manager import CacheManager
+from app.ia_module.ocr_engine import OCREngine, OCREngineSature
+
+# Textes OCR de référence (sortie normalisée de extraire_texte_ocr)
+OCR_TEXTES = Path(__file__).parent / "fixtures" / "ocr_textes"
+
+
+@pytest.fixture
+def ocr_engine_test():
+    """Small OCR engine dedicated to a test"""
+    engine = OCREngine(max_workers=1, max_pending=1, job_timeout=60)
+    yield engine
+    engine.stop()
+
+
+@pytest.mark.unit
+class TestOCREngine:
+    """Process-pool OCR engine"""
+
+    def test_analyse_runs_in_pool(self, ocr_engine_test, tmp_path):
+        """A missing file is reported by analyser_document running in a worker process"""
+        resultat = asyncio.run(ocr_engine_test.analyser_async(str(tmp_path / "absent.pdf")))
+
+        assert resultat["status"] == "erreur"
+        assert resultat["message"] == "Fichier introuvable"
+        stats = ocr_engine_test.get_stats()
+        assert stats["terminees"] == 1
+        assert stats["en_cours"] == 0
+
+    def test_back_pressure_rejects_when_full(self, ocr_engine_test, tmp_path):
+        """Submissions beyond max_pending are rejected instead of queued"""
+        future = ocr_engine_test.soumettre(str(tmp_path / "absent.pdf"))
+        with pytest.raises(OCREngineSature):
+            ocr_engine_test.soumettre(str(tmp_path / "absent.pdf"))
+
+        future.result(timeout=60)
+        assert ocr_engine_test.get_stats()["refusees"] == 1
+
+    def test_analyser_lot_streams_results_with_timing(self, tmp_path):
+        """A batch yields one timed result per document"""
+        engine = OCREngine(max_workers=2, max_pending=2, job_timeout=60)
+        try:
+            resultats = list(engine.analyser_lot([str(tmp_path / "a.pdf"), str(tmp_path / "b.pdf")]))
+        finally:
+            engine.stop()
+
+        assert sorted(index for index, _, _, _ in resultats) == [0, 1]
+        for _, resultat, erreur, duree_totale_ms in resultats:
+            assert erreur is None
+            assert resultat["status"] == "erreur"
+            assert resultat["duree_ms"] >= 0
+            assert duree_totale_ms >= resultat["duree_ms"]
+
+    def test_batch_is_rejected_before_any_work_when_slots_are_missing(self, tmp_path):
+        """soumettre_lot reserves every slot first: a batch that does not fit starts nothing"""
+        engine = OCREngine(max_workers=1, max_pending=2, job_timeout=60)
+        try:
+            with pytest.raises(OCREngineSature):
+                engine.soumettre_lot([str(tmp_path / f"{i}.pdf") for i in range(3)])
+            stats = engine.get_stats()
+            assert (stats["en_cours"], stats["refusees"], stats["demarre"]) == (0, 1, False)
+
+            futures = engine.soumettre_lot([str(tmp_path / "a.pdf"), str(tmp_path / "b.pdf")])
+            assert [future.result(timeout=60)["status"] for future in futures] == ["erreur", "erreur"]
+        finally:
+            engine.stop()
+
+    def test_timed_out_upload_keeps_its_file_until_the_analysis_ends(self, tmp_path, monkeypatch):
+        """A timeout is reported per file; the temp file is removed only once the job finishes"""
+        from concurrent.futures import Future
+
+        from app.api.v1 import ia
+
+        chemin = tmp_path / "lent.pdf"
+        chemin.write_bytes(b"%PDF-1.4")
+        en_cours = Future()
+        en_cours.set_running_or_notify_cancel()
+        engine = OCREngine(max_workers=1, max_pending=1, job_timeout=0.05)
+        monkeypatch.setattr(engine, "soumettre_lot", lambda chemins: [en_cours])
+        monkeypatch.setattr(ia, "ocr_engine", engine)
+        fichiers = [{"path": str(chemin), "original_name": "lent.pdf"}]
+
+        resultats = asyncio.run(ia._analyser_fichiers(fichiers))
+        ia._supprimer_fichiers_temp(fichiers)
+
+        assert resultats[0]["status"] == "error"
+        assert chemin.exists()
+        en_cours.set_result({"status": "ok"})
+        assert not chemin.exists()
+
+    def test_page_threads_share_the_cpu_budget_with_workers(self, monkeypatch):
+        """Default page threads per document keep workers x pages within the core count"""
+        from app.ia_module.config import Config
+
+        monkeypatch.setattr("os.cpu_count", lambda: 8)
+        monkeypatch.delenv("OCR_PAGE_WORKERS", raising=False)
+        monkeypatch.delenv("OCR_MAX_WORKERS", raising=False)
+        assert (Config().OCR_MAX_WORKERS, Config().OCR_PAGE_WORKERS) == (7, 1)
+
+        monkeypatch.setenv("OCR_MAX_WORKERS", "2")
+        assert Config().OCR_PAGE_WORKERS == 4
+
+
+@pytest.mark.unit
+class TestReconstructionTexteOCR:
+    """Text reconstruction from image_to_data word boxes"""
+
+    def test_lines_and_paragraphs_rebuilt_from_word_boxes(self):
+        """Words are grouped by line and paragraph, structural rows are ignored"""
+        from app.ia_module.analyse import reconstruire_texte_ocr
+
+        data = {
+            "level":     [1, 2, 3, 4, 5, 5, 4, 5, 3, 4, 5, 5],
+            "block_num": [0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+            "par_num":   [0, 0, 1, 1, 1, 1, 1, 1, 2, 2, 2, 2],
+            "line_num":  [0, 0, 0, 1, 1, 1, 2, 2, 0, 1, 1, 1],
+            "text":      ["", "", "", "", "Nom", ":DIALLO", "", "Prénom", "", "", "Sexe", " "],
+            "conf":      [-1, -1, -1, -1, 96, 90.5, -1, 88, -1, -1, 70, 12],
+        }
+
+        texte, confiances = reconstruire_texte_ocr(data)
+
+        assert texte == "Nom :DIALLO\nPrénom\n\nSexe"
+        assert confiances == [96.0, 90.5, 88.0, 70.0]
+
+    def test_empty_page(self):
+        """A page without words yields no text and no confidence"""
+        from app.ia_module.analyse import reconstruire_texte_ocr
+
+        assert reconstruire_texte_ocr({"text": [], "conf": []}) == ("", [])
+
+
+
+@pytest.mark.unit
+class TestPipelinePagesPDF:
+    """Per-page PDF rasterisation with adaptive DPI"""
+
+    @pytest.fixture
+    def pipeline(self, monkeypatch, tmp_path):
+        """PDF of 3 pages where only page 2 is poorly read at low DPI"""
+        from PIL import Image
+
+        from app.ia_module import analyse
+
+        chemin = tmp_path / "passeport.pdf"
+        chemin.write_bytes(b"%PDF-1.4\n%fake\n")
+        rasterisations = []
+
+        def fake_convert(filepath, poppler_path=None, dpi=200, first_page=None, last_page=None, **kwargs):
+            assert first_page == last_page
+            rasterisations.append((first_page, dpi))
+            # La taille de l'image encode la page et le DPI pour le faux OCR
+            return [Image.new("L", (first_page, dpi))]
+
+        def fake_ocr(img):
+            page, dpi = img.size
+            conf = 40 if (page == 2 and dpi < 300) else 92
+            return f"page{page}@{dpi}", [conf]
+
+        monkeypatch.setattr(analyse, "pdfinfo_from_path", lambda *a, **k: {"Pages": 3})
+        monkeypatch.setattr(analyse, "convert_from_path", fake_convert)
+        monkeypatch.setattr(analyse, "_ocr_image", fake_ocr)
+        monkeypatch.setattr(analyse.config, "OCR_DPI_INITIAL", 200)
+        monkeypatch.setattr(analyse.config, "OCR_DPI_MAX", 300)
+        monkeypatch.setattr(analyse.config, "OCR_SEUIL_CONFIANCE_PAGE", 0.7)
+        monkeypatch.setattr(analyse.config, "OCR_PAGE_WORKERS", 3)
+        monkeypatch.setattr(analyse, "ocr_cache", CacheManager(use_redis=False))
+        return analyse, str(chemin), rasterisations
+
+    def test_only_low_confidence_pages_are_rerasterised(self, pipeline):
+        """Pages are rasterised one at a time and only page 2 goes back to 300 DPI"""
+        analyse, chemin, rasterisations = pipeline
+
+        texte, mime, confiance = analyse.extraire_texte_ocr(chemin)
+
+        assert mime == "application/pdf"
+        assert texte == "page1@200 page2@300 page3@200"
+        assert sorted(rasterisations) == [(1, 200), (2, 200), (2, 300), (3, 200)]
+        assert confiance == pytest.approx(0.92)
+
+    def test_low_dpi_kept_when_high_dpi_is_not_better(self, pipeline, monkeypatch):
+        """The high-DPI pass is discarded when it does not improve confidence"""
+        analyse, chemin, _ = pipeline
+        monkeypatch.setattr(
+            analyse, "_ocr_image",
+            lambda img: (f"page{img.size[0]}@{img.size[1]}", [50 if img.size[1] < 300 else 45]),
+        )
+
+        texte, _, confiance = analyse.extraire_texte_ocr(chemin)
+
+        assert texte == "page1@200 page2@200 page3@200"
+        assert confiance == pytest.approx(0.5)
+
+    def test_same_content_is_ocred_once(self, pipeline, tmp_path):
+        """A second temp file with identical bytes is served from the content cache"""
+        analyse, chemin, rasterisations = pipeline
+        copie = tmp_path / "copie_checkout.pdf"
+        copie.write_bytes(open(chemin, "rb").read())
+
+        premier = analyse.extraire_texte_ocr(chemin)
+        nb_rasterisations = len(rasterisations)
+        second = analyse.extraire_texte_ocr(str(copie))
+
+        assert second == premier
+        assert len(rasterisations) == nb_rasterisations
+        assert analyse.ocr_cache.get_stats()["hits"] == 1
+
+    def test_cache_fault_does_not_fail_ocr(self, pipeline, monkeypatch):
+        """A failing cache read or write is ignored and the OCR result is still returned"""
+        analyse, chemin, _ = pipeline
+
+        def panne(*args, **kwargs):
+            raise KeyError("cache")
+
+        monkeypatch.setattr(analyse.ocr_cache, "get", panne)
+        monkeypatch.setattr(analyse.ocr_cache, "set", panne)
+
+        texte, _, _ = analyse.extraire_texte_ocr(chemin)
+
+        assert texte == "page1@200 page2@300 page3@200"
+
+
+def _extraire_champs(chemin):
+    from app.ia_module import analyse
+
+    texte = chemin.read_text(encoding="utf-8")
+    return {
+        "perso": analyse.extraire_infos_personnelles(texte),
+        "sante": analyse.extraire_infos_sante(texte),
+        "dates": analyse.extraire_dates_document(texte),
+        "type": analyse.detecter_type_document(texte, str(chemin)),
+    }
+
+
+@pytest.mark.unit
+class TestExtractionChamps:
+    """Precompiled field extraction engine"""
+
+    @pytest.mark.parametrize("nom", sorted(p.name for p in OCR_TEXTES.glob("*.txt")))
+    def test_fixture_fields_match_reference(self, nom):
+        """Each OCR fixture yields the fields recorded with the former pattern-by-pattern extractors"""
+        attendus = json.loads((OCR_TEXTES / "attendus.json").read_text(encoding="utf-8"))
+
+        assert _extraire_champs(OCR_TEXTES / nom) == attendus[nom]
+
+    def test_pattern_priority_wins_over_position(self):
+        """The highest-priority label wins even when a lower one appears earlier in the text"""
+        from app.ia_module.analyse import extraire_dates_document
+
+        dates = extraire_dates_document("Issue date : 05/05/2023 Issued on 04/05/2023 Valid until 01/01/2024")
+
+        assert dates["date_delivrance"] == "04/05/2023"
+        assert dates["date_expiration"] == "01/01/2024"
+
+    def test_precision_follows_first_si_oui(self):
+        """'Si oui ... précisez' answers are searched after the first 'Si oui' only"""
+        from app.ia_module.analyse import extraire_infos_sante
+
+        data = extraire_infos_sante("Précisez : avant Si oui, précisez : toux Si oui précisez : autre")
+
+        assert data["sante_actuelle"]["symptomes_details"] == "toux Si oui précisez : autre"
+        assert data["allergies"]["details"] == data["sante_actuelle"]["symptomes_details"]
+        assert extraire_infos_sante("Précisez : avant")["allergies"]["details"] == ""
+
+    def test_prefilter_keeps_ignorecase_equivalences(self):
+        """Keyword prefilter never skips a label that re.IGNORECASE would match"""
+        from app.ia_module.analyse import extraire_infos_sante
+
+        data = extraire_infos_sante("SPÉCIALITÉ : Cardiologie Spécıalıté : ignoré")
+
+        assert data["sante_actuelle"]["specialite_medecin"] == "Cardiologie Spécıalıté : ignoré"
+        assert extraire_infos_sante("Spécıalıté : Pédiatrie")["sante_actuelle"]["specialite_medecin"] == "Pédiatrie"
+
+
+class _RedisMemoire:
+    """Minimal Redis double (get/setex/ttl) shared by two cache instances"""
+
+    def __init__(self):
+        self.donnees = {}
+
+    def get(self, cle):
+        return self.donnees.get(cle, (None, None))[0]
+
+    def setex(self, cle, ttl, valeur):
+        self.donnees[cle] = (valeur, ttl)
+
+    def ttl(self, cle):
+        return self.donnees.get(cle, (None, -2))[1]
+
+
+@pytest.mark.unit
+class TestCacheManager:
+    """Content-addressed two-tier cache"""
+
+    def test_hash_is_content_based(self, tmp_path):
+        """Two paths with the same bytes share a key"""
+        a = tmp_path / "a.png"
+        b = tmp_path / "b.png"
+        a.write_bytes(b"meme contenu")
+        b.write_bytes(b"meme contenu")
+
+        assert CacheManager.hash_fichier(str(a)) == CacheManager.hash_fichier(str(b))
+
+    def test_lru_eviction(self):
+        """The least recently used entry is evicted when full"""
+        cache = CacheManager(max_size=2, use_redis=False)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+
+    def test_expiry_only_pops_due_entries(self, monkeypatch):
+        """Expired entries are removed from the heap head, fresh ones are kept"""
+        from app.ia_module import cache_manager
+
+        maintenant = [1000.0]
+        monkeypatch.setattr(cache_manager.time, "monotonic", lambda: maintenant[0])
+        cache = CacheManager(ttl_hours=1, use_redis=False)
+        cache.set("ancien", 1)
+        maintenant[0] += 1800
+        cache.set("recent", 2)
+        maintenant[0] += 1801
+
+        assert cache.get("ancien") is None
+        assert cache.get("recent") == 2
+        assert cache.get_stats()["expirations"] == 1
+
+    def test_redis_tier_shared_between_processes(self):
+        """An entry written by one process is read from Redis by another"""
+        redis_partage = _RedisMemoire()
+        api = CacheManager(redis_client=redis_partage, namespace="ia:ocr")
+        worker = CacheManager(redis_client=redis_partage, namespace="ia:ocr")
+
+        api.set("sha", {"texte": "Nom : DIALLO", "mime": "application/pdf", "confiance": 0.9})
+
+        assert worker.get("sha") == {"texte": "Nom : DIALLO", "mime": "application/pdf", "confiance": 0.9}
+        assert worker.get("sha")["texte"] == "Nom : DIALLO"
+        stats = worker.get_stats()
+        assert stats["hits_redis"] == 1
+        assert stats["hits"] == 1
+
+    def test_concurrent_access_keeps_structures_consistent(self, monkeypatch):
+        """Threads hitting get/set while entries expire never raise and keep the counters consistent"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        from app.ia_module import cache_manager
+
+        horloge = [0.0]
+        monkeypatch.setattr(cache_manager.time, "monotonic", lambda: horloge[0])
+        cache = CacheManager(ttl_hours=1 / 3600, max_size=8, use_redis=False)
+
+        def travail(numero):
+            for i in range(500):
+                horloge[0] += 0.01
+                cache.set(f"k{(numero + i) % 12}", i)
+                cache.get(f"k{i % 12}")
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(travail, range(8)))
+
+        stats = cache.get_stats()
+        assert stats["size"] <= 8
+        assert stats["hits"] + stats["misses"] == 8 * 500
+
+
+@pytest.mark.unit
+class TestQueueManager:
+    """Bounded job queue with TTL eviction, counters, persistence and histograms"""
+
+    def test_jobs_complete_and_counters_track_transitions(self):
+        """Sync and async jobs run; per-status counters and histograms follow"""
+        from app.ia_module.queue_manager import QueueManager
+
+        async def scenario():
+            queue = QueueManager(max_workers=2, max_en_attente=10, use_redis=False)
+
+            async def echoue():
+                raise ValueError("document illisible")
+
+            await queue.ajouter_demande("DEM-1", lambda x: x * 2, 21)
+            await queue.ajouter_demande("DEM-2", echoue)
+            await queue.queue.join()
+            stats = queue.get_stats()
+            statut = queue.get_status("DEM-1")
+            await queue.stop()
+            return stats, statut, queue.get_status("DEM-2")
+
+        stats, statut_ok, statut_erreur = asyncio.run(scenario())
+
+        assert statut_ok["status"] == "termine"
+        assert statut_ok["result"] == 42
+        assert statut_erreur["status"] == "erreur"
+        assert statut_erreur["error"] == "document illisible"
+        assert (stats["en_attente"], stats["en_traitement"], stats["terminees"], stats["erreurs"]) == (0, 0, 1, 1)
+        assert stats["histogrammes"]["traitement_secondes"]["count"] == 2
+        assert stats["histogrammes"]["attente_secondes"]["count"] == 2
+        assert stats["histogrammes"]["profondeur_file"]["buckets"]["+Inf"] == 2
+
+    def test_full_queue_rejects_new_jobs(self):
+        """Beyond max_en_attente pending jobs, ajouter_demande raises QueueSaturee"""
+        from app.ia_module.queue_manager import QueueManager, QueueSaturee
+
+        async def scenario():
+            queue = QueueManager(max_workers=1, max_en_attente=1, use_redis=False)
+            bloque = asyncio.Event()
+            await queue.ajouter_demande("DEM-1", bloque.wait)
+            await asyncio.sleep(0.05)  # DEM-1 en traitement, la file est vide
+            await queue.ajouter_demande("DEM-2", bloque.wait)
+            with pytest.raises(QueueSaturee):
+                await queue.ajouter_demande("DEM-3", bloque.wait)
+            stats = queue.get_stats()
+            bloque.set()
+            await queue.queue.join()
+            await queue.stop()
+            return stats
+
+        stats = asyncio.run(scenario())
+
+        assert stats["refusees"] == 1
+        assert stats["en_traitement"] == 1
+        assert stats["en_attente"] == 1
+
+    def test_readding_unfinished_job_is_ignored(self):
+        """A job re-added while pending or running keeps its record; a finished one is replaced"""
+        from app.ia_module.queue_manager import QueueManager
+
+        async def scenario():
+            queue = QueueManager(max_workers=1, max_en_attente=5, use_redis=False)
+            bloque = asyncio.Event()
+            assert await queue.ajouter_demande("DEM-1", bloque.wait) is True
+            await asyncio.sleep(0.05)  # DEM-1 en traitement
+            assert await queue.ajouter_demande("DEM-2", lambda: "premier") is True
+            ajouts = [
+                await queue.ajouter_demande("DEM-1", lambda: "doublon"),
+                await queue.ajouter_demande("DEM-2", lambda: "doublon"),
+            ]
+            pendant = queue.get_stats()
+            bloque.set()
+            await queue.queue.join()
+            relance = await queue.ajouter_demande("DEM-2", lambda: "relance")
+            await queue.queue.join()
+            stats = queue.get_stats()
+            statut = queue.get_status("DEM-2")
+            await queue.stop()
+            return ajouts, pendant, relance, stats, statut
+
+        ajouts, pendant, relance, stats, statut = asyncio.run(scenario())
+
+        assert ajouts == [False, False]
+        assert (pendant["en_attente"], pendant["en_traitement"]) == (1, 1)
+        assert relance is True and statut["result"] == "relance"
+        assert (stats["en_attente"], stats["en_traitement"], stats["terminees"]) == (0, 0, 2)
+
+    def test_finished_jobs_are_evicted_after_ttl(self, monkeypatch):
+        """Finished jobs leave memory after their TTL but stay readable from Redis"""
+        import importlib
+
+        from app.ia_module.queue_manager import QueueManager
+
+        # Le paquet réexporte l'instance `queue_manager` sous le nom du module
+        module_queue = importlib.import_module("app.ia_module.queue_manager")
+
+        redis_partage = _RedisMemoire()
+        maintenant = [1000.0]
+        monkeypatch.setattr(module_queue, "_horloge", lambda: maintenant[0])
+
+        async def scenario():
+            queue = QueueManager(max_workers=1, max_en_attente=5, ttl_terminees=60, redis_client=redis_partage)
+            await queue.ajouter_demande("DEM-1", lambda: "ok")
+            await queue.queue.join()
+            await queue.stop()
+            return queue
+
+        queue = asyncio.run(scenario())
+        assert queue.get_stats()["terminees"] == 1
+
+        maintenant[0] += 61
+        stats = queue.get_stats()
+        assert stats["total"] == 0
+        assert stats["terminees"] == 0
+        assert stats["evincees"] == 1
+
+        # Un autre worker (ou le même après redémarrage) lit le statut persisté
+        autre_worker = QueueManager(max_workers=1, redis_client=redis_partage)
+        assert autre_worker.get_status("DEM-1")["status"] == "termine"
+
+    def test_pending_jobs_are_not_persisted(self):
+        """A queued job cannot resume after a restart, so only final states reach Redis"""
+        from app.ia_module.queue_manager import QueueManager
+
+        redis_partage = _RedisMemoire()
+
+        async def scenario():
+            queue = QueueManager(max_workers=1, max_en_attente=5, redis_client=redis_partage)
+            await queue.ajouter_demande("DEM-1", lambda: "ok")
+            return queue
+
+        asyncio.run(scenario())
+        assert redis_partage.donnees == {}
+
+        # Après redémarrage, la demande perdue n'apparaît pas bloquée en attente
+        redemarre = QueueManager(max_workers=1, redis_client=redis_partage)
+        assert redemarre.get_status("DEM-1") is None
+
+@pytest.fixture
+def fixture_pdf(tmp_path):
+    """Small subscription form rendered as PDF"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    chemin = tmp_path / "formulaire.pdf"
+    pdf = canvas.Canvas(str(chemin), pagesize=A4)
+    lignes = [
+        "FORMULAIRE DE SOUSCRIPTION",
+        "Nom : DIALLO",
+        "Prenom : Aminata",
+        "Date de naissance : 12/04/1985",
+        "Sexe : F",
+        "Nationalite : Ivoirienne",
+        "Numero de passeport : AB1234567",
+        "Maladies chroniques : Non",
+        "Traitement en cours : Non",
+    ]
+    y = 780
+    for ligne in lignes:
+        pdf.drawString(72, y, ligne)
+        y -= 24
+    pdf.save()
+    return chemin
+
+
+@pytest.mark.benchmark
+@pytest.mark.skipif(
+    shutil.which("tesseract") is None or shutil.which("pdftoppm") is None,
+    reason="tesseract/poppler non installés",
+)
+def test_benchmark_single_pass_ocr_halves_page_time(fixture_pdf):
+    """One image_to_data pass per page costs about half the former data + string passes"""
+    import pytesseract
+    from pdf2image import convert_from_path
+
+    from app.ia_module.analyse import _ocr_image, _pretraiter_image
+
+    page = _pretraiter_image(convert_from_path(str(fixture_pdf), dpi=300)[0])
+
+    def deux_passes():
+        pytesseract.image_to_data(page, lang="fra+eng", output_type=pytesseract.Output.DICT)
+        return pytesseract.image_to_string(page, lang="fra+eng")
+
+    def meilleur_temps(fonction, essais=3):
+        durees = []
+        for _ in range(essais):
+            debut = time.perf_counter()
+            fonction()
+            durees.append(time.perf_counter() - debut)
+        return min(durees)
+
+    avant = meilleur_temps(deux_passes)
+    apres = meilleur_temps(lambda: _ocr_image(page))
+    texte, _ = _ocr_image(page)
+
+    assert "DIALLO" in texte
+    assert apres <= avant * 0.65, f"OCR par page : deux passes {avant:.3f}s, une passe {apres:.3f}s"
+
+
+@pytest.mark.benchmark
+def test_benchmark_field_extraction_per_document():
+    """Field extraction throughput over the OCR text corpus"""
+    from app.ia_module import analyse
+
+    documents = [(str(chemin), chemin.read_text(encoding="utf-8")) for chemin in sorted(OCR_TEXTES.glob("*.txt"))]
+
+    def extraire(chemin, texte):
+        analyse.detecter_type_document(texte, chemin)
+        analyse.extraire_dates_document(texte)
+        analyse.extraire_infos_personnelles(texte)
+        analyse.extraire_infos_sante(texte)
+
+    iterations = 200
+    durees = {}
+    for chemin, texte in documents:
+        debut = time.perf_counter()
+        for _ in range(iterations):
+            extraire(chemin, texte)
+        durees[Path(chemin).name] = (time.perf_counter() - debut) / iterations
+
+    rapport = ", ".join(f"{nom}: {duree * 1000:.3f} ms/document" for nom, duree in durees.items())
+    assert max(durees.values()) < 0.02, f"Extraction trop lente ({rapport})"
+
+
+@pytest.fixture
+def souscription_ia(db, test_user, test_product):
+    """Active subscription owned by test_user"""
+    from datetime import datetime
+    from decimal import Decimal
+
+    from app.core.enums import StatutSouscription
+    from app.models.souscription import Souscription
+
+    product = test_product(db, code="IA-PROD-001", cout=Decimal("100.00"))
+    souscription = Souscription(
+        user_id=test_user.id,
+        produit_assurance_id=product.id,
+        numero_souscription="SUB-IA-001",
+        prix_applique=product.cout,
+        date_debut=datetime.utcnow(),
+        statut=StatutSouscription.ACTIVE
+    )
+    db.add(souscription)
+    db.commit()
+    db.refresh(souscription)
+    yield souscription
+
+    from app.services.ia_auto_service import IAAutoService, _local_statuts
+    IAAutoService.release_analysis_lock(souscription.id)
+    _local_statuts.pop(souscription.id, None)
+
+
+@pytest.fixture
+def file_ia(monkeypatch):
+    """Records the tasks sent to the ia_analysis queue instead of a broker"""
+    from app.workers import tasks
+
+    envois = []
+
+    class _Resultat:
+        def __init__(self, task_id):
+            self.id = task_id
+
+    def fake_apply_async(args=None, kwargs=None, **options):
+        envois.append({"args": args, "kwargs": kwargs, **options})
+        return _Resultat(f"task-{len(envois)}")
+
+    monkeypatch.setattr(tasks.analyse_souscription_ia, "apply_async", fake_apply_async)
+    return envois
+
+
+@pytest.mark.unit
+class TestIAAnalysisPipeline:
+    """Celery-backed IA analysis: idempotent enqueue and progress status"""
+
+    def test_enqueue_is_idempotent_per_souscription(self, souscription_ia, file_ia):
+        """A second payment event for the same subscription does not enqueue twice"""
+        from app.services.ia_auto_service import IAAutoService, IA_ANALYSIS_QUEUE, IA_PRIORITY_PAIEMENT
+
+        premier = IAAutoService.enqueue_ia_analysis(souscription_ia.id, source="checkout")
+        second = IAAutoService.enqueue_ia_analysis(souscription_ia.id, source="confirmation_paiement")
+
+        assert premier["mise_en_file"] is True
+        assert second["mise_en_file"] is False
+        assert len(file_ia) == 1
+        assert file_ia[0]["queue"] == IA_ANALYSIS_QUEUE
+        assert file_ia[0]["priority"] == IA_PRIORITY_PAIEMENT
+        assert second["statut"] == "en_attente"
+        assert second["task_id"] == "task-1"
+
+    def test_enqueue_failure_releases_lock(self, souscription_ia, file_ia, monkeypatch):
+        """When the broker is unreachable the status is 'echec' and a later enqueue works"""
+        from app.services.ia_auto_service import IAAutoService
+        from app.workers import tasks
+
+        def broker_indisponible(*args, **kwargs):
+            raise ConnectionError("broker indisponible")
+
+        monkeypatch.setattr(tasks.analyse_souscription_ia, "apply_async", broker_indisponible)
+        echec = IAAutoService.enqueue_ia_analysis(souscription_ia.id)
+        assert echec["mise_en_file"] is False
+        assert echec["statut"] == "echec"
+
+        monkeypatch.undo()
+        monkeypatch.setattr(
+            tasks.analyse_souscription_ia, "apply_async",
+            lambda *a, **k: type("R", (), {"id": "task-ok"})()
+        )
+        assert IAAutoService.enqueue_ia_analysis(souscription_ia.id)["mise_en_file"] is True
+
+    def test_status_endpoint_reports_progress(self, client, souscription_ia, auth_headers):
+        """The subscriber can read the progress of their analysis"""
+        from app.services.ia_auto_service import IAAutoService
+
+        response = client.get(f"/api/v1/ia/souscriptions/{souscription_ia.id}/analyse/statut", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.json()["data"]["statut"] == "non_demarre"
+
+        IAAutoService.set_analysis_status(souscription_ia.id, "en_cours", etape="ocr", progression=40)
+        response = client.get(f"/api/v1/ia/souscriptions/{souscription_ia.id}/analyse/statut", headers=auth_headers)
+        data = response.json()["data"]
+        assert data["statut"] == "en_cours"
+        assert data["etape"] == "ocr"
+        assert data["progression"] == 40
+
+    def test_relaunch_requires_production_role(self, client, souscription_ia, auth_headers, admin_headers, file_ia):
+        """Only production agents and admins can force a new analysis"""
+        url = f"/api/v1/ia/souscriptions/{souscription_ia.id}/analyse/relancer"
+
+        assert client.post(url, headers=auth_headers).status_code == 403
+
+        response = client.post(url, headers=admin_headers)
+        assert response.status_code == 200
+        assert response.json()["data"]["mise_en_file"] is True
+        assert file_ia[0]["kwargs"] == {"force": True}
+
+    def test_parallel_analysis_merges_as_results_arrive(self, db, souscription_ia, monkeypatch):
+        """Out-of-order completions are merged with questionnaires and restored to document order"""
+        from app.services import ia_auto_service
+        from app.services.ia_auto_service import IAAutoService
+
+        documents = [
+            {"path": f"/tmp/doc{i}.pdf", "original_name": f"doc{i}.pdf", "type": "projet_voyage"}
+            for i in range(3)
+        ]
+        formates = {}
+
+        def fake_lot(filepaths, timeout=None):
+            assert len(filepaths) == 3
+            yield 2, {"status": "ok", "infos_personnelles": {"nom": ""}, "duree_ms": 40}, None, 45
+            yield 0, {"status": "ok", "infos_personnelles": {"nom": "DIALLO"}, "duree_ms": 900}, None, 950
+            yield 1, None, RuntimeError("illisible"), 12
+
+        def fake_formater(resultats_analyse, demande_id):
+            formates["resultats"] = resultats_analyse
+            return {"infos_personnelles": {}}
+
+        monkeypatch.setattr(IAAutoService, "collect_subscription_documents", staticmethod(lambda db, s: documents))
+        monkeypatch.setattr(
+            IAAutoService, "_extract_questionnaire_data",
+            staticmethod(lambda db, s: {"infos_personnelles": {"nom": "KONE", "email": "a@b.ci"}, "questionnaires": []})
+        )
+        monkeypatch.setattr(ia_auto_service.ocr_engine, "analyser_lot", fake_lot)
+        monkeypatch.setattr(ia_auto_service, "formater_pour_agent_production", fake_formater)
+        monkeypatch.setattr(ia_auto_service.router_assureur, "router_demande", lambda **kwargs: [])
+        monkeypatch.setattr(ia_auto_service.storage_analyses, "sauvegarder_analyse", lambda **kwargs: None)
+        monkeypatch.setattr(IAAutoService, "_notify_production_agents", staticmethod(lambda *a: None))
+
+        assert IAAutoService.trigger_ia_analysis(db, souscription_ia) is not None
+
+        resultats = formates["resultats"]
+        assert [r["nom_fichier"] for r in resultats] == ["doc0.pdf", "doc1.pdf", "doc2.pdf"]
+        assert resultats[0]["analyse"]["infos_personnelles"] == {"nom": "DIALLO", "email": "a@b.ci"}
+        assert resultats[2]["analyse"]["infos_personnelles"] == {"nom": "KONE", "email": "a@b.ci"}
+        assert resultats[1]["status"] == "error"
+        assert [r["duree_totale_ms"] for r in resultats] == [950, 12, 45]
+        statut = IAAutoService.get_analysis_status(souscription_ia.id)
+        assert statut["statut"] == "termine"
+        assert statut["durees_ms"] == {"doc0.pdf": 950, "doc1.pdf": 12, "doc2.pdf": 45}
+
+    def test_task_retries_then_records_failure(self, db, souscription_ia, monkeypatch):
+        """A pipeline error reaches the Celery task: retried first, recorded once retries are exhausted"""
+        from celery.exceptions import Retry
+
+        from app.services.ia_auto_service import IAAutoService
+        from app.workers import tasks
+
+        def documents_illisibles(db, souscription):
+            raise RuntimeError("MinIO indisponible")
+
+        tentatives, echecs = [], []
+        souscription_id = souscription_ia.id
+        monkeypatch.setattr(IAAutoService, "collect_subscription_documents", staticmethod(documents_illisibles))
+        monkeypatch.setattr(db, "close", lambda: None)  # session du test, fermée par la fixture
+        monkeypatch.setattr(tasks, "SessionLocal", lambda: db)
+        monkeypatch.setattr(tasks.analyse_souscription_ia, "retry", lambda exc, countdown: tentatives.append(countdown) or Retry())
+        monkeypatch.setattr(tasks.record_failed_task, "delay", lambda **kwargs: echecs.append(kwargs))
+
+        with pytest.raises(Retry):
+            tasks.analyse_souscription_ia(souscription_id)
+        assert tentatives == [tasks.INITIAL_COUNTDOWN]
+        assert IAAutoService.get_analysis_status(souscription_id)["statut"] == "en_attente"
+
+        monkeypatch.setattr(tasks.analyse_souscription_ia, "max_retries", 0)
+        resultat = tasks.analyse_souscription_ia(souscription_id)
+        assert resultat == {"status": "error", "message": "MinIO indisponible"}
+        assert len(echecs) == 1 and echecs[0]["error_message"] == "MinIO indisponible"
+        assert IAAutoService.get_analysis_status(souscription_id)["statut"] == "echec"
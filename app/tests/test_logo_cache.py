@@ -0,0 +1,130 @@
+"""
+Insurer logo cache tests: conditional revalidation, MinIO bucket memo, shared PDF/card variants
+"""
+from io import BytesIO
+from types import SimpleNamespace
+
+import httpx
+from fastapi import status
+from PIL import Image
+
+from app.services import logo_cache as module_logo_cache
+from app.services.logo_cache import LogoAssureurCache
+from app.services.minio_service import MinioService
+
+
+def _png(couleur, size=(600, 300)):
+    sortie = BytesIO()
+    Image.new("RGB", size, couleur).save(sortie, format="PNG")
+    return sortie.getvalue()
+
+
+def _client_http(monkeypatch, handler):
+    client_reel = httpx.Client
+    monkeypatch.setattr(httpx, "Client", lambda **kwargs: client_reel(transport=httpx.MockTransport(handler), **kwargs))
+
+
+class TestLogoAssureurCache:
+    def test_http_logo_is_revalidated_with_etag(self, monkeypatch):
+        version = {"etag": '"v1"', "contenu": _png("red")}
+        requetes = []
+
+        def handler(request):
+            requetes.append(request.headers.get("if-none-match"))
+            if request.headers.get("if-none-match") == version["etag"]:
+                return httpx.Response(304)
+            return httpx.Response(200, content=version["contenu"], headers={"ETag": version["etag"]})
+
+        _client_http(monkeypatch, handler)
+        cache = LogoAssureurCache(revalidate_seconds=3600)
+        url = "https://cdn.example.com/logo.png"
+
+        assert cache.get_bytes(1, url) == version["contenu"]
+        assert cache.get_bytes(1, url) == version["contenu"]
+        assert requetes == [None]  # second appel servi par le cache
+
+        cache.revalidate_seconds = 0
+        variante = cache.get_variant(1, url, "taille", len)
+        assert requetes == [None, '"v1"']  # GET conditionnel -> 304, variante conservée
+        assert cache.get_variant(1, url, "taille", lambda contenu: -1) == variante
+
+        version.update(etag='"v2"', contenu=_png("blue", (50, 50)))
+        assert cache.get_bytes(1, url) == version["contenu"]
+        assert cache.get_variant(1, url, "taille", len) == len(version["contenu"])
+        assert cache.get_stats()["misses"] == 1
+
+    def test_minio_logo_remembers_bucket_and_keeps_stale_copy(self, monkeypatch):
+        objets = {("assets", "assureurs/7/logo.png"): ('"e1"', _png("green"))}
+        appels = []
+
+        def get_file_etag(bucket, objet):
+            appels.append(("stat", bucket))
+            return objets.get((bucket, objet), (None,))[0]
+
+        def get_file(bucket, objet):
+            appels.append(("get", bucket))
+            return objets[(bucket, objet)][1]
+
+        monkeypatch.setattr(MinioService, "get_file_etag", staticmethod(get_file_etag))
+        monkeypatch.setattr(MinioService, "get_file", staticmethod(get_file))
+        cache = LogoAssureurCache(revalidate_seconds=0)
+
+        contenu = cache.get_bytes(7, "assureurs/7/logo.png")
+        assert contenu == objets[("assets", "assureurs/7/logo.png")][1]
+        assert appels == [("stat", "logos"), ("stat", "assureurs"), ("stat", "assets"), ("get", "assets")]
+
+        del appels[:]
+        assert cache.get_bytes(7, "assureurs/7/logo.png") == contenu
+        assert appels == [("stat", "assets")]  # ETag inchangé : pas de téléchargement
+
+        monkeypatch.setattr(MinioService, "get_file_etag", staticmethod(lambda bucket, objet: None))
+        assert cache.get_bytes(7, "assureurs/7/logo.png") == contenu  # MinIO indisponible
+
+        cache.invalidate(7)
+        assert cache.get_stats()["entries"] == 0
+        assert cache.get_bytes(7, "assureurs/7/logo.png") is None
+
+    def test_pdf_and_card_share_resized_variants(self, monkeypatch, tmp_path):
+        from app.services.card_service import CardService
+        from app.services.pdf_service import PDF_LOGO_MAX_PIXELS, _load_logo_bytes_assureur
+
+        chemin = tmp_path / "logo.png"
+        chemin.write_bytes(_png("purple", (2000, 1000)))
+        cache = LogoAssureurCache(revalidate_seconds=3600)
+        monkeypatch.setattr(module_logo_cache, "logo_cache", cache)
+        monkeypatch.setattr("app.services.pdf_service.logo_cache", cache)
+        monkeypatch.setattr("app.services.card_service.logo_cache", cache)
+
+        assureur = SimpleNamespace(id=3, logo_url=str(chemin))
+        souscription = SimpleNamespace(produit_assurance=SimpleNamespace(assureur_obj=assureur))
+
+        carte = CardService._load_assureur_logo(souscription, max_size=(200, 80))
+        assert carte.size == (160, 80) and carte.mode == "RGBA"
+        assert CardService._load_assureur_logo(souscription, max_size=(200, 80)) is carte
+
+        entete = Image.open(_load_logo_bytes_assureur(souscription))
+        assert entete.width <= PDF_LOGO_MAX_PIXELS[0] and entete.height <= PDF_LOGO_MAX_PIXELS[1]
+        assert cache.get_stats() == {"entries": 1, "hits": 2, "misses": 1, "revalidations": 0}
+
+    def test_logo_upload_invalidates_cache(self, client, db, admin_headers, monkeypatch):
+        from app.models.assureur import Assureur
+
+        assureur = Assureur(nom="Assureur Logo", pays="CI", logo_url="assureurs/1/logo.png")
+        db.add(assureur)
+        db.commit()
+        cache = LogoAssureurCache(revalidate_seconds=3600)
+        cache._entrees[(assureur.id, "assureurs/1/logo.png")] = module_logo_cache._Logo(b"ancien")
+        monkeypatch.setattr("app.api.v1.admin_assureurs.logo_cache", cache)
+        monkeypatch.setattr(
+            MinioService,
+            "upload_assureur_logo",
+            staticmethod(lambda assureur_id, body, content_type, ext: f"assureurs/{assureur_id}/logo.{ext}"),
+        )
+
+        response = client.post(
+            f"/api/v1/admin/assureurs/{assureur.id}/logo",
+            headers=admin_headers,
+            files={"file": ("logo.png", _png("red"), "image/png")},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert cache.get_stats()["entries"] == 0
@@ -0,0 +1,144 @@
+"""
+Signed URL cache tests: reuse until the safety margin, no existence probe for known keys, one-pass listing signatures
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from fastapi import status
+
+from app.core.enums import StatutSouscription
+from app.models.attestation import Attestation
+from app.models.souscription import Souscription
+from app.services import minio_service
+from app.services.attestation_service import AttestationService
+from app.services.minio_service import MinioService
+from app.services.signed_url_cache import SignedUrlCache
+
+
+@pytest.fixture
+def minio(monkeypatch):
+    """Client MinIO simulé : compte les stat_object et les signatures"""
+    appels = {"stat": [], "signe": []}
+
+    def stat_object(bucket, objet):
+        appels["stat"].append((bucket, objet))
+
+    def presigned_get_object(bucket, objet, expires):
+        appels["signe"].append((bucket, objet))
+        return f"https://minio/{bucket}/{objet}?sig={len(appels['signe'])}"
+
+    monkeypatch.setattr(minio_service.minio_client, "stat_object", stat_object)
+    monkeypatch.setattr(minio_service.minio_client, "presigned_get_object", presigned_get_object)
+    monkeypatch.setattr(minio_service, "signed_url_cache", SignedUrlCache(safety_margin_seconds=900))
+    return appels
+
+
+def _attestation(db, user, product, numero, carte=True):
+    souscription = Souscription(
+        user_id=user.id,
+        produit_assurance_id=product.id,
+        numero_souscription=f"SUB-{numero}",
+        prix_applique=product.cout,
+        date_debut=datetime.utcnow(),
+        date_fin=datetime.utcnow() + timedelta(days=30),
+        statut=StatutSouscription.ACTIVE,
+    )
+    db.add(souscription)
+    db.flush()
+    attestation = Attestation(
+        souscription_id=souscription.id,
+        type_attestation="definitive",
+        numero_attestation=numero,
+        chemin_fichier_minio=f"{souscription.id}/definitive/{numero}.pdf",
+        bucket_minio="attestations",
+        url_signee="https://minio/ancienne",
+        carte_numerique_path=f"{souscription.id}/cards/{numero}.png" if carte else None,
+        carte_numerique_bucket="attestations" if carte else None,
+        est_valide=True,
+    )
+    db.add(attestation)
+    db.commit()
+    return attestation
+
+
+class TestSignedUrlCache:
+    def test_url_is_reused_until_safety_margin(self, minio, monkeypatch):
+        url, expire_le = MinioService.generate_signed_url_with_expiry("attestations", "a.pdf", timedelta(hours=24))
+        assert minio["stat"] == [("attestations", "a.pdf")]  # objet inconnu : vérifié une fois
+        assert MinioService.generate_signed_url("attestations", "a.pdf", timedelta(hours=24)) == url
+        assert MinioService.generate_signed_url("attestations", "a.pdf", timedelta(hours=1)) != url  # autre durée
+        assert len(minio["stat"]) == 1 and len(minio["signe"]) == 2
+
+        cache = minio_service.signed_url_cache
+        cle = ("attestations", "a.pdf", 24 * 3600)
+        cache._urls[cle] = (url, datetime.utcnow() + timedelta(minutes=10))  # dans la marge de 15 min
+        nouvelle, nouvelle_expiration = MinioService.generate_signed_url_with_expiry(
+            "attestations", "a.pdf", timedelta(hours=24)
+        )
+        assert nouvelle != url and nouvelle_expiration > expire_le - timedelta(minutes=1)
+
+        monkeypatch.setattr(minio_service.minio_client, "remove_object", lambda bucket, objet: None)
+        MinioService.delete_pdf("attestations", "a.pdf")
+        assert cache.get_stats()["entries"] == 0
+        MinioService.generate_signed_url("attestations", "a.pdf", timedelta(hours=24))
+        assert len(minio["stat"]) == 2  # clé oubliée après suppression
+
+    def test_uploaded_and_known_keys_skip_existence_probe(self, minio, monkeypatch):
+        monkeypatch.setattr(MinioService, "ensure_attestations_bucket", staticmethod(lambda: None))
+        monkeypatch.setattr(minio_service.minio_client, "put_object", lambda *args, **kwargs: None)
+
+        chemin = MinioService.upload_pdf(b"%PDF-1.4", 7, "provisoire", "ATT-PROV-7")
+        MinioService.get_pdf_url(chemin, expires=timedelta(hours=24))
+        MinioService.generate_signed_url("project-documents", "projets/1/passeport.pdf", known_object=True)
+        assert minio["stat"] == []
+        assert len(minio["signe"]) == 2
+
+    def test_short_lived_urls_keep_half_their_lifetime(self):
+        cache = SignedUrlCache(safety_margin_seconds=3600)
+        expires = timedelta(minutes=30)
+        cache.put("b", "o", expires, "url", datetime.utcnow() + timedelta(minutes=20))
+        assert cache.get("b", "o", expires) == ("url", cache._urls[("b", "o", 1800)][1])
+        cache.put("b", "o", expires, "url", datetime.utcnow() + timedelta(minutes=10))
+        assert cache.get("b", "o", expires) is None
+
+
+class TestListingSignatures:
+    def test_user_attestations_are_signed_once_without_probe(
+        self, client, db, test_user, test_product, auth_headers, minio
+    ):
+        product = test_product(db, code="URL-001", cout=Decimal("80.00"))
+        _attestation(db, test_user, product, "ATT-URL-001")
+        _attestation(db, test_user, product, "ATT-URL-002", carte=False)
+
+        for _ in range(2):
+            response = client.get("/api/v1/users/me/attestations", headers=auth_headers)
+            assert response.status_code == status.HTTP_200_OK
+        data = {item["numero_attestation"]: item for item in response.json()}
+        assert data["ATT-URL-001"]["url_signee"].startswith("https://minio/attestations/")
+        assert data["ATT-URL-001"]["carte_numerique_url"].startswith("https://minio/attestations/")
+        assert minio["stat"] == []
+        assert len(minio["signe"]) == 3  # 2 PDF + 1 carte, la seconde requête est servie par le cache
+
+        response = client.get("/api/v1/documents", headers=auth_headers)
+        assert response.status_code == status.HTTP_200_OK
+        urls = {doc["numero"]: doc["url_download"] for doc in response.json()}
+        assert urls["ATT-URL-001"] == data["ATT-URL-001"]["url_signee"]
+        assert len(minio["signe"]) == 3
+
+    def test_refresh_signed_url_commits_only_when_url_changes(
+        self, db, test_user, test_product, minio, monkeypatch
+    ):
+        product = test_product(db, code="URL-002", cout=Decimal("80.00"))
+        attestation = _attestation(db, test_user, product, "ATT-URL-010")
+        commits = []
+        commit_reel = db.commit
+        monkeypatch.setattr(db, "commit", lambda: commits.append(1) or commit_reel())
+
+        url = AttestationService.refresh_signed_url(db, attestation, timedelta(hours=1), refresh_card=True)
+        assert attestation.url_signee == url and attestation.carte_numerique_url
+        assert len(commits) == 1
+
+        assert AttestationService.refresh_signed_url(db, attestation, timedelta(hours=1), refresh_card=True) == url
+        assert len(commits) == 1  # URL inchangée : pas de commit
+        assert minio["stat"] == [] and len(minio["signe"]) == 2
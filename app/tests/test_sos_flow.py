@@ -2,10 +2,15 @@
 SOS flow tests
 Flow: trigger -> agent reception -> create sinistre
 """
+import asyncio
+import fnmatch
+import time
+
 import pytest
 from fastapi import status
 from decimal import Decimal
 from datetime import datetime, timedelta
+from sqlalchemy.orm import selectinload
 
 PARIS_LAT = float(Decimal("48.8566"))
 PARIS_LON = float(Decimal("2.3522"))
@@ -501,3 +506,783 @@ class TestSOSFlow:
         assert medical_questionnaire["id"] == questionnaire.id
         assert medical_questionnaire["type_questionnaire"] == "medical"
 
+
+
+def _hospital(db, nom, latitude, longitude, est_actif=True):
+    from app.models.hospital import Hospital
+
+    hospital = Hospital(
+        nom=nom,
+        latitude=Decimal(str(latitude)),
+        longitude=Decimal(str(longitude)),
+        est_actif=est_actif,
+    )
+    db.add(hospital)
+    db.commit()
+    db.refresh(hospital)
+    return hospital
+
+
+@pytest.mark.sos
+class TestHospitalSpatialIndex:
+    """In-memory spatial index used to pick the nearest hospital"""
+
+    def test_nearest_and_radius_match_full_scan(self, db):
+        """k-nearest and radius queries agree with a Haversine scan of every active hospital"""
+        import random
+
+        from app.api.v1.sos import calculate_distance
+        from app.services.hospital_index import hospital_index
+
+        rnd = random.Random(7)
+        hospitals = [
+            _hospital(db, f"H{i}", round(rnd.uniform(4.0, 15.0), 6), round(rnd.uniform(-17.5, 3.0), 6), est_actif=i % 5 != 0)
+            for i in range(60)
+        ]
+        actifs = [h for h in hospitals if h.est_actif]
+        latitude, longitude = 5.3364, -4.0267
+
+        par_distance = sorted(
+            ((calculate_distance(latitude, longitude, h.latitude, h.longitude), h.id) for h in actifs)
+        )
+        attendus = [(hospital_id, distance) for distance, hospital_id in par_distance]
+
+        plus_proches = hospital_index.nearest(db, latitude, longitude, k=5)
+        assert [hospital_id for hospital_id, _ in plus_proches] == [hospital_id for hospital_id, _ in attendus[:5]]
+        assert [round(d, 6) for _, d in plus_proches] == [round(d, 6) for _, d in attendus[:5]]
+
+        rayon = attendus[9][1]
+        dans_rayon = hospital_index.within_radius(db, latitude, longitude, rayon)
+        assert [hospital_id for hospital_id, _ in dans_rayon] == [hospital_id for hospital_id, _ in attendus[:10]]
+
+    def test_index_follows_hospital_writes(self, db):
+        """Creating, moving or deactivating a hospital is visible to the next lookup"""
+        from app.services.hospital_index import find_nearest_active_hospital
+
+        abidjan = _hospital(db, "CHU Cocody", 5.3480, -3.9870)
+        assert find_nearest_active_hospital(db, 5.3364, -4.0267).id == abidjan.id
+
+        plateau = _hospital(db, "Polyclinique Plateau", 5.3250, -4.0200)
+        assert find_nearest_active_hospital(db, 5.3364, -4.0267).id == plateau.id
+
+        plateau.est_actif = False
+        db.commit()
+        assert find_nearest_active_hospital(db, 5.3364, -4.0267).id == abidjan.id
+
+        abidjan.latitude = Decimal("6.8200")
+        abidjan.longitude = Decimal("-5.2800")
+        db.commit()
+        assert find_nearest_active_hospital(db, 6.8, -5.3).id == abidjan.id
+
+        abidjan.est_actif = False
+        db.commit()
+        assert find_nearest_active_hospital(db, 6.8, -5.3) is None
+
+    def test_assign_hospital_defaults_to_nearest(
+        self, client, db, test_user, test_product, test_sos_operator, test_hospital, auth_headers, sos_operator_headers
+    ):
+        """Assigning without hospital_id picks the active hospital nearest to the alert"""
+        from app.models.souscription import Souscription
+        from app.models.sinistre import Sinistre
+        from app.core.enums import StatutSouscription
+
+        product = test_product(db, code="SOS-IDX-001", cout=Decimal("100.00"))
+        subscription = Souscription(
+            user_id=test_user.id,
+            produit_assurance_id=product.id,
+            numero_souscription="SUB-IDX-001",
+            prix_applique=product.cout,
+            date_debut=datetime.utcnow() - timedelta(days=1),
+            statut=StatutSouscription.ACTIVE
+        )
+        db.add(subscription)
+        db.commit()
+
+        sos_response = client.post(
+            "/api/v1/sos/trigger",
+            json={
+                "souscription_id": subscription.id,
+                "latitude": 48.8606,
+                "longitude": 2.3376,
+                "description": "Emergency near the Louvre",
+                "priorite": "haute"
+            },
+            headers=auth_headers
+        )
+        assert sos_response.status_code == status.HTTP_201_CREATED
+        sinistre = db.query(Sinistre).filter(Sinistre.alerte_id == sos_response.json()["id"]).first()
+        assert sinistre.hospital_id == test_hospital.id
+
+        louvre = _hospital(db, "Hopital du Louvre", 48.8610, 2.3380)
+        response = client.put(
+            f"/api/v1/admin/sinistres/sinistres/{sinistre.id}/assign-hospital",
+            json={},
+            headers=sos_operator_headers
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["hospital_id"] == louvre.id
+
+
+@pytest.mark.sos
+class TestNearbyHospitals:
+    """Ranking of alternative hospitals for SOS dispatch"""
+
+    def _staff(self, db, hospital, username, role, is_active=True):
+        from app.models.user import User
+        from app.core.security import get_password_hash
+
+        user = User(
+            email=f"{username}@example.com",
+            username=username,
+            hashed_password=get_password_hash("staffpassword123"),
+            role=role,
+            hospital_id=hospital.id,
+            is_active=is_active,
+        )
+        db.add(user)
+        db.commit()
+        return user
+
+    def test_nearby_filters_catalogue_and_staff(self, client, db, sos_operator_headers):
+        """Hospitals are ranked by travel estimate and filtered by catalogue and active staff"""
+        from app.core.enums import Role
+        from app.models.hospital_exam_tarif import HospitalExamTarif
+        from app.models.hospital_act_tarif import HospitalActTarif
+
+        proche = _hospital(db, "Clinique Proche", 5.3400, -4.0200)
+        moyen = _hospital(db, "Hopital Moyen", 5.3700, -4.0000)
+        loin = _hospital(db, "CHU Lointain", 5.4500, -3.9000)
+        sans_personnel = _hospital(db, "Centre Vide", 5.3370, -4.0260)
+        self._staff(db, proche, "doc_proche", Role.MEDECIN_HOPITAL)
+        self._staff(db, moyen, "recep_moyen", Role.AGENT_RECEPTION_HOPITAL)
+        self._staff(db, loin, "doc_loin", Role.MEDECIN_HOPITAL)
+        self._staff(db, sans_personnel, "doc_inactif", Role.MEDECIN_HOPITAL, is_active=False)
+        db.add_all([
+            HospitalExamTarif(hospital_id=moyen.id, nom="Scanner", montant=Decimal("50000")),
+            HospitalExamTarif(hospital_id=loin.id, nom="Scanner", montant=Decimal("45000")),
+            HospitalActTarif(hospital_id=loin.id, code="CHIR-01", nom="Chirurgie", montant=Decimal("90000")),
+        ])
+        db.commit()
+
+        params = {"latitude": 5.3364, "longitude": -4.0267}
+        response = client.get("/api/v1/sos/hospitals/nearby", params=params, headers=sos_operator_headers)
+        assert response.status_code == status.HTTP_200_OK
+        resultats = response.json()
+        assert [h["id"] for h in resultats] == [proche.id, moyen.id, loin.id]
+        assert resultats[0]["medecins_actifs"] == 1
+        assert resultats[0]["distance_route_km"] > resultats[0]["distance_km"]
+        assert resultats[0]["duree_trajet_minutes"] < resultats[1]["duree_trajet_minutes"]
+
+        response = client.get(
+            "/api/v1/sos/hospitals/nearby",
+            params={**params, "examens": ["scanner"], "limit": 1},
+            headers=sos_operator_headers,
+        )
+        assert [h["id"] for h in response.json()] == [moyen.id]
+
+        response = client.get(
+            "/api/v1/sos/hospitals/nearby",
+            params={**params, "examens": ["Scanner"], "actes": ["chir-01"]},
+            headers=sos_operator_headers,
+        )
+        assert [h["id"] for h in response.json()] == [loin.id]
+
+        response = client.get(
+            "/api/v1/sos/hospitals/nearby",
+            params={**params, "personnel_actif": "false", "rayon_km": 1},
+            headers=sos_operator_headers,
+        )
+        assert [h["id"] for h in response.json()] == [sans_personnel.id, proche.id]
+
+        # Un acte ajouté au catalogue est visible dès le commit suivant
+        db.add(HospitalActTarif(hospital_id=moyen.id, code="CHIR-01", nom="Chirurgie", montant=Decimal("80000")))
+        db.commit()
+        response = client.get(
+            "/api/v1/sos/hospitals/nearby",
+            params={**params, "actes": ["Chirurgie"]},
+            headers=sos_operator_headers,
+        )
+        assert [h["id"] for h in response.json()] == [moyen.id, loin.id]
+
+    def test_nearby_forbidden_for_insured_users(self, client, auth_headers):
+        """Only dispatch roles can list nearby hospitals"""
+        response = client.get(
+            "/api/v1/sos/hospitals/nearby",
+            params={"latitude": 5.3364, "longitude": -4.0267},
+            headers=auth_headers,
+        )
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_ranking_uses_precomputed_index(self, db):
+        """Once the index is built, ranking runs without querying the database"""
+        import random
+        import time as _time
+
+        from sqlalchemy import event
+
+        from app.core.enums import Role
+        from app.services.hospital_ranking_service import rank_nearby_hospitals
+
+        rnd = random.Random(3)
+        hospitals = [
+            _hospital(db, f"H{i}", round(rnd.uniform(4.0, 10.0), 6), round(rnd.uniform(-8.0, -2.0), 6))
+            for i in range(300)
+        ]
+        for i, hospital in enumerate(hospitals[::10]):
+            self._staff(db, hospital, f"staff_{i}", Role.AGENT_RECEPTION_HOPITAL)
+        rank_nearby_hospitals(db, 5.3364, -4.0267)
+
+        requetes = []
+        ecouteur = lambda *args: requetes.append(args)
+        event.listen(db.get_bind(), "before_cursor_execute", ecouteur)
+        try:
+            debut = _time.perf_counter()
+            resultats = rank_nearby_hospitals(db, 5.3364, -4.0267, limit=10)
+            duree = _time.perf_counter() - debut
+        finally:
+            event.remove(db.get_bind(), "before_cursor_execute", ecouteur)
+
+        assert len(resultats) == 10
+        assert all(h["personnel_actif"] == 1 for h in resultats)
+        assert requetes == []
+        assert duree < 0.05
+
+
+class _FakeWebSocket:
+    """Socket de test : enregistre les messages, peut simuler un client lent ou fermé"""
+
+    def __init__(self, delai=0.0, erreur=False):
+        self.delai = delai
+        self.erreur = erreur
+        self.messages = []
+        self.fermee = False
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, message):
+        if self.erreur:
+            raise RuntimeError("socket fermée")
+        await asyncio.sleep(self.delai)
+        self.messages.append(message)
+
+    async def close(self, code=1000):
+        self.fermee = True
+
+
+def _contenus(ws):
+    """Messages reçus, sans leur event_id"""
+    return [{cle: valeur for cle, valeur in m.items() if cle != "event_id"} for m in ws.messages]
+
+
+async def _attendre(condition, delai=2.0):
+    limite = time.monotonic() + delai
+    while not condition():
+        assert time.monotonic() < limite, "condition non atteinte"
+        await asyncio.sleep(0.01)
+
+
+class _FakeRedisBus:
+    """Redis pub/sub en mémoire partagé entre plusieurs ConnectionManager (un par worker)"""
+
+    def __init__(self):
+        self.abonnements = []
+        self.flux = []
+
+    def client(self):
+        bus = self
+
+        class _PubSub:
+            def __init__(self):
+                self.canaux, self.motifs = set(), set()
+                self.file = asyncio.Queue()
+                bus.abonnements.append(self)
+
+            async def subscribe(self, canal):
+                self.canaux.add(canal)
+
+            async def unsubscribe(self, canal):
+                self.canaux.discard(canal)
+
+            async def psubscribe(self, motif):
+                self.motifs.add(motif)
+
+            async def get_message(self, ignore_subscribe_messages=True, timeout=1.0):
+                try:
+                    return await asyncio.wait_for(self.file.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    return None
+
+            async def aclose(self):
+                bus.abonnements.remove(self)
+
+        class _Client:
+            async def ping(self):
+                return True
+
+            def pubsub(self):
+                return _PubSub()
+
+            async def xadd(self, cle, champs, maxlen=None, approximate=True):
+                event_id = f"{len(bus.flux) + 1}-0"
+                bus.flux.append((event_id, dict(champs)))
+                del bus.flux[:-maxlen]
+                return event_id
+
+            async def xrange(self, cle, min="-", max="+", count=None):
+                depart = int(min[1:].split("-")[0]) if min.startswith("(") else 0
+                entrees = [e for e in bus.flux if int(e[0].split("-")[0]) > depart]
+                return entrees[:count]
+
+            async def publish(self, canal, data):
+                for abonne in bus.abonnements:
+                    if canal in abonne.canaux or any(fnmatch.fnmatch(canal, m) for m in abonne.motifs):
+                        abonne.file.put_nowait({"type": "message", "channel": canal, "data": data})
+
+            async def aclose(self):
+                pass
+
+        return _Client()
+
+
+@pytest.mark.sos
+class TestConnectionManager:
+    """Diffusion WebSocket : files d'envoi par socket, heartbeats et bus Redis entre workers"""
+
+    def test_slow_socket_does_not_delay_others(self):
+        from app.core.websocket_manager import ConnectionManager
+
+        async def scenario():
+            gestionnaire = ConnectionManager(send_timeout=0.2)
+            lent, rapide, ferme = _FakeWebSocket(delai=5), _FakeWebSocket(), _FakeWebSocket(erreur=True)
+            for ws in (lent, rapide, ferme):
+                await gestionnaire.connect(ws, 1)
+
+            debut = time.perf_counter()
+            await gestionnaire.send_personal_message({"type": "new_alert"}, 1)
+            assert time.perf_counter() - debut < 0.05
+            await _attendre(lambda: rapide.messages)
+            assert _contenus(rapide) == [{"type": "new_alert"}]
+
+            # Les sockets en échec ou trop lentes sont retirées et fermées
+            await _attendre(lambda: gestionnaire.active_connections[1] == {rapide})
+            assert lent.fermee and ferme.fermee and not rapide.fermee
+            gestionnaire.disconnect(rapide, 1)
+
+        asyncio.run(scenario())
+
+    def test_burst_is_coalesced_bounded_and_batched(self):
+        from app.core.websocket_manager import ConnectionManager
+
+        async def scenario():
+            gestionnaire = ConnectionManager(outbox_size=10)
+            ws = _FakeWebSocket(delai=0.05)
+            await gestionnaire.connect(ws, 1, batch=True)
+            gestionnaire.send_to_socket(ws, {"type": "connected"})
+            await asyncio.sleep(0.01)  # le premier envoi est en cours
+
+            for version in range(30):
+                await gestionnaire.send_personal_message({"type": "new_alert", "alerte_id": 5, "version": version}, 1)
+            for numero in range(15):
+                await gestionnaire.send_personal_message({"type": "medical_notification", "numero": numero}, 1)
+            assert gestionnaire.get_stats()["queued_messages"] == 10
+
+            await _attendre(lambda: len(ws.messages) == 2)
+            gestionnaire.disconnect(ws, 1)
+            return ws.messages
+
+        bienvenue, trame = asyncio.run(scenario())
+        assert bienvenue == {"type": "connected"}
+        assert trame["type"] == "batch"
+        # 1 état d'alerte (coalescé) + 15 notifications dans une file de 10 : 6 abandonnés
+        assert trame["dropped"] == 6
+        assert [m["numero"] for m in trame["messages"]] == list(range(5, 15))
+
+    def test_heartbeat_and_silent_client_eviction(self):
+        from app.core.websocket_manager import ConnectionManager
+
+        async def scenario():
+            gestionnaire = ConnectionManager(heartbeat_interval=0.05, heartbeat_timeout=0.3)
+            ws = _FakeWebSocket()
+            await gestionnaire.connect(ws, 1)
+            await _attendre(lambda: any(m["type"] == "heartbeat" for m in ws.messages))
+            # Un client qui ne parle jamais n'est pas évincé sur son silence
+            await asyncio.sleep(0.4)
+            assert 1 in gestionnaire.active_connections
+
+            gestionnaire.touch(ws)
+            await _attendre(lambda: 1 not in gestionnaire.active_connections, delai=1.0)
+            assert ws.fermee
+
+        asyncio.run(scenario())
+
+    def test_messages_fan_out_across_workers(self):
+        from app.core.websocket_manager import ConnectionManager
+
+        async def scenario():
+            bus = _FakeRedisBus()
+            worker_a, worker_b = ConnectionManager(), ConnectionManager()
+            await worker_a.start(bus.client())
+            await worker_b.start(bus.client())
+            assert worker_a.distributed and worker_b.distributed
+
+            ws = _FakeWebSocket()
+            await worker_b.connect(ws, 7)
+            # Publié depuis le worker A, livré par le worker B qui détient la socket
+            await worker_a.send_personal_message({"type": "sinistre_update", "id": 3}, 7)
+            await _attendre(lambda: ws.messages)
+            assert _contenus(ws) == [{"type": "sinistre_update", "id": 3}]
+            assert ws.messages[0]["event_id"] == bus.flux[0][0]
+
+            worker_b.disconnect(ws, 7)
+            await asyncio.sleep(0.01)
+            assert all("ws:user:7" not in abonne.canaux for abonne in bus.abonnements)
+
+            await worker_a.stop()
+            await worker_b.stop()
+            assert not bus.abonnements
+
+        asyncio.run(scenario())
+
+    def test_role_broadcast_uses_connection_registry(self, monkeypatch):
+        from app.core import database
+        from app.core.enums import Role
+        from app.core.websocket_manager import ConnectionManager
+
+        def sans_base():
+            raise AssertionError("la diffusion par rôle ne doit pas interroger la base")
+
+        monkeypatch.setattr(database, "SessionLocal", sans_base)
+
+        async def scenario():
+            gestionnaire = ConnectionManager()
+            sockets = {uid: _FakeWebSocket() for uid in (1, 2, 3)}
+            await gestionnaire.connect(sockets[1], 1, Role.SOS_OPERATOR)
+            await gestionnaire.connect(sockets[2], 2, Role.SOS_OPERATOR)
+            await gestionnaire.connect(sockets[3], 3, Role.DOCTOR)
+            await gestionnaire.broadcast_to_role({"type": "new_alert"}, Role.SOS_OPERATOR)
+            await _attendre(lambda: sockets[1].messages and sockets[2].messages)
+
+            gestionnaire.disconnect(sockets[2], 2)
+            assert gestionnaire.users_by_role == {Role.SOS_OPERATOR: {1}, Role.DOCTOR: {3}}
+            gestionnaire.disconnect(sockets[3], 3)
+            assert Role.DOCTOR not in gestionnaire.users_by_role
+            gestionnaire.disconnect(sockets[1], 1)
+            return sockets
+
+        sockets = asyncio.run(scenario())
+        assert sockets[1].messages == sockets[2].messages
+        assert _contenus(sockets[1]) == [{"type": "new_alert"}]
+        assert sockets[3].messages == []
+
+    def test_ws_sos_endpoint_welcome_and_pong(self, client, test_sos_operator, sos_operator_headers):
+        from app.core.websocket_manager import manager
+
+        # Le principal est mis en cache par la requête HTTP : le WebSocket n'ouvre pas de session
+        assert client.get("/api/v1/auth/me", headers=sos_operator_headers).status_code == 200
+        token = sos_operator_headers["Authorization"].split()[1]
+        with client.websocket_connect(f"/ws/sos?token={token}&batch=true") as ws:
+            bienvenue = ws.receive_json()
+            assert bienvenue["type"] == "connected"
+            assert bienvenue["user_id"] == test_sos_operator.id
+            ws.send_text('{"type": "ping"}')
+            assert ws.receive_json() == {"type": "pong"}
+            assert manager._connexions[next(iter(manager.active_connections[test_sos_operator.id]))].client_actif
+        limite = time.monotonic() + 2
+        while test_sos_operator.id in manager.active_connections and time.monotonic() < limite:
+            time.sleep(0.01)
+        assert test_sos_operator.id not in manager.active_connections
+
+    def test_reconnect_replays_missed_events(self):
+        from app.core.enums import Role
+        from app.core.websocket_manager import ConnectionManager
+
+        async def scenario():
+            gestionnaire = ConnectionManager()
+            premiere = _FakeWebSocket()
+            await gestionnaire.connect(premiere, 1, Role.SOS_OPERATOR)
+            await gestionnaire.send_personal_message({"type": "new_alert", "alerte_id": 1}, 1)
+            await _attendre(lambda: premiere.messages)
+            gestionnaire.disconnect(premiere, 1)
+
+            # Publiés pendant la coupure
+            await gestionnaire.send_personal_message({"type": "new_alert", "alerte_id": 2}, 1)
+            await gestionnaire.send_personal_message({"type": "new_alert", "alerte_id": 3}, 2)
+            await gestionnaire.broadcast_to_role({"type": "alerte_update", "alerte_id": 2}, Role.SOS_OPERATOR)
+            await gestionnaire.broadcast_to_role({"type": "alerte_update", "alerte_id": 2}, Role.DOCTOR)
+
+            seconde = _FakeWebSocket()
+            await gestionnaire.connect(
+                seconde, 1, Role.SOS_OPERATOR, last_event_id=premiere.messages[-1]["event_id"]
+            )
+            gestionnaire.send_to_socket(seconde, {"type": "connected"}, prioritaire=True)
+            await gestionnaire.send_personal_message({"type": "new_alert", "alerte_id": 4}, 1)
+            await _attendre(lambda: len(seconde.messages) == 4)
+            gestionnaire.disconnect(seconde, 1)
+            return _contenus(seconde)
+
+        assert asyncio.run(scenario()) == [
+            {"type": "connected"},
+            {"type": "new_alert", "alerte_id": 2},
+            {"type": "alerte_update", "alerte_id": 2},
+            {"type": "new_alert", "alerte_id": 4},
+        ]
+
+    def test_reconnect_beyond_log_requires_resync(self):
+        from app.core import websocket_manager as module
+        from app.core.websocket_manager import ConnectionManager
+
+        async def scenario():
+            gestionnaire = ConnectionManager()
+            gestionnaire._journal = module._JournalLocal(taille=2)
+            ids = []
+            for numero in range(5):
+                message = {"type": "medical_notification", "numero": numero}
+                ids.append((await gestionnaire._journaliser("ws:user:1", message))["event_id"])
+
+            ws = _FakeWebSocket()
+            await gestionnaire.connect(ws, 1, last_event_id=ids[0])
+            await _attendre(lambda: ws.messages)
+            gestionnaire.disconnect(ws, 1)
+            return ws.messages
+
+        assert asyncio.run(scenario()) == [{"type": "resync_required", "last_event_id": "0-1"}]
+
+    def test_replay_across_workers_from_redis_stream(self):
+        from app.core.websocket_manager import ConnectionManager
+
+        async def scenario():
+            bus = _FakeRedisBus()
+            worker_a, worker_b = ConnectionManager(), ConnectionManager()
+            await worker_a.start(bus.client())
+            await worker_b.start(bus.client())
+
+            await worker_a.send_personal_message({"type": "new_alert", "alerte_id": 1}, 7)
+            vu = bus.flux[-1][0]
+            await worker_a.send_personal_message({"type": "new_alert", "alerte_id": 2}, 7)
+            await worker_a.send_personal_message({"type": "new_alert", "alerte_id": 9}, 8)
+
+            ws = _FakeWebSocket()
+            await worker_b.connect(ws, 7, last_event_id=vu)
+            await _attendre(lambda: ws.messages)
+            worker_b.disconnect(ws, 7)
+            await worker_a.stop()
+            await worker_b.stop()
+            return _contenus(ws)
+
+        assert asyncio.run(scenario()) == [{"type": "new_alert", "alerte_id": 2}]
+
+
+def _dossier(db, user, numero, hospital=None, **champs_sinistre):
+    from app.models.alerte import Alerte
+    from app.models.sinistre import Sinistre
+
+    alerte = Alerte(
+        user_id=user.id,
+        numero_alerte=f"ALT-WF-{numero}",
+        latitude=Decimal("48.85"),
+        longitude=Decimal("2.35"),
+        statut="en_cours",
+    )
+    db.add(alerte)
+    db.flush()
+    sinistre = Sinistre(
+        alerte_id=alerte.id,
+        hospital_id=hospital.id if hospital else None,
+        **champs_sinistre,
+    )
+    db.add(sinistre)
+    db.commit()
+    return alerte, sinistre
+
+
+@pytest.mark.sos
+class TestWorkflowProjection:
+    """Projection en lecture seule du workflow des sinistres et synchronisation au commit"""
+
+    def test_commit_materializes_workflow_steps(self, db, test_user, test_hospital):
+        from app.models.sinistre_process_step import SinistreProcessStep
+
+        _, sinistre = _dossier(db, test_user, 1, test_hospital)
+        statuts = dict(
+            db.query(SinistreProcessStep.step_key, SinistreProcessStep.statut)
+            .filter(SinistreProcessStep.sinistre_id == sinistre.id)
+        )
+        assert len(statuts) == 15
+        assert statuts["validation_et_numero_sinistre"] == "in_progress"
+
+        sinistre.numero_sinistre = "SIN-WF-1"
+        db.commit()
+        etape = db.query(SinistreProcessStep).filter(
+            SinistreProcessStep.sinistre_id == sinistre.id,
+            SinistreProcessStep.step_key == "validation_et_numero_sinistre",
+        ).one()
+        assert etape.statut == "completed"
+        assert etape.completed_at is not None
+
+    def test_projection_matches_ensure_workflow_steps(self, db, test_user, test_hospital):
+        from app.models.hospital_stay import HospitalStay
+        from app.models.invoice import Invoice, InvoiceStatus
+        from app.models.sinistre import Sinistre
+        from app.models.sinistre_process_step import SinistreProcessStep
+        from app.services.sinistre_workflow_service import ensure_workflow_steps, project_workflow_steps
+
+        _dossier(db, test_user, 1)
+        _dossier(db, test_user, 2, test_hospital, numero_sinistre="SIN-WF-2")
+        _dossier(db, test_user, 3, test_hospital, statut="annule")
+        _, facture = _dossier(db, test_user, 4, test_hospital, numero_sinistre="SIN-WF-4")
+        sejour = HospitalStay(sinistre_id=facture.id, hospital_id=test_hospital.id, status="invoiced")
+        db.add(sejour)
+        db.flush()
+        db.add(Invoice(
+            hospital_id=test_hospital.id,
+            hospital_stay_id=sejour.id,
+            numero_facture="FAC-WF-4",
+            montant_ht=Decimal("100"),
+            montant_ttc=Decimal("100"),
+            date_facture=datetime.utcnow(),
+            statut=InvoiceStatus.PENDING_SINISTRE,
+            validation_medicale="approved",
+            validation_medicale_date=datetime.utcnow(),
+        ))
+        db.commit()
+
+        # États stockés désynchronisés, écrits sans passer par les objets suivis
+        ids = [s.id for s in db.query(Sinistre).order_by(Sinistre.id)]
+        db.query(SinistreProcessStep).filter(SinistreProcessStep.sinistre_id == ids[0]).delete()
+        db.query(SinistreProcessStep).filter(
+            SinistreProcessStep.sinistre_id == ids[1],
+            SinistreProcessStep.step_key.in_(["verification_urgence", "validation_et_numero_sinistre"]),
+        ).update({"statut": "pending", "completed_at": None}, synchronize_session=False)
+        db.query(SinistreProcessStep).filter(
+            SinistreProcessStep.sinistre_id == ids[2],
+            SinistreProcessStep.step_key == "ambulance_en_route",
+        ).update({"statut": "in_progress"}, synchronize_session=False)
+        db.commit()
+        db.expire_all()
+
+        sinistres = (
+            db.query(Sinistre)
+            .options(
+                selectinload(Sinistre.workflow_steps),
+                selectinload(Sinistre.hospital_stay).selectinload(HospitalStay.invoice),
+            )
+            .order_by(Sinistre.id)
+            .all()
+        )
+        alertes = {s.alerte_id: s.alerte for s in sinistres}
+        projection = project_workflow_steps(sinistres, alertes)
+        assert not db.new and not db.dirty
+
+        for sinistre in sinistres:
+            steps, _ = ensure_workflow_steps(db, sinistre, sinistre.alerte)
+            attendu = [(s.step_key, s.titre, s.ordre, s.statut, s.completed_at) for s in steps]
+            obtenu = [
+                (e["step_key"], e["titre"], e["ordre"], e["statut"], e["completed_at"])
+                for e in projection[sinistre.id]
+            ]
+            assert obtenu == attendu
+        assert projection[ids[2]][5]["statut"] == "in_progress"  # étape manuelle conservée
+        db.rollback()
+
+    def test_alert_listing_is_read_only_with_fixed_query_count(
+        self, client, db, test_user, test_hospital, sos_operator_headers
+    ):
+        from sqlalchemy import event
+
+        def mesurer():
+            requetes = []
+
+            def _noter(conn, cursor, statement, parameters, context, executemany):
+                requetes.append(statement.split(None, 1)[0].upper())
+
+            event.listen(db.get_bind(), "before_cursor_execute", _noter)
+            try:
+                response = client.get("/api/v1/sos/", headers=sos_operator_headers)
+            finally:
+                event.remove(db.get_bind(), "before_cursor_execute", _noter)
+            assert response.status_code == status.HTTP_200_OK
+            return response.json(), requetes
+
+        from app.models.hospital_stay import HospitalStay
+        from app.models.sinistre_process_step import SinistreProcessStep
+
+        def dossiers(numeros):
+            for numero in numeros:
+                _, sinistre = _dossier(db, test_user, numero, test_hospital if numero % 2 else None)
+                if sinistre.hospital_id:
+                    db.add(HospitalStay(sinistre_id=sinistre.id, hospital_id=test_hospital.id))
+                    db.commit()
+            # Étapes jamais matérialisées (données antérieures) : la liste ne doit pas les créer
+            db.query(SinistreProcessStep).delete()
+            db.commit()
+
+        dossiers(range(2))
+        mesurer()  # met en cache l'utilisateur authentifié
+        page, requetes_petite_page = mesurer()
+        assert len(page) == 2 and all(len(a["workflow_steps"]) == 15 for a in page)
+
+        dossiers(range(2, 10))
+        page, requetes_grande_page = mesurer()
+        assert len(page) == 10
+        assert len(requetes_grande_page) == len(requetes_petite_page)
+        assert set(requetes_grande_page) == {"SELECT"}
+        assert db.query(SinistreProcessStep).count() == 0
+
+
+@pytest.mark.sos
+@pytest.mark.benchmark
+def test_benchmark_concurrent_alert_listing_on_one_worker(client, db, test_user, sos_operator_headers):
+    """
+    Les handlers synchrones tournent dans le threadpool : pendant qu'une requête attend
+    la base, la boucle asyncio du worker sert les autres.
+    """
+    import httpx
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import sessionmaker
+
+    from app.core.database import get_db
+    from app.main import app
+
+    for numero in range(5):
+        _dossier(db, test_user, numero)
+
+    # Base « distante » : une connexion par session, latence réseau simulée par requête SQL
+    latence = 0.02
+    moteur = create_engine(str(db.get_bind().url), connect_args={"check_same_thread": False}, pool_size=20)
+    event.listen(moteur, "before_cursor_execute", lambda *args: time.sleep(latence))
+    Session = sessionmaker(bind=moteur, autoflush=False)
+
+    def session_par_requete():
+        session = Session()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    async def lister(nombre, concurrence):
+        limite = asyncio.Semaphore(concurrence)
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client_async:
+            async def une_requete():
+                async with limite:
+                    response = await client_async.get("/api/v1/sos/", headers=sos_operator_headers)
+                    assert response.status_code == status.HTTP_200_OK
+                    assert len(response.json()) == 5
+
+            debut = time.perf_counter()
+            await asyncio.gather(*(une_requete() for _ in range(nombre)))
+            return nombre / (time.perf_counter() - debut)
+
+    override_test = app.dependency_overrides[get_db]
+    app.dependency_overrides[get_db] = session_par_requete
+    try:
+        asyncio.run(lister(1, 1))  # met en cache l'utilisateur authentifié
+        en_serie = asyncio.run(lister(10, 1))
+        concurrent = asyncio.run(lister(10, 10))
+    finally:
+        app.dependency_overrides[get_db] = override_test
+        moteur.dispose()
+
+    assert concurrent >= en_serie * 2, (
+        f"Liste des alertes : {en_serie:.1f} requêtes/s en série, {concurrent:.1f} requêtes/s à 10 en parallèle"
+    )
@@ -344,6 +344,107 @@ class TestSubscriptionE2E:
         assert subscription["produit_assurance_id"] == product.id
 
 
+def _attestation_inputs():
+    from io import BytesIO
+    from types import SimpleNamespace
 
+    import qrcode
 
+    qr = BytesIO()
+    qrcode.make("https://example.com/verify/ATT-PDF-001").save(qr, format="PNG")
+    produit = SimpleNamespace(
+        assureur="Mobility Health",
+        assureur_obj=None,
+        garanties=[{"titre": "Frais médicaux", "franchise": 50, "capitaux": 100000, "obligatoire": True}],
+        primes_generees=None,
+        age_maximum=70,
+        zones_geographiques=None,
+    )
+    souscription = SimpleNamespace(
+        produit_assurance=produit,
+        projet_voyage=SimpleNamespace(destination="France", objet_voyage="Tourisme"),
+        numero_souscription="SUB-PDF-001",
+        date_debut=datetime(2026, 1, 1),
+        date_fin=datetime(2026, 2, 1),
+        created_at=datetime(2025, 12, 1),
+        prix_applique=Decimal("100.00"),
+    )
+    user = SimpleNamespace(full_name="Awa Traoré", username="awa", email="awa@example.com", date_naissance=None)
+    paiement = SimpleNamespace(
+        montant=Decimal("100.00"),
+        type_paiement=SimpleNamespace(value="carte_bancaire"),
+        reference_transaction="TX-PDF-001",
+        date_paiement=datetime(2025, 12, 1),
+    )
+    return souscription, paiement, user, qr.getvalue()
 
+
+def _generer_attestations(provisoire=True):
+    from io import BytesIO
+
+    from app.services.pdf_service import PDFService
+
+    souscription, paiement, user, qr = _attestation_inputs()
+    generer = PDFService.generate_attestation_provisoire if provisoire else PDFService.generate_attestation_definitive
+    return generer(souscription, paiement, user, "ATT-PDF-001", BytesIO(qr), "https://example.com/verify").getvalue()
+
+
+def test_attestation_appendices_are_compiled_once_and_render_identically(monkeypatch):
+    from reportlab import rl_config
+
+    from app.services import pdf_service
+
+    class _Horloge(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(2026, 1, 2, 3, 4)
+
+        @classmethod
+        def utcnow(cls):
+            return datetime(2026, 1, 2, 3, 4)
+
+    monkeypatch.setattr(pdf_service, "dt", _Horloge)
+    monkeypatch.setattr(rl_config, "invariant", 1)
+
+    for provisoire in (True, False):
+        pdf_service._gabarit_paragraphe.cache_clear()
+        premier = _generer_attestations(provisoire)  # annexes analysées et mises en page
+        analyses = pdf_service._gabarit_paragraphe.cache_info().misses
+        second = _generer_attestations(provisoire)  # gabarits réutilisés
+        assert second == premier
+        assert premier.startswith(b"%PDF")
+        assert pdf_service._gabarit_paragraphe.cache_info().misses == analyses
+
+    style = pdf_service._styles_attestation()["normal"]
+    assert pdf_service._gabarit_paragraphe("Franchise : 50 €.", style) is pdf_service._gabarit_paragraphe("Franchise : 50 €.", style)
+    assert pdf_service._gabarit_paragraphe("Franchise : 80 €.", style) is not pdf_service._gabarit_paragraphe("Franchise : 50 €.", style)
+
+
+@pytest.mark.benchmark
+def test_benchmark_attestations_per_second(monkeypatch):
+    """Attestations par seconde, contre des annexes reconstruites et un encodage ASCII85 à chaque document"""
+    import time
+
+    from reportlab import rl_config
+
+    from app.services import pdf_service
+
+    _generer_attestations()
+    iterations = 10
+
+    with monkeypatch.context() as m:
+        m.setattr(rl_config, "useA85", 1)
+        debut = time.perf_counter()
+        for _ in range(iterations):
+            pdf_service._gabarit_paragraphe.cache_clear()
+            _generer_attestations()
+        ancien = (time.perf_counter() - debut) / iterations
+
+    _generer_attestations()
+    debut = time.perf_counter()
+    for _ in range(iterations):
+        pdf = _generer_attestations()
+    nouveau = (time.perf_counter() - debut) / iterations
+
+    assert pdf.startswith(b"%PDF")
+    assert nouveau <= ancien * 0.8, f"Attestations : {1 / nouveau:.1f}/s (annexes non compilées : {1 / ancien:.1f}/s)"
@@ -1,6 +1,8 @@
 from datetime import datetime, timedelta
 from decimal import Decimal
 
+import pytest
+
 from app.core.enums import StatutSouscription
 from app.models.attestation import Attestation
 from app.models.souscription import Souscription
@@ -88,3 +90,99 @@ def test_get_subscription_ecard_for_other_user(
     )
     assert response.status_code == 404
 
+
+
+def _card_inputs():
+    from io import BytesIO
+    from types import SimpleNamespace
+
+    import qrcode
+    from PIL import Image
+
+    qr = BytesIO()
+    qrcode.make("https://example.com/verify/ATT-ECARD-001").save(qr, format="PNG")
+    photo = BytesIO()
+    Image.new("RGB", (300, 400), "#884422").save(photo, format="JPEG")
+    user = SimpleNamespace(full_name="Awa Traoré", username="awa")
+    souscription = SimpleNamespace(
+        numero_souscription="SUB-ECARD-001",
+        date_fin=datetime(2026, 12, 22),
+        produit_assurance=SimpleNamespace(assureur_obj=None, assureur_id=None),
+    )
+    return user, souscription, photo.getvalue(), qr.getvalue()
+
+
+def _legacy_background():
+    """Fond tel qu'il était redessiné pour chaque carte (dégradé ligne par ligne)"""
+    from PIL import Image, ImageDraw
+
+    from app.services.card_service import CardService
+
+    card = Image.new("RGB", (CardService.WIDTH, CardService.HEIGHT), CardService.PURPLE_DARK)
+    r1, g1, b1 = CardService._hex_to_rgb(CardService.PURPLE_DARK)
+    r2, g2, b2 = CardService._hex_to_rgb(CardService.PURPLE_INDIGO)
+    draw = ImageDraw.Draw(card)
+    for x in range(CardService.WIDTH):
+        t = x / (CardService.WIDTH - 1)
+        couleur = (int(r1 + (r2 - r1) * t), int(g1 + (g2 - g1) * t), int(b1 + (b2 - b1) * t))
+        draw.line([(x, 0), (x, CardService.HEIGHT)], fill=couleur)
+    CardService._draw_wavy_pattern(card)
+    CardService._draw_halftone_pattern(card)
+    return card
+
+
+def test_card_background_is_rendered_once_and_matches_legacy_drawing():
+    from PIL import ImageChops
+
+    from app.services.card_service import CardService, _fond_carte
+
+    fond = CardService._create_card_background()
+    assert ImageChops.difference(fond, _legacy_background()).getbbox() is None
+
+    appels = _fond_carte.cache_info().hits
+    fond.paste((255, 0, 0), (0, 0, 100, 100))  # la copie reçue ne modifie pas le cache
+    autre = CardService._create_card_background()
+    assert _fond_carte.cache_info().hits == appels + 1
+    assert autre.getpixel((10, 10)) != (255, 0, 0)
+    assert CardService._font(28, bold=True) is CardService._font(28, bold=True)
+
+
+def test_cached_asset_is_decoded_and_releases_its_file(tmp_path):
+    from PIL import Image
+
+    from app.services.card_service import _charger_asset
+
+    chemin = tmp_path / "logo.png"
+    Image.new("RGBA", (20, 10), (0, 128, 0, 255)).save(chemin)
+
+    logo = _charger_asset(str(chemin), max_size=(200, 100))  # déjà RGBA, sans réduction
+    assert logo.size == (20, 10)
+    assert getattr(logo, "fp", None) is None  # fichier fermé après décodage
+    chemin.unlink()
+    assert logo.getpixel((0, 0)) == (0, 128, 0, 255)
+
+
+@pytest.mark.benchmark
+def test_benchmark_insurance_cards_per_second():
+    """Cartes par seconde, contre le fond et l'encodage PNG refaits à chaque carte"""
+    import time
+    from io import BytesIO
+
+    from app.services.card_service import CardService
+
+    user, souscription, photo, qr = _card_inputs()
+    CardService.generate_insurance_card(user, souscription, "ATT-ECARD-001", "https://example.com", photo, qr)
+
+    iterations = 5
+    debut = time.perf_counter()
+    for _ in range(iterations):
+        _legacy_background().save(BytesIO(), format="PNG", optimize=True)
+    ancien = (time.perf_counter() - debut) / iterations
+
+    debut = time.perf_counter()
+    for _ in range(iterations):
+        carte = CardService.generate_insurance_card(user, souscription, "ATT-ECARD-001", "https://example.com", photo, qr)
+    nouveau = (time.perf_counter() - debut) / iterations
+
+    assert carte.getvalue().startswith(b"\x89PNG")
+    assert nouveau <= ancien * 0.8, f"E-carte : {1 / nouveau:.1f} cartes/s (fond + PNG optimize seuls : {1 / ancien:.1f}/s)"
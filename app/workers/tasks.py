@@ -691,4 +691,125 @@ def record_failed_task(
             db.close()
     except Exception as e:
         logger.error(f"Erreur lors de l'enregistrement de la tâche échouée: {str(e)}")
-        return {"status": "error", "error": str(e)}
\ No newline at end of file
+        return {"status": "error", "error": str(e)}
+
+@celery_app.task(bind=True, name="app.workers.tasks.analyse_souscription_ia", max_retries=MAX_RETRIES)
+def analyse_souscription_ia(
+    self: Task,
+    souscription_id: int,
+    force: bool = False
+) -> Dict[str, Any]:
+    """
+    Exécuter le pipeline d'analyse IA d'une souscription (queue `ia_analysis`).
+    Documents -> OCR -> formatage Agent de Production -> routage -> sauvegarde -> notification.
+    
+    Idempotent : une souscription déjà analysée n'est pas ré-analysée (sauf force=True),
+    ce qui couvre la relivraison de la tâche après la perte d'un worker (acks_late).
+    """
+    from app.models.ia_analysis import IAAnalysis
+    from app.services.ia_auto_service import IAAutoService
+    
+    db = SessionLocal()
+    liberer_verrou = True
+    try:
+        souscription = db.query(Souscription).filter(
+            Souscription.id == souscription_id
+        ).first()
+        
+        if not souscription:
+            IAAutoService.set_analysis_status(souscription_id, "echec", erreur="Souscription introuvable")
+            return {"status": "error", "message": "Subscription not found"}
+        
+        if not force:
+            analyse_existante = db.query(IAAnalysis.demande_id).filter(
+                IAAnalysis.souscription_id == souscription_id
+            ).first()
+            if analyse_existante:
+                IAAutoService.set_analysis_status(
+                    souscription_id, "termine", etape="termine", progression=100,
+                    demande_id=analyse_existante.demande_id
+                )
+                return {"status": "skipped", "message": "Analysis already exists", "demande_id": analyse_existante.demande_id}
+        
+        IAAutoService.set_analysis_status(
+            souscription_id, "en_cours", etape="demarrage", progression=1,
+            task_id=self.request.id, tentative=self.request.retries
+        )
+        IAAutoService.trigger_ia_analysis(db=db, souscription=souscription, background=True, raise_errors=True)
+        
+        statut = IAAutoService.get_analysis_status(souscription_id) or {}
+        return {
+            "status": statut.get("statut", "termine"),
+            "souscription_id": souscription_id,
+            "demande_id": statut.get("demande_id")
+        }
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Erreur lors de l'analyse IA de la souscription {souscription_id}: {str(e)}")
+        
+        retry_count = getattr(self.request, 'retries', 0)
+        max_retries = getattr(self, 'max_retries', MAX_RETRIES)
+        
+        if retry_count < max_retries:
+            # Le verrou reste pris : la tentative suivante est déjà planifiée
+            liberer_verrou = False
+            IAAutoService.set_analysis_status(souscription_id, "en_attente", etape="nouvelle_tentative", erreur=str(e))
+            raise self.retry(
+                exc=e,
+                countdown=INITIAL_COUNTDOWN * (2 ** retry_count),
+            )
+        
+        IAAutoService.set_analysis_status(souscription_id, "echec", erreur=str(e))
+        try:
+            record_failed_task.delay(
+                task_id=self.request.id,
+                task_name=self.name,
+                error_message=str(e),
+                task_args=[souscription_id],
+                error_traceback=traceback.format_exc(),
+                queue_name=(self.request.delivery_info or {}).get('routing_key', 'ia_analysis')
+            )
+        except Exception as record_error:
+            logger.error(f"Erreur lors de l'enregistrement de la tâche échouée: {str(record_error)}")
+        
+        return {"status": "error", "message": str(e)}
+    finally:
+        db.close()
+        if liberer_verrou:
+            IAAutoService.release_analysis_lock(souscription_id)
+
+
+@celery_app.task(
+    bind=True,
+    name="app.workers.tasks.regenerate_attestations",
+    max_retries=0,
+    acks_late=False,
+    time_limit=6 * 3600,
+    soft_time_limit=6 * 3600 - 300,
+)
+def regenerate_attestations(
+    self: Task,
+    job_id: str,
+    type_attestation: str,
+    filtres: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Régénérer en masse les attestations (et e-cartes) des souscriptions filtrées (queue `documents`).
+    Rendu dans un pool de processus, uploads MinIO bornés, un commit par lot.
+    
+    Pas de relance automatique ni d'acks_late : une régénération dure plus longtemps que le
+    visibility_timeout du broker et serait relivrée en cours d'exécution. Une régénération
+    interrompue se relance depuis l'API (les attestations déjà traitées sont simplement refaites).
+    """
+    from app.services.attestation_batch_service import AttestationBatchService
+    
+    db = SessionLocal()
+    try:
+        statut = AttestationBatchService.run(db, job_id, type_attestation, filtres)
+        return {key: statut.get(key) for key in ("job_id", "statut", "total", "reussies", "ignorees", "echecs")}
+    except Exception as e:
+        logger.error(f"Erreur lors de la régénération d'attestations {job_id}: {str(e)}")
+        AttestationBatchService.set_job_status(job_id, "echec", erreur=str(e))
+        return {"status": "error", "message": str(e)}
+    finally:
+        db.close()
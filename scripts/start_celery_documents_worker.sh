@@ -0,0 +1,19 @@
+#!/bin/bash
+
+# Script pour démarrer le worker Celery dédié à la régénération des attestations
+
+cd "$(dirname "$0")/.."
+
+# Activer l'environnement virtuel si présent
+if [ -d "venv" ]; then
+    source venv/bin/activate
+fi
+
+# Pool solo : le processus du worker n'est pas daemon et peut créer les processus
+# de rendu PDF/carte (ATTESTATION_BATCH_WORKERS) ; une seule régénération à la fois
+celery -A app.core.celery_app:celery_app worker \
+    --loglevel=info \
+    --pool=solo \
+    --prefetch-multiplier=1 \
+    --queues=documents \
+    --hostname=documents_worker@%h
@@ -0,0 +1,20 @@
+#!/bin/bash
+
+# Script pour démarrer le worker Celery dédié à l'analyse IA (OCR)
+
+cd "$(dirname "$0")/.."
+
+# Activer l'environnement virtuel si présent
+if [ -d "venv" ]; then
+    source venv/bin/activate
+fi
+
+# Démarrer le worker IA : peu de processus (OCR coûteux en CPU/mémoire),
+# une seule tâche réservée à la fois pour respecter les priorités
+celery -A app.core.celery_app:celery_app worker \
+    --loglevel=info \
+    --concurrency=${IA_WORKER_CONCURRENCY:-2} \
+    --prefetch-multiplier=1 \
+    --max-tasks-per-child=50 \
+    --queues=ia_analysis \
+    --hostname=ia_worker@%h